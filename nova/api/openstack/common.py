@@ -13,7 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import collections
+import datetime
 import functools
 import itertools
 import os
@@ -21,7 +23,9 @@ import re
 
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import strutils
+from oslo_utils import timeutils
 import six
 import six.moves.urllib.parse as urlparse
 import webob
@@ -49,6 +53,15 @@ osapi_opts = [
     cfg.StrOpt('osapi_glance_link_prefix',
                help='Base URL that will be presented to users in links '
                     'to glance resources'),
+    cfg.BoolOpt('osapi_keyset_pagination',
+                default=False,
+                help='Whether the next links of the lists of servers carry '
+                     'an opaque marker with the values of the sort keys of '
+                     'the last server of the page, from which the database '
+                     'pages with a range scan of a composite index, instead '
+                     'of the uuid of that server, whose row is loaded '
+                     'first. Only used when the servers are sorted by '
+                     'created_at, id or uuid.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(osapi_opts)
@@ -61,6 +74,13 @@ CONF.import_opt('enable', 'nova.cells.opts', group='cells')
 
 XML_NS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 
+# Prefix of the markers returned by get_keyset_marker()
+_KEYSET_MARKER_PREFIX = 'ks.'
+
+# Sort keys which are never NULL and are backed by composite indexes of the
+# instances table, the keyset markers only support those
+KEYSET_SORT_KEYS = ('created_at', 'id', 'uuid')
+
 
 _STATE_MAP = {
     vm_states.ACTIVE: {
@@ -231,6 +251,73 @@ def _get_marker_param(request):
     return request.GET['marker']
 
 
+def get_keyset_marker(item, sort_keys):
+    """Return an opaque marker with the values of the sort keys of an item.
+
+    The database pages from those values instead of loading the row of the
+    marker, see get_keyset_marker_values().
+
+    :param item: the last item of a page
+    :param sort_keys: the sort keys of the request, to which the database
+                      adds the default created_at and id sort keys
+    :returns: the marker, or None if a sort key is not supported or is not
+              set for the item
+    """
+    values = {}
+    for key in list(sort_keys) + ['created_at', 'id']:
+        if key not in KEYSET_SORT_KEYS:
+            return None
+        value = item.get(key)
+        if value is None:
+            return None
+        if isinstance(value, datetime.datetime):
+            value = timeutils.normalize_time(value).isoformat()
+        values[key] = value
+    data = base64.urlsafe_b64encode(jsonutils.dumps(values).encode('utf-8'))
+    return _KEYSET_MARKER_PREFIX + data.decode('ascii')
+
+
+def _is_keyset_value(key, value):
+    """Return whether a value of a keyset marker has the type of its key."""
+    if key == 'id':
+        return (isinstance(value, six.integer_types) and
+                not isinstance(value, bool))
+    if not isinstance(value, six.string_types):
+        return False
+    if key == 'created_at':
+        try:
+            timeutils.parse_isotime(value)
+        except ValueError:
+            return False
+    return True
+
+
+def get_keyset_marker_values(marker):
+    """Return the values of the sort keys of a marker.
+
+    :param marker: the marker of a request
+    :returns: a dict of the values of the sort keys, or None if the marker
+              was not returned by get_keyset_marker()
+    :raises: webob.exc.HTTPBadRequest if the marker can't be decoded, or if
+             its keys or the types of its values are not supported
+    """
+    if not marker or not marker.startswith(_KEYSET_MARKER_PREFIX):
+        return None
+    data = marker[len(_KEYSET_MARKER_PREFIX):]
+    try:
+        values = jsonutils.loads(
+            base64.urlsafe_b64decode(str(data)).decode('utf-8'))
+    except (TypeError, ValueError):
+        values = None
+    if (not isinstance(values, dict) or
+            not set(['created_at', 'id']).issubset(values) or
+            not all(key in KEYSET_SORT_KEYS and _is_keyset_value(key, value)
+                    for key, value in values.items())):
+        msg = _('Invalid marker %s') % marker
+        raise webob.exc.HTTPBadRequest(explanation=msg)
+    return values
+
+
 def limited(items, request, max_limit=CONF.osapi_max_limit):
     """Return a slice of items according to requested offset and limit.
 
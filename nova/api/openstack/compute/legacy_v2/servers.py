@@ -214,6 +214,9 @@ class Controller(wsgi.Controller):
         sort_keys, sort_dirs = None, None
         if self.ext_mgr.is_loaded('os-server-sort-keys'):
             sort_keys, sort_dirs = common.get_sort_params(req.params)
+        # The database pages from the values of the sort keys of a keyset
+        # marker instead of loading the row of the marker
+        keyset_marker = common.get_keyset_marker_values(marker)
 
         expected_attrs = None
         if is_detail:
@@ -224,8 +227,9 @@ class Controller(wsgi.Controller):
 
         try:
             instance_list = self.compute_api.get_all(elevated or context,
-                    search_opts=search_opts, limit=limit, marker=marker,
-                    want_objects=True, expected_attrs=expected_attrs,
+                    search_opts=search_opts, limit=limit,
+                    marker=keyset_marker or marker, want_objects=True,
+                    expected_attrs=expected_attrs,
                     sort_keys=sort_keys, sort_dirs=sort_dirs)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
@@ -380,6 +380,9 @@ class ServersController(wsgi.Controller):
 
         limit, marker = common.get_limit_and_marker(req)
         sort_keys, sort_dirs = common.get_sort_params(req.params)
+        # The database pages from the values of the sort keys of a keyset
+        # marker instead of loading the row of the marker
+        keyset_marker = common.get_keyset_marker_values(marker)
 
         expected_attrs = ['pci_devices']
         if is_detail:
@@ -390,8 +393,9 @@ class ServersController(wsgi.Controller):
 
         try:
             instance_list = self.compute_api.get_all(elevated or context,
-                    search_opts=search_opts, limit=limit, marker=marker,
-                    want_objects=True, expected_attrs=expected_attrs,
+                    search_opts=search_opts, limit=limit,
+                    marker=keyset_marker or marker, want_objects=True,
+                    expected_attrs=expected_attrs,
                     sort_keys=sort_keys, sort_dirs=sort_dirs)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
@@ -16,6 +16,7 @@
 
 import hashlib
 
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import timeutils
 
@@ -29,6 +30,7 @@ from nova.objects import base as obj_base
 from nova import utils
 
 
+CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
@@ -171,6 +173,18 @@ class ViewBuilder(common.ViewBuilder):
 
         return servers_dict
 
+    def _get_collection_links(self, request, items, collection_name,
+                              id_key="uuid"):
+        links = super(ViewBuilder, self)._get_collection_links(
+            request, items, collection_name, id_key=id_key)
+        if links and CONF.osapi_keyset_pagination:
+            sort_keys, sort_dirs = common.get_sort_params(request.params)
+            marker = common.get_keyset_marker(items[-1], sort_keys)
+            if marker:
+                links[0]['href'] = self._get_next_link(request, marker,
+                                                       collection_name)
+        return links
+
     @staticmethod
     def _get_metadata(instance):
         # FIXME(danms): Transitional support for objects
@@ -65,7 +65,9 @@ from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
+from oslo_utils import timeutils
 import six
 
 from nova.api.ec2 import ec2utils
@@ -80,6 +82,7 @@ from nova import objects
 from nova.openstack.common import cliutils
 from nova import quota
 from nova import rpc
+from nova.scheduler import profiler as scheduler_profiler
 from nova import servicegroup
 from nova import utils
 from nova import version
@@ -675,8 +678,9 @@ class VmCommands(object):
                                              _('index'))))
 
         if host is None:
-            instances = objects.InstanceList.get_by_filters(
-                context.get_admin_context(), {}, expected_attrs=['flavor'])
+            instances = objects.InstanceList.iter_by_filters(
+                context.get_admin_context(), {}, sort_dir='desc',
+                expected_attrs=['flavor'])
         else:
             instances = objects.InstanceList.get_by_host(
                 context.get_admin_context(), host, expected_attrs=['flavor'])
@@ -926,6 +930,25 @@ class DbCommands(object):
                 return(1)
         db.archive_deleted_rows(max_rows)
 
+    @args('--max_rows', metavar='<number>', default=1000,
+            help='Maximum number of instances indexed per transaction')
+    def rebuild_instance_search_index(self, max_rows=1000):
+        """Rebuild the search index of the instances which are not
+        deleted, see the instance_search_index option.
+        """
+        max_rows = int(max_rows)
+        if max_rows <= 0:
+            print(_("Must supply a positive value for max_rows"))
+            return(1)
+        ctxt = context.get_admin_context()
+        count = 0
+        last_id = db.instance_search_index_rebuild(ctxt, None, max_rows)
+        while last_id is not None:
+            count += 1
+            last_id = db.instance_search_index_rebuild(ctxt, last_id,
+                                                       max_rows)
+        print(_("Rebuilt the search index in %d transaction(s).") % count)
+
     @args('--delete', action='store_true', dest='delete',
           help='If specified, automatically delete any records found where '
                'instance_uuid is NULL.')
@@ -1278,6 +1301,82 @@ class CellV2Commands(object):
             print('Next marker: - %s' % instance.uuid)
 
 
+class SchedulerCommands(object):
+    """Class for profiling the scheduler."""
+
+    @args('--path', metavar='<path>', help='Snapshot file to write')
+    def snapshot(self, path):
+        """Save the hosts known to the scheduler into a snapshot file."""
+        ctxt = context.get_admin_context()
+        snapshot = scheduler_profiler.take_snapshot(ctxt)
+        scheduler_profiler.save_snapshot(snapshot, path)
+        print(_("Saved %(nodes)d compute nodes to %(path)s") %
+              {'nodes': len(snapshot['compute_nodes']), 'path': path})
+
+    @args('--snapshot', metavar='<path>',
+          help='Snapshot file written by the snapshot command')
+    @args('--requests', metavar='<path>',
+          help='JSON file with one or a list of requests, each of them being '
+               'a dict with the request_spec of a '
+               'scheduler.select_destinations.start notification and '
+               'optionally its filter_properties')
+    @args('--repeat', metavar='<number>',
+          help='Number of times each request is scheduled (default: 1)')
+    def profile(self, snapshot, requests, repeat=1):
+        """Schedule requests against a snapshot and print the time spent in
+        each filter and weigher.
+        """
+        repeat = int(repeat)
+        if repeat < 1:
+            print(_("Must supply a positive value for repeat"))
+            return(1)
+        ctxt = context.get_admin_context()
+        scheduler = scheduler_profiler.SnapshotFilterScheduler(
+            scheduler_profiler.load_snapshot(snapshot))
+        for i, (request_spec, filter_properties) in enumerate(
+                scheduler_profiler.load_requests(ctxt, requests)):
+            for attempt in range(repeat):
+                with timeutils.StopWatch() as timer:
+                    hosts = scheduler.schedule(ctxt, request_spec,
+                                               filter_properties)
+                print(_("Request %(request)d: %(hosts)d host(s) selected in "
+                        "%(time).3f ms") %
+                      {'request': i, 'hosts': len(hosts),
+                       'time': timer.elapsed() * 1000})
+        print()
+        for line in scheduler_profiler.format_host_manager_stats(
+                scheduler.host_manager):
+            print(line)
+
+    @args('--snapshot', metavar='<path>',
+          help='Snapshot file written by the snapshot command')
+    @args('--requests', metavar='<path>',
+          help='JSON file with the requests to schedule, in the same format '
+               'as for the profile command')
+    @args('--configurations', metavar='<path>',
+          help='JSON file with a list of scheduler configurations to '
+               'compare, each of them being a dict with a name and the '
+               'options to override, e.g. {"name": "ram only", "options": '
+               '{"scheduler_default_filters": ["RamFilter"]}}. By default, '
+               'only the current configuration is benchmarked')
+    def benchmark(self, snapshot, requests, configurations=None):
+        """Schedule requests against a snapshot and print the requests per
+        second, latencies and memory usage for each configuration.
+        """
+        ctxt = context.get_admin_context()
+        if configurations:
+            with open(configurations) as f:
+                configurations = jsonutils.load(f)
+        else:
+            configurations = [{'name': 'current', 'options': {}}]
+        results = scheduler_profiler.benchmark_configurations(
+            ctxt, scheduler_profiler.load_snapshot(snapshot),
+            scheduler_profiler.load_requests(ctxt, requests),
+            configurations)
+        for line in scheduler_profiler.format_benchmark_results(results):
+            print(line)
+
+
 CATEGORIES = {
     'account': AccountCommands,
     'agent': AgentBuildCommands,
@@ -1291,6 +1390,7 @@ CATEGORIES = {
     'logs': GetLogCommands,
     'network': NetworkCommands,
     'project': ProjectCommands,
+    'scheduler': SchedulerCommands,
     'service': ServiceCommands,
     'shell': ShellCommands,
     'vm': VmCommands,
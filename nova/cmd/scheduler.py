@@ -24,6 +24,7 @@ from oslo_reports import guru_meditation_report as gmr
 
 from nova import config
 from nova import objects
+from nova.scheduler import host_shards
 from nova import service
 from nova import utils
 from nova import version
@@ -40,6 +41,9 @@ def main():
 
     gmr.TextGuruMeditation.setup_autorun(version)
 
+    # The processes filtering the hosts must be forked before the service
+    # opens any connection
+    host_shards.start_workers()
     server = service.Service.create(binary='nova-scheduler',
                                     topic=CONF.scheduler_topic)
     service.serve(server)
@@ -2109,6 +2109,13 @@ class API(base.Base):
         # IP address filtering cannot be applied at the DB layer, remove any DB
         # limit so that it can be applied after the IP filter.
         filter_ip = 'ip6' in filters or 'ip' in filters
+        if (filter_ip and CONF.instance_search_index and
+                'deleted' in filters and not filters['deleted'] and
+                all(utils.get_address_like_pattern(filters[key]) is not None
+                    for key in ('ip', 'ip6') if key in filters) and
+                self.db.instance_search_index_complete(context)):
+            # Unless the search index of the DB looks up the IP addresses
+            filter_ip = False
         orig_limit = limit
         if filter_ip and limit:
             LOG.debug('Removing limit for DB query due to IP filter')
@@ -0,0 +1,158 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the instances of a compute host, read by the periodic tasks of the
+compute manager instead of each of them loading the instances of the host.
+"""
+
+import datetime
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from nova import objects
+from nova import utils
+
+instance_cache_opts = [
+    cfg.BoolOpt('compute_instance_cache',
+                default=False,
+                help='Whether the periodic tasks of the compute service '
+                     'read the instances of the host from a local cache, '
+                     'which is refreshed with the instances updated since '
+                     'its last refresh, instead of each of them querying '
+                     'all the instances of the host.'),
+    cfg.IntOpt('compute_instance_cache_full_refresh_interval',
+               default=600,
+               help='Interval in seconds between the full reloads of the '
+                    'local cache of the instances of the host, which catch '
+                    'up with the changes missed by the incremental '
+                    'refreshes, e.g. because of clock skew between hosts.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(instance_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+# The updated_at column may be stored without the fractions of seconds, so
+# the incremental refreshes overlap a bit.
+_REFRESH_OVERLAP = datetime.timedelta(seconds=2)
+
+
+def _matches(instance, filters):
+    for key, value in filters.items():
+        actual = getattr(instance, key)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            if actual not in value:
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+class HostInstanceCache(object):
+    """Instances of a compute host, refreshed incrementally.
+
+    Each refresh loads the instances of the host updated since the previous
+    one, including the deleted ones which are dropped from the cache. The
+    instances which are in a transition or were invalidated, e.g. after
+    being saved by the compute manager, are reloaded by uuid, so that the
+    instances which left the host are dropped too.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self._instances = {}
+        self._expected_attrs = set()
+        self._stale = set()
+        self._last_refresh = None
+        self._last_full_refresh = None
+
+    def invalidate(self, instance_uuid):
+        """Reload an instance on the next refresh."""
+        self._stale.add(instance_uuid)
+
+    def _needs_full_refresh(self, expected_attrs):
+        return (self._last_full_refresh is None or
+                not expected_attrs <= self._expected_attrs or
+                timeutils.is_older_than(
+                    self._last_full_refresh,
+                    CONF.compute_instance_cache_full_refresh_interval))
+
+    def _full_refresh(self, context, now):
+        instances = objects.InstanceList.get_by_host(
+            context, self.host, expected_attrs=list(self._expected_attrs),
+            use_slave=True)
+        self._instances = {instance.uuid: instance for instance in instances}
+        self._last_full_refresh = now
+
+    def _incremental_refresh(self, context):
+        read_deleted_ctxt = context.elevated(read_deleted='yes')
+        expected_attrs = list(self._expected_attrs)
+        changed = list(objects.InstanceList.get_by_filters(
+            read_deleted_ctxt,
+            {'host': self.host,
+             'changes-since': self._last_refresh - _REFRESH_OVERLAP},
+            expected_attrs=expected_attrs))
+        # The instances in a transition may have left the host
+        stale = self._stale | set(
+            uuid for uuid, instance in self._instances.items()
+            if instance.task_state is not None)
+        stale -= set(instance.uuid for instance in changed)
+        if stale:
+            changed.extend(objects.InstanceList.get_by_filters(
+                read_deleted_ctxt, {'uuid': list(stale)},
+                expected_attrs=expected_attrs))
+            for uuid in stale:
+                # Dropped if not found at all
+                self._instances.pop(uuid, None)
+        for instance in changed:
+            if instance.deleted or instance.host != self.host:
+                self._instances.pop(instance.uuid, None)
+            else:
+                self._instances[instance.uuid] = instance
+        LOG.debug("Refreshed %(changed)d instance(s) of the instance cache",
+                  {'changed': len(changed)})
+
+    @utils.synchronized('compute-instance-cache')
+    def _refresh(self, context, expected_attrs):
+        now = timeutils.utcnow()
+        if self._needs_full_refresh(expected_attrs):
+            self._expected_attrs |= expected_attrs
+            self._full_refresh(context, now)
+        else:
+            self._incremental_refresh(context)
+        self._stale.clear()
+        self._last_refresh = now
+
+    def get_by_host(self, context, expected_attrs=None, filters=None):
+        """Return copies of the instances of the host.
+
+        :param expected_attrs: the attributes of the instances to load
+        :param filters: dict of the values of the fields the instances must
+                        have, a list of values matching any of them
+        :returns: an InstanceList
+        """
+        self._refresh(context, set(expected_attrs or []))
+        instances = []
+        for instance in self._instances.values():
+            if filters and not _matches(instance, filters):
+                continue
+            instance = instance.obj_clone()
+            instance._context = context
+            instances.append(instance)
+        return objects.InstanceList(context, objects=instances)
@@ -26,6 +26,7 @@ terminating it.
 """
 
 import base64
+import collections
 import contextlib
 import functools
 import socket
@@ -58,6 +59,7 @@ from nova.cloudpipe import pipelib
 from nova import compute
 from nova.compute import build_results
 from nova.compute import claims
+from nova.compute import instance_cache
 from nova.compute import power_state
 from nova.compute import resource_tracker
 from nova.compute import rpcapi as compute_rpcapi
@@ -130,6 +132,28 @@ compute_opts = [
     cfg.IntOpt('max_concurrent_builds',
                default=10,
                help='Maximum number of instance builds to run concurrently'),
+    cfg.IntOpt('max_concurrent_network_allocations',
+               default=0,
+               help='Maximum number of instance builds allocating their '
+                    'networks concurrently. 0 means no limit other than '
+                    'max_concurrent_builds.'),
+    cfg.IntOpt('max_concurrent_block_device_preps',
+               default=0,
+               help='Maximum number of instance builds preparing their block '
+                    'devices concurrently. 0 means no limit other than '
+                    'max_concurrent_builds.'),
+    cfg.BoolOpt('build_image_prefetch',
+                default=False,
+                help='Whether the instance builds ask the virt driver to '
+                     'fetch the image of the instance while its networks '
+                     'are allocated and its block devices are prepared, '
+                     'instead of when spawning it. Only supported by some '
+                     'drivers.'),
+    cfg.IntOpt('max_concurrent_image_prefetches',
+               default=0,
+               help='Maximum number of instance builds fetching their image '
+                    'concurrently when build_image_prefetch is enabled. 0 '
+                    'means no limit other than max_concurrent_builds.'),
     cfg.IntOpt('max_concurrent_live_migrations',
                default=1,
                help='Maximum number of live migrations to run concurrently. '
@@ -141,7 +165,68 @@ compute_opts = [
     cfg.IntOpt('block_device_allocate_retries',
                default=60,
                help='Number of times to retry block device'
-                    ' allocation on failures')
+                    ' allocation on failures'),
+    cfg.BoolOpt('bulk_resource_audit',
+                default=False,
+                help='Whether the periodic resource audit retrieves the '
+                     'resources, instances and migrations of all the nodes '
+                     'of the host with a few batched calls, then audits the '
+                     'nodes concurrently, instead of auditing them one by '
+                     'one. Meant for drivers managing many nodes, such as '
+                     'Ironic.'),
+    cfg.IntOpt('max_concurrent_resource_audits',
+               default=10,
+               help='Maximum number of nodes to audit concurrently when '
+                    'bulk_resource_audit is enabled'),
+    cfg.IntOpt('periodic_task_busy_builds',
+               default=0,
+               help='Number of instance builds in progress from which the '
+                    'periodic tasks listed in periodic_tasks_deferrable are '
+                    'deferred, for up to their spacing, until the host is '
+                    'less busy. 0 disables it.'),
+    cfg.ListOpt('periodic_tasks_deferrable',
+                default=['_poll_bandwidth_usage', '_poll_volume_usage',
+                         '_instance_usage_audit',
+                         '_run_image_cache_manager_pass',
+                         '_cleanup_running_deleted_instances',
+                         'update_available_resource'],
+                help='Names of the periodic tasks which are deferred when '
+                     'the host is busy building instances'),
+    cfg.IntOpt('periodic_task_defer_interval',
+               default=30,
+               help='Number of seconds by which the deferrable periodic '
+                    'tasks are deferred when the host is busy building '
+                    'instances'),
+    cfg.BoolOpt('sync_power_state_bulk',
+                default=False,
+                help='Whether the periodic power state sync retrieves the '
+                     'power states of all the instances with a single call '
+                     'to the virt driver, and only synchronizes the '
+                     'instances whose power state differs from the '
+                     'database, relying on the lifecycle events of the '
+                     'driver for the others. All the instances are still '
+                     'synchronized every sync_power_state_full_interval '
+                     'seconds, or when the driver does not support it.'),
+    cfg.BoolOpt('sync_power_state_columns_only',
+                default=False,
+                help='Whether the periodic power state sync only loads the '
+                     'columns of the instances it checks from the database, '
+                     'the other ones being loaded on demand. Ignored when '
+                     'compute_instance_cache is enabled.'),
+    cfg.IntOpt('instance_list_batch_size',
+               default=0,
+               help='Number of instances loaded per database query when '
+                    'the compute service scans many instances, e.g. the '
+                    'deleted instances of the host when the virt driver '
+                    'cannot list the uuids of its instances, so that only '
+                    'one batch of them is held in memory. 0 loads them all '
+                    'at once.'),
+    cfg.IntOpt('usage_audit_batch_size',
+               default=0,
+               help='Number of instances whose bandwidth usages are loaded '
+                    'and saved with a single database call by the bandwidth '
+                    'polling and the instance usage audit periodic tasks. '
+                    '0 loads and saves them instance by instance.'),
     ]
 
 interval_opts = [
@@ -155,10 +240,24 @@ interval_opts = [
                help='Interval to sync power states between the database and '
                     'the hypervisor. Set to -1 to disable. '
                     'Setting this to 0 will run at the default rate.'),
+    cfg.IntOpt('sync_power_state_full_interval',
+               default=3600,
+               help='Interval in seconds between the power state syncs '
+                    'checking all the instances one by one when '
+                    'sync_power_state_bulk is enabled. Set to 0 to only '
+                    'check them one by one when the power states cannot be '
+                    'retrieved at once.'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance network information "
                     "cache updates"),
+    cfg.IntOpt('heal_instance_info_cache_batch_size',
+               default=1,
+               help='Number of instances whose network information cache '
+                    'is updated at each update, the ones whose cache is the '
+                    'oldest first. When greater than 1, the network '
+                    'information of the instances is retrieved with bulk '
+                    'requests to the network service when it supports it.'),
     cfg.IntOpt('reclaim_instance_interval',
                default=0,
                help='Interval in seconds for reclaiming deleted instances'),
@@ -191,6 +290,13 @@ interval_opts = [
                     'that its view of instances is in sync with nova. If the '
                     'CONF option `scheduler_tracks_instance_changes` is '
                     'False, changing this option will have no effect.'),
+    cfg.IntOpt('build_stage_stats_interval',
+               default=-1,
+               help='Interval in seconds to log the latency of the stages of '
+                    'the instance builds since the service started, and to '
+                    'send it in a compute.build_stage_stats notification. '
+                    'Set to -1 to disable. '
+                    'Setting this to 0 will run at the default rate.'),
     cfg.IntOpt('update_resources_interval',
                default=0,
                help='Interval in seconds for updating compute resources. A '
@@ -277,6 +383,11 @@ get_notifier = functools.partial(rpc.get_notifier, service='compute')
 wrap_exception = functools.partial(exception.wrap_exception,
                                    get_notifier=get_notifier)
 
+# The columns of the instances checked by the power state sync, which
+# compares their power state with the one of the virtual machines
+_SYNC_POWER_STATE_COLUMNS = ['host', 'vm_state', 'power_state',
+                             'task_state']
+
 
 @utils.expects_func_args('migration')
 def errors_out_migration(function):
@@ -697,12 +808,23 @@ class ComputeManager(manager.Manager):
         self.instance_events = InstanceEvents()
         self._sync_power_pool = eventlet.GreenPool()
         self._syncs_in_progress = {}
+        self._last_full_power_sync = 0
+        self._builds_in_progress = 0
         self.send_instance_updates = CONF.scheduler_tracks_instance_changes
         if CONF.max_concurrent_builds != 0:
             self._build_semaphore = eventlet.semaphore.Semaphore(
                 CONF.max_concurrent_builds)
         else:
             self._build_semaphore = compute_utils.UnlimitedSemaphore()
+        self._build_stage_semaphores = {}
+        for stage, limit in (
+                ('network', CONF.max_concurrent_network_allocations),
+                ('block_device', CONF.max_concurrent_block_device_preps),
+                ('image', CONF.max_concurrent_image_prefetches)):
+            if limit > 0:
+                self._build_stage_semaphores[stage] = (
+                    eventlet.semaphore.Semaphore(limit))
+        self.build_stage_stats = compute_utils.BuildStageStats()
         if max(CONF.max_concurrent_live_migrations, 0) != 0:
             self._live_migration_semaphore = eventlet.semaphore.Semaphore(
                 CONF.max_concurrent_live_migrations)
@@ -711,6 +833,7 @@ class ComputeManager(manager.Manager):
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
+        self._instance_cache = instance_cache.HostInstanceCache(self.host)
 
         # NOTE(russellb) Load the driver last.  It may call back into the
         # compute manager via the virtapi, so we want it to be fully
@@ -719,6 +842,16 @@ class ComputeManager(manager.Manager):
         self.use_legacy_block_device_info = \
                             self.driver.need_legacy_block_device_info
 
+    def _defer_periodic_task(self, task_name):
+        """Defer the deferrable periodic tasks while the host is busy
+        building instances.
+        """
+        if (CONF.periodic_task_busy_builds > 0 and
+                task_name in CONF.periodic_tasks_deferrable and
+                self._builds_in_progress >= CONF.periodic_task_busy_builds):
+            return CONF.periodic_task_defer_interval
+        return None
+
     def _get_resource_tracker(self, nodename):
         rt = self._resource_tracker_dict.get(nodename)
         if not rt:
@@ -740,6 +873,33 @@ class ComputeManager(manager.Manager):
                 self.driver.node_is_available(instance.node)):
             rt = self._get_resource_tracker(instance.node)
             rt.update_usage(context, instance)
+        self._instance_cache.invalidate(instance.uuid)
+
+    def _get_host_instances(self, context, filters=None, expected_attrs=None,
+                            columns=None):
+        """Return the instances of the host, read from the local instance
+        cache if compute_instance_cache is enabled.
+
+        :param filters: dict of the values of the fields the instances must
+                        have, a list of values matching any of them
+        :param expected_attrs: the attributes of the instances to load
+        :param columns: the fields of the instances to load from the
+                        database, the other ones being lazy-loaded, or None
+                        to load all of them
+        """
+        if CONF.compute_instance_cache:
+            return self._instance_cache.get_by_host(
+                context, expected_attrs=expected_attrs, filters=filters)
+        kwargs = {}
+        if columns is not None:
+            kwargs['columns'] = columns
+        if filters:
+            return objects.InstanceList.get_by_filters(
+                context, dict(filters, host=self.host),
+                expected_attrs=expected_attrs, use_slave=True, **kwargs)
+        return objects.InstanceList.get_by_host(
+            context, self.host, expected_attrs=expected_attrs,
+            use_slave=True, **kwargs)
 
     def _instance_update(self, context, instance, **kwargs):
         """Update an instance in the database using kwargs as value."""
@@ -791,9 +951,17 @@ class ComputeManager(manager.Manager):
         # The driver doesn't support uuids listing, so we'll have
         # to brute force.
         driver_instances = self.driver.list_instances()
-        instances = objects.InstanceList.get_by_filters(context, filters,
-                                                        use_slave=True)
-        name_map = {instance.name: instance for instance in instances}
+        if CONF.instance_list_batch_size > 0:
+            instances = objects.InstanceList.iter_by_filters(
+                context, filters, batch_size=CONF.instance_list_batch_size,
+                use_slave=True)
+        else:
+            instances = objects.InstanceList.get_by_filters(context, filters,
+                                                            use_slave=True)
+        # Only the instances running on the hypervisor are kept
+        driver_names = set(driver_instances)
+        name_map = {instance.name: instance for instance in instances
+                    if instance.name in driver_names}
         local_instances = []
         for driver_instance in driver_instances:
             instance = name_map.get(driver_instance)
@@ -1549,12 +1717,13 @@ class ComputeManager(manager.Manager):
         retry_time = 1
         for attempt in range(1, attempts + 1):
             try:
-                nwinfo = self.network_api.allocate_for_instance(
-                        context, instance, vpn=is_vpn,
-                        requested_networks=requested_networks,
-                        macs=macs,
-                        security_groups=security_groups,
-                        dhcp_options=dhcp_options)
+                with self._build_stage('network', instance):
+                    nwinfo = self.network_api.allocate_for_instance(
+                            context, instance, vpn=is_vpn,
+                            requested_networks=requested_networks,
+                            macs=macs,
+                            security_groups=security_groups,
+                            dhcp_options=dhcp_options)
                 LOG.debug('Instance network_info: |%s|', nwinfo,
                           instance=instance)
                 instance.system_metadata['network_allocated'] = 'True'
@@ -1848,7 +2017,11 @@ class ComputeManager(manager.Manager):
             # for a while and we want to make sure that nothing else tries
             # to do anything with this instance while we wait.
             with self._build_semaphore:
-                self._do_build_and_run_instance(*args, **kwargs)
+                self._builds_in_progress += 1
+                try:
+                    self._do_build_and_run_instance(*args, **kwargs)
+                finally:
+                    self._builds_in_progress -= 1
 
         # NOTE(danms): We spawn here to return the RPC worker thread back to
         # the pool. Since what follows could take a really long time, we don't
@@ -2005,7 +2178,8 @@ class ComputeManager(manager.Manager):
                     network_info = resources['network_info']
                     LOG.debug('Start spawning the instance on the hypervisor.',
                               instance=instance)
-                    with timeutils.StopWatch() as timer:
+                    with timeutils.StopWatch() as timer, \
+                            self._build_stage('spawn', instance):
                         self.driver.spawn(context, instance, image,
                                           injected_files, admin_password,
                                           network_info=network_info,
@@ -2096,6 +2270,28 @@ class ComputeManager(manager.Manager):
                 extra_usage_info={'message': _('Success')},
                 network_info=network_info)
 
+    @contextlib.contextmanager
+    def _build_stage(self, stage, instance):
+        """Run a stage of an instance build within its concurrency limit
+        and record its latency in build_stage_stats.
+        """
+        with self.build_stage_stats.measure(
+                stage, self._build_stage_semaphores.get(stage),
+                instance=instance):
+            yield
+
+    def _prefetch_image(self, context, instance, image):
+        """Fetch the image of an instance being built, while its networks
+        are allocated and its block devices are prepared.
+        """
+        try:
+            with self._build_stage('image', instance):
+                self.driver.prefetch_image(context, instance, image)
+        except Exception:
+            LOG.warning(_LW('Failed to prefetch the image of the instance, '
+                            'it will be fetched when spawning it.'),
+                        instance=instance, exc_info=True)
+
     @contextlib.contextmanager
     def _build_resources(self, context, instance, requested_networks,
             security_groups, image, block_device_mapping):
@@ -2122,6 +2318,13 @@ class ComputeManager(manager.Manager):
             raise exception.BuildAbortException(instance_uuid=instance.uuid,
                     reason=msg)
 
+        image_prefetch = None
+        if (CONF.build_image_prefetch and
+                not self.compute_api.is_volume_backed_instance(
+                    context, instance, block_device_mapping)):
+            image_prefetch = utils.spawn(self._prefetch_image, context,
+                                         instance, image)
+
         try:
             # Verify that all the BDMs have a device_name set and assign a
             # default to the ones missing it with the help of the driver.
@@ -2134,33 +2337,45 @@ class ComputeManager(manager.Manager):
             instance.task_state = task_states.BLOCK_DEVICE_MAPPING
             instance.save()
 
-            block_device_info = self._prep_block_device(context, instance,
-                    block_device_mapping)
+            with self._build_stage('block_device', instance):
+                block_device_info = self._prep_block_device(context, instance,
+                        block_device_mapping)
             resources['block_device_info'] = block_device_info
         except (exception.InstanceNotFound,
                 exception.UnexpectedDeletingTaskStateError):
             with excutils.save_and_reraise_exception():
-                # Make sure the async call finishes
+                # Make sure the async calls finish
                 if network_info is not None:
                     network_info.wait(do_raise=False)
+                if image_prefetch is not None:
+                    image_prefetch.kill()
         except (exception.UnexpectedTaskStateError,
                 exception.VolumeLimitExceeded,
                 exception.InvalidBDM) as e:
-            # Make sure the async call finishes
+            # Make sure the async calls finish
             if network_info is not None:
                 network_info.wait(do_raise=False)
+            if image_prefetch is not None:
+                image_prefetch.kill()
             raise exception.BuildAbortException(instance_uuid=instance.uuid,
                     reason=e.format_message())
         except Exception:
             LOG.exception(_LE('Failure prepping block device'),
                     instance=instance)
-            # Make sure the async call finishes
+            # Make sure the async calls finish
             if network_info is not None:
                 network_info.wait(do_raise=False)
+            if image_prefetch is not None:
+                image_prefetch.kill()
             msg = _('Failure prepping block device.')
             raise exception.BuildAbortException(instance_uuid=instance.uuid,
                     reason=msg)
 
+        if image_prefetch is not None:
+            # The driver fetches the image when spawning the instance if the
+            # prefetch failed.
+            image_prefetch.wait()
+
         try:
             yield resources
         except Exception as exc:
@@ -5509,6 +5724,11 @@ class ComputeManager(manager.Manager):
         if not heal_interval:
             return
 
+        if CONF.heal_instance_info_cache_batch_size > 1:
+            self._heal_instances_info_cache(
+                context, CONF.heal_instance_info_cache_batch_size)
+            return
+
         instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
         instance = None
 
@@ -5517,8 +5737,8 @@ class ComputeManager(manager.Manager):
         if not instance_uuids:
             # The list of instances to heal is empty so rebuild it
             LOG.debug('Rebuilding the list of instances to heal')
-            db_instances = objects.InstanceList.get_by_host(
-                context, self.host, expected_attrs=[], use_slave=True)
+            db_instances = self._get_host_instances(context,
+                                                    expected_attrs=[])
             for inst in db_instances:
                 # We don't want to refresh the cache for instances
                 # which are building or deleting so don't put them
@@ -5590,16 +5810,88 @@ class ComputeManager(manager.Manager):
             LOG.debug("Didn't find any instances for network info cache "
                       "update.")
 
+    @staticmethod
+    def _get_info_cache_age_key(instance):
+        """Sort key of the instances, the ones whose network info cache was
+        updated the longest ago first.
+        """
+        info_cache = instance.info_cache
+        if info_cache is None:
+            return (False, None)
+        updated_at = info_cache.updated_at or info_cache.created_at
+        return (updated_at is not None, updated_at)
+
+    def _heal_instances_info_cache(self, context, batch_size):
+        """Update the network info cache of up to batch_size instances,
+        the ones whose cache is the oldest being updated first.
+        """
+        instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
+
+        LOG.debug('Starting heal instance info cache')
+
+        if not instance_uuids:
+            # The list of instances to heal is empty so rebuild it
+            LOG.debug('Rebuilding the list of instances to heal')
+            db_instances = self._get_host_instances(
+                context, expected_attrs=['info_cache'])
+            # We don't want to refresh the cache for instances which are
+            # building or deleting. If they are building they will get
+            # added to the list next time we build it.
+            db_instances = [inst for inst in db_instances
+                            if inst.vm_state != vm_states.BUILDING and
+                            inst.task_state != task_states.DELETING]
+            db_instances.sort(key=self._get_info_cache_age_key)
+            instance_uuids = [inst.uuid for inst in db_instances]
+
+        self._instance_uuids_to_heal = instance_uuids[batch_size:]
+        batch_uuids = instance_uuids[:batch_size]
+        instances = []
+        if batch_uuids:
+            instances = objects.InstanceList.get_by_filters(
+                context, {'uuid': batch_uuids, 'deleted': False},
+                expected_attrs=['system_metadata', 'info_cache'],
+                use_slave=True)
+        # Check the instances haven't been migrated or aren't being deleted
+        # since the list was built
+        instances = [inst for inst in instances
+                     if inst.host == self.host and
+                     inst.task_state != task_states.DELETING]
+        if not instances:
+            LOG.debug("Didn't find any instances for network info cache "
+                      "update.")
+            return
+
+        # Call to network API to get the instances info.. this will force
+        # an update to the instances info_cache
+        results = self.network_api.get_instances_nw_info(context, instances)
+        for instance in instances:
+            # Saving the info cache doesn't change the updated_at of the
+            # instance, so the instance cache wouldn't reload it and would
+            # keep returning the healed instances as the oldest ones
+            self._instance_cache.invalidate(instance.uuid)
+            result = results.get(instance.uuid)
+            if isinstance(result, exception.InstanceNotFound):
+                LOG.debug('Instance no longer exists. Unable to refresh',
+                          instance=instance)
+            elif isinstance(result, exception.InstanceInfoCacheNotFound):
+                LOG.debug('InstanceInfoCache no longer exists. '
+                          'Unable to refresh', instance=instance)
+            elif isinstance(result, Exception):
+                LOG.error(_LE('An error occurred while refreshing the network '
+                              'cache: %s'), result, instance=instance)
+            else:
+                LOG.debug('Updated the network info_cache for instance',
+                          instance=instance)
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
             filters = {'task_state':
                        [task_states.REBOOTING,
                         task_states.REBOOT_STARTED,
-                        task_states.REBOOT_PENDING],
-                       'host': self.host}
-            rebooting = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[], use_slave=True)
+                        task_states.REBOOT_PENDING]}
+            rebooting = self._get_host_instances(context, filters,
+                                                 expected_attrs=[])
 
             to_poll = []
             for instance in rebooting:
@@ -5612,11 +5904,9 @@ class ComputeManager(manager.Manager):
     @periodic_task.periodic_task
     def _poll_rescued_instances(self, context):
         if CONF.rescue_timeout > 0:
-            filters = {'vm_state': vm_states.RESCUED,
-                       'host': self.host}
-            rescued_instances = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=["system_metadata"],
-                use_slave=True)
+            filters = {'vm_state': vm_states.RESCUED}
+            rescued_instances = self._get_host_instances(
+                context, filters, expected_attrs=["system_metadata"])
 
             to_unrescue = []
             for instance in rescued_instances:
@@ -5776,11 +6066,28 @@ class ComputeManager(manager.Manager):
         task_log.task_items = num_instances
         task_log.message = 'Instance usage audit started...'
         task_log.begin_task()
-        for instance in instances:
+        batch_size = CONF.usage_audit_batch_size
+        bw_usages = None
+        for i, instance in enumerate(instances):
+            kwargs = {}
+            if batch_size > 0 and i % batch_size == 0:
+                batch = instances[i:i + batch_size]
+                try:
+                    bw_usages = self._get_bw_usages_by_instance(
+                        context, batch, begin)
+                except Exception:
+                    # The usages are then loaded for each instance
+                    LOG.exception(_LE('Failed to load the bandwidth usages '
+                                      'of %(count)d instances on host '
+                                      '%(host)s'),
+                                  {'count': len(batch), 'host': self.host})
+                    bw_usages = None
+            if bw_usages is not None:
+                kwargs['bw_usages'] = bw_usages.get(instance.uuid, [])
             try:
                 compute_utils.notify_usage_exists(
                     self.notifier, context, instance,
-                    ignore_missing_network_data=False)
+                    ignore_missing_network_data=False, **kwargs)
                 successes += 1
             except Exception:
                 LOG.exception(_LE('Failed to generate usage '
@@ -5794,6 +6101,88 @@ class ComputeManager(manager.Manager):
             % (self.host, num_instances, time.time() - start_time))
         task_log.end_task()
 
+    @staticmethod
+    def _get_bw_usages_by_instance(context, instances, start_period):
+        """Return the bandwidth usages of the instances in the audit period
+        starting at start_period, by instance uuid.
+        """
+        admin_context = context.elevated(read_deleted='yes')
+        bw_usages = collections.defaultdict(list)
+        for bw_usage in objects.BandwidthUsageList.get_by_uuids(
+                admin_context, [instance.uuid for instance in instances],
+                start_period=start_period, use_slave=True):
+            bw_usages[bw_usage.instance_uuid].append(bw_usage)
+        return bw_usages
+
+    @staticmethod
+    def _get_bw_usage_values(bw_ctr, usage, prev_usage):
+        """Return the bandwidth usage values of an interface from its
+        counters and its usages in the current and previous audit periods.
+        """
+        bw_in = 0
+        bw_out = 0
+        last_ctr_in = None
+        last_ctr_out = None
+        if usage:
+            bw_in = usage.bw_in
+            bw_out = usage.bw_out
+            last_ctr_in = usage.last_ctr_in
+            last_ctr_out = usage.last_ctr_out
+        elif prev_usage:
+            last_ctr_in = prev_usage.last_ctr_in
+            last_ctr_out = prev_usage.last_ctr_out
+
+        if last_ctr_in is not None:
+            if bw_ctr['bw_in'] < last_ctr_in:
+                # counter rollover
+                bw_in += bw_ctr['bw_in']
+            else:
+                bw_in += (bw_ctr['bw_in'] - last_ctr_in)
+
+        if last_ctr_out is not None:
+            if bw_ctr['bw_out'] < last_ctr_out:
+                # counter rollover
+                bw_out += bw_ctr['bw_out']
+            else:
+                bw_out += (bw_ctr['bw_out'] - last_ctr_out)
+
+        return {'uuid': bw_ctr['uuid'],
+                'mac': bw_ctr['mac_address'],
+                'bw_in': bw_in,
+                'bw_out': bw_out,
+                'last_ctr_in': bw_ctr['bw_in'],
+                'last_ctr_out': bw_ctr['bw_out']}
+
+    def _update_bw_usages(self, context, bw_counters, prev_time, start_time,
+                          refreshed, update_cells):
+        """Update the bandwidth usages of usage_audit_batch_size instances
+        at a time, with a database call to load the usages of the current
+        and previous audit periods and another one to save them.
+        """
+        bw_counters = list(bw_counters)
+        batch_size = CONF.usage_audit_batch_size
+        for i in range(0, len(bw_counters), batch_size):
+            batch = bw_counters[i:i + batch_size]
+            uuids = list(set(bw_ctr['uuid'] for bw_ctr in batch))
+            usages = {}
+            prev_usages = {}
+            for period, period_usages in ((start_time, usages),
+                                          (prev_time, prev_usages)):
+                for usage in objects.BandwidthUsageList.get_by_uuids(
+                        context, uuids, start_period=period,
+                        use_slave=True):
+                    period_usages[(usage.instance_uuid, usage.mac)] = usage
+            bw_usages = []
+            for bw_ctr in batch:
+                key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+                bw_usages.append(self._get_bw_usage_values(
+                    bw_ctr, usages.get(key), prev_usages.get(key)))
+            objects.BandwidthUsageList.create_many(
+                context, bw_usages, start_period=start_time,
+                last_refreshed=refreshed, update_cells=update_cells)
+            # Allow switching of greenthreads between batches.
+            greenthread.sleep(0)
+
     @periodic_task.periodic_task(spacing=CONF.bandwidth_poll_interval)
     def _poll_bandwidth_usage(self, context):
 
@@ -5834,51 +6223,32 @@ class ComputeManager(manager.Manager):
                 return
 
             refreshed = timeutils.utcnow()
+            if CONF.usage_audit_batch_size > 0:
+                self._update_bw_usages(context, bw_counters, prev_time,
+                                       start_time, refreshed, update_cells)
+                return
+
             for bw_ctr in bw_counters:
                 # Allow switching of greenthreads between queries.
                 greenthread.sleep(0)
-                bw_in = 0
-                bw_out = 0
-                last_ctr_in = None
-                last_ctr_out = None
                 usage = objects.BandwidthUsage.get_by_instance_uuid_and_mac(
                     context, bw_ctr['uuid'], bw_ctr['mac_address'],
                     start_period=start_time, use_slave=True)
-                if usage:
-                    bw_in = usage.bw_in
-                    bw_out = usage.bw_out
-                    last_ctr_in = usage.last_ctr_in
-                    last_ctr_out = usage.last_ctr_out
-                else:
-                    usage = (objects.BandwidthUsage.
-                             get_by_instance_uuid_and_mac(
+                prev_usage = None
+                if not usage:
+                    prev_usage = (objects.BandwidthUsage.
+                                  get_by_instance_uuid_and_mac(
                         context, bw_ctr['uuid'], bw_ctr['mac_address'],
                         start_period=prev_time, use_slave=True))
-                    if usage:
-                        last_ctr_in = usage.last_ctr_in
-                        last_ctr_out = usage.last_ctr_out
-
-                if last_ctr_in is not None:
-                    if bw_ctr['bw_in'] < last_ctr_in:
-                        # counter rollover
-                        bw_in += bw_ctr['bw_in']
-                    else:
-                        bw_in += (bw_ctr['bw_in'] - last_ctr_in)
-
-                if last_ctr_out is not None:
-                    if bw_ctr['bw_out'] < last_ctr_out:
-                        # counter rollover
-                        bw_out += bw_ctr['bw_out']
-                    else:
-                        bw_out += (bw_ctr['bw_out'] - last_ctr_out)
+                values = self._get_bw_usage_values(bw_ctr, usage, prev_usage)
 
                 objects.BandwidthUsage(context=context).create(
-                                              bw_ctr['uuid'],
-                                              bw_ctr['mac_address'],
-                                              bw_in,
-                                              bw_out,
-                                              bw_ctr['bw_in'],
-                                              bw_ctr['bw_out'],
+                                              values['uuid'],
+                                              values['mac'],
+                                              values['bw_in'],
+                                              values['bw_out'],
+                                              values['last_ctr_in'],
+                                              values['last_ctr_out'],
                                               start_period=start_time,
                                               last_refreshed=refreshed,
                                               update_cells=update_cells)
@@ -5948,12 +6318,22 @@ class ComputeManager(manager.Manager):
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
-        """
-        db_instances = objects.InstanceList.get_by_host(context, self.host,
-                                                        expected_attrs=[],
-                                                        use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
+        If sync_power_state_bulk is enabled, the power states of all the
+        virtual machines are retrieved at once, and only the instances whose
+        power state differs from the one in the database are synchronized.
+        """
+        columns = None
+        if CONF.sync_power_state_columns_only:
+            columns = _SYNC_POWER_STATE_COLUMNS
+        db_instances = self._get_host_instances(context, expected_attrs=[],
+                                                columns=columns)
+
+        vm_power_states = self._get_instances_power_states()
+        if vm_power_states is None:
+            num_vm_instances = self.driver.get_num_instances()
+        else:
+            num_vm_instances = len(vm_power_states)
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -5964,6 +6344,16 @@ class ComputeManager(manager.Manager):
                         {'num_db_instances': num_db_instances,
                          'num_vm_instances': num_vm_instances})
 
+        if vm_power_states is not None:
+            # The other instances are kept in sync by the lifecycle events
+            db_instances = [db_instance for db_instance in db_instances
+                            if db_instance.power_state != vm_power_states.get(
+                                db_instance.uuid, power_state.NOSTATE)]
+            LOG.debug("Found %(changed)d out of %(total)d instances whose "
+                      "power state changed",
+                      {'changed': len(db_instances),
+                       'total': num_db_instances})
+
         def _sync(db_instance):
             # NOTE(melwitt): This must be synchronized as we query state from
             #                two separate sources, the driver and the database.
@@ -5992,6 +6382,30 @@ class ComputeManager(manager.Manager):
                 self._syncs_in_progress[uuid] = True
                 self._sync_power_pool.spawn_n(_sync, db_instance)
 
+    def _get_instances_power_states(self):
+        """Return the power states of all the virtual machines, keyed by
+        instance uuid, or None if each instance must be synchronized.
+        """
+        if not CONF.sync_power_state_bulk:
+            return None
+
+        curr_time = time.time()
+        if (CONF.sync_power_state_full_interval > 0 and
+                curr_time - self._last_full_power_sync >
+                CONF.sync_power_state_full_interval):
+            self._last_full_power_sync = curr_time
+            return None
+
+        try:
+            return self.driver.get_instances_power_states()
+        except NotImplementedError:
+            LOG.debug("The driver cannot retrieve the power states of all "
+                      "the instances at once")
+        except Exception:
+            LOG.exception(_LE("Failed to retrieve the power states of all "
+                              "the instances at once"))
+        return None
+
     def _query_driver_power_state_and_sync(self, context, db_instance):
         if db_instance.task_state is not None:
             LOG.info(_LI("During sync_power_state the instance has a "
@@ -6214,6 +6628,21 @@ class ComputeManager(manager.Manager):
                                     "instance: %s"),
                                 e, instance=instance)
 
+    @periodic_task.periodic_task(spacing=CONF.build_stage_stats_interval)
+    def _report_build_stage_stats(self, context):
+        """Log and notify the latency of the stages of the instance builds
+        since the service started.
+        """
+        stats = self.build_stage_stats.get()
+        if not stats:
+            return
+        LOG.info(_LI("Latency of the instance build stages:\n%s"),
+                 '\n'.join(self.build_stage_stats.format()))
+        payload = {'host': self.host,
+                   'buckets': list(self.build_stage_stats.BUCKETS),
+                   'stages': stats}
+        self.notifier.info(context, 'compute.build_stage_stats', payload)
+
     @periodic_task.periodic_task(spacing=CONF.update_resources_interval)
     def update_available_resource(self, context):
         """See driver.get_available_resource()
@@ -6227,26 +6656,41 @@ class ComputeManager(manager.Manager):
 
         compute_nodes_in_db = self._get_compute_nodes_in_db(context,
                                                             use_slave=True)
+        # The generations let the resource trackers release the resources
+        # claimed by the schedulers, without loading their node again
+        generations = {cn.hypervisor_hostname: cn.generation
+                       for cn in compute_nodes_in_db
+                       if cn.obj_attr_is_set('generation')}
         nodenames = set(self.driver.get_available_nodes())
-        for nodename in nodenames:
-            rt = self._get_resource_tracker(nodename)
+        audit_data = None
+        if CONF.bulk_resource_audit:
+            # The claims made while the audit data is loaded are recorded by
+            # the resource trackers, so that the audits account for them
+            for nodename in nodenames:
+                self._get_resource_tracker(nodename).start_audit()
             try:
-                rt.update_available_resource(context)
-            except exception.ComputeHostNotFound:
-                # NOTE(comstud): We can get to this case if a node was
-                # marked 'deleted' in the DB and then re-added with a
-                # different auto-increment id. The cached resource
-                # tracker tried to update a deleted record and failed.
-                # Don't add this resource tracker to the new dict, so
-                # that this will resolve itself on the next run.
-                LOG.info(_LI("Compute node '%s' not found in "
-                             "update_available_resource."), nodename)
-                continue
-            except Exception as e:
-                LOG.error(_LE("Error updating resources for node "
-                              "%(node)s: %(e)s"),
-                          {'node': nodename, 'e': e})
-            new_resource_tracker_dict[nodename] = rt
+                audit_data = self._get_resource_audit_data(context,
+                                                           nodenames)
+            except Exception:
+                LOG.exception(_LE('Error retrieving the resources of all '
+                                  'the nodes, auditing them one by one'))
+                for nodename in nodenames:
+                    self._get_resource_tracker(nodename)._stop_audit()
+        if audit_data is not None:
+            pool = eventlet.GreenPool(CONF.max_concurrent_resource_audits)
+            results = pool.imap(
+                lambda nodename: self._update_available_resource_for_node(
+                    context, nodename, generation=generations.get(nodename),
+                    **audit_data[nodename]),
+                nodenames)
+        else:
+            results = (self._update_available_resource_for_node(
+                           context, nodename,
+                           generation=generations.get(nodename))
+                       for nodename in nodenames)
+        for nodename, rt in zip(nodenames, results):
+            if rt is not None:
+                new_resource_tracker_dict[nodename] = rt
 
         # NOTE(comstud): Replace the RT cache before looping through
         # compute nodes to delete below, as we can end up doing greenthread
@@ -6260,6 +6704,74 @@ class ComputeManager(manager.Manager):
                 LOG.info(_LI("Deleting orphan compute node %s") % cn.id)
                 cn.destroy()
 
+    def _update_available_resource_for_node(self, context, nodename,
+                                            **audit_data):
+        """Audit the resources of a node.
+
+        :param audit_data: data of the node already retrieved, e.g. by
+                           _get_resource_audit_data()
+        :returns: the ResourceTracker of the node, or None if its compute
+                  node record was not found
+        """
+        rt = self._get_resource_tracker(nodename)
+        try:
+            rt.update_available_resource(context, **audit_data)
+        except exception.ComputeHostNotFound:
+            rt._stop_audit()
+            # NOTE(comstud): We can get to this case if a node was
+            # marked 'deleted' in the DB and then re-added with a
+            # different auto-increment id. The cached resource
+            # tracker tried to update a deleted record and failed.
+            # Don't add this resource tracker to the new dict, so
+            # that this will resolve itself on the next run.
+            LOG.info(_LI("Compute node '%s' not found in "
+                         "update_available_resource."), nodename)
+            return None
+        except Exception as e:
+            # The claims are no longer recorded for an audit which failed
+            rt._stop_audit()
+            LOG.error(_LE("Error updating resources for node "
+                          "%(node)s: %(e)s"),
+                      {'node': nodename, 'e': e})
+        return rt
+
+    def _get_resource_audit_data(self, context, nodenames):
+        """Retrieve the resources, instances and in-progress migrations of
+        all the nodes of the host at once.
+
+        :returns: dictionary of the keyword arguments of
+                  ResourceTracker.update_available_resource(), keyed by
+                  nodename
+        """
+        resources = self.driver.get_available_resources(nodenames)
+        audit_data = {nodename: {'resources': resources.get(nodename),
+                                 'instances': objects.InstanceList(
+                                     context, objects=[]),
+                                 'migrations': objects.MigrationList(
+                                     context, objects=[])}
+                      for nodename in nodenames}
+        instances = objects.InstanceList.get_by_host(
+            context, self.host,
+            expected_attrs=['system_metadata', 'numa_topology'])
+        for instance in instances:
+            if instance.node in audit_data:
+                audit_data[instance.node]['instances'].objects.append(
+                    instance)
+        migrations = objects.MigrationList.get_in_progress_by_host(
+            context, self.host)
+        for migration in migrations:
+            # A migration between two nodes of the host is tracked by both
+            nodes = set()
+            if migration.source_compute == self.host:
+                nodes.add(migration.source_node)
+            if migration.dest_compute == self.host:
+                nodes.add(migration.dest_node)
+            for nodename in nodes:
+                if nodename in audit_data:
+                    audit_data[nodename]['migrations'].objects.append(
+                        migration)
+        return audit_data
+
     def _get_compute_nodes_in_db(self, context, use_slave=False):
         try:
             return objects.ComputeNodeList.get_all_by_host(context, self.host,
@@ -19,6 +19,8 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 import copy
+import functools
+import hashlib
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -52,6 +54,24 @@ resource_tracker_opts = [
     cfg.ListOpt('compute_resources',
                 default=['vcpu'],
                 help='The names of the extra resources to track.'),
+    cfg.BoolOpt('resource_audit_prefetch',
+                default=False,
+                help='Whether the periodic resource audit loads the '
+                     'instances and in-progress migrations of the node '
+                     'before taking the lock it shares with the resource '
+                     'claims, so that the claims made during an audit do '
+                     'not wait for those database queries. The claims made '
+                     'while the audit loads them are accounted for by the '
+                     'audit. The claims still wait for the audit to write '
+                     'the compute node and its PCI devices.'),
+    cfg.BoolOpt('resource_audit_checksum',
+                default=False,
+                help='Whether the periodic resource audit keeps the usage '
+                     'maintained by the resource claims, instead of '
+                     'computing it again from all the instances, migrations '
+                     'and orphans of the node, when neither they nor that '
+                     'usage changed since the previous audit, as detected '
+                     'by comparing their checksums.'),
 ]
 
 allocation_ratio_opts = [
@@ -83,9 +103,35 @@ CONF.register_opts(allocation_ratio_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Fields of the compute node computed by the audit from the instances,
+# migrations and orphans of the node
+_AUDIT_USAGE_FIELDS = ('memory_mb_used', 'local_gb_used', 'vcpus_used',
+                       'free_ram_mb', 'free_disk_gb', 'current_workload',
+                       'running_vms', 'numa_topology')
+
+# Fields of the compute node consumed by the claims of the schedulers
+_CLAIMED_FIELDS = ('free_ram_mb', 'memory_mb_used', 'free_disk_gb',
+                   'local_gb_used', 'vcpus_used', 'running_vms')
+
 CONF.import_opt('my_ip', 'nova.netconf')
 
 
+def _synchronized_node(f):
+    """Run a method of a ResourceTracker holding the lock of its node.
+
+    The trackers of the nodes of a host don't share any state, so each of
+    them has its own COMPUTE_RESOURCE_SEMAPHORE, and the nodes can be
+    audited concurrently.
+    """
+    @functools.wraps(f)
+    def inner(self, *args, **kwargs):
+        @utils.synchronized(self._lock_name)
+        def locked():
+            return f(self, *args, **kwargs)
+        return locked()
+    return inner
+
+
 def _instance_in_resize_state(instance):
     """Returns True if the instance is in one of the resizing states.
 
@@ -116,6 +162,7 @@ class ResourceTracker(object):
         self.driver = driver
         self.pci_tracker = None
         self.nodename = nodename
+        self._lock_name = '%s-%s' % (COMPUTE_RESOURCE_SEMAPHORE, nodename)
         self.compute_node = None
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
@@ -124,12 +171,26 @@ class ResourceTracker(object):
         self.monitors = monitor_handler.monitors
         self.ext_resources_handler = \
             ext_resources.ResourceHandler(CONF.compute_resources)
-        self.old_resources = objects.ComputeNode()
+        # Primitives of the compute node fields as last reported, keyed by
+        # field name
+        self.old_resources = {}
+        # Generation of the compute node as of the last update written by
+        # this tracker, to detect the resources claimed by the schedulers
+        self.saved_generation = None
+        # Instances and migrations claimed since the instances and
+        # migrations used by the running audit started to be loaded, keyed
+        # by uuid and id, or None if no audit is loading them
+        self.audit_claimed_instances = None
+        self.audit_claimed_migrations = None
+        # Checksums of what the usage was computed from and of that usage at
+        # the end of the previous audit, if resource_audit_checksum is set
+        self._audit_checksum = None
+        self._audit_usage_checksum = None
         self.scheduler_client = scheduler_client.SchedulerClient()
         self.ram_allocation_ratio = CONF.ram_allocation_ratio
         self.cpu_allocation_ratio = CONF.cpu_allocation_ratio
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def instance_claim(self, context, instance_ref, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -181,6 +242,7 @@ class ResourceTracker(object):
 
         # Mark resources in-use and update stats
         self._update_usage_from_instance(context, instance_ref)
+        self._record_audit_claim(instance=instance_ref)
 
         elevated = context.elevated()
         # persist changes to the compute node:
@@ -188,7 +250,7 @@ class ResourceTracker(object):
 
         return claim
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def rebuild_claim(self, context, instance, limits=None, image_meta=None,
                       migration=None):
         """Create a claim for a rebuild operation."""
@@ -197,7 +259,7 @@ class ResourceTracker(object):
                                 move_type='evacuation', limits=limits,
                                 image_meta=image_meta, migration=migration)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def resize_claim(self, context, instance, instance_type,
                      image_meta=None, limits=None):
         """Create a claim for a resize or cold-migration move."""
@@ -254,6 +316,7 @@ class ResourceTracker(object):
         # compute host:
         self._update_usage_from_migration(context, instance, image_meta,
                                           migration)
+        self._record_audit_claim(migration=migration)
         elevated = context.elevated()
         self._update(elevated)
 
@@ -307,17 +370,18 @@ class ResourceTracker(object):
         instance.node = self.nodename
         instance.save()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def abort_instance_claim(self, context, instance):
         """Remove usage from the given instance."""
         # flag the instance as deleted to revert the resource usage
         # and associated stats:
         instance['vm_state'] = vm_states.DELETED
         self._update_usage_from_instance(context, instance)
+        self._record_audit_claim(instance=instance)
 
         self._update(context.elevated())
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def drop_move_claim(self, context, instance, instance_type=None,
                         image_meta=None, prefix='new_'):
         """Remove usage for an incoming/outgoing migration."""
@@ -352,7 +416,7 @@ class ResourceTracker(object):
 
             instance.drop_migration_context()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized_node
     def update_usage(self, context, instance):
         """Update the resource usage and stats after a change in an
         instance
@@ -366,12 +430,57 @@ class ResourceTracker(object):
         # claim first:
         if uuid in self.tracked_instances:
             self._update_usage_from_instance(context, instance)
+            self._record_audit_claim(instance=instance)
             self._update(context.elevated())
 
     @property
     def disabled(self):
         return self.compute_node is None
 
+    def start_audit(self):
+        """Start recording the claims made on the node, before loading the
+        instances and migrations of an audit without holding the lock of the
+        node, so that the audit accounts for the claims made while they are
+        loaded.
+        """
+        self.audit_claimed_instances = {}
+        self.audit_claimed_migrations = {}
+
+    def _stop_audit(self):
+        """Stop recording the claims and return the (instances, migrations)
+        recorded since start_audit() was called.
+
+        This should be called while the lock of the node is held, see
+        _synchronized_node().
+        """
+        claimed = (self.audit_claimed_instances or {},
+                   self.audit_claimed_migrations or {})
+        self.audit_claimed_instances = None
+        self.audit_claimed_migrations = None
+        return claimed
+
+    def _record_audit_claim(self, instance=None, migration=None):
+        """Record a claim made while an audit loads the instances and
+        migrations of the node.
+        """
+        if instance is not None and self.audit_claimed_instances is not None:
+            self.audit_claimed_instances[instance['uuid']] = instance
+        if (migration is not None and
+                self.audit_claimed_migrations is not None):
+            self.audit_claimed_migrations[migration.id] = migration
+
+    @staticmethod
+    def _merge_audit_claims(objs, claimed, key):
+        """Return the objects loaded by an audit, the claimed ones replacing
+        the loaded ones with the same key and being added if missing.
+        """
+        if not claimed:
+            return objs
+        claimed = dict(claimed)
+        merged = [claimed.pop(getattr(obj, key), obj) for obj in objs]
+        merged.extend(claimed.values())
+        return merged
+
     def _init_compute_node(self, context, resources):
         """Initialise the compute node if it does not already exist.
 
@@ -411,6 +520,30 @@ class ResourceTracker(object):
                      '%(host)s:%(node)s'),
                  {'host': self.host, 'node': self.nodename})
 
+    def _reconcile_claims(self, generation):
+        """Make the next update write all the fields of the compute node if
+        schedulers claimed resources on it since our last update.
+
+        The claims of the schedulers are only reverted by the updates of this
+        tracker, which otherwise only write the fields whose value changed.
+        Writing them all releases the claims for the instances which were
+        not built on this node, e.g. because their request failed or was
+        rescheduled.
+
+        :param generation: the generation of the compute node record, as
+                           loaded by the compute manager before the audit
+        """
+        if generation is None or self.saved_generation is None:
+            return
+        # NOTE: The record may have been loaded before an update of this
+        # tracker, or from a lagging slave, so only a newer generation
+        # tells that a scheduler claimed the node.
+        if generation > self.saved_generation:
+            LOG.debug('Compute node %(host)s:%(node)s was claimed by a '
+                      'scheduler since its last update, writing all of its '
+                      'resources', {'host': self.host, 'node': self.nodename})
+            self.old_resources.clear()
+
     def _copy_resources(self, resources):
         """Copy resource values to initialise compute_node and related
         data structures.
@@ -449,24 +582,38 @@ class ResourceTracker(object):
             notifier.info(context, 'compute.metrics.update', metrics_info)
         return metrics
 
-    def update_available_resource(self, context):
+    def update_available_resource(self, context, resources=None,
+                                  instances=None, migrations=None,
+                                  generation=None):
         """Override in-memory calculations of compute node resource usage based
         on data audited from the hypervisor layer.
 
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        :param resources: the resources of the node from the virt driver, if
+                          they were already retrieved along with the ones of
+                          the other nodes of the host
+        :param instances: the InstanceList of the node, if already loaded
+        :param migrations: the in-progress MigrationList of the node, if
+                           already loaded
+        :param generation: the generation of the compute node record of the
+                           node, if already loaded, to release the resources
+                           claimed by the schedulers
         """
         LOG.info(_LI("Auditing locally available compute resources for "
                      "node %(node)s"),
                  {'node': self.nodename})
-        resources = self.driver.get_available_resource(self.nodename)
+        if resources is None:
+            resources = self.driver.get_available_resource(self.nodename)
 
         if not resources:
             # The virt driver does not support this function
             LOG.info(_LI("Virt driver does not support "
                  "'get_available_resource'. Compute tracking is disabled."))
             self.compute_node = None
+            self._stop_audit()
             return
         resources['host_ip'] = CONF.my_ip
 
@@ -481,10 +628,30 @@ class ResourceTracker(object):
 
         self._report_hypervisor_resource_view(resources)
 
-        self._update_available_resource(context, resources)
+        if CONF.resource_audit_prefetch and (instances is None or
+                                             migrations is None):
+            self.start_audit()
+            if instances is None:
+                instances = self._get_instances_for_audit(context)
+            if migrations is None:
+                migrations = self._get_migrations_for_audit(context)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
-    def _update_available_resource(self, context, resources):
+        self._update_available_resource(context, resources,
+                                        instances=instances,
+                                        migrations=migrations,
+                                        generation=generation)
+
+    @_synchronized_node
+    def _update_available_resource(self, context, resources, instances=None,
+                                   migrations=None, generation=None):
+
+        claimed_instances, claimed_migrations = self._stop_audit()
+
+        # The usage maintained by the claims since the previous audit, which
+        # is reset by the initialisation of the compute node
+        usage = None
+        if CONF.resource_audit_checksum and self.compute_node:
+            usage = self._get_audit_usage()
 
         # initialise the compute node object, creating it
         # if it does not already exist.
@@ -495,6 +662,8 @@ class ResourceTracker(object):
         if self.disabled:
             return
 
+        self._reconcile_claims(generation)
+
         if 'pci_passthrough_devices' in resources:
             # TODO(jaypipes): Move this into _init_compute_node()
             if not self.pci_tracker:
@@ -505,24 +674,46 @@ class ResourceTracker(object):
             self.pci_tracker.update_devices_from_hypervisor_resources(dev_json)
 
         # Grab all instances assigned to this node:
-        instances = objects.InstanceList.get_by_host_and_node(
-            context, self.host, self.nodename,
-            expected_attrs=['system_metadata',
-                            'numa_topology'])
-
-        # Now calculate usage based on instance utilization:
-        self._update_usage_from_instances(context, instances)
+        if instances is None:
+            instances = self._get_instances_for_audit(context)
+        # The instances claimed while they were loaded are more recent
+        instances = self._merge_audit_claims(instances, claimed_instances,
+                                             'uuid')
 
         # Grab all in-progress migrations:
-        migrations = objects.MigrationList.get_in_progress_by_host_and_node(
-                context, self.host, self.nodename)
+        if migrations is None:
+            migrations = self._get_migrations_for_audit(context)
+        migrations = self._merge_audit_claims(migrations, claimed_migrations,
+                                              'id')
+
+        checksum = None
+        if (usage is not None and self._audit_checksum is not None and
+                self._get_audit_usage_checksum(usage) ==
+                self._audit_usage_checksum):
+            orphans = self._find_orphaned_instances()
+            checksum = self._get_audit_checksum(resources, instances,
+                                                migrations, orphans)
+        if checksum is not None and checksum == self._audit_checksum:
+            # Neither the instances, migrations and orphans nor the usage
+            # maintained by the claims changed since the previous audit
+            LOG.debug('Usage of %(host)s:%(node)s unchanged since the '
+                      'previous audit',
+                      {'host': self.host, 'node': self.nodename})
+            self._restore_audit_usage(usage)
+        else:
+            # Now calculate usage based on instance utilization:
+            self._update_usage_from_instances(context, instances)
 
-        self._update_usage_from_migrations(context, migrations)
+            self._update_usage_from_migrations(context, migrations)
 
-        # Detect and account for orphaned instances that may exist on the
-        # hypervisor, but are not in the DB:
-        orphans = self._find_orphaned_instances()
-        self._update_usage_from_orphans(orphans)
+            # Detect and account for orphaned instances that may exist on the
+            # hypervisor, but are not in the DB:
+            orphans = self._find_orphaned_instances()
+            self._update_usage_from_orphans(orphans)
+
+            if CONF.resource_audit_checksum:
+                self._audit_checksum = self._get_audit_checksum(
+                    resources, instances, migrations, orphans)
 
         # NOTE(yjiang5): Because pci device tracker status is not cleared in
         # this periodic task, and also because the resource tracker is not
@@ -543,10 +734,80 @@ class ResourceTracker(object):
         self.compute_node.metrics = jsonutils.dumps(metrics)
 
         # update the compute_node
+        # NOTE: Unlike the audit data, the compute node and its PCI devices
+        # are still written while holding the lock of the node, so the claims
+        # wait for these writes. The claims save the same compute node, and
+        # an audit writing it after releasing the lock could overwrite the
+        # usage of a later claim with the usage it computed.
         self._update(context)
+        if CONF.resource_audit_checksum:
+            self._audit_usage_checksum = self._get_audit_usage_checksum(
+                self._get_audit_usage())
         LOG.info(_LI('Compute_service record updated for %(host)s:%(node)s'),
                      {'host': self.host, 'node': self.nodename})
 
+    def _get_audit_usage(self):
+        """Return the usage of the node computed from its instances,
+        migrations and orphans, as maintained by the claims.
+        """
+        return {'fields': {field: self._get_field_primitive(field)
+                           for field in _AUDIT_USAGE_FIELDS
+                           if self.compute_node.obj_attr_is_set(field)},
+                'stats': copy.deepcopy(self.stats),
+                'tracked_instances': sorted(self.tracked_instances),
+                'tracked_migrations': sorted(self.tracked_migrations)}
+
+    @staticmethod
+    def _get_audit_usage_checksum(usage):
+        data = (sorted(usage['fields'].items()),
+                sorted(usage['stats'].items()),
+                usage['tracked_instances'], usage['tracked_migrations'])
+        return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
+
+    def _restore_audit_usage(self, usage):
+        """Restore the usage returned by _get_audit_usage()."""
+        for field, value in usage['fields'].items():
+            setattr(self.compute_node, field,
+                    self.compute_node.fields[field].from_primitive(
+                        self.compute_node, field, value))
+        self.stats = usage['stats']
+
+    @staticmethod
+    def _get_audit_checksum(resources, instances, migrations, orphans):
+        """Return a checksum of what the usage of the node is computed
+        from.
+        """
+        def _get_values(obj, fields):
+            return tuple(getattr(obj, field)
+                         if obj.obj_attr_is_set(field) else None
+                         for field in fields)
+
+        data = (
+            CONF.reserved_host_disk_mb, CONF.reserved_host_memory_mb,
+            sorted((key, repr(resources.get(key)))
+                   for key in ('vcpus', 'memory_mb', 'local_gb',
+                               'numa_topology', 'stats')),
+            sorted(_get_values(instance, ('uuid', 'updated_at', 'vm_state',
+                                          'task_state', 'instance_type_id',
+                                          'memory_mb', 'vcpus', 'root_gb',
+                                          'ephemeral_gb'))
+                   for instance in instances),
+            sorted(_get_values(migration, ('id', 'updated_at', 'status',
+                                           'instance_uuid'))
+                   for migration in migrations),
+            sorted((orphan['uuid'], orphan['memory_mb'])
+                   for orphan in orphans))
+        return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
+
+    def _get_instances_for_audit(self, context):
+        return objects.InstanceList.get_by_host_and_node(
+            context, self.host, self.nodename,
+            expected_attrs=['system_metadata', 'numa_topology'])
+
+    def _get_migrations_for_audit(self, context):
+        return objects.MigrationList.get_in_progress_by_host_and_node(
+            context, self.host, self.nodename)
+
     def _get_compute_node(self, context):
         """Returns compute node for the host and nodename."""
         try:
@@ -637,23 +898,71 @@ class ResourceTracker(object):
                   'used_vcpus': ucpu,
                   'pci_stats': pci_stats})
 
+    def _get_field_primitive(self, field):
+        value = getattr(self.compute_node, field)
+        return self.compute_node.fields[field].to_primitive(
+            self.compute_node, field, value)
+
     def _resource_change(self):
-        """Check to see if any resources have changed."""
-        if not obj_base.obj_equal_prims(self.compute_node, self.old_resources):
-            self.old_resources = copy.deepcopy(self.compute_node)
-            return True
-        return False
+        """Return the fields of the compute node which were set since they
+        were last saved and whose value differs from the reported one.
+        """
+        return set(field for field in self.compute_node.obj_what_changed()
+                   if self.compute_node.obj_attr_is_set(field) and
+                   (field not in self.old_resources or
+                    self.old_resources[field] !=
+                    self._get_field_primitive(field)))
 
     def _update(self, context):
         """Update partial stats locally and populate them to Scheduler."""
         self._write_ext_resources(self.compute_node)
-        if not self._resource_change():
+        changed_fields = self._resource_change()
+        if not changed_fields:
             return
+        # Only the fields whose value changed are written, not the ones
+        # which were set to the same value (e.g. the metrics, stats or
+        # NUMA topology blobs during each audit)
+        unchanged_fields = (self.compute_node.obj_what_changed() -
+                            changed_fields)
+        if unchanged_fields:
+            self.compute_node.obj_reset_changes(unchanged_fields,
+                                                recursive=True)
+        reported = {field: self._get_field_primitive(field)
+                    for field in changed_fields}
+        claimed = {field: getattr(self.compute_node, field)
+                   for field in _CLAIMED_FIELDS
+                   if self.compute_node.obj_attr_is_set(field)}
         # Persist the stats to the Scheduler
         self.scheduler_client.update_resource_stats(self.compute_node)
+        self.old_resources.update(reported)
+        if self._claimed_since_saved():
+            # The fields which were not written were loaded back with the
+            # resources claimed by the schedulers since our last update, so
+            # write our own values of all of them
+            LOG.debug('Compute node %(host)s:%(node)s was claimed by a '
+                      'scheduler since its last update, writing all of its '
+                      'resources', {'host': self.host, 'node': self.nodename})
+            for field, value in claimed.items():
+                setattr(self.compute_node, field, value)
+            self.scheduler_client.update_resource_stats(self.compute_node)
+            self.old_resources.update(
+                {field: self._get_field_primitive(field)
+                 for field in claimed})
+        if self.compute_node.obj_attr_is_set('generation'):
+            self.saved_generation = self.compute_node.generation
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
+    def _claimed_since_saved(self):
+        """Return whether the generation of the compute node was bumped by
+        others than this tracker since its last update.
+
+        The update which was just written bumped it once.
+        """
+        return (self.saved_generation is not None and
+                self.compute_node.obj_attr_is_set('generation') and
+                self.compute_node.generation != self.saved_generation + 1)
+
     def _update_usage(self, usage, sign=1):
         mem_usage = usage['memory_mb']
 
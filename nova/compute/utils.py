@@ -14,6 +14,9 @@
 
 """Compute-related Utilities and helpers."""
 
+import bisect
+import contextlib
+import copy
 import itertools
 import string
 import traceback
@@ -21,6 +24,7 @@ import traceback
 import netifaces
 from oslo_config import cfg
 from oslo_log import log
+from oslo_utils import timeutils
 import six
 
 from nova import block_device
@@ -218,7 +222,8 @@ def get_value_from_system_metadata(instance, key, type, default):
 
 def notify_usage_exists(notifier, context, instance_ref, current_period=False,
                         ignore_missing_network_data=True,
-                        system_metadata=None, extra_usage_info=None):
+                        system_metadata=None, extra_usage_info=None,
+                        bw_usages=None):
     """Generates 'exists' notification for an instance for usage auditing
     purposes.
 
@@ -235,12 +240,14 @@ def notify_usage_exists(notifier, context, instance_ref, current_period=False,
         potential custom modifications.
     :param extra_usage_info: Dictionary containing extra values to add or
         override in the notification if not None.
+    :param bw_usages: BandwidthUsage objects of the instance for the audit
+        period if already loaded, e.g. for several instances at once.
     """
 
     audit_start, audit_end = notifications.audit_period_bounds(current_period)
 
     bw = notifications.bandwidth_usage(instance_ref, audit_start,
-            ignore_missing_network_data)
+            ignore_missing_network_data, bw_usages=bw_usages)
 
     if system_metadata is None:
         system_metadata = utils.instance_sys_meta(instance_ref)
@@ -550,9 +557,82 @@ class UnlimitedSemaphore(object):
     def __enter__(self):
         pass
 
-    def __exit__(self):
+    def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
     @property
     def balance(self):
         return 0
+
+
+class BuildStageStats(object):
+    """Latency histograms of the stages of the instance builds.
+
+    For each stage, the number of runs, the total and maximum time spent
+    running it and waiting for its concurrency limit, and the number of
+    runs per latency bucket are recorded.
+    """
+
+    # Upper bounds in seconds of the latency buckets, the last bucket
+    # counting the slower runs
+    BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self):
+        self._stats = {}
+
+    def add(self, stage, elapsed, waited=0.0):
+        """Record a run of a stage."""
+        stats = self._stats.get(stage)
+        if stats is None:
+            stats = self._stats[stage] = {
+                'runs': 0,
+                'time': 0.0,
+                'max_time': 0.0,
+                'wait_time': 0.0,
+                'histogram': [0] * (len(self.BUCKETS) + 1)}
+        stats['runs'] += 1
+        stats['time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['wait_time'] += waited
+        stats['histogram'][bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+
+    @contextlib.contextmanager
+    def measure(self, stage, semaphore=None, instance=None):
+        """Run a stage, within the concurrency limit of the semaphore if
+        any, and record how long it took.
+        """
+        wait_timer = timeutils.StopWatch()
+        wait_timer.start()
+        with semaphore or UnlimitedSemaphore():
+            waited = wait_timer.elapsed()
+            timer = timeutils.StopWatch()
+            timer.start()
+            try:
+                yield
+            finally:
+                elapsed = timer.elapsed()
+                self.add(stage, elapsed, waited)
+                LOG.debug('Build stage %(stage)s took %(elapsed)0.2f '
+                          'seconds after waiting %(waited)0.2f seconds.',
+                          {'stage': stage, 'elapsed': elapsed,
+                           'waited': waited}, instance=instance)
+
+    def get(self):
+        """Return a copy of the statistics, keyed by stage."""
+        return copy.deepcopy(self._stats)
+
+    def format(self):
+        """Return the lines of a table of the statistics, the number of
+        runs per latency bucket in the last columns.
+        """
+        buckets = ['<=%ds' % bound for bound in self.BUCKETS]
+        buckets.append('>%ds' % self.BUCKETS[-1])
+        lines = [('%-14s %6s %9s %9s %9s' % ('Stage', 'Runs', 'Avg (s)',
+                                            'Max (s)', 'Wait (s)')) +
+                 ''.join(' %6s' % bucket for bucket in buckets)]
+        for stage, stats in sorted(self._stats.items()):
+            lines.append(('%-14s %6d %9.2f %9.2f %9.2f' % (
+                stage, stats['runs'], stats['time'] / stats['runs'],
+                stats['max_time'], stats['wait_time'] / stats['runs'])) +
+                ''.join(' %6d' % count for count in stats['histogram']))
+        return lines
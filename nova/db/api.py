@@ -45,6 +45,18 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.BoolOpt('instance_search_index',
+                default=False,
+                help='Whether the name and IP address filters of the lists '
+                     'of instances which are not deleted are looked up in '
+                     'search index tables of the names and fixed IP '
+                     'addresses of the instances, before the regular '
+                     'expressions are matched. The index is maintained by '
+                     'the services updating the instances when this is set, '
+                     'so it must be set for all of them before the index is '
+                     'populated with "nova-manage db '
+                     'rebuild_instance_search_index". The index is only used '
+                     'once that command completed.'),
 ]
 
 CONF = cfg.CONF
@@ -215,6 +227,18 @@ def compute_node_get_all(context):
     return IMPL.compute_node_get_all(context)
 
 
+def compute_node_get_all_changed_since(context, since):
+    """Get computeNodes created, updated or deleted since a point in time.
+
+    :param context: The security context
+    :param since: datetime after which the compute nodes have changed
+
+    :returns: List of dictionaries each containing compute node properties,
+              including the soft-deleted ones
+    """
+    return IMPL.compute_node_get_all_changed_since(context, since)
+
+
 def compute_node_get_all_by_host(context, host, use_slave=False):
     """Get compute nodes by host name
 
@@ -265,6 +289,28 @@ def compute_node_update(context, compute_id, values):
     return IMPL.compute_node_update(context, compute_id, values)
 
 
+def compute_node_claim(context, compute_id, generation, memory_mb, disk_gb,
+                       vcpus):
+    """Atomically consume resources on a ComputeNode.
+
+    :param context: The security context (admin)
+    :param compute_id: ID of the compute node
+    :param generation: generation of the compute node the caller based its
+                       decision on
+    :param memory_mb: RAM to consume, in MB
+    :param disk_gb: disk to consume, in GB
+    :param vcpus: number of VCPUs to consume
+
+    :returns: Dictionary-like object containing the updated properties of the
+              compute node
+
+    Raises ComputeNodeGenerationConflict if the compute node was updated since
+    the given generation.
+    """
+    return IMPL.compute_node_claim(context, compute_id, generation,
+                                   memory_mb, disk_gb, vcpus)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a compute node from the database.
 
@@ -485,6 +531,13 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
     return IMPL.migration_get_in_progress_by_host_and_node(context, host, node)
 
 
+def migration_get_in_progress_by_host(context, host):
+    """Finds all migrations from or to any node of the given host that are
+    not yet confirmed or reverted.
+    """
+    return IMPL.migration_get_in_progress_by_host(context, host)
+
+
 def migration_get_all_by_filters(context, filters):
     """Finds all migrations in progress."""
     return IMPL.migration_get_all_by_filters(context, filters)
@@ -664,7 +717,8 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
+                                columns_to_join=None, use_slave=False,
+                                columns=None):
     """Get all instances that match all filters."""
     # Note: This function exists for backwards compatibility since calls to
     # the instance layer coming in over RPC may specify the single sort
@@ -674,21 +728,23 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave,
+                                            columns=columns)
 
 
 def instance_get_all_by_filters_sort(context, filters, limit=None,
                                      marker=None, columns_to_join=None,
                                      use_slave=False, sort_keys=None,
-                                     sort_dirs=None):
+                                     sort_dirs=None, columns=None):
     """Get all instances that match all filters sorted by multiple keys.
 
-    sort_keys and sort_dirs must be a list of strings.
+    sort_keys and sort_dirs must be a list of strings. If columns is given,
+    only these columns of the instances are loaded.
     """
     return IMPL.instance_get_all_by_filters_sort(
         context, filters, limit=limit, marker=marker,
         columns_to_join=columns_to_join, use_slave=use_slave,
-        sort_keys=sort_keys, sort_dirs=sort_dirs)
+        sort_keys=sort_keys, sort_dirs=sort_dirs, columns=columns)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -707,11 +763,13 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def instance_get_all_by_host(context, host,
-                             columns_to_join=None, use_slave=False):
+                             columns_to_join=None, use_slave=False,
+                             columns=None):
     """Get all instances belonging to a host."""
     return IMPL.instance_get_all_by_host(context, host,
                                          columns_to_join,
-                                         use_slave=use_slave)
+                                         use_slave=use_slave,
+                                         columns=columns)
 
 
 def instance_get_all_by_host_and_node(context, host, node,
@@ -871,6 +929,25 @@ def instance_info_cache_delete(context, instance_uuid):
     return IMPL.instance_info_cache_delete(context, instance_uuid)
 
 
+def instance_search_index_rebuild(context, last_id, max_count):
+    """Rebuild the search index of the instances which are not deleted.
+
+    :param last_id: the id of the last instance whose index was rebuilt, or
+                    None to start from the first instance
+    :param max_count: the maximum number of instances to rebuild the index of
+    :returns: the id of the last instance whose index was rebuilt, or None if
+              there was none left
+    """
+    return IMPL.instance_search_index_rebuild(context, last_id, max_count)
+
+
+def instance_search_index_complete(context):
+    """Return whether the search index of the instances was completely
+    rebuilt, so that it can be used.
+    """
+    return IMPL.instance_search_index_complete(context)
+
+
 ###################
 
 
@@ -1102,6 +1179,16 @@ def quota_usage_get_all_by_project(context, project_id):
     return IMPL.quota_usage_get_all_by_project(context, project_id)
 
 
+def quota_usage_count(context, project_id, syncs, user_id=None):
+    """Count the resources of a project, or of a user of the project, with
+    the given usage synchronization functions, without locking any row.
+
+    The instances being resized are counted with their new flavor.
+    """
+    return IMPL.quota_usage_count(context, project_id, syncs,
+                                  user_id=user_id)
+
+
 def quota_usage_update(context, project_id, user_id, resource, **kwargs):
     """Update a quota usage or raise if it does not exist."""
     return IMPL.quota_usage_update(context, project_id, user_id, resource,
@@ -1652,6 +1739,30 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_many(context, start_period, bw_usages,
+                         last_refreshed=None, update_cells=True):
+    """Update the cached bandwidth usages of several instance networks at
+    once.  Creates the missing records.
+
+    :param bw_usages: list of dicts with the uuid, mac, bw_in, bw_out,
+                      last_ctr_in and last_ctr_out of the usages
+    """
+    rv = IMPL.bw_usage_update_many(context, start_period, bw_usages,
+                                   last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for usage in rv:
+                cells_api.bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], start_period,
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        last_refreshed)
+        except Exception:
+            LOG.exception(_LE("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ###################
 
 
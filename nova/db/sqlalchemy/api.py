@@ -46,10 +46,12 @@ from sqlalchemy.orm import aliased
 from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import noload
 from sqlalchemy.orm import undefer
 from sqlalchemy.schema import Table
 from sqlalchemy import sql
+from sqlalchemy import types as sqltypes
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql import false
@@ -64,7 +66,9 @@ import nova.context
 from nova.db.sqlalchemy import models
 from nova import exception
 from nova.i18n import _, _LI, _LE, _LW
+from nova.network import model as network_model
 from nova import quota
+from nova import utils
 
 db_opts = [
     cfg.StrOpt('osapi_compute_unique_server_name_scope',
@@ -128,6 +132,15 @@ CONF.register_opts(oslo_db_options.database_opts, 'database')
 CONF.register_opts(api_db_opts, group='api_database')
 CONF.import_opt('until_refresh', 'nova.quota')
 
+# Names of the instances indexed by the search index, see
+# _search_index_instance_filter()
+_SEARCH_INDEX_NAME_FIELDS = ('display_name', 'hostname')
+# Number of seconds during which the state of the search index is cached,
+# see instance_search_index_complete()
+_SEARCH_INDEX_STATE_TTL = 60
+_search_index_state = {'complete': False, 'checked_at': None}
+_REGEXP_METACHARACTERS = '.^$*+?{}[]\\|()'
+
 LOG = logging.getLogger(__name__)
 
 _ENGINE_FACADE = {'main': None, 'api': None}
@@ -601,6 +614,15 @@ def compute_node_get_all(context):
     return model_query(context, models.ComputeNode, read_deleted='no').all()
 
 
+def compute_node_get_all_changed_since(context, since):
+    since = timeutils.normalize_time(since)
+    return model_query(context, models.ComputeNode, read_deleted='yes').\
+        filter(or_(models.ComputeNode.created_at >= since,
+                   models.ComputeNode.updated_at >= since,
+                   models.ComputeNode.deleted_at >= since)).\
+        all()
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
     return model_query(context, models.ComputeNode).\
@@ -632,12 +654,42 @@ def compute_node_update(context, compute_id, values):
         # changes in data.  This ensures that we invalidate the
         # scheduler cache of compute node data in case of races.
         values['updated_at'] = timeutils.utcnow()
+        # Bump the generation so that schedulers claiming resources on this
+        # compute node notice that their view of it is stale.
+        values['generation'] = compute_ref.generation + 1
         convert_objects_related_datetimes(values)
         compute_ref.update(values)
 
     return compute_ref
 
 
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+def compute_node_claim(context, compute_id, generation, memory_mb, disk_gb,
+                       vcpus):
+    """Consume resources on a ComputeNode if its generation didn't change."""
+    session = get_session()
+    with session.begin():
+        cn = models.ComputeNode
+        values = {
+            'free_ram_mb': cn.free_ram_mb - memory_mb,
+            'memory_mb_used': cn.memory_mb_used + memory_mb,
+            'free_disk_gb': cn.free_disk_gb - disk_gb,
+            'local_gb_used': cn.local_gb_used + disk_gb,
+            'vcpus_used': cn.vcpus_used + vcpus,
+            'running_vms': cn.running_vms + 1,
+            'generation': cn.generation + 1,
+            'updated_at': timeutils.utcnow(),
+        }
+        result = model_query(context, cn, session=session, read_deleted='no').\
+                 filter_by(id=compute_id, generation=generation).\
+                 update(values, synchronize_session=False)
+        if not result:
+            raise exception.ComputeNodeGenerationConflict(
+                compute_id=compute_id, generation=generation)
+
+        return _compute_node_get(context, compute_id, session=session)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record."""
     session = get_session()
@@ -1652,6 +1704,11 @@ def instance_create(context, values):
         instance_ref.security_groups = _get_sec_group_models(session,
                 security_groups)
         session.add(instance_ref)
+        if CONF.instance_search_index:
+            _instance_search_names_update(session, values['uuid'], values)
+            if info_cache and 'network_info' in info_cache:
+                _instance_search_fixed_ips_update(
+                    session, values['uuid'], info_cache['network_info'])
 
     # create the instance uuid to ec2_id mapping entry for instance
     ec2_instance_create(context, instance_ref['uuid'])
@@ -1715,6 +1772,13 @@ def instance_destroy(context, instance_uuid, constraint=None):
         # NOTE(snikitin): We can't use model_query here, because there is no
         # column 'deleted' in 'tags' table.
         session.query(models.Tag).filter_by(resource_id=instance_uuid).delete()
+        if CONF.instance_search_index:
+            for model in (models.InstanceSearchPrefix,
+                          models.InstanceSearchTrigram,
+                          models.InstanceSearchFixedIP):
+                session.query(model).\
+                    filter_by(instance_uuid=instance_uuid).\
+                    delete(synchronize_session=False)
 
     return instance_ref
 
@@ -1781,7 +1845,8 @@ def _build_instance_get(context, session=None,
 
 
 def _instances_fill_metadata(context, instances,
-                             manual_joins=None, use_slave=False):
+                             manual_joins=None, use_slave=False,
+                             columns=None):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1790,6 +1855,8 @@ def _instances_fill_metadata(context, instances,
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param columns: list of the columns the instances were loaded with, or
+                    None if they were loaded with all of them
     """
     uuids = [inst['uuid'] for inst in instances]
 
@@ -1815,7 +1882,13 @@ def _instances_fill_metadata(context, instances,
 
     filled_instances = []
     for inst in instances:
-        inst = dict(inst)
+        if columns is None:
+            inst = dict(inst)
+        else:
+            # NOTE: Only the loaded attributes are converted, the others
+            # would be loaded one instance at a time.
+            inst = dict((key, value) for key, value in inst.__dict__.items()
+                        if not key.startswith('_'))
         inst['system_metadata'] = sys_meta[inst['uuid']]
         inst['metadata'] = meta[inst['uuid']]
         if 'pci_devices' in manual_joins:
@@ -1825,6 +1898,13 @@ def _instances_fill_metadata(context, instances,
     return filled_instances
 
 
+def _instance_columns_option(columns):
+    """Return the query option loading only the given columns of the
+    instances, along with the ones identifying them.
+    """
+    return load_only(*set(columns).union(['id', 'uuid']))
+
+
 def _manual_join_columns(columns_to_join):
     """Separate manually joined columns from columns_to_join
 
@@ -1872,7 +1952,7 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None):
     """Return instances matching all filters sorted by the primary key.
 
     See instance_get_all_by_filters_sort for more information.
@@ -1884,13 +1964,15 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                             columns_to_join=columns_to_join,
                                             use_slave=use_slave,
                                             sort_keys=[sort_key],
-                                            sort_dirs=[sort_dir])
+                                            sort_dirs=[sort_dir],
+                                            columns=columns)
 
 
 @require_context
 def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
                                      columns_to_join=None, use_slave=False,
-                                     sort_keys=None, sort_dirs=None):
+                                     sort_keys=None, sort_dirs=None,
+                                     columns=None):
     """Return instances that match all filters sorted the the given keys.
     Deleted instances will be returned by default, unless there's a filter that
     says otherwise.
@@ -1941,6 +2023,10 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     |        'tag-any: [some-any-tag, some-another-any-tag]
     |    }
 
+    The marker is either the uuid of the last instance of the previous page
+    or a dict of the values of its sort keys, from which the page is read
+    without loading that instance.
+
     """
     # NOTE(mriedem): If the limit is 0 there is no point in even going
     # to the database since nothing is going to be returned anyway.
@@ -1969,6 +2055,8 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
             query_prefix = query_prefix.options(undefer(column))
         else:
             query_prefix = query_prefix.options(joinedload(column))
+    if columns is not None:
+        query_prefix = query_prefix.options(_instance_columns_option(columns))
 
     # Note: order_by is done in the sqlalchemy.utils.py paginate_query(),
     # no need to do it here as well
@@ -1977,6 +2065,11 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
 
+    # The search index only has the instances which are not deleted
+    use_search_index = (CONF.instance_search_index and
+                        'deleted' in filters and not filters['deleted'] and
+                        instance_search_index_complete(context))
+
     if 'changes-since' in filters:
         changes_since = timeutils.normalize_time(filters['changes-since'])
         query_prefix = query_prefix.\
@@ -2054,10 +2147,18 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     # Filter the query
     query_prefix = _exact_instance_filter(query_prefix,
                                 filters, exact_match_filter_names)
+    if use_search_index:
+        query_prefix = _search_index_instance_filter(query_prefix, filters)
     query_prefix = _regex_instance_filter(query_prefix, filters)
     query_prefix = _tag_instance_filter(context, query_prefix, filters)
 
     # paginate query
+    if isinstance(marker, dict):
+        query_prefix = _keyset_paginate_query(query_prefix, models.Instance,
+                                              limit, sort_keys, marker,
+                                              sort_dirs)
+        return _instances_fill_metadata(context, query_prefix.all(),
+                                        manual_joins, columns=columns)
     if marker is not None:
         try:
             marker = _instance_get_by_uuid(
@@ -2074,7 +2175,62 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     except db_exc.InvalidSortKey:
         raise exception.InvalidSortKey()
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins,
+                                    columns=columns)
+
+
+def _keyset_paginate_query(query, model, limit, sort_keys, marker,
+                           sort_dirs):
+    """Returns a query sorted by the given keys, past the marker values.
+
+    Unlike paginate_query(), the row of the marker is not loaded and the
+    query is bounded by the value of the first sort key, so that the page is
+    read with a range scan of a composite index on the sort keys.
+
+    :param marker: dict of the values of the sort keys of the last row of
+                   the previous page, the datetimes in ISO 8601 format
+    """
+    keys = []
+    for sort_key, sort_dir in zip(sort_keys, sort_dirs):
+        if sort_key not in model.__table__.columns:
+            raise exception.InvalidSortKey()
+        column = getattr(model, sort_key)
+        value = marker.get(sort_key)
+        if (isinstance(column.type, sqltypes.DateTime) and
+                isinstance(value, six.string_types)):
+            try:
+                value = timeutils.normalize_time(
+                    timeutils.parse_isotime(value))
+            except ValueError:
+                value = None
+        if value is None:
+            raise exception.MarkerNotFound(marker=marker)
+        if sort_dir == 'desc':
+            query = query.order_by(desc(column))
+        else:
+            query = query.order_by(asc(column))
+        keys.append((column, value, sort_dir))
+
+    # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ..., bounded by k1 >= v1
+    criteria = []
+    for i, (column, value, sort_dir) in enumerate(keys):
+        criterion = [prev_column == prev_value
+                     for prev_column, prev_value, _dir in keys[:i]]
+        if sort_dir == 'desc':
+            criterion.append(column < value)
+        else:
+            criterion.append(column > value)
+        criteria.append(and_(*criterion))
+    column, value, sort_dir = keys[0]
+    if sort_dir == 'desc':
+        query = query.filter(column <= value)
+    else:
+        query = query.filter(column >= value)
+    query = query.filter(or_(*criteria))
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 
 def _tag_instance_filter(context, query, filters):
@@ -2138,6 +2294,130 @@ def _tag_instance_filter(context, query, filters):
     return query
 
 
+def _get_search_literal(regex):
+    """Returns the literal which the names matching a regular expression
+    contain, and whether they start with it, or None.
+
+    Only the ASCII literals are returned, lowercased, so that the names
+    containing them are a superset of the names matching the regular
+    expression, whether the database matches it case sensitively or not.
+    """
+    if not isinstance(regex, six.string_types):
+        return None
+    prefix = regex.startswith('^')
+    if prefix:
+        regex = regex[1:]
+    if regex.endswith('$'):
+        regex = regex[:-1]
+    if not regex or any(char in _REGEXP_METACHARACTERS for char in regex):
+        return None
+    try:
+        regex.encode('ascii')
+    except UnicodeError:
+        return None
+    return regex.lower(), prefix
+
+
+def _get_trigrams(value):
+    return set(value[i:i + 3] for i in range(len(value) - 2))
+
+
+def _search_index_instance_filter(query, filters):
+    """Applies the search index lookups to an Instance query.
+
+    Returns the updated query. The instances whose names are filtered by a
+    regular expression containing a literal are looked up by the prefix or
+    trigrams of that literal, the regular expression being still matched
+    against the instances found. The IP address filters supported by
+    utils.get_address_like_pattern() are replaced by a lookup of the fixed
+    IP addresses of the instances, and removed from the filters.
+
+    :param query: query to apply filters to
+    :param filters: dictionary of filters
+    """
+    model = models.Instance
+    for field in _SEARCH_INDEX_NAME_FIELDS:
+        literal = _get_search_literal(filters.get(field))
+        if literal is None:
+            continue
+        value, prefix = literal
+        if prefix:
+            search_model = models.InstanceSearchPrefix
+            value = value[:search_model.value.type.length]
+            value = value.replace('!', '!!').replace('%', '!%').\
+                replace('_', '!_')
+            subq = query.session.query(search_model.instance_uuid).\
+                filter_by(field=field).\
+                filter(search_model.value.like(value + '%', escape='!'))
+        else:
+            trigrams = _get_trigrams(value)
+            if not trigrams:
+                continue
+            search_model = models.InstanceSearchTrigram
+            subq = query.session.query(search_model.instance_uuid).\
+                filter_by(field=field).\
+                filter(search_model.trigram.in_(trigrams)).\
+                group_by(search_model.instance_uuid).\
+                having(func.count(search_model.trigram) == len(trigrams))
+        query = query.filter(model.uuid.in_(subq))
+
+    # The instances matching either of the IP address filters are returned
+    patterns = {}
+    for version, filter_name in ((4, 'ip'), (6, 'ip6')):
+        if filter_name in filters:
+            patterns[version] = utils.get_address_like_pattern(
+                filters[filter_name])
+    if patterns and None not in patterns.values():
+        search_model = models.InstanceSearchFixedIP
+        subq = query.session.query(search_model.instance_uuid).\
+            filter(or_(*[and_(search_model.version == version,
+                              search_model.address.like(pattern))
+                         for version, pattern in patterns.items()]))
+        query = query.filter(model.uuid.in_(subq))
+        filters.pop('ip', None)
+        filters.pop('ip6', None)
+
+    return query
+
+
+def _instance_search_names_update(session, instance_uuid, values):
+    """Updates the search index of the names of an instance."""
+    for field in _SEARCH_INDEX_NAME_FIELDS:
+        if field not in values:
+            continue
+        for search_model in (models.InstanceSearchPrefix,
+                             models.InstanceSearchTrigram):
+            session.query(search_model).\
+                filter_by(instance_uuid=instance_uuid, field=field).\
+                delete(synchronize_session=False)
+        if not values[field]:
+            continue
+        value = values[field].lower()
+        length = models.InstanceSearchPrefix.value.type.length
+        session.add(models.InstanceSearchPrefix(
+            instance_uuid=instance_uuid, field=field, value=value[:length]))
+        session.add_all([models.InstanceSearchTrigram(
+                             instance_uuid=instance_uuid, field=field,
+                             trigram=trigram)
+                         for trigram in _get_trigrams(value)])
+
+
+def _instance_search_fixed_ips_update(session, instance_uuid, network_info):
+    """Updates the search index of the fixed IP addresses of an instance."""
+    session.query(models.InstanceSearchFixedIP).\
+        filter_by(instance_uuid=instance_uuid).\
+        delete(synchronize_session=False)
+    if not network_info:
+        return
+    nw_info = network_model.NetworkInfo.hydrate(network_info)
+    session.add_all([models.InstanceSearchFixedIP(
+                         instance_uuid=instance_uuid,
+                         address=fixed_ip['address'],
+                         version=fixed_ip['version'])
+                     for vif in nw_info for fixed_ip in vif.fixed_ips()
+                     if fixed_ip.get('address')])
+
+
 def _get_regexp_op_for_connection(db_connection):
     db_string = db_connection.split(':')[0].split('+')[0]
     regexp_op_map = {
@@ -2354,12 +2634,14 @@ def _instance_get_all_query(context, project_only=False,
 
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
-                             use_slave=False):
+                             use_slave=False, columns=None):
+    query = _instance_get_all_query(context, use_slave=use_slave)
+    if columns is not None:
+        query = query.options(_instance_columns_option(columns))
     return _instances_fill_metadata(context,
-      _instance_get_all_query(context,
-                              use_slave=use_slave).filter_by(host=host).all(),
-                              manual_joins=columns_to_join,
-                              use_slave=use_slave)
+                                    query.filter_by(host=host).all(),
+                                    manual_joins=columns_to_join,
+                                    use_slave=use_slave, columns=columns)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2622,6 +2904,9 @@ def _instance_update(context, session, instance_uuid, values, expected,
 
         raise exc(**exc_props)
 
+    if CONF.instance_search_index:
+        _instance_search_names_update(session, instance_uuid, values)
+
     if metadata is not None:
         _instance_metadata_update_in_place(context, instance_ref,
                                            'metadata',
@@ -2700,6 +2985,10 @@ def instance_info_cache_update(context, instance_uuid, values):
             # wins.
             pass
 
+        if CONF.instance_search_index and 'network_info' in values:
+            _instance_search_fixed_ips_update(session, instance_uuid,
+                                              values['network_info'])
+
     return info_cache
 
 
@@ -2714,6 +3003,60 @@ def instance_info_cache_delete(context, instance_uuid):
                          soft_delete()
 
 
+def _instance_search_index_set_complete(context, session, complete):
+    state = model_query(context, models.InstanceSearchIndexState,
+                        session=session, read_deleted='yes').first()
+    if state is None:
+        state = models.InstanceSearchIndexState()
+    state.complete = complete
+    state.save(session=session)
+    _search_index_state.update(complete=complete,
+                               checked_at=timeutils.utcnow())
+
+
+@require_context
+def instance_search_index_complete(context):
+    checked_at = _search_index_state['checked_at']
+    if (checked_at is None or
+            timeutils.is_older_than(checked_at, _SEARCH_INDEX_STATE_TTL)):
+        state = model_query(context, models.InstanceSearchIndexState,
+                            read_deleted='yes').first()
+        _search_index_state.update(
+            complete=state is not None and state.complete,
+            checked_at=timeutils.utcnow())
+    return _search_index_state['complete']
+
+
+@require_context
+def instance_search_index_rebuild(context, last_id, max_count):
+    session = get_session()
+    with session.begin():
+        if last_id is None:
+            # The index is not used until all the instances are indexed
+            _instance_search_index_set_complete(context, session, False)
+        query = model_query(context, models.Instance, session=session,
+                            read_deleted='no').\
+                options(joinedload('info_cache'))
+        if last_id is not None:
+            query = query.filter(models.Instance.id > last_id)
+        instances = query.order_by(asc(models.Instance.id)).\
+                          limit(max_count).\
+                          all()
+        for instance in instances:
+            _instance_search_names_update(
+                session, instance['uuid'],
+                {field: instance[field]
+                 for field in _SEARCH_INDEX_NAME_FIELDS})
+            info_cache = instance['info_cache']
+            _instance_search_fixed_ips_update(
+                session, instance['uuid'],
+                info_cache['network_info'] if info_cache else None)
+        if not instances:
+            _instance_search_index_set_complete(context, session, True)
+
+    return instances[-1]['id'] if instances else None
+
+
 ###################
 
 
@@ -3324,6 +3667,53 @@ def quota_usage_get_all_by_project(context, project_id):
     return _quota_usage_get_all(context, project_id)
 
 
+def _resize_growth_get_for_user(context, project_id, user_id, session):
+    """Return the cores and RAM the in progress resizes of the instances
+    of a project, or of a user, add until they are finished.
+
+    An instance only has the vcpus and memory_mb of its new flavor once
+    the resize is finished, so an upsize is counted at its new flavor
+    meanwhile.
+    """
+    query = model_query(context, models.Instance,
+                        (models.Instance.vcpus, models.Instance.memory_mb,
+                         models.InstanceTypes.vcpus,
+                         models.InstanceTypes.memory_mb),
+                        session=session, read_deleted='no').\
+        join(models.Migration,
+             and_(models.Migration.instance_uuid == models.Instance.uuid,
+                  models.Migration.deleted == 0)).\
+        join(models.InstanceTypes,
+             models.InstanceTypes.id ==
+             models.Migration.new_instance_type_id).\
+        filter(models.Migration.status.in_(['pre-migrating', 'migrating',
+                                            'post-migrating'])).\
+        filter(models.Instance.project_id == project_id)
+    if user_id:
+        query = query.filter(models.Instance.user_id == user_id)
+    cores = ram = 0
+    for old_vcpus, old_memory_mb, new_vcpus, new_memory_mb in query.all():
+        cores += max(0, (new_vcpus or 0) - (old_vcpus or 0))
+        ram += max(0, (new_memory_mb or 0) - (old_memory_mb or 0))
+    return cores, ram
+
+
+@require_context
+def quota_usage_count(context, project_id, syncs, user_id=None):
+    elevated = context.elevated()
+    session = get_session()
+    counts = {}
+    for sync in syncs:
+        counts.update(QUOTA_SYNC_FUNCTIONS[sync](elevated, project_id,
+                                                 user_id, session))
+    if '_sync_instances' in syncs:
+        cores, ram = _resize_growth_get_for_user(elevated, project_id,
+                                                 user_id, session)
+        counts['cores'] += cores
+        counts['ram'] += ram
+    return counts
+
+
 def _quota_usage_create(project_id, user_id, resource, in_use,
                         reserved, until_refresh, session=None):
     quota_usage_ref = models.QuotaUsage()
@@ -4257,11 +4647,12 @@ def security_group_destroy(context, security_group_id):
 def _security_group_count_by_project_and_user(context, project_id, user_id,
                                              session=None):
     nova.context.authorize_project_context(context, project_id)
-    return model_query(context, models.SecurityGroup, read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   filter_by(user_id=user_id).\
-                   count()
+    query = model_query(context, models.SecurityGroup, read_deleted="no",
+                        session=session).\
+                   filter_by(project_id=project_id)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    return query.count()
 
 
 ###################
@@ -4492,6 +4883,17 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
             all()
 
 
+def migration_get_in_progress_by_host(context, host):
+
+    return model_query(context, models.Migration).\
+            filter(or_(models.Migration.source_compute == host,
+                       models.Migration.dest_compute == host)).\
+            filter(~models.Migration.status.in_(['confirmed', 'reverted',
+                                                 'error'])).\
+            options(joinedload_all('instance.system_metadata')).\
+            all()
+
+
 def migration_get_all_by_filters(context, filters):
     query = model_query(context, models.Migration)
     if "status" in filters:
@@ -5221,6 +5623,60 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         return bwusage
 
 
+@require_context
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True,
+                           retry_on_request=True)
+def bw_usage_update_many(context, start_period, bw_usages,
+                         last_refreshed=None):
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+    ts_values = {'last_refreshed': last_refreshed,
+                 'start_period': start_period}
+    ts_values = convert_objects_related_datetimes(ts_values,
+                                                  'start_period',
+                                                  'last_refreshed')
+    if not bw_usages:
+        return []
+
+    session = get_session()
+    with session.begin():
+        uuids = set(usage['uuid'] for usage in bw_usages)
+        existing = model_query(context, models.BandwidthUsage,
+                               session=session, read_deleted='yes').\
+                        filter_by(start_period=ts_values['start_period']).\
+                        filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                        all()
+        existing = {(bw_usage.uuid, bw_usage.mac): bw_usage
+                    for bw_usage in existing}
+
+        result = []
+        for usage in bw_usages:
+            values = {'last_refreshed': ts_values['last_refreshed'],
+                      'last_ctr_in': usage['last_ctr_in'],
+                      'last_ctr_out': usage['last_ctr_out'],
+                      'bw_in': usage['bw_in'],
+                      'bw_out': usage['bw_out']}
+            bw_usage = existing.get((usage['uuid'], usage['mac']))
+            if bw_usage is None:
+                bw_usage = models.BandwidthUsage()
+                bw_usage.start_period = ts_values['start_period']
+                bw_usage.uuid = usage['uuid']
+                bw_usage.mac = usage['mac']
+                session.add(bw_usage)
+                existing[(usage['uuid'], usage['mac'])] = bw_usage
+            bw_usage.update(values)
+            result.append(bw_usage)
+        try:
+            session.flush()
+        except db_exc.DBDuplicateEntry:
+            # NOTE: A usage was created concurrently, so the existing usages
+            # are loaded again.
+            raise db_exc.RetryRequest(
+                exception.NovaException(_('Concurrent bandwidth usage '
+                                          'creation')))
+    return result
+
+
 ####################
 
 
@@ -6204,11 +6660,12 @@ def instance_group_get_all_by_project_id(context, project_id):
 
 def _instance_group_count_by_project_and_user(context, project_id,
                                               user_id, session=None):
-    return model_query(context, models.InstanceGroup, read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   filter_by(user_id=user_id).\
-                   count()
+    query = model_query(context, models.InstanceGroup, read_deleted="no",
+                        session=session).\
+                   filter_by(project_id=project_id)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    return query.count()
 
 
 def _instance_group_model_get_query(context, model_class, group_id,
@@ -0,0 +1,25 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Integer, MetaData, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    cn = Table('compute_nodes', meta, autoload=True)
+    shadow_cn = Table('shadow_compute_nodes', meta, autoload=True)
+    cn.create_column(Column('generation', Integer, nullable=False,
+                            server_default='0'))
+    shadow_cn.create_column(Column('generation', Integer, nullable=False,
+                                   server_default='0'))
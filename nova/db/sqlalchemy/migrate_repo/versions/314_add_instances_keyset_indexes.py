@@ -0,0 +1,42 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from sqlalchemy import MetaData, Table, Index
+
+from nova.i18n import _LI
+
+LOG = logging.getLogger(__name__)
+
+# Indexes for the keyset pagination of the instances by their default sort
+# keys, of all the projects or of a single one
+INDEXES = [
+    ('instances_deleted_created_at_id_idx',
+     ['deleted', 'created_at', 'id']),
+    ('instances_project_id_deleted_created_at_id_idx',
+     ['project_id', 'deleted', 'created_at', 'id']),
+]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    table = Table('instances', meta, autoload=True)
+    existing = [idx.columns.keys() for idx in table.indexes]
+    for index_name, index_columns in INDEXES:
+        if index_columns in existing:
+            LOG.info(_LI('Skipped adding %s because an equivalent index'
+                         ' already exists.'), index_name)
+            continue
+        columns = [getattr(table.c, col_name) for col_name in index_columns]
+        index = Index(index_name, *columns)
+        index.create(migrate_engine)
@@ -0,0 +1,70 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    prefixes = Table('instance_search_prefixes', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('instance_uuid', String(length=36), nullable=False),
+        Column('field', String(length=16), nullable=False),
+        Column('value', String(length=200), nullable=False),
+        Index('instance_search_prefixes_field_value_idx', 'field', 'value'),
+        Index('instance_search_prefixes_instance_uuid_idx',
+              'instance_uuid'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    prefixes.create(checkfirst=True)
+
+    trigrams = Table('instance_search_trigrams', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('instance_uuid', String(length=36), nullable=False),
+        Column('field', String(length=16), nullable=False),
+        Column('trigram', String(length=3), nullable=False),
+        Index('instance_search_trigrams_field_trigram_idx',
+              'field', 'trigram', 'instance_uuid'),
+        Index('instance_search_trigrams_instance_uuid_idx',
+              'instance_uuid'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    trigrams.create(checkfirst=True)
+
+    fixed_ips = Table('instance_search_fixed_ips', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('instance_uuid', String(length=36), nullable=False),
+        Column('address', String(length=39), nullable=False),
+        Column('version', Integer, nullable=False),
+        Index('instance_search_fixed_ips_address_idx', 'address'),
+        Index('instance_search_fixed_ips_instance_uuid_idx',
+              'instance_uuid'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    fixed_ips.create(checkfirst=True)
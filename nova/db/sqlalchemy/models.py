@@ -175,6 +175,11 @@ class ComputeNode(BASE, NovaBase, models.SoftDeleteMixin):
     ram_allocation_ratio = Column(Float, nullable=True)
     cpu_allocation_ratio = Column(Float, nullable=True)
 
+    # incremented on each update so that concurrent schedulers can detect
+    # that their view of the compute node is stale
+    generation = Column(Integer, nullable=False, default=0,
+                        server_default='0')
+
 
 class Certificate(BASE, NovaBase, models.SoftDeleteMixin):
     """Represents a x509 certificate."""
@@ -209,6 +214,10 @@ class Instance(BASE, NovaBase, models.SoftDeleteMixin):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_deleted_created_at_id_idx',
+              'deleted', 'created_at', 'id'),
+        Index('instances_project_id_deleted_created_at_id_idx',
+              'project_id', 'deleted', 'created_at', 'id'),
         schema.UniqueConstraint('uuid', name='uniq_instances0uuid'),
     )
     injected_files = []
@@ -1427,3 +1436,64 @@ class Tag(BASE, models.ModelBase):
                     'Instance.deleted == 0)',
         foreign_keys=resource_id
     )
+
+
+class InstanceSearchPrefix(BASE, NovaBase):
+    """Represents the lowercased name of an instance, searched by prefix."""
+
+    __tablename__ = 'instance_search_prefixes'
+    __table_args__ = (
+        Index('instance_search_prefixes_field_value_idx', 'field', 'value'),
+        Index('instance_search_prefixes_instance_uuid_idx',
+              'instance_uuid'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    instance_uuid = Column(String(36), nullable=False)
+    field = Column(String(16), nullable=False)
+    # Truncated to keep the index within the InnoDB key length limit
+    value = Column(String(200), nullable=False)
+
+
+class InstanceSearchTrigram(BASE, NovaBase):
+    """Represents a trigram of the lowercased name of an instance, searched
+    by substring.
+    """
+
+    __tablename__ = 'instance_search_trigrams'
+    __table_args__ = (
+        Index('instance_search_trigrams_field_trigram_idx',
+              'field', 'trigram', 'instance_uuid'),
+        Index('instance_search_trigrams_instance_uuid_idx',
+              'instance_uuid'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    instance_uuid = Column(String(36), nullable=False)
+    field = Column(String(16), nullable=False)
+    trigram = Column(String(3), nullable=False)
+
+
+class InstanceSearchFixedIP(BASE, NovaBase):
+    """Represents a fixed IP address of the network info cache of an
+    instance, searched by prefix.
+    """
+
+    __tablename__ = 'instance_search_fixed_ips'
+    __table_args__ = (
+        Index('instance_search_fixed_ips_address_idx', 'address'),
+        Index('instance_search_fixed_ips_instance_uuid_idx',
+              'instance_uuid'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    instance_uuid = Column(String(36), nullable=False)
+    address = Column(String(39), nullable=False)
+    version = Column(Integer, nullable=False)
+
+
+class InstanceSearchIndexState(BASE, NovaBase):
+    """Represents whether the search index of the instances was completely
+    rebuilt, so that it can be used.
+    """
+
+    __tablename__ = 'instance_search_index_state'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    complete = Column(Boolean, nullable=False, default=False)
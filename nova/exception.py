@@ -967,6 +967,11 @@ class ComputeHostNotCreated(HostNotFound):
                 " before updating.")
 
 
+class ComputeNodeGenerationConflict(NovaException):
+    msg_fmt = _("Compute node %(compute_id)s has been updated since "
+                "generation %(generation)s.")
+
+
 class HostBinaryNotFound(NotFound):
     msg_fmt = _("Could not find binary %(binary)s on host %(host)s.")
 
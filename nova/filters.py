@@ -18,6 +18,7 @@ Filter support
 """
 
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from nova.i18n import _LI
 from nova import loadables
@@ -65,8 +66,21 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    def __init__(self, *args, **kwargs):
+        super(BaseFilterHandler, self).__init__(*args, **kwargs)
+        # Time spent in each filter and number of objects they filtered
+        self.stats = loadables.LoadableStats()
+
+    def _collect(self, objs, previous=None):
+        """Return the objects returned by a filter as a sequence.
+
+        :param previous: the sequence of objects passed to the filter, or
+                         None for the initial objects
+        """
+        return list(objs)
+
     def get_filtered_objects(self, filters, objs, filter_properties, index=0):
-        list_objs = list(objs)
+        list_objs = self._collect(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
         # Track the hosts as they are removed. The 'full_filter_results' list
         # contains the host/nodename info for every host that passes each
@@ -82,12 +96,17 @@ class BaseFilterHandler(loadables.BaseLoader):
             if filter_.run_filter_for_index(index):
                 cls_name = filter_.__class__.__name__
                 start_count = len(list_objs)
-                objs = filter_.filter_all(list_objs, filter_properties)
+                with timeutils.StopWatch() as timer:
+                    objs = filter_.filter_all(list_objs, filter_properties)
+                    if objs is not None:
+                        objs = self._collect(objs, list_objs)
                 if objs is None:
                     LOG.debug("Filter %s says to stop filtering", cls_name)
                     return
-                list_objs = list(objs)
+                list_objs = objs
                 end_count = len(list_objs)
+                self.stats.add(cls_name, timer.elapsed(), start_count,
+                               end_count)
                 part_filter_results.append(log_msg % {"cls_name": cls_name,
                         "start": start_count, "end": end_count})
                 if list_objs:
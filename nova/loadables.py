@@ -38,6 +38,7 @@ within them, MyLoader().get_all_classes() will return a list
 of such classes.
 """
 
+import copy
 import inspect
 import os
 import sys
@@ -47,6 +48,52 @@ from oslo_utils import importutils
 from nova import exception
 
 
+class LoadableStats(object):
+    """Cumulative statistics about the calls to some loadable objects.
+
+    For each object name, the number of calls, the total and maximum wall
+    time spent in them, and the total number of items they were given and
+    they returned are recorded.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    def add(self, name, elapsed, count_in, count_out):
+        """Record a call to an object."""
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'calls': 0,
+                                         'time': 0.0,
+                                         'max_time': 0.0,
+                                         'count_in': 0,
+                                         'count_out': 0}
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['count_in'] += count_in
+        stats['count_out'] += count_out
+
+    def merge(self, stats):
+        """Add statistics returned by get() on another LoadableStats."""
+        for name, other in stats.items():
+            own = self._stats.setdefault(name, {'calls': 0,
+                                                'time': 0.0,
+                                                'max_time': 0.0,
+                                                'count_in': 0,
+                                                'count_out': 0})
+            for key in ('calls', 'time', 'count_in', 'count_out'):
+                own[key] += other[key]
+            own['max_time'] = max(own['max_time'], other['max_time'])
+
+    def get(self):
+        """Return a copy of the statistics, keyed by object name."""
+        return copy.deepcopy(self._stats)
+
+    def reset(self):
+        self._stats = {}
+
+
 class BaseLoader(object):
     def __init__(self, loadable_cls_type):
         mod = sys.modules[self.__class__.__module__]
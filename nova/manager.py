@@ -51,15 +51,38 @@ This module provides Manager, a base class for managers.
 
 """
 
+import functools
+import hashlib
+
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_service import periodic_task
+from oslo_utils import timeutils
 
 from nova.db import base
+from nova.i18n import _LW
 from nova import rpc
 
+periodic_opts = [
+    cfg.FloatOpt('periodic_task_jitter',
+                 default=0.0,
+                 min=0.0,
+                 max=1.0,
+                 help='Fraction of the spacing of each periodic task by which '
+                      'its runs are shifted. The shift is derived from the '
+                      'host and the task names, so that the services of '
+                      'many hosts restarted at the same time do not run '
+                      'their periodic tasks in lockstep. 0 disables it.'),
+    cfg.BoolOpt('periodic_task_notifications',
+                default=False,
+                help='Whether to send a periodic_task.end notification '
+                     'with the run time of each periodic task and the '
+                     'number of times it overran its spacing or was '
+                     'deferred.'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(periodic_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
@@ -80,11 +103,98 @@ class Manager(base.Base, PeriodicTasks):
         self.notifier = rpc.get_notifier(self.service_name, self.host)
         self.additional_endpoints = []
         super(Manager, self).__init__(db_driver)
+        # Statistics of the periodic tasks, keyed by task name
+        self.periodic_task_stats = {}
+        self._periodic_tasks_deferred_since = {}
+        # NOTE: the periodic tasks run by oslo.service are looked up on the
+        # instance, so they can be wrapped to measure and defer them
+        self._periodic_tasks = [
+            (name, self._wrap_periodic_task(name, task))
+            for name, task in self._periodic_tasks]
+        if CONF.periodic_task_jitter:
+            for name, task in self._periodic_tasks:
+                if self._periodic_last_run[name] is not None:
+                    self._periodic_last_run[name] += (
+                        self._get_periodic_task_offset(name, task))
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
+    def _get_periodic_task_offset(self, task_name, task):
+        """Return by how many seconds the runs of a periodic task are
+        shifted on this host.
+        """
+        digest = hashlib.sha1(
+            ('%s.%s' % (self.host, task_name)).encode('utf-8')).hexdigest()
+        fraction = int(digest[:8], 16) / float(0xffffffff)
+        return task._periodic_spacing * CONF.periodic_task_jitter * fraction
+
+    def _defer_periodic_task(self, task_name):
+        """Return the number of seconds to defer a periodic task by, or
+        None if it must run now.
+
+        Child classes can override this method, for example to defer the
+        tasks which can wait while the service is busy.
+        """
+        return None
+
+    def _wrap_periodic_task(self, task_name, task):
+        stats = self.periodic_task_stats.setdefault(
+            task_name, {'runs': 0, 'time': 0.0, 'max_time': 0.0,
+                        'last_time': 0.0, 'overruns': 0, 'deferrals': 0})
+        spacing = task._periodic_spacing
+        # The tasks run immediately are only shifted after their first run
+        shift_after_run = [self._periodic_last_run[task_name] is None]
+
+        @functools.wraps(task)
+        def wrapped(manager, context):
+            defer_for = self._defer_periodic_task(task_name)
+            deferred_since = self._periodic_tasks_deferred_since.get(
+                task_name)
+            if (defer_for and (deferred_since is None or
+                    not timeutils.is_older_than(deferred_since, spacing))):
+                # The task is due again in defer_for seconds, but it is
+                # not deferred for longer than its spacing
+                self._periodic_last_run[task_name] -= max(
+                    spacing - defer_for, 0)
+                if deferred_since is None:
+                    self._periodic_tasks_deferred_since[task_name] = (
+                        timeutils.utcnow())
+                stats['deferrals'] += 1
+                LOG.debug("Deferring periodic task %(task)s by %(defer)d "
+                          "seconds", {'task': task_name, 'defer': defer_for})
+                return
+            self._periodic_tasks_deferred_since.pop(task_name, None)
+
+            with timeutils.StopWatch() as timer:
+                try:
+                    return task(manager, context)
+                finally:
+                    elapsed = timer.elapsed()
+                    stats['runs'] += 1
+                    stats['time'] += elapsed
+                    stats['last_time'] = elapsed
+                    stats['max_time'] = max(stats['max_time'], elapsed)
+                    if elapsed > spacing:
+                        stats['overruns'] += 1
+                        LOG.warning(_LW("Periodic task %(task)s ran for "
+                                        "%(elapsed).1f seconds, longer than "
+                                        "its %(spacing)d seconds spacing"),
+                                    {'task': task_name, 'elapsed': elapsed,
+                                     'spacing': spacing})
+                    if shift_after_run[0] and CONF.periodic_task_jitter:
+                        self._periodic_last_run[task_name] += (
+                            self._get_periodic_task_offset(task_name, task))
+                    shift_after_run[0] = False
+                    if CONF.periodic_task_notifications:
+                        payload = dict(stats, task=task_name, host=self.host,
+                                       spacing=spacing)
+                        self.notifier.info(context, 'periodic_task.end',
+                                           payload)
+
+        return wrapped
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
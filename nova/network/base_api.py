@@ -256,6 +256,30 @@ class NetworkAPI(base.Base):
         """Template method, so a subclass can implement for neutron/network."""
         raise NotImplementedError()
 
+    def get_instances_nw_info(self, context, instances):
+        """Refresh the network info of several instances.
+
+        :returns: a dict keyed by instance uuid of the network info of each
+                  instance, or of the exception raised while refreshing it,
+                  so that the other instances are refreshed anyway
+        """
+        prefetched = self._get_instances_nw_info_kwargs(context, instances)
+        results = {}
+        for instance in instances:
+            try:
+                results[instance.uuid] = self.get_instance_nw_info(
+                    context, instance, **prefetched.get(instance.uuid, {}))
+            except Exception as e:
+                results[instance.uuid] = e
+        return results
+
+    def _get_instances_nw_info_kwargs(self, context, instances):
+        """Template method, so a subclass can retrieve at once what
+        _get_instance_nw_info() needs for several instances, returning its
+        keyword arguments keyed by instance uuid.
+        """
+        return {}
+
     def create_pci_requests_for_sriov_ports(self, context,
                                             pci_requests,
                                             requested_networks):
@@ -151,6 +151,11 @@ soft_external_network_attach_authorize = extensions.soft_core_authorizer(
 _SESSION = None
 _ADMIN_AUTH = None
 
+# NOTE: The search criteria are part of the URL, whose length is limited by
+# Neutron and by the proxies in front of it, so a search by many IDs is
+# split in requests of at most that many IDs.
+MAX_SEARCH_IDS = 100
+
 
 def list_opts():
     list = copy.deepcopy(_neutron_options)
@@ -916,7 +921,8 @@ class API(base_api.NetworkAPI):
 
     def _get_instance_nw_info(self, context, instance, networks=None,
                               port_ids=None, admin_client=None,
-                              preexisting_port_ids=None, **kwargs):
+                              preexisting_port_ids=None, neutron_ports=None,
+                              neutron_resources=None, **kwargs):
         # NOTE(danms): This is an inner method intended to be called
         # by other code that updates instance nwinfo. It *must* be
         # called with the refresh_cache-%(instance_uuid) lock held!
@@ -927,11 +933,103 @@ class API(base_api.NetworkAPI):
         compute_utils.refresh_info_cache_for_instance(context, instance)
         nw_info = self._build_network_info_model(context, instance, networks,
                                                  port_ids, admin_client,
-                                                 preexisting_port_ids)
+                                                 preexisting_port_ids,
+                                                 neutron_ports,
+                                                 neutron_resources)
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def _get_instances_nw_info_kwargs(self, context, instances):
+        """Retrieve what the network info of several instances is built
+        from, i.e. their ports and the networks, subnets, DHCP ports and
+        floating IPs of these ports, with a few requests for all of them.
+        """
+        if not instances:
+            return {}
+        client = get_client(context, admin=True)
+        neutron = get_client(context)
+        ports = {instance.uuid: [] for instance in instances}
+        projects = {instance.uuid: instance.project_id
+                    for instance in instances}
+        for port in _list_by_ids(client.list_ports, 'ports', 'device_id',
+                                 ports):
+            uuid = port['device_id']
+            # Only the ports of the project of the instance are used, as
+            # when they are listed for a single instance
+            if uuid in ports and port.get('tenant_id') == projects[uuid]:
+                ports[uuid].append(port)
+        all_ports = [port for instance_ports in ports.values()
+                     for port in instance_ports]
+
+        # The networks of the info caches, or all the networks available to
+        # the projects of the instances without any
+        net_ids = set()
+        bare_projects = set()
+        for instance in instances:
+            ifaces = compute_utils.get_nw_info_for_instance(instance)
+            net_ids.update(iface['network']['id'] for iface in ifaces)
+            if not ifaces:
+                bare_projects.add(instance.project_id)
+        networks = {net['id']: net
+                    for net in _list_by_ids(neutron.list_networks,
+                                            'networks', 'id', net_ids)}
+        project_networks = {
+            project_id: self._get_available_networks(context, project_id,
+                                                     neutron=neutron)
+            for project_id in bare_projects}
+
+        subnet_ids = set(fixed_ip['subnet_id'] for port in all_ports
+                         for fixed_ip in port.get('fixed_ips', []))
+        subnets = {subnet['id']: subnet
+                   for subnet in _list_by_ids(neutron.list_subnets,
+                                              'subnets', 'id', subnet_ids)}
+        dhcp_ports = {}
+        for port in _list_by_ids(
+                neutron.list_ports, 'ports', 'network_id',
+                set(subnet['network_id'] for subnet in subnets.values()),
+                device_owner='network:dhcp'):
+            dhcp_ports.setdefault(port['network_id'], []).append(port)
+
+        try:
+            fips = _list_by_ids(client.list_floatingips, 'floatingips',
+                                'port_id', [port['id'] for port in all_ports])
+        # If a neutron plugin does not implement the L3 API a 404 from
+        # list_floatingips will be raised.
+        except neutron_client_exc.NotFound:
+            fips = []
+        floating_ips = {}
+        for fip in fips:
+            floating_ips.setdefault(fip['port_id'], []).append(fip)
+
+        neutron_resources = {'network_ids': net_ids,
+                             'networks': networks,
+                             'project_networks': project_networks,
+                             'subnets': subnets,
+                             'dhcp_ports': dhcp_ports,
+                             'floating_ips': floating_ips}
+        return {uuid: {'neutron_ports': instance_ports,
+                       'admin_client': client,
+                       'neutron_resources': neutron_resources}
+                for uuid, instance_ports in ports.items()}
+
+    @staticmethod
+    def _get_prefetched_networks(project_id, net_ids, neutron_resources):
+        """Return the networks _get_available_networks() would return, out
+        of the ones retrieved by _get_instances_nw_info_kwargs(), or None if
+        some of them were not retrieved.
+        """
+        if not net_ids:
+            return neutron_resources['project_networks'].get(project_id)
+        if not neutron_resources['network_ids'].issuperset(net_ids):
+            return None
+        networks = []
+        for net_id in net_ids:
+            net = neutron_resources['networks'].get(net_id)
+            if net is not None and net not in networks:
+                networks.append(net)
+        return networks
+
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
-                                      port_ids=None):
+                                      port_ids=None, neutron_resources=None):
         """Return an instance's complete list of port_ids and networks."""
 
         if ((networks is None and port_ids is not None) or
@@ -948,9 +1046,13 @@ class API(base_api.NetworkAPI):
             net_ids = [iface['network']['id'] for iface in ifaces]
 
         if networks is None:
-            networks = self._get_available_networks(context,
-                                                    instance.project_id,
-                                                    net_ids)
+            if neutron_resources is not None:
+                networks = self._get_prefetched_networks(
+                    instance.project_id, net_ids, neutron_resources)
+            if networks is None:
+                networks = self._get_available_networks(context,
+                                                        instance.project_id,
+                                                        net_ids)
         # an interface was added/removed from instance.
         else:
             # Since networks does not contain the existing networks on the
@@ -1552,12 +1654,18 @@ class API(base_api.NetworkAPI):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, client, port, neutron_resources=None):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
+            if neutron_resources is None:
+                floats = self._get_floating_ips_by_fixed_and_port(
+                    client, fixed_ip['ip_address'], port['id'])
+            else:
+                floats = [
+                    fip for fip in
+                    neutron_resources['floating_ips'].get(port['id'], [])
+                    if fip['fixed_ip_address'] == fixed_ip['ip_address']]
             for ip in floats:
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
@@ -1565,8 +1673,10 @@ class API(base_api.NetworkAPI):
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, context, port, network_IPs,
+                             neutron_resources=None):
+        subnets = self._get_subnets_from_port(context, port,
+                                              neutron_resources)
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -1647,7 +1757,9 @@ class API(base_api.NetworkAPI):
 
     def _build_network_info_model(self, context, instance, networks=None,
                                   port_ids=None, admin_client=None,
-                                  preexisting_port_ids=None):
+                                  preexisting_port_ids=None,
+                                  neutron_ports=None,
+                                  neutron_resources=None):
         """Return list of ordered VIFs attached to instance.
 
         :param context - request context.
@@ -1664,21 +1776,29 @@ class API(base_api.NetworkAPI):
         allocate and there shouldn't be deleted when an instance is
         de-allocated. Supplied list will be added to the cached list of
         preexisting port IDs for this instance.
+        :param neutron_ports - List of the ports of the instance, if already
+                               retrieved from Neutron.
+        :param neutron_resources - The networks, subnets, DHCP ports and
+                                   floating IPs of the ports, if already
+                                   retrieved from Neutron, see
+                                   _get_instances_nw_info_kwargs().
         """
 
-        search_opts = {'tenant_id': instance.project_id,
-                       'device_id': instance.uuid, }
         if admin_client is None:
             client = get_client(context, admin=True)
         else:
             client = admin_client
 
-        data = client.list_ports(**search_opts)
+        if neutron_ports is None:
+            search_opts = {'tenant_id': instance.project_id,
+                           'device_id': instance.uuid, }
+            data = client.list_ports(**search_opts)
+            neutron_ports = data.get('ports', [])
 
-        current_neutron_ports = data.get('ports', [])
+        current_neutron_ports = neutron_ports
         nw_info_refresh = networks is None and port_ids is None
         networks, port_ids = self._gather_port_ids_and_networks(
-                context, instance, networks, port_ids)
+                context, instance, networks, port_ids, neutron_resources)
         nw_info = network_model.NetworkInfo()
 
         if preexisting_port_ids is None:
@@ -1705,10 +1825,12 @@ class API(base_api.NetworkAPI):
                     vif_active = True
 
                 network_IPs = self._nw_info_get_ips(client,
-                                                    current_neutron_port)
+                                                    current_neutron_port,
+                                                    neutron_resources)
                 subnets = self._nw_info_get_subnets(context,
                                                     current_neutron_port,
-                                                    network_IPs)
+                                                    network_IPs,
+                                                    neutron_resources)
 
                 devname = "tap" + current_neutron_port['id']
                 devname = devname[:network_model.NIC_NAME_LEN]
@@ -1741,7 +1863,7 @@ class API(base_api.NetworkAPI):
 
         return nw_info
 
-    def _get_subnets_from_port(self, context, port):
+    def _get_subnets_from_port(self, context, port, neutron_resources=None):
         """Return the subnets for a given port."""
 
         fixed_ips = port['fixed_ips']
@@ -1752,9 +1874,16 @@ class API(base_api.NetworkAPI):
         # related to the port. To avoid this, the method returns here.
         if not fixed_ips:
             return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
+        if neutron_resources is None:
+            search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
+            data = get_client(context).list_subnets(**search_opts)
+            ipam_subnets = data.get('subnets', [])
+        else:
+            ipam_subnets = []
+            for ip in fixed_ips:
+                subnet = neutron_resources['subnets'].get(ip['subnet_id'])
+                if subnet is not None and subnet not in ipam_subnets:
+                    ipam_subnets.append(subnet)
         subnets = []
 
         for subnet in ipam_subnets:
@@ -1765,10 +1894,14 @@ class API(base_api.NetworkAPI):
             }
 
             # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
+            if neutron_resources is None:
+                search_opts = {'network_id': subnet['network_id'],
+                               'device_owner': 'network:dhcp'}
+                data = get_client(context).list_ports(**search_opts)
+                dhcp_ports = data.get('ports', [])
+            else:
+                dhcp_ports = neutron_resources['dhcp_ports'].get(
+                    subnet['network_id'], [])
             for p in dhcp_ports:
                 for ip_pair in p['fixed_ips']:
                     if ip_pair['subnet_id'] == subnet['id']:
@@ -1876,6 +2009,18 @@ class API(base_api.NetworkAPI):
                                   vif['id'], instance=instance)
 
 
+def _list_by_ids(list_func, resources, key, ids, **search_opts):
+    """Return the resources whose key attribute is one of the given ids,
+    listed with as many requests as needed to keep their URLs short enough.
+    """
+    ids = sorted(set(ids))
+    found = []
+    for i in range(0, len(ids), MAX_SEARCH_IDS):
+        search_opts[key] = ids[i:i + MAX_SEARCH_IDS]
+        found.extend(list_func(**search_opts).get(resources, []))
+    return found
+
+
 def _ensure_requested_network_ordering(accessor, unordered, preferred):
     """Sort a list with respect to the preferred network ordering."""
     if preferred:
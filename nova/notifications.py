@@ -285,9 +285,12 @@ def audit_period_bounds(current_period=False):
 
 
 def bandwidth_usage(instance_ref, audit_start,
-        ignore_missing_network_data=True):
+        ignore_missing_network_data=True, bw_usages=None):
     """Get bandwidth usage information for the instance for the
     specified audit period.
+
+    :param bw_usages: BandwidthUsage objects of the instance for the audit
+        period if already loaded, otherwise they are loaded.
     """
     admin_context = nova.context.get_admin_context(read_deleted='yes')
 
@@ -323,8 +326,10 @@ def bandwidth_usage(instance_ref, audit_start,
     macs = [vif['address'] for vif in nw_info]
     uuids = [instance_ref["uuid"]]
 
-    bw_usages = objects.BandwidthUsageList.get_by_uuids(admin_context, uuids,
-                                                        audit_start)
+    if bw_usages is None:
+        bw_usages = objects.BandwidthUsageList.get_by_uuids(admin_context,
+                                                            uuids,
+                                                            audit_start)
     bw = {}
 
     for b in bw_usages:
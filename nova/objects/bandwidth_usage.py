@@ -74,7 +74,8 @@ class BandwidthUsageList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Add use_slave to get_by_uuids
     # Version 1.2: BandwidthUsage <= version 1.2
-    VERSION = '1.2'
+    # Version 1.3: Add create_many
+    VERSION = '1.3'
     fields = {
         'objects': fields.ListOfObjectsField('BandwidthUsage'),
     }
@@ -86,3 +87,17 @@ class BandwidthUsageList(base.ObjectListBase, base.NovaObject):
                                                 start_period=start_period,
                                                 use_slave=use_slave)
         return base.obj_make_list(context, cls(), BandwidthUsage, db_bw_usages)
+
+    @base.serialize_args
+    @base.remotable_classmethod
+    def create_many(cls, context, bw_usages, start_period=None,
+                    last_refreshed=None, update_cells=True):
+        """Create or update several bandwidth usages at once.
+
+        :param bw_usages: list of dicts with the uuid, mac, bw_in, bw_out,
+                          last_ctr_in and last_ctr_out of the usages
+        """
+        db_bw_usages = db.bw_usage_update_many(
+            context, start_period, bw_usages, last_refreshed=last_refreshed,
+            update_cells=update_cells)
+        return base.obj_make_list(context, cls(), BandwidthUsage, db_bw_usages)
@@ -14,6 +14,7 @@
 
 from oslo_config import cfg
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 
 from nova import db
@@ -48,7 +49,8 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
     # Version 1.12: HVSpec version 1.1
     # Version 1.13: Changed service_id field to be nullable
     # Version 1.14: Added cpu_allocation_ratio and ram_allocation_ratio
-    VERSION = '1.14'
+    # Version 1.15: Added generation and claim()
+    VERSION = '1.15'
 
     fields = {
         'id': fields.IntegerField(read_only=True),
@@ -82,11 +84,14 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
                                                nullable=True),
         'cpu_allocation_ratio': fields.FloatField(),
         'ram_allocation_ratio': fields.FloatField(),
+        'generation': fields.IntegerField(),
         }
 
     def obj_make_compatible(self, primitive, target_version):
         super(ComputeNode, self).obj_make_compatible(primitive, target_version)
         target_version = utils.convert_version_to_tuple(target_version)
+        if target_version < (1, 15) and 'generation' in primitive:
+            del primitive['generation']
         if target_version < (1, 14):
             if 'ram_allocation_ratio' in primitive:
                 del primitive['ram_allocation_ratio']
@@ -151,6 +156,7 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
             'supported_hv_specs',
             'host',
             'pci_device_pools',
+            'generation',
             ])
         fields = set(compute.fields) - special_cases
         for key in fields:
@@ -196,6 +202,7 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
 
         pci_stats = db_compute.get('pci_stats')
         compute.pci_device_pools = pci_device_pool.from_pci_stats(pci_stats)
+        compute.generation = db_compute.get('generation') or 0
         compute._context = context
 
         # Make sure that we correctly set the host field depending on either
@@ -313,6 +320,19 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
         db_compute = db.compute_node_update(self._context, self.id, updates)
         self._from_db_object(self._context, self, db_compute)
 
+    @base.remotable
+    def claim(self, memory_mb, disk_gb, vcpus):
+        """Consume resources if the compute node is still at our generation.
+
+        Raises ComputeNodeGenerationConflict if the compute node was updated
+        since it was loaded, e.g. by another scheduler or by its compute
+        service.
+        """
+        db_compute = db.compute_node_claim(self._context, self.id,
+                                           self.generation, memory_mb,
+                                           disk_gb, vcpus)
+        self._from_db_object(self._context, self, db_compute)
+
     @base.remotable
     def destroy(self):
         db.compute_node_delete(self._context, self.id)
@@ -359,7 +379,9 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
     # Version 1.12 ComputeNode version 1.12
     # Version 1.13 ComputeNode version 1.13
     # Version 1.14 ComputeNode version 1.14
-    VERSION = '1.14'
+    # Version 1.15 Added get_all_changed_since()
+    # Version 1.16 ComputeNode version 1.15
+    VERSION = '1.16'
     fields = {
         'objects': fields.ListOfObjectsField('ComputeNode'),
         }
@@ -370,6 +392,28 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
         return base.obj_make_list(context, cls(context), objects.ComputeNode,
                                   db_computes)
 
+    @base.remotable_classmethod
+    def _get_all_changed_since(cls, context, since):
+        # The timestamp string needs to be converted back to a
+        # timezone-aware datetime object for the DB API call.
+        since = timeutils.parse_isotime(since)
+        db_computes = db.compute_node_get_all_changed_since(context, since)
+        return base.obj_make_list(context, cls(context), objects.ComputeNode,
+                                  db_computes)
+
+    @classmethod
+    def get_all_changed_since(cls, context, since):
+        """Get the compute nodes which changed since a point in time.
+
+        :param context: nova request context
+        :param since: datetime after which the compute nodes were created,
+                      updated or deleted
+        :returns: ComputeNodeList, including the deleted compute nodes
+        """
+        # We have to convert the datetime object to a string
+        # primitive for the remote call.
+        return cls._get_all_changed_since(context, timeutils.isotime(since))
+
     @base.remotable_classmethod
     def get_by_hypervisor(cls, context, hypervisor_match):
         db_computes = db.compute_node_search_by_hypervisor(context,
@@ -13,6 +13,7 @@
 #    under the License.
 
 import contextlib
+import copy
 
 from oslo_config import cfg
 from oslo_db import exception as db_exc
@@ -189,6 +190,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
 
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
+        # Whether only some of the columns were loaded, see _load_columns()
+        self._projected = False
         self._reset_metadata_tracking()
 
     def _reset_metadata_tracking(self, fields=None):
@@ -262,18 +265,25 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         self.obj_reset_changes(['flavor', 'old_flavor', 'new_flavor'])
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
-        Converts a database entity to a formal object.
+        Converts a database entity to a formal object. If columns is given,
+        the entity was only loaded with these columns and the other fields
+        are lazy-loaded.
         """
         instance._context = context
+        if columns is not None:
+            instance._projected = True
         if expected_attrs is None:
             expected_attrs = []
         # Most of the field names match right now, so be quick
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in db_inst:
+                continue
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -819,8 +829,26 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             objects.MigrationContext._destroy(self._context, self.uuid)
             self.migration_context = None
 
+    def _load_columns(self):
+        instance = self.__class__.get_by_uuid(self._context,
+                                              uuid=self.uuid,
+                                              expected_attrs=[])
+        loaded = []
+        for field in self.fields:
+            if (field not in INSTANCE_OPTIONAL_ATTRS and
+                    not self.obj_attr_is_set(field)):
+                self[field] = instance[field]
+                loaded.append(field)
+        self.obj_reset_changes(loaded)
+        self._projected = False
+
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        # NOTE: The instances loaded from the database with only some of
+        # their columns, see InstanceList.get_by_filters(), load the other
+        # ones on demand.
+        load_columns = (self._projected and attrname in self.fields and
+                        attrname not in INSTANCE_OPTIONAL_ATTRS)
+        if attrname not in INSTANCE_OPTIONAL_ATTRS and not load_columns:
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -837,7 +865,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
 
         # NOTE(danms): We handle some fields differently here so that we
         # can be more efficient
-        if attrname == 'fault':
+        if load_columns:
+            self._load_columns()
+        elif attrname == 'fault':
             self._load_fault()
         elif attrname == 'numa_topology':
             self._load_numa_topology()
@@ -947,7 +977,22 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             self._normalize_cell_name()
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _columns_kwargs(columns):
+    """Return the arguments of the database calls loading only the given
+    columns of the instances.
+    """
+    if columns is None:
+        return {}
+    bad = set(columns) & set(INSTANCE_OPTIONAL_ATTRS)
+    if bad:
+        raise exception.ObjectActionError(
+            action='load_columns',
+            reason='%s are not columns' % ', '.join(sorted(bad)))
+    return {'columns': list(columns)}
+
+
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -966,7 +1011,7 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     for db_inst in db_inst_list:
         inst_obj = inst_cls._from_db_object(
                 context, inst_cls(context), db_inst,
-                expected_attrs=expected_attrs)
+                expected_attrs=expected_attrs, columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
@@ -977,7 +1022,8 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
 @base.NovaObjectRegistry.register
 class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 2.0: Initial Version
-    VERSION = '2.0'
+    # Version 2.1: Add columns to get_by_filters() and get_by_host()
+    VERSION = '2.1'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -987,27 +1033,66 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
                        marker=None, expected_attrs=None, use_slave=False,
-                       sort_keys=None, sort_dirs=None):
+                       sort_keys=None, sort_dirs=None, columns=None):
+        """Return the instances matching the filters.
+
+        :param columns: list of the fields of the instances to load from
+                        the database along with id and uuid, the other ones
+                        being lazy-loaded, or None to load all of them
+        """
+        kwargs = _columns_kwargs(columns)
         if sort_keys or sort_dirs:
             db_inst_list = db.instance_get_all_by_filters_sort(
                 context, filters, limit=limit, marker=marker,
                 columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs)
+                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs,
+                **kwargs)
         else:
             db_inst_list = db.instance_get_all_by_filters(
                 context, filters, sort_key, sort_dir, limit=limit,
                 marker=marker, columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave)
+                use_slave=use_slave, **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
+
+    @classmethod
+    def iter_by_filters(cls, context, filters, batch_size=1000,
+                        sort_dir='asc', expected_attrs=None, use_slave=False,
+                        columns=None):
+        """Yield the instances matching the filters, ordered by id.
+
+        Unlike get_by_filters(), the instances are loaded by batches of
+        batch_size instances, each of them past the id of the last instance
+        of the previous one, so that only one batch is held in memory.
+        """
+        # NOTE: The database always sorts by created_at after the given sort
+        # keys, so the keyset marker needs its value too.
+        if columns is not None and 'created_at' not in columns:
+            columns = list(columns) + ['created_at']
+        marker = None
+        while True:
+            instances = cls.get_by_filters(
+                context, filters, limit=batch_size, marker=marker,
+                expected_attrs=copy.copy(expected_attrs),
+                use_slave=use_slave, sort_keys=['id', 'created_at'],
+                sort_dirs=[sort_dir, sort_dir], columns=columns)
+            for instance in instances:
+                yield instance
+            if len(instances) < batch_size:
+                return
+            last = instances[-1]
+            marker = {'id': last.id,
+                      'created_at': timeutils.normalize_time(
+                          last.created_at).isoformat()}
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False,
+                    columns=None):
         db_inst_list = db.instance_get_all_by_host(
             context, host, columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave, **_columns_kwargs(columns))
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
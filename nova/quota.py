@@ -18,10 +18,12 @@
 
 import datetime
 
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import importutils
 from oslo_utils import timeutils
+from oslo_utils import uuidutils
 import six
 
 from nova import db
@@ -96,6 +98,25 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
+    cfg.IntOpt('quota_limits_cache_ttl',
+               default=60,
+               help='Number of seconds the quota limits of a project and '
+                    'user are cached by the CountingQuotaDriver, so that '
+                    'quota changes may take that long to be enforced'),
+    cfg.IntOpt('quota_usage_cache_ttl',
+               default=2,
+               help='Number of seconds the resources of a project, and of '
+                    'a user, counted by the CountingQuotaDriver are cached. '
+                    'Set to 0 to count them for each reservation.'),
+    cfg.IntOpt('quota_reservation_hold_time',
+               default=60,
+               help='Number of seconds the reservations made by a service '
+                    'are added to the resources counted by the '
+                    'CountingQuotaDriver, unless the service commits or '
+                    'rolls them back earlier. The reservations committed or '
+                    'rolled back by other services, e.g. the ones of a '
+                    'resize, are held that long, which should cover the '
+                    'time until the compute host records the migration.'),
     ]
 
 CONF = cfg.CONF
@@ -690,6 +711,257 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class CountingQuotaDriver(DbQuotaDriver):
+    """Driver checking the reservable resources against counts of the live
+    resources, e.g. the instances of a project, rather than against the
+    quota usages and reservations tables.
+
+    The reservations never lock nor write any database row. Instead, the
+    quota limits and the counts of the resources are cached by the service
+    for quota_limits_cache_ttl and quota_usage_cache_ttl seconds, and the
+    positive deltas of the reservations made by the service are added to
+    the counts until they are committed, rolled back or held for
+    quota_reservation_hold_time seconds. The instances being resized are
+    counted with their new flavor.
+
+    The checks are not serialized between services though: a request
+    handled by another service does not see these reservations, only the
+    resources once they are created, e.g. the instances of a boot or the
+    migration of a resize. The requests handled concurrently by several
+    services may thus exceed the quotas.
+    """
+
+    def __init__(self):
+        # (project_id, user_id, quota_class): (cached at, quotas, user quotas)
+        self._limits = {}
+        # (project_id, user_id or None): {'cached_at': ..., 'counts': ...}
+        self._usages = {}
+        # reservation uuid: (reserved at, project_id, user_id, deltas)
+        self._reservations = {}
+
+    def _get_limits(self, context, resources, project_id, user_id):
+        key = (project_id, user_id, context.quota_class)
+        cached = self._limits.get(key)
+        if cached and not timeutils.is_older_than(
+                cached[0], CONF.quota_limits_cache_ttl):
+            return cached[1], cached[2]
+
+        reservable = {k: v for k, v in resources.items()
+                      if hasattr(v, 'sync')}
+        project_quotas = db.quota_get_all_by_project(context, project_id)
+        quotas = self._get_quotas(context, reservable, reservable.keys(),
+                                  has_sync=True, project_id=project_id,
+                                  project_quotas=project_quotas)
+        user_quotas = self._get_quotas(context, reservable, reservable.keys(),
+                                       has_sync=True, project_id=project_id,
+                                       user_id=user_id,
+                                       project_quotas=project_quotas)
+        self._limits[key] = (timeutils.utcnow(), quotas, user_quotas)
+        return quotas, user_quotas
+
+    def _usages_expired(self, key):
+        entry = self._usages.get(key)
+        return entry is None or timeutils.is_older_than(
+            entry['cached_at'], CONF.quota_usage_cache_ttl)
+
+    def _get_counts(self, context, resources, project_id, user_id):
+        key = (project_id, user_id)
+        entry = self._usages.get(key)
+        if self._usages_expired(key):
+            with lockutils.lock('quota-usages-%s-%s' % key):
+                # NOTE: Another greenthread may have counted the resources
+                # while this one waited for the lock.
+                entry = self._usages.get(key)
+                if self._usages_expired(key):
+                    syncs = set(resource.sync
+                                for resource in resources.values()
+                                if hasattr(resource, 'sync'))
+                    entry = {'cached_at': timeutils.utcnow(),
+                             'counts': db.quota_usage_count(
+                                 context, project_id, syncs,
+                                 user_id=user_id)}
+                    self._usages[key] = entry
+        return entry['counts']
+
+    def _get_reserved(self, project_id, user_id):
+        reserved = {}
+        for (_reserved_at, res_project_id, res_user_id,
+                deltas) in self._reservations.values():
+            if res_project_id != project_id or user_id not in (None,
+                                                               res_user_id):
+                continue
+            for res, delta in deltas.items():
+                reserved[res] = reserved.get(res, 0) + delta
+        return reserved
+
+    def _expire_cache(self):
+        for key in list(self._usages):
+            if self._usages_expired(key):
+                self._usages.pop(key, None)
+        for key, cached in list(self._limits.items()):
+            if timeutils.is_older_than(cached[0],
+                                       CONF.quota_limits_cache_ttl):
+                del self._limits[key]
+        for uuid, held in list(self._reservations.items()):
+            if timeutils.is_older_than(held[0],
+                                       CONF.quota_reservation_hold_time):
+                del self._reservations[uuid]
+
+    @staticmethod
+    def _add_usages(quotas, counts, reserved):
+        for resource, quota in quotas.items():
+            quota.update(in_use=counts.get(resource, 0),
+                         reserved=reserved.get(resource, 0))
+
+    def get_user_quotas(self, context, resources, project_id, user_id,
+                        quota_class=None, defaults=True,
+                        usages=True, project_quotas=None,
+                        user_quotas=None):
+        """Given a list of resources, retrieve the quotas for the given
+        user and project, the usages being the counts of the resources.
+
+        See DbQuotaDriver.get_user_quotas().
+        """
+        quotas = super(CountingQuotaDriver, self).get_user_quotas(
+            context, resources, project_id, user_id, quota_class=quota_class,
+            defaults=defaults, usages=False, project_quotas=project_quotas,
+            user_quotas=user_quotas)
+        if usages:
+            self._expire_cache()
+            counts = self._get_counts(context, resources, project_id,
+                                      user_id)
+            self._add_usages(quotas, counts,
+                             self._get_reserved(project_id, user_id))
+        return quotas
+
+    def get_project_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True,
+                           usages=True, remains=False, project_quotas=None):
+        """Given a list of resources, retrieve the quotas for the given
+        project, the usages being the counts of the resources.
+
+        See DbQuotaDriver.get_project_quotas().
+        """
+        quotas = super(CountingQuotaDriver, self).get_project_quotas(
+            context, resources, project_id, quota_class=quota_class,
+            defaults=defaults, usages=False, remains=remains,
+            project_quotas=project_quotas)
+        if usages:
+            self._expire_cache()
+            counts = self._get_counts(context, resources, project_id, None)
+            self._add_usages(quotas, counts,
+                             self._get_reserved(project_id, None))
+        return quotas
+
+    def reserve(self, context, resources, deltas, expire=None,
+                project_id=None, user_id=None):
+        """Check quotas against the counts of the resources.
+
+        Unlike DbQuotaDriver.reserve(), the returned reservation UUIDs
+        only exist in this service, where their positive deltas are added
+        to the counts until they are committed, rolled back or held for
+        quota_reservation_hold_time seconds, and the expire argument is
+        ignored. The negative deltas are never added, the resources are
+        only counted out once they are gone.
+
+        See DbQuotaDriver.reserve() for the arguments.
+        """
+        _valid_method_call_check_resources(deltas, 'reserve')
+
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        self._expire_cache()
+        quotas, user_quotas = self._get_limits(context, resources,
+                                               project_id, user_id)
+        project_counts = self._get_counts(context, resources, project_id,
+                                          None)
+        user_counts = self._get_counts(context, resources, project_id,
+                                       user_id)
+        # NOTE: Nothing yields from here on, so that the reservations made
+        # concurrently by the other greenthreads are all accounted for.
+        project_reserved = self._get_reserved(project_id, None)
+        user_reserved = self._get_reserved(project_id, user_id)
+
+        def _used(counts, reserved, res):
+            return counts.get(res, 0) + reserved.get(res, 0)
+
+        # NOTE: Only the positive deltas are checked, so that a project
+        # over quota can still reduce its usage.
+        overs = [res for res, delta in deltas.items()
+                 if delta > 0 and
+                 (0 <= quotas[res] <
+                  _used(project_counts, project_reserved, res) + delta or
+                  0 <= user_quotas[res] <
+                  _used(user_counts, user_reserved, res) + delta)]
+        if overs:
+            usages = {res: dict(in_use=count,
+                                reserved=user_reserved.get(res, 0))
+                      for res, count in user_counts.items()}
+            LOG.debug('Raise OverQuota exception because: '
+                      'project_quotas: %(project_quotas)s, '
+                      'user_quotas: %(user_quotas)s, deltas: %(deltas)s, '
+                      'overs: %(overs)s, project_counts: %(project_counts)s, '
+                      'user_counts: %(user_counts)s',
+                      {'project_quotas': quotas, 'user_quotas': user_quotas,
+                       'deltas': deltas, 'overs': overs,
+                       'project_counts': project_counts,
+                       'user_counts': user_counts})
+            raise exception.OverQuota(overs=sorted(overs),
+                                      quotas=user_quotas, usages=usages)
+
+        reservation = uuidutils.generate_uuid()
+        held = {res: delta for res, delta in deltas.items() if delta > 0}
+        if held:
+            self._reservations[reservation] = (timeutils.utcnow(), project_id,
+                                               user_id, held)
+        return [reservation]
+
+    def _pop_reservations(self, reservations):
+        popped = []
+        for reservation in reservations:
+            held = self._reservations.pop(reservation, None)
+            if held is None:
+                LOG.debug('Reservation %s is not held by this service, it '
+                          'was made by another service or it expired',
+                          reservation)
+            else:
+                popped.append(held)
+        return popped
+
+    def commit(self, context, reservations, project_id=None, user_id=None):
+        """Commit reservations.
+
+        The reserved resources exist once the reservations are committed,
+        so that they are counted again.
+        """
+        for (_reserved_at, res_project_id, res_user_id,
+                _deltas) in self._pop_reservations(reservations):
+            for key in ((res_project_id, None),
+                        (res_project_id, res_user_id)):
+                # NOTE: The lock waits for a count in progress, which could
+                # miss the resources, to be cached before it is forgotten.
+                with lockutils.lock('quota-usages-%s-%s' % key):
+                    self._usages.pop(key, None)
+
+    def rollback(self, context, reservations, project_id=None, user_id=None):
+        """Roll back reservations, removing them from the counts."""
+        self._pop_reservations(reservations)
+
+    def usage_reset(self, context, resources):
+        """Forget the cached counts of the resources of the user, and of
+        its project, so that they are counted again.
+        """
+        self._usages.pop((context.project_id, None), None)
+        self._usages.pop((context.project_id, context.user_id), None)
+
+    def expire(self, context):
+        """Expire reservations, which are not stored in the database."""
+        self._expire_cache()
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
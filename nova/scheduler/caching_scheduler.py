@@ -62,8 +62,11 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
         # fetch the list of hosts.
         self.all_host_states = self._get_up_hosts(elevated)
 
-    def _get_all_host_states(self, context):
-        """Called from the filter scheduler, in a template pattern."""
+    def _get_all_host_states(self, context, spec_obj=None):
+        """Called from the filter scheduler, in a template pattern.
+
+        All the hosts are cached, so the request is not used to prune them.
+        """
         if self.all_host_states is None:
             # NOTE(johngarbutt) We only get here when we a scheduler request
             # comes in before the first run of the periodic task.
@@ -19,6 +19,8 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
+import itertools
 import random
 
 from oslo_config import cfg
@@ -46,7 +48,24 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.IntOpt('scheduler_claim_attempts',
+               default=3,
+               help='When scheduler_optimistic_claims is enabled, maximum '
+                    'number of times a host is chosen again for an instance '
+                    'because another scheduler claimed the previously chosen '
+                    'one first. After that, no host is selected for the '
+                    'instance.'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='For requests of several instances, filter and weigh '
+                     'all the hosts only once, then only filter and weigh '
+                     'again the host chosen for each instance, instead of '
+                     'all the hosts for every instance. The weights of the '
+                     'other hosts are not normalized again, so the result '
+                     'can slightly differ from the default behaviour. '
+                     'Requests for a server group are always scheduled '
+                     'instance by instance.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -123,7 +142,7 @@ class FilterScheduler(driver.Scheduler):
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
-        hosts = self._get_all_host_states(elevated)
+        hosts = self._get_all_host_states(elevated, spec_obj)
 
         selected_hosts = []
         num_instances = spec_obj.num_instances
@@ -140,29 +159,49 @@ class FilterScheduler(driver.Scheduler):
         # filters
         filter_properties.update({'context': context,
                                   'config_options': config_options})
+        # NOTE: the hosts passing the group filters depend on the hosts
+        # already chosen, so they need to be filtered again for each instance
+        if (CONF.scheduler_batch_placement and num_instances > 1 and
+                filter_properties.get('group_updated') is not True):
+            return self._schedule_batch(elevated, spec_obj, hosts,
+                                        filter_properties)
         for num in range(num_instances):
-            # Filter local hosts based on requirements ...
-            hosts = self.host_manager.get_filtered_hosts(hosts,
-                    filter_properties, index=num)
-            if not hosts:
-                # Can't get any more locally.
-                break
+            claim_attempts = max(1, CONF.scheduler_claim_attempts)
+            chosen_host = None
+            for attempt in range(claim_attempts):
+                # Filter local hosts based on requirements ...
+                hosts = self.host_manager.get_filtered_hosts(hosts,
+                        filter_properties, index=num)
+                if not hosts:
+                    break
 
-            LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+                LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
 
-            weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                        filter_properties)
 
-            LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+                LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
+                scheduler_host_subset_size = CONF.scheduler_host_subset_size
+                if scheduler_host_subset_size > len(weighed_hosts):
+                    scheduler_host_subset_size = len(weighed_hosts)
+                if scheduler_host_subset_size < 1:
+                    scheduler_host_subset_size = 1
+
+                weighed_host = random.choice(
+                    weighed_hosts[0:scheduler_host_subset_size])
+                # If another scheduler claimed the chosen host first, its
+                # HostState has been refreshed, so choose again.
+                if self.host_manager.claim_host(elevated, weighed_host.obj,
+                                                spec_obj):
+                    chosen_host = weighed_host
+                    break
+                LOG.debug("Host %(host)s was claimed by another scheduler, "
+                          "choosing again", {'host': weighed_host})
+            if chosen_host is None:
+                # Can't get any more locally.
+                break
 
-            chosen_host = random.choice(
-                weighed_hosts[0:scheduler_host_subset_size])
             LOG.debug("Selected host: %(host)s", {'host': chosen_host})
             selected_hosts.append(chosen_host)
 
@@ -173,6 +212,91 @@ class FilterScheduler(driver.Scheduler):
                 filter_properties['group_hosts'].add(chosen_host.obj.host)
         return selected_hosts
 
-    def _get_all_host_states(self, context):
+    def _schedule_batch(self, context, spec_obj, hosts, filter_properties):
+        """Returns a list of hosts for all the instances of a request.
+
+        All the hosts are filtered and weighed once, and kept in a heap
+        ordered by weight. Each time a host is chosen, the request is
+        consumed from it, then only that host is filtered and weighed again
+        before being pushed back in the heap.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+
+        LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+
+        # The counter keeps the heap stable between hosts of equal weight
+        counter = itertools.count()
+        heap = [(-weighed_host.weight, next(counter), weighed_host)
+                for weighed_host in weighed_hosts]
+        heapq.heapify(heap)
+
+        selected_hosts = []
+        for num in range(spec_obj.num_instances):
+            claim_attempts = max(1, CONF.scheduler_claim_attempts)
+            chosen_host = None
+            for attempt in range(claim_attempts):
+                if not heap:
+                    break
+                weighed_host = self._pop_weighed_host(heap)
+                if self.host_manager.claim_host(context, weighed_host.obj,
+                                                spec_obj):
+                    chosen_host = weighed_host
+                    break
+                LOG.debug("Host %(host)s was claimed by another scheduler, "
+                          "choosing again", {'host': weighed_host})
+                self._push_weighed_host(heap, counter, weighed_host,
+                                        filter_properties, num)
+            if chosen_host is None:
+                # Can't get any more locally.
+                break
+
+            LOG.debug("Selected host: %(host)s", {'host': chosen_host})
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            chosen_host.obj.consume_from_request(spec_obj)
+            self._push_weighed_host(heap, counter, chosen_host,
+                                    filter_properties, num + 1)
+        return selected_hosts
+
+    @staticmethod
+    def _pop_weighed_host(heap):
+        """Pop a host randomly chosen among the N best hosts of a heap."""
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size > len(heap):
+            scheduler_host_subset_size = len(heap)
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+
+        subset = [heapq.heappop(heap)
+                  for i in range(scheduler_host_subset_size)]
+        chosen = random.choice(subset)
+        for item in subset:
+            if item is not chosen:
+                heapq.heappush(heap, item)
+        return chosen[2]
+
+    def _push_weighed_host(self, heap, counter, weighed_host,
+                           filter_properties, index):
+        """Filter and weigh a host again, then push it back in a heap."""
+        if not self.host_manager.get_filtered_hosts([weighed_host.obj],
+                filter_properties, index=index):
+            LOG.debug("Host %(host)s does not pass the filters anymore",
+                      {'host': weighed_host.obj})
+            return
+        self.host_manager.reweigh_host(weighed_host, filter_properties)
+        heapq.heappush(heap,
+                       (-weighed_host.weight, next(counter), weighed_host))
+
+    def _get_all_host_states(self, context, spec_obj=None):
         """Template method, so a subclass can implement caching."""
-        return self.host_manager.get_all_host_states(context)
+        return self.host_manager.get_all_host_states(context, spec_obj)
@@ -18,6 +18,7 @@ Scheduler host filters
 """
 
 from nova import filters
+from nova.scheduler import host_table
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -26,6 +27,48 @@ class BaseHostFilter(filters.BaseFilter):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Return the HostStates that pass the filter.
+
+        If vectorized filtering is enabled and the filter supports it, all
+        the hosts are evaluated at once by hosts_pass(). Otherwise,
+        host_passes() is called for each host. The hosts are passed as a
+        HostStateTable by the HostFilterHandler, which then gets the table
+        of the hosts which pass.
+        """
+        if isinstance(filter_obj_list, host_table.HostStateTable):
+            mask = self.hosts_pass(filter_obj_list, filter_properties)
+            if mask is not None:
+                return filter_obj_list.take(mask)
+        elif host_table.is_enabled():
+            table = host_table.HostStateTable(filter_obj_list)
+            mask = self.hosts_pass(table, filter_properties)
+            if mask is not None:
+                return table.select(mask)
+            filter_obj_list = table.host_states
+        return super(BaseHostFilter, self).filter_all(filter_obj_list,
+                                                      filter_properties)
+
+    def hosts_pass(self, table, filter_properties):
+        """Return a boolean array telling which hosts pass the filter.
+
+        Override this in a subclass which can evaluate all the hosts of a
+        HostStateTable at once. Returning None means that the filter can't,
+        and that host_passes() has to be called for each host instead.
+        """
+        return None
+
+    def excluded_hosts(self, aggregate_index, filter_properties):
+        """Return the names of the hosts which don't pass the filter.
+
+        Override this in a subclass whose result only depends on the
+        metadata of the aggregates of the hosts, which can be looked up in
+        an AggregateIndex. The hosts are then removed before running the
+        other filters, and host_passes() is never called. Returning None
+        means that host_passes() has to be called for each host instead.
+        """
+        return None
+
     def host_passes(self, host_state, filter_properties):
         """Return True if the HostState passes the filter, otherwise False.
         Override this in a subclass.
@@ -37,6 +80,24 @@ class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def _collect(self, objs, previous=None):
+        # NOTE: With vectorized filtering, a single HostStateTable is built
+        # per request, the filters getting tables of the remaining hosts.
+        if not host_table.is_enabled():
+            return list(objs)
+        if isinstance(objs, host_table.HostStateTable):
+            return objs
+        if isinstance(previous, host_table.HostStateTable):
+            return previous.view(objs)
+        return host_table.HostStateTable(objs)
+
+    def get_filtered_objects(self, filters, objs, filter_properties, index=0):
+        objs = super(HostFilterHandler, self).get_filtered_objects(
+            filters, objs, filter_properties, index=index)
+        if objs is None:
+            return None
+        return list(objs)
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
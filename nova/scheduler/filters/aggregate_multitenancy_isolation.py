@@ -28,6 +28,21 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
     # Aggregate data and tenant do not change within a request
     run_filter_once_per_request = True
 
+    @staticmethod
+    def _get_tenant_id(filter_properties):
+        spec = filter_properties.get('request_spec', {})
+        props = spec.get('instance_properties', {})
+        return props.get('project_id')
+
+    def excluded_hosts(self, aggregate_index, filter_properties):
+        """The hosts in an aggregate with a "filter_tenant_id" metadata are
+        excluded, unless they are in one with the tenant of the request.
+        """
+        tenant_id = self._get_tenant_id(filter_properties)
+        return (aggregate_index.hosts_with_key('filter_tenant_id') -
+                aggregate_index.hosts_with_value('filter_tenant_id',
+                                                 tenant_id))
+
     def host_passes(self, host_state, filter_properties):
         """If a host is in an aggregate that has the metadata key
         "filter_tenant_id" it can only create instances from that tenant(s).
@@ -36,9 +51,7 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
         If a host doesn't belong to an aggregate with the metadata key
         "filter_tenant_id" it can create instances from all tenants.
         """
-        spec = filter_properties.get('request_spec', {})
-        props = spec.get('instance_properties', {})
-        tenant_id = props.get('project_id')
+        tenant_id = self._get_tenant_id(filter_properties)
 
         metadata = utils.aggregate_metadata_get_by_host(host_state,
                                                         key="filter_tenant_id")
@@ -29,6 +29,13 @@ class BaseCoreFilter(filters.BaseHostFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
+    def _get_cpu_allocation_ratios(self, table, filter_properties):
+        """Return the CPU allocation ratios of all the hosts of a table.
+
+        Returns None if they can't be computed for all the hosts at once.
+        """
+        return None
+
     def host_passes(self, host_state, filter_properties):
         """Return True if host has sufficient CPU cores."""
         instance_type = filter_properties.get('instance_type')
@@ -72,6 +79,38 @@ class BaseCoreFilter(filters.BaseHostFilter):
 
         return True
 
+    def hosts_pass(self, table, filter_properties):
+        """Return the hosts which have sufficient CPU cores."""
+        cpu_allocation_ratio = self._get_cpu_allocation_ratios(
+            table, filter_properties)
+        if cpu_allocation_ratio is None:
+            return None
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return table.all_pass()
+
+        # Fail safe
+        unknown_vcpus = table.is_unset('vcpus_total')
+        if unknown_vcpus.any():
+            LOG.warning(_LW("VCPUs not set; assuming CPU collection broken"))
+
+        instance_vcpus = instance_type['vcpus']
+        host_vcpus_total = table['vcpus_total']
+        vcpus_total = host_vcpus_total * cpu_allocation_ratio
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        has_limit = vcpus_total > 0
+        # Do not allow an instance to overcommit against itself, only against
+        # other instances.
+        fits_total = ~has_limit | (host_vcpus_total >= instance_vcpus)
+        fits_free = vcpus_total - table['vcpus_used'] >= instance_vcpus
+        passes = unknown_vcpus | (fits_total & fits_free)
+
+        for host_state, limit in table.select_with_values(
+                passes & ~unknown_vcpus & has_limit, vcpus_total):
+            host_state.limits['vcpu'] = limit
+        return passes
+
 
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
@@ -79,6 +118,9 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return host_state.cpu_allocation_ratio
 
+    def _get_cpu_allocation_ratios(self, table, filter_properties):
+        return table['cpu_allocation_ratio']
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
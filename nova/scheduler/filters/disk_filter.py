@@ -35,6 +35,13 @@ class DiskFilter(filters.BaseHostFilter):
     def _get_disk_allocation_ratio(self, host_state, filter_properties):
         return CONF.disk_allocation_ratio
 
+    def _get_disk_allocation_ratios(self, table, filter_properties):
+        """Return the disk allocation ratios of all the hosts of a table.
+
+        Returns None if they can't be computed for all the hosts at once.
+        """
+        return CONF.disk_allocation_ratio
+
     def host_passes(self, host_state, filter_properties):
         """Filter based on disk usage."""
         instance_type = filter_properties.get('instance_type')
@@ -64,6 +71,28 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def hosts_pass(self, table, filter_properties):
+        """Filter based on disk usage."""
+        disk_allocation_ratio = self._get_disk_allocation_ratios(
+            table, filter_properties)
+        if disk_allocation_ratio is None:
+            return None
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = (1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb']) +
+                         instance_type['swap'])
+
+        total_usable_disk_mb = table['total_usable_disk_gb'] * 1024
+        disk_mb_limit = total_usable_disk_mb * disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - table['free_disk_mb']
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+        passes = usable_disk_mb >= requested_disk
+
+        for host_state, limit in table.select_with_values(
+                passes, disk_mb_limit / 1024):
+            host_state.limits['disk_gb'] = limit
+        return passes
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -84,3 +113,7 @@ class AggregateDiskFilter(DiskFilter):
             ratio = CONF.disk_allocation_ratio
 
         return ratio
+
+    def _get_disk_allocation_ratios(self, table, filter_properties):
+        # The ratio depends on the aggregates of each host
+        return None
@@ -39,6 +39,13 @@ class IoOpsFilter(filters.BaseHostFilter):
     def _get_max_io_ops_per_host(self, host_state, filter_properties):
         return CONF.max_io_ops_per_host
 
+    def _get_max_io_ops_per_hosts(self, table, filter_properties):
+        """Return the maximum number of I/O operations for all the hosts.
+
+        Returns None if it can't be computed for all the hosts at once.
+        """
+        return CONF.max_io_ops_per_host
+
     def host_passes(self, host_state, filter_properties):
         """Use information about current vm and task states collected from
         compute node statistics to decide whether to filter.
@@ -54,6 +61,13 @@ class IoOpsFilter(filters.BaseHostFilter):
                          'max_io_ops': max_io_ops})
         return passes
 
+    def hosts_pass(self, table, filter_properties):
+        """Only return hosts which have less I/O operations than the max."""
+        max_io_ops = self._get_max_io_ops_per_hosts(table, filter_properties)
+        if max_io_ops is None:
+            return None
+        return table['num_io_ops'] < max_io_ops
+
 
 class AggregateIoOpsFilter(IoOpsFilter):
     """AggregateIoOpsFilter with per-aggregate the max io operations.
@@ -73,3 +87,7 @@ class AggregateIoOpsFilter(IoOpsFilter):
             value = CONF.max_io_ops_per_host
 
         return value
+
+    def _get_max_io_ops_per_hosts(self, table, filter_properties):
+        # The maximum depends on the aggregates of each host
+        return None
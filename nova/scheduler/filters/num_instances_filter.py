@@ -36,6 +36,13 @@ class NumInstancesFilter(filters.BaseHostFilter):
     def _get_max_instances_per_host(self, host_state, filter_properties):
         return CONF.max_instances_per_host
 
+    def _get_max_instances_per_hosts(self, table, filter_properties):
+        """Return the maximum number of instances for all the hosts.
+
+        Returns None if it can't be computed for all the hosts at once.
+        """
+        return CONF.max_instances_per_host
+
     def host_passes(self, host_state, filter_properties):
         num_instances = host_state.num_instances
         max_instances = self._get_max_instances_per_host(
@@ -48,6 +55,14 @@ class NumInstancesFilter(filters.BaseHostFilter):
                          'max_instances': max_instances})
         return passes
 
+    def hosts_pass(self, table, filter_properties):
+        """Only return hosts which have less instances than the max."""
+        max_instances = self._get_max_instances_per_hosts(table,
+                                                          filter_properties)
+        if max_instances is None:
+            return None
+        return table['num_instances'] < max_instances
+
 
 class AggregateNumInstancesFilter(NumInstancesFilter):
     """AggregateNumInstancesFilter with per-aggregate the max num instances.
@@ -69,3 +84,7 @@ class AggregateNumInstancesFilter(NumInstancesFilter):
             value = CONF.max_instances_per_host
 
         return value
+
+    def _get_max_instances_per_hosts(self, table, filter_properties):
+        # The maximum depends on the aggregates of each host
+        return None
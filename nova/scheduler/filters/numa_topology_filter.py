@@ -18,7 +18,22 @@ from nova.virt import hardware
 class NUMATopologyFilter(filters.BaseHostFilter):
     """Filter on requested NUMA topology."""
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Yield the HostStates the requested NUMA topology fits onto.
+
+        Most hosts usually have the same NUMA topology and usage, so the
+        result of fitting the instance onto a host is reused for the other
+        hosts with the same NUMA topology fingerprint and allocation ratios.
+        """
+        fit_cache = {}
+        for host_state in filter_obj_list:
+            if self._host_passes(host_state, filter_properties, fit_cache):
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
+        return self._host_passes(host_state, filter_properties)
+
+    def _host_passes(self, host_state, filter_properties, fit_cache=None):
         ram_ratio = host_state.ram_allocation_ratio
         cpu_ratio = host_state.cpu_allocation_ratio
         request_spec = filter_properties.get('request_spec', {})
@@ -33,12 +48,23 @@ class NUMATopologyFilter(filters.BaseHostFilter):
             limits = objects.NUMATopologyLimits(
                 cpu_allocation_ratio=cpu_ratio,
                 ram_allocation_ratio=ram_ratio)
-            instance_topology = (hardware.numa_fit_instance_to_host(
-                        host_topology, requested_topology,
-                        limits=limits,
-                        pci_requests=pci_requests,
-                        pci_stats=host_state.pci_stats))
-            if not instance_topology:
+            # NOTE: the PCI devices of the hosts differ, so a request for
+            # some of them is always fitted again
+            cache_key = None
+            if fit_cache is not None and not pci_requests:
+                cache_key = (hardware.numa_topology_fingerprint(host_topology),
+                             cpu_ratio, ram_ratio)
+            if cache_key is not None and cache_key in fit_cache:
+                fits = fit_cache[cache_key]
+            else:
+                fits = bool(hardware.numa_fit_instance_to_host(
+                            host_topology, requested_topology,
+                            limits=limits,
+                            pci_requests=pci_requests,
+                            pci_stats=host_state.pci_stats))
+                if cache_key is not None:
+                    fit_cache[cache_key] = fits
+            if not fits:
                 return False
             host_state.limits['numa_topology'] = limits
             return True
@@ -28,6 +28,13 @@ class BaseRamFilter(filters.BaseHostFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
+    def _get_ram_allocation_ratios(self, table, filter_properties):
+        """Return the RAM allocation ratios of all the hosts of a table.
+
+        Returns None if they can't be computed for all the hosts at once.
+        """
+        return None
+
     def host_passes(self, host_state, filter_properties):
         """Only return hosts with sufficient available RAM."""
         instance_type = filter_properties.get('instance_type')
@@ -64,6 +71,30 @@ class BaseRamFilter(filters.BaseHostFilter):
         host_state.limits['memory_mb'] = memory_mb_limit
         return True
 
+    def hosts_pass(self, table, filter_properties):
+        """Only return hosts with sufficient available RAM."""
+        ram_allocation_ratio = self._get_ram_allocation_ratios(
+            table, filter_properties)
+        if ram_allocation_ratio is None:
+            return None
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        total_usable_ram_mb = table['total_usable_ram_mb']
+
+        memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - table['free_ram_mb']
+        usable_ram = memory_mb_limit - used_ram_mb
+        # Do not allow an instance to overcommit against itself, only against
+        # other instances.
+        passes = ((total_usable_ram_mb >= requested_ram) &
+                  (usable_ram >= requested_ram))
+
+        # save oversubscription limit for compute node to test against:
+        for host_state, limit in table.select_with_values(passes,
+                                                          memory_mb_limit):
+            host_state.limits['memory_mb'] = limit
+        return passes
+
 
 class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
@@ -71,6 +102,9 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return host_state.ram_allocation_ratio
 
+    def _get_ram_allocation_ratios(self, table, filter_properties):
+        return table['ram_allocation_ratio']
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
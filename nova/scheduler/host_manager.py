@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
 import functools
 import time
 try:
@@ -38,6 +39,8 @@ from nova.i18n import _LI, _LW
 from nova import objects
 from nova.pci import stats as pci_stats
 from nova.scheduler import filters
+from nova.scheduler.filters import availability_zone_filter
+from nova.scheduler import host_shards
 from nova.scheduler import weights
 from nova import utils
 from nova.virt import hardware
@@ -70,14 +73,54 @@ host_manager_opts = [
                default=True,
                help='Determines if the Scheduler tracks changes to instances '
                     'to help with its filtering decisions.'),
+    cfg.BoolOpt('scheduler_incremental_host_state',
+                default=False,
+                help='Keep the compute nodes known by the Scheduler between '
+                     'requests and only reload the ones which were created, '
+                     'updated or deleted since the last request, instead of '
+                     'reloading all of them from the database each time.'),
+    cfg.IntOpt('scheduler_host_state_full_sync_interval',
+               default=600,
+               help='When scheduler_incremental_host_state is enabled, '
+                    'number of seconds after which all the compute nodes are '
+                    'reloaded from the database anyway. A value of 0 means '
+                    'that they are only fully loaded once at start-up.'),
+    cfg.BoolOpt('scheduler_optimistic_claims',
+                default=False,
+                help='Atomically claim the resources of each selected host '
+                     'in the database, so that several scheduler workers '
+                     'can run concurrently. A worker whose view of a host '
+                     'is stale because another worker claimed it first '
+                     'refreshes that host and chooses again, instead of '
+                     'failing the build on the compute node.'),
+    cfg.BoolOpt('scheduler_bulk_load_instance_info',
+                default=False,
+                help='Load the instances of all the hosts whose compute '
+                     'service does not keep the scheduler updated about '
+                     'them with a single database query per request, '
+                     'instead of one query per host.'),
+    cfg.BoolOpt('scheduler_prune_hosts_before_filtering',
+                default=False,
+                help='Before building the HostStates of a request, leave out '
+                     'the hosts which cannot match its ignored hosts, forced '
+                     'hosts and nodes, or availability zone (when the '
+                     'AvailabilityZoneFilter is enabled), using the '
+                     'aggregates known by the scheduler. Only the remaining '
+                     'hosts are refreshed and filtered.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
+CONF.import_opt('default_availability_zone', 'nova.availability_zones')
 
 LOG = logging.getLogger(__name__)
 HOST_INSTANCE_SEMAPHORE = "host_instance"
 
+# The timestamps of the compute nodes are written with the clocks of their
+# hosts and may be stored without the fractions of seconds, so the
+# incremental reloads of the compute nodes overlap a bit.
+_CHANGES_SINCE_OVERLAP = datetime.timedelta(seconds=2)
+
 
 class ReadOnlyDict(IterableUserDict):
     """A read-only dict."""
@@ -172,6 +215,8 @@ class HostState(object):
 
         # List of aggregates the host belongs to
         self.aggregates = []
+        # Generation of the HostManager aggregates the list was built from
+        self.aggregates_generation = None
 
         # Instances on this host
         self.instances = {}
@@ -310,6 +355,40 @@ class HostState(object):
                  self.num_io_ops, self.num_instances))
 
 
+class AggregateIndex(object):
+    """Inverted index of the metadata of the aggregates.
+
+    Maps each metadata key and value to the names of the hosts belonging to
+    an aggregate with that metadata. As done by the filters, the values are
+    split on commas, so that a host in an aggregate with the metadata
+    filter_tenant_id=t1,t2 is indexed under both t1 and t2.
+    """
+
+    def __init__(self, aggregates):
+        self._hosts_by_key = collections.defaultdict(set)
+        self._hosts_by_value = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+        for aggregate in aggregates:
+            for key, value in aggregate.metadata.items():
+                self._hosts_by_key[key].update(aggregate.hosts)
+                for item in value.split(','):
+                    self._hosts_by_value[key][item.strip()].update(
+                        aggregate.hosts)
+
+    def hosts_with_key(self, key):
+        """Return the hosts in an aggregate having a metadata key."""
+        return self._hosts_by_key.get(key, set())
+
+    def hosts_with_value(self, key, value):
+        """Return the hosts in an aggregate having a metadata key set to a
+        value, or to a list of values containing it.
+        """
+        hosts_by_value = self._hosts_by_value.get(key)
+        if hosts_by_value is None:
+            return set()
+        return hosts_by_value.get(value, set())
+
+
 class HostManager(object):
     """Base HostManager class."""
 
@@ -334,8 +413,26 @@ class HostManager(object):
         # Dict of set of aggregate IDs keyed by the name of the host belonging
         # to those aggregates
         self.host_aggregates_map = collections.defaultdict(set)
+        # Incremented each time an aggregate changes, so that the aggregates
+        # of the HostStates are only refreshed after a change
+        self.aggregates_generation = 0
+        self._aggregate_index = None
         self._init_aggregates()
         self.tracks_instance_changes = CONF.scheduler_tracks_instance_changes
+        self.incremental_host_state = CONF.scheduler_incremental_host_state
+        self.optimistic_claims = CONF.scheduler_optimistic_claims
+        self.bulk_load_instance_info = CONF.scheduler_bulk_load_instance_info
+        self.prune_hosts = CONF.scheduler_prune_hosts_before_filtering
+        az_filter_cls = availability_zone_filter.AvailabilityZoneFilter
+        self.filters_availability_zones = any(
+            isinstance(filter_, az_filter_cls)
+            for filter_ in self.default_filters)
+        # Dict of ComputeNode objects keyed by (host, nodename), kept between
+        # requests so that only the changed nodes need to be reloaded
+        self._compute_nodes = collections.OrderedDict()
+        # Most recent created_at/updated_at/deleted_at seen on a compute node
+        self._compute_nodes_high_water_mark = None
+        self._last_full_sync = None
         # Dict of instances and status, keyed by host
         self._instance_info = {}
         if self.tracks_instance_changes:
@@ -360,7 +457,19 @@ class HostManager(object):
         else:
             self._update_aggregate(aggregates)
 
+    @property
+    def aggregate_index(self):
+        """AggregateIndex of the known aggregates, rebuilt after a change."""
+        if self._aggregate_index is None:
+            self._aggregate_index = AggregateIndex(self.aggs_by_id.values())
+        return self._aggregate_index
+
+    def _aggregates_changed(self):
+        self.aggregates_generation += 1
+        self._aggregate_index = None
+
     def _update_aggregate(self, aggregate):
+        self._aggregates_changed()
         self.aggs_by_id[aggregate.id] = aggregate
         for host in aggregate.hosts:
             self.host_aggregates_map[host].add(aggregate.id)
@@ -374,6 +483,7 @@ class HostManager(object):
     def delete_aggregate(self, aggregate):
         """Deletes internal HostManager information about a specific aggregate.
         """
+        self._aggregates_changed()
         if aggregate.id in self.aggs_by_id:
             del self.aggs_by_id[aggregate.id]
         for host in aggregate.hosts:
@@ -522,27 +632,183 @@ class HostManager(object):
                     return name_to_cls_map.values()
             hosts = six.itervalues(name_to_cls_map)
 
-        return self.filter_handler.get_filtered_objects(filters,
-                hosts, filter_properties, index)
+        filters, hosts = self._exclude_hosts_by_aggregates(
+            filters, hosts, filter_properties, index)
+        return host_shards.get_filtered_objects(self.filter_handler,
+                filters, hosts, filter_properties, index)
+
+    def _exclude_hosts_by_aggregates(self, filters, hosts, filter_properties,
+                                     index):
+        """Removes the hosts failing the filters which only depend on the
+        aggregates metadata, using the aggregate index.
+
+        Those filters don't need to be run, so the other filters are returned
+        with the remaining hosts.
+        """
+        excluded_hosts = set()
+        remaining_filters = []
+        for filter_ in filters:
+            filter_excluded_hosts = None
+            if filter_.run_filter_for_index(index):
+                filter_excluded_hosts = filter_.excluded_hosts(
+                    self.aggregate_index, filter_properties)
+            if filter_excluded_hosts is None:
+                remaining_filters.append(filter_)
+            else:
+                LOG.debug("Filter %(cls_name)s excludes %(count)d host(s) "
+                          "by their aggregates",
+                          {'cls_name': filter_.__class__.__name__,
+                           'count': len(filter_excluded_hosts)})
+                excluded_hosts |= filter_excluded_hosts
+        if excluded_hosts:
+            hosts = [host for host in hosts
+                     if host.host not in excluded_hosts]
+        return remaining_filters, hosts
 
     def get_weighed_hosts(self, hosts, weight_properties):
         """Weigh the hosts."""
         return self.weight_handler.get_weighed_objects(self.weighers,
                 hosts, weight_properties)
 
-    def get_all_host_states(self, context):
+    def reweigh_host(self, weighed_host, weight_properties):
+        """Weigh again a host whose state changed since it was weighed."""
+        return self.weight_handler.reweigh_object(self.weighers,
+                weighed_host, weight_properties)
+
+    def _get_changed_compute_nodes(self, context):
+        """Returns the compute nodes to refresh and if it is a full reload.
+
+        Unless the incremental mode is enabled, all the compute nodes are
+        loaded each time. Otherwise, only the ones which were created, updated
+        or (soft-)deleted since the last known high-water mark are loaded,
+        and a full reload is periodically done to catch up on any missed
+        change (e.g. due to clock skew between the compute nodes).
+
+        The high-water mark is the most recent timestamp of the compute
+        nodes, but never later than the time of the scheduler when they were
+        loaded, so that a compute host whose clock is ahead doesn't hide the
+        changes of the other ones until the next full reload.
+        """
+        # NOTE: Objects are UTC tz-aware by default
+        now = timeutils.utcnow().replace(tzinfo=iso8601.iso8601.Utc())
+        full_sync_interval = CONF.scheduler_host_state_full_sync_interval
+        if (not self.incremental_host_state or
+                self._compute_nodes_high_water_mark is None or
+                (full_sync_interval > 0 and
+                 timeutils.is_older_than(self._last_full_sync,
+                                         full_sync_interval))):
+            compute_nodes = objects.ComputeNodeList.get_all(context)
+            self._last_full_sync = timeutils.utcnow()
+            full_sync = True
+        else:
+            compute_nodes = objects.ComputeNodeList.get_all_changed_since(
+                context,
+                self._compute_nodes_high_water_mark - _CHANGES_SINCE_OVERLAP)
+            full_sync = False
+
+        if self.incremental_host_state:
+            for compute in compute_nodes:
+                for field in ('created_at', 'updated_at', 'deleted_at'):
+                    value = compute.obj_attr_is_set(field) and getattr(
+                        compute, field)
+                    if value and (self._compute_nodes_high_water_mark is None
+                            or value > self._compute_nodes_high_water_mark):
+                        self._compute_nodes_high_water_mark = min(value, now)
+        return compute_nodes, full_sync
+
+    def _get_compute_services(self, context):
+        """Returns the nova-compute services keyed by host."""
+        return {service.host: service
+                for service in objects.ServiceList.get_by_binary(
+                    context, 'nova-compute')}
+
+    def _get_host_constraints(self, spec_obj):
+        """Returns the constraints of a request on the host and node names,
+        which can be checked without a HostState.
+
+        The forced hosts and nodes skip the filters, so the availability zone
+        is only enforced when nothing is forced and the AvailabilityZoneFilter
+        is enabled, in which case the hosts of the zone are looked up in the
+        aggregate index.
+
+        :returns: a (allowed_hosts, excluded_hosts, allowed_nodes) tuple of
+                  sets, allowed_hosts and allowed_nodes being None if any host
+                  or node is allowed
+        """
+        def _get_field(field):
+            if spec_obj.obj_attr_is_set(field):
+                return getattr(spec_obj, field)
+            return None
+
+        force_hosts = _get_field('force_hosts')
+        force_nodes = _get_field('force_nodes')
+        availability_zone = _get_field('availability_zone')
+        allowed_hosts = set(force_hosts) if force_hosts else None
+        allowed_nodes = set(force_nodes) if force_nodes else None
+        excluded_hosts = set(_get_field('ignore_hosts') or [])
+        if (availability_zone and not force_hosts and not force_nodes and
+                self.filters_availability_zones):
+            index = self.aggregate_index
+            zone_hosts = index.hosts_with_value('availability_zone',
+                                                availability_zone)
+            if availability_zone == CONF.default_availability_zone:
+                # Hosts which are not in any zone are in the default one
+                excluded_hosts |= (index.hosts_with_key('availability_zone') -
+                                   zone_hosts)
+            else:
+                allowed_hosts = zone_hosts
+        return allowed_hosts, excluded_hosts, allowed_nodes
+
+    def get_all_host_states(self, context, spec_obj=None):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        If host pruning is enabled and a RequestSpec is given, only the
+        HostStates of the hosts which can match its ignored hosts, forced
+        hosts and nodes and availability zone are refreshed and returned.
         """
 
-        service_refs = {service.host: service
-                        for service in objects.ServiceList.get_by_binary(
-                            context, 'nova-compute')}
+        service_refs = self._get_compute_services(context)
         # Get resource usage across the available compute nodes:
-        compute_nodes = objects.ComputeNodeList.get_all(context)
-        seen_nodes = set()
+        compute_nodes, full_sync = self._get_changed_compute_nodes(context)
+        if full_sync:
+            # Compute nodes which are not part of a full load have been
+            # deleted and will be removed from host_state_map below
+            self._compute_nodes = collections.OrderedDict()
+        changed_nodes = set()
         for compute in compute_nodes:
+            state_key = (compute.host, compute.hypervisor_hostname)
+            if compute.obj_attr_is_set('deleted') and compute.deleted:
+                self._compute_nodes.pop(state_key, None)
+                continue
+            self._compute_nodes[state_key] = compute
+            changed_nodes.add(state_key)
+
+        prune_hosts = self.prune_hosts and spec_obj is not None
+        if prune_hosts:
+            allowed_hosts, excluded_hosts, allowed_nodes = (
+                self._get_host_constraints(spec_obj))
+        else:
+            allowed_hosts, excluded_hosts, allowed_nodes = None, set(), None
+
+        def _is_candidate(host, node):
+            return ((allowed_hosts is None or host in allowed_hosts) and
+                    host not in excluded_hosts and
+                    (allowed_nodes is None or node in allowed_nodes))
+
+        if self.bulk_load_instance_info:
+            stale_instances = self._get_stale_instance_info(
+                context, [compute.host for state_key, compute in
+                          six.iteritems(self._compute_nodes)
+                          if compute.host in service_refs and
+                          _is_candidate(*state_key)])
+        else:
+            stale_instances = {}
+
+        seen_nodes = set()
+        candidate_nodes = []
+        for state_key, compute in six.iteritems(self._compute_nodes):
             service = service_refs.get(compute.host)
 
             if not service:
@@ -550,24 +816,39 @@ class HostManager(object):
                     "No compute service record found for host %(host)s"),
                     {'host': compute.host})
                 continue
-            host = compute.host
-            node = compute.hypervisor_hostname
-            state_key = (host, node)
+            host, node = state_key
             host_state = self.host_state_map.get(state_key)
+            if not _is_candidate(host, node):
+                if host_state:
+                    seen_nodes.add(state_key)
+                    # The change would be lost in incremental mode, so the
+                    # HostState is refreshed the next time it is a candidate
+                    if state_key in changed_nodes:
+                        host_state.updated = None
+                continue
             if host_state:
-                host_state.update_from_compute_node(compute)
+                # A HostState with no updated time was asked to be refreshed
+                # (e.g. after a failed multiple create), so we need to update
+                # it even if its compute node didn't change
+                if state_key in changed_nodes or host_state.updated is None:
+                    host_state.update_from_compute_node(compute)
             else:
                 host_state = self.host_state_cls(host, node, compute=compute)
                 self.host_state_map[state_key] = host_state
-            # We force to update the aggregates info each time a new request
-            # comes in, because some changes on the aggregates could have been
-            # happening after setting this field for the first time
-            host_state.aggregates = [self.aggs_by_id[agg_id] for agg_id in
-                                     self.host_aggregates_map[
-                                         host_state.host]]
+            # The aggregates info has to be updated if some changes on the
+            # aggregates happened after setting this field for the last time
+            if host_state.aggregates_generation != self.aggregates_generation:
+                host_state.aggregates = [self.aggs_by_id[agg_id] for agg_id in
+                                         self.host_aggregates_map[
+                                             host_state.host]]
+                host_state.aggregates_generation = self.aggregates_generation
             host_state.update_service(dict(service))
-            self._add_instance_info(context, compute, host_state)
+            if host in stale_instances:
+                host_state.instances = dict(stale_instances[host])
+            else:
+                self._add_instance_info(context, compute, host_state)
             seen_nodes.add(state_key)
+            candidate_nodes.append(state_key)
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
@@ -577,7 +858,45 @@ class HostManager(object):
                          "from scheduler"), {'host': host, 'node': node})
             del self.host_state_map[state_key]
 
-        return six.itervalues(self.host_state_map)
+        if not prune_hosts:
+            return six.itervalues(self.host_state_map)
+        LOG.debug("Pruned the candidate hosts down to %(count)d node(s) "
+                  "before filtering", {'count': len(candidate_nodes)})
+        return iter([self.host_state_map[state_key]
+                     for state_key in candidate_nodes])
+
+    def claim_host(self, context, host_state, spec_obj):
+        """Atomically claim the resources of a request on a host.
+
+        The claim only succeeds if the compute node of the host was not
+        updated, by another scheduler or by its compute service, since it was
+        loaded to refresh the HostState.
+
+        :returns: True if the claim succeeded or if optimistic claims are
+                  disabled, False otherwise. In that case the HostState has
+                  been refreshed from the database, so that the caller can
+                  filter and weigh the hosts again.
+        """
+        if not self.optimistic_claims:
+            return True
+        state_key = (host_state.host, host_state.nodename)
+        compute = self._compute_nodes.get(state_key)
+        if compute is None:
+            return True
+        try:
+            compute.claim(spec_obj.memory_mb,
+                          spec_obj.root_gb + spec_obj.ephemeral_gb,
+                          spec_obj.vcpus)
+        except exception.ComputeNodeGenerationConflict:
+            LOG.debug("Compute node %(host)s:%(node)s was updated since it "
+                      "was loaded, refreshing it",
+                      {'host': host_state.host, 'node': host_state.nodename})
+            compute = objects.ComputeNode.get_by_id(context, compute.id)
+            self._compute_nodes[state_key] = compute
+            host_state.updated = None
+            host_state.update_from_compute_node(compute)
+            return False
+        return True
 
     def _add_instance_info(self, context, compute, host_state):
         """Adds the host instance info to the host_state object.
@@ -600,6 +919,30 @@ class HostManager(object):
                          for instance in inst_list.objects}
         host_state.instances = inst_dict
 
+    def _get_stale_instance_info(self, context, host_names):
+        """Gets with a single query the instances of the hosts for which
+        _add_instance_info() would have to query the database.
+
+        :returns: a dict of dicts of instances keyed by their UUID, keyed by
+                  host name
+        """
+        stale_hosts = set()
+        for host_name in host_names:
+            host_info = self._instance_info.get(host_name)
+            if not (host_info and host_info.get("updated")):
+                stale_hosts.add(host_name)
+        if not stale_hosts:
+            return {}
+        # NOTE: soft deleted instances are returned like by
+        # InstanceList.get_by_host()
+        filters = {'host': list(stale_hosts), 'deleted': False,
+                   'soft_deleted': True}
+        instances = objects.InstanceList.get_by_filters(context, filters)
+        stale_instances = {host_name: {} for host_name in stale_hosts}
+        for instance in instances:
+            stale_instances[instance.host][instance.uuid] = instance
+        return stale_instances
+
     def _recreate_instance_info(self, context, host_name):
         """Get the InstanceList for the specified host, and store it in the
         _instance_info dict.
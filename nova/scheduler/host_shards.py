@@ -0,0 +1,571 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Parallel filtering of the hosts, by splitting them into shards which are
+filtered by a pool of worker processes.
+
+The workers are forked by a spawner process, itself forked when the
+scheduler service starts, before any connection to the database or to the
+message bus is opened and before any greenthread is spawned, so that no
+worker inherits them, not even the ones replacing the workers which died.
+
+Each worker keeps a table of the HostStates it was sent. For each filtering,
+the filters, the request, the keys of the hosts of a shard and only those
+of their HostStates which changed since they were last sent to the worker
+are pickled to it, and only the positions of the hosts which passed the
+filters and their limits are sent back. The scheduler reads the results
+with green I/O, so that it keeps serving other requests meanwhile.
+"""
+
+import errno
+import os
+import shutil
+import signal
+import struct
+import tempfile
+
+from eventlet import greenio
+from eventlet import greenthread
+from oslo_config import cfg
+from oslo_log import log as logging
+from six.moves import cPickle as pickle
+
+from nova.i18n import _LE, _LW
+from nova.scheduler import filters as host_filters
+
+host_shards_opts = [
+    cfg.IntOpt('scheduler_filter_processes',
+               default=0,
+               help='Number of processes forked when the scheduler service '
+                    'starts to run the filters on shards of the hosts in '
+                    'parallel, which is worth it when some CPU-heavy filters '
+                    'are enabled (e.g. ComputeCapabilitiesFilter or '
+                    'JsonFilter). The filters must not rely on the database '
+                    'or on RPC. A value of 0 or 1 runs the filters in the '
+                    'scheduler process.'),
+    cfg.IntOpt('scheduler_filter_shard_min_hosts',
+               default=500,
+               help='Minimum number of hosts in each shard filtered by a '
+                    'separate process, so that the hosts are only sent to '
+                    'the processes when there are enough of them to make up '
+                    'for it.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(host_shards_opts)
+
+LOG = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!Q')
+
+# Number of requests after which the HostStates which were not part of any
+# of them are evicted from the table of a worker
+_EVICTION_REQUESTS = 100
+
+# Number of times the scheduler tries to open the request pipe of a new
+# worker, a tenth of a second apart, until the worker opened it too
+_OPEN_ATTEMPTS = 100
+
+# The process forking the workers
+_spawner = None
+# The workers which are not filtering a shard
+_idle_workers = []
+# All the workers still running
+_workers = []
+# What could not be pickled to the workers, which is only logged once
+_pickling_errors = set()
+
+
+def _write_message(f, data):
+    f.write(_HEADER.pack(len(data)) + data)
+    f.flush()
+
+
+def _read_exactly(f, size):
+    chunks = []
+    while size:
+        chunk = f.read(size)
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_message(f):
+    """Return the data of a message, or None if the pipe was closed."""
+    try:
+        header = _read_exactly(f, _HEADER.size)
+    except EOFError:
+        return None
+    return _read_exactly(f, _HEADER.unpack(header)[0])
+
+
+def _log_pickling_error(description):
+    """Log that something could not be pickled to the workers, once, as it
+    will likely fail again for the next requests.
+    """
+    if description in _pickling_errors:
+        return
+    _pickling_errors.add(description)
+    LOG.warning(_LW("Failed to send %s to the host filtering processes, "
+                    "filtering the hosts in the scheduler"), description,
+                exc_info=True)
+
+
+def _filter_shard(filter_handler, filters, hosts, filter_properties, index):
+    """Filter a shard of hosts and return the pickled result.
+
+    The result is a (passed, stats) tuple, where passed is None if a filter
+    said to stop filtering, or the list of the (position, limits) of the
+    hosts which passed the filters.
+    """
+    filter_handler.stats.reset()
+    filtered = filter_handler.get_filtered_objects(filters, hosts,
+                                                   filter_properties, index)
+    passed = None
+    if filtered is not None:
+        positions = {id(host): position
+                     for position, host in enumerate(hosts)}
+        passed = [(positions[id(host)], host.limits) for host in filtered]
+    return pickle.dumps((passed, filter_handler.stats.get()),
+                        pickle.HIGHEST_PROTOCOL)
+
+
+def _serve(request_file, result_file):
+    """Filter the shards sent by the scheduler until it closes the pipe.
+
+    An empty result is sent back when the filtering failed, in which case
+    the table of the HostStates is emptied, as the scheduler does with its
+    copy of it.
+    """
+    filter_handler = host_filters.HostFilterHandler()
+    hosts = {}
+    while True:
+        request = _read_message(request_file)
+        if request is None:
+            return
+        try:
+            pickled_request, keys, updates, evicted = pickle.loads(request)
+            for key in evicted:
+                hosts.pop(key, None)
+            for key, pickled_host in updates.items():
+                hosts[key] = pickle.loads(pickled_host)
+            pickled_filters, filter_properties, index = pickle.loads(
+                pickled_request)
+            filters = [pickle.loads(pickled_filter)
+                       for pickled_filter in pickled_filters]
+            result = _filter_shard(filter_handler, filters,
+                                   [hosts[key] for key in keys],
+                                   filter_properties, index)
+        except Exception:
+            LOG.exception(_LE("Failed to filter a shard of hosts"))
+            hosts = {}
+            result = b''
+        _write_message(result_file, result)
+
+
+def _get_version(host_state):
+    """Return what tells whether a HostState changed since it was sent.
+
+    The resources of a HostState only change along with its updated time,
+    when it is refreshed from its compute node or consumed by a request,
+    while its service and instances are replaced or updated in place by the
+    HostManager, so copies of them are compared.
+    """
+    return (host_state.updated,
+            getattr(host_state, 'aggregates_generation', None),
+            dict(getattr(host_state, 'service', None) or {}),
+            dict(host_state.instances))
+
+
+def _is_changed(host_state, version):
+    updated, aggregates_generation, service, instances = version
+    return (host_state.updated != updated or
+            getattr(host_state, 'aggregates_generation', None) !=
+            aggregates_generation or
+            (getattr(host_state, 'service', None) or {}) != service or
+            host_state.instances != instances)
+
+
+class _HostTable(object):
+    """The HostStates sent to a worker, so that only the ones which changed
+    since are sent to it again.
+
+    The worker keeps the HostStates themselves, and applies the changes to
+    them before filtering. The HostStates which were not part of any of the
+    last _EVICTION_REQUESTS shards are evicted from both tables, so that
+    the removed hosts don't stay in them.
+    """
+
+    def __init__(self):
+        # (version, last request) of the HostStates sent, keyed by
+        # (host, nodename)
+        self.versions = {}
+        self.requests = 0
+
+    def clear(self):
+        self.versions = {}
+
+    def make_request(self, pickled_request, hosts):
+        """Return the pickled request to filter a shard of hosts, or None if
+        one of the HostStates to send can't be pickled.
+        """
+        self.requests += 1
+        keys = []
+        updates = {}
+        versions = {}
+        for host in hosts:
+            key = (host.host, host.nodename)
+            keys.append(key)
+            sent = self.versions.get(key)
+            if sent is not None and not _is_changed(host, sent[0]):
+                versions[key] = (sent[0], self.requests)
+                continue
+            try:
+                updates[key] = pickle.dumps(host, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                _log_pickling_error('the HostState of %s:%s' % key)
+                return None
+            versions[key] = (_get_version(host), self.requests)
+        evicted = []
+        if self.requests % _EVICTION_REQUESTS == 0:
+            oldest = self.requests - _EVICTION_REQUESTS
+            evicted = [key for key, (version, last) in self.versions.items()
+                       if last <= oldest and key not in versions]
+            for key in evicted:
+                del self.versions[key]
+        self.versions.update(versions)
+        return pickle.dumps((pickled_request, keys, updates, evicted),
+                            pickle.HIGHEST_PROTOCOL)
+
+
+class _Worker(object):
+    """A worker process filtering the shards of hosts sent to it."""
+
+    def __init__(self, pid, request_fd, result_fd):
+        self.pid = pid
+        self.request_file = greenio.GreenPipe(request_fd, 'wb', 0)
+        self.result_file = greenio.GreenPipe(result_fd, 'rb', 0)
+        self.alive = True
+        self.table = _HostTable()
+
+    def submit(self, pickled_request, hosts):
+        """Send a shard of hosts to filter.
+
+        :returns: whether the shard was sent, which it is not when one of
+                  its HostStates can't be pickled
+        """
+        request = self.table.make_request(pickled_request, hosts)
+        if request is None:
+            return False
+        try:
+            _write_message(self.request_file, request)
+        except (IOError, OSError):
+            self._died()
+        except BaseException:
+            # The rest of the request would be taken for the next one
+            self._died()
+            raise
+        return True
+
+    def get_result(self):
+        """Return the unpickled result of the filtering of the shard
+        submitted, or None if it failed.
+        """
+        if not self.alive:
+            return None
+        try:
+            result = _read_message(self.result_file)
+        except (EOFError, IOError, OSError):
+            result = None
+        except BaseException:
+            # The unread result would be taken for the one of the next shard
+            self._died()
+            raise
+        if result is None:
+            self._died()
+            return None
+        if not result:
+            self.table.clear()
+            return None
+        return pickle.loads(result)
+
+    def _died(self):
+        if not self.alive:
+            return
+        LOG.warning(_LW("Host filtering process %d died"), self.pid)
+        self.alive = False
+        self.close()
+
+    def close(self):
+        for f in (self.request_file, self.result_file):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+
+
+class _Spawner(object):
+    """A process forking the workers.
+
+    The pipes of a worker are named pipes created by the spawner, which the
+    worker and the scheduler both open.
+    """
+
+    def __init__(self):
+        self.fifo_dir = tempfile.mkdtemp(prefix='nova-host-shards-')
+        self.count = 0
+        command_read_fd, command_write_fd = os.pipe()
+        reply_read_fd, reply_write_fd = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            status = 1
+            try:
+                os.close(command_write_fd)
+                os.close(reply_read_fd)
+                # The workers are reaped as soon as they exit
+                signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+                with os.fdopen(command_read_fd, 'rb') as command_file:
+                    with os.fdopen(reply_write_fd, 'wb') as reply_file:
+                        self._serve(command_file, reply_file)
+                status = 0
+            except Exception:
+                LOG.exception(_LE("Host filtering spawner process failed"))
+            finally:
+                os._exit(status)
+        os.close(command_read_fd)
+        os.close(reply_write_fd)
+        self.command_file = greenio.GreenPipe(command_write_fd, 'wb', 0)
+        self.reply_file = greenio.GreenPipe(reply_read_fd, 'rb', 0)
+
+    def _serve(self, command_file, reply_file):
+        """Fork a worker for each command, until the scheduler closes the
+        pipe.
+        """
+        while _read_message(command_file) is not None:
+            self.count += 1
+            request_path = os.path.join(self.fifo_dir,
+                                        '%d.request' % self.count)
+            result_path = os.path.join(self.fifo_dir,
+                                       '%d.result' % self.count)
+            os.mkfifo(request_path, 0o600)
+            os.mkfifo(result_path, 0o600)
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    command_file.close()
+                    reply_file.close()
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    with open(result_path, 'wb') as result_file:
+                        with open(request_path, 'rb') as request_file:
+                            _serve(request_file, result_file)
+                    status = 0
+                except Exception:
+                    LOG.exception(_LE("Host filtering process failed"))
+                finally:
+                    os._exit(status)
+            _write_message(reply_file,
+                           pickle.dumps((pid, request_path, result_path),
+                                        pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _open_writer(path):
+        """Open a named pipe for writing once the worker opened it for
+        reading, without blocking the other greenthreads meanwhile.
+        """
+        for attempt in range(_OPEN_ATTEMPTS):
+            try:
+                return os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            greenthread.sleep(0.1)
+        raise OSError(errno.ENXIO, os.strerror(errno.ENXIO), path)
+
+    def spawn(self):
+        """Fork a worker and return it."""
+        _write_message(self.command_file, b'')
+        reply = _read_message(self.reply_file)
+        if reply is None:
+            raise EOFError()
+        pid, request_path, result_path = pickle.loads(reply)
+        try:
+            # The worker opens its result pipe before its request pipe, so
+            # both are connected once it opened its request pipe
+            result_fd = os.open(result_path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                request_fd = self._open_writer(request_path)
+            except Exception:
+                os.close(result_fd)
+                raise
+        finally:
+            os.unlink(request_path)
+            os.unlink(result_path)
+        return _Worker(pid, request_fd, result_fd)
+
+    def close(self):
+        """Stop the spawner, which exits once its pipe is closed."""
+        for f in (self.command_file, self.reply_file):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+        os.waitpid(self.pid, 0)
+        shutil.rmtree(self.fifo_dir, ignore_errors=True)
+
+
+def _add_worker():
+    try:
+        worker = _spawner.spawn()
+    except Exception:
+        LOG.exception(_LE("Failed to fork a host filtering process"))
+        return
+    _workers.append(worker)
+    _idle_workers.append(worker)
+
+
+def start_workers():
+    """Fork the pool of processes filtering the shards of hosts.
+
+    This must be called when the scheduler service starts, before any
+    connection or greenthread which the processes must not inherit exists.
+    """
+    global _spawner
+    if not hasattr(os, 'fork') or CONF.scheduler_filter_processes < 2:
+        return
+    _spawner = _Spawner()
+    for i in range(CONF.scheduler_filter_processes):
+        _add_worker()
+    LOG.debug("Forked %d host filtering processes", len(_workers))
+
+
+def stop_workers():
+    """Stop the processes filtering the shards of hosts."""
+    global _spawner
+    while _workers:
+        _workers.pop().close()
+    del _idle_workers[:]
+    if _spawner is not None:
+        _spawner.close()
+        _spawner = None
+
+
+def get_num_shards(num_hosts):
+    """Return the number of shards to split some hosts into."""
+    min_hosts = max(CONF.scheduler_filter_shard_min_hosts, 1)
+    return max(min(len(_idle_workers), num_hosts // min_hosts), 1)
+
+
+def _take_idle_workers(num_workers):
+    workers = []
+    while _idle_workers and len(workers) < num_workers:
+        workers.append(_idle_workers.pop(0))
+    return workers
+
+
+def _release_workers(workers):
+    for worker in workers:
+        if worker.alive:
+            _idle_workers.append(worker)
+        elif worker in _workers:
+            _workers.remove(worker)
+            if _spawner is not None:
+                _add_worker()
+
+
+def get_filtered_objects(filter_handler, filters, hosts, filter_properties,
+                         index=0):
+    """Filter the hosts, in the worker processes if there are enough of
+    them.
+
+    The hosts are split into contiguous shards, so that the hosts which
+    passed the filters are returned in the same order as when filtered by
+    a single process. The limits set by the filters on those hosts are
+    copied back, and the statistics of the filters are merged into the ones
+    of the filter handler. A shard whose filtering failed is filtered again
+    in the scheduler process.
+    """
+    hosts = list(hosts)
+    workers = _take_idle_workers(get_num_shards(len(hosts)))
+    try:
+        if len(workers) < 2:
+            return filter_handler.get_filtered_objects(
+                filters, hosts, filter_properties, index)
+        return _filter_shards(workers, filter_handler, filters, hosts,
+                              filter_properties, index)
+    finally:
+        _release_workers(workers)
+
+
+def _filter_shards(workers, filter_handler, filters, hosts,
+                   filter_properties, index):
+    shard_size = -(-len(hosts) // len(workers))
+    shards = [hosts[start:start + shard_size]
+              for start in range(0, len(hosts), shard_size)]
+    pickled_filters = []
+    for filter_ in filters:
+        try:
+            pickled_filters.append(pickle.dumps(filter_,
+                                                pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            _log_pickling_error('the %s filter' % type(filter_).__name__)
+            return filter_handler.get_filtered_objects(
+                filters, hosts, filter_properties, index)
+    try:
+        pickled_request = pickle.dumps(
+            (pickled_filters, filter_properties, index),
+            pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        _log_pickling_error('the filter properties')
+        return filter_handler.get_filtered_objects(filters, hosts,
+                                                   filter_properties, index)
+    LOG.debug("Filtering %(hosts)d host(s) in %(shards)d processes",
+              {'hosts': len(hosts), 'shards': len(shards)})
+    submitted = [worker.submit(pickled_request, shard)
+                 for worker, shard in zip(workers, shards)]
+
+    # All the results are read before filtering the failed shards again, so
+    # that none is left in the pipes if that raises
+    results = [worker.get_result() if sent else None
+               for worker, sent in zip(workers, submitted)]
+    filtered = []
+    stop = False
+    for shard, sent, result in zip(shards, submitted, results):
+        if result is None:
+            if sent:
+                LOG.warning(_LW("Failed to filter a shard of %d host(s) in "
+                                "a separate process, filtering it again"),
+                            len(shard))
+            shard_filtered = filter_handler.get_filtered_objects(
+                filters, shard, filter_properties, index)
+            if shard_filtered is None:
+                stop = True
+            else:
+                filtered.extend(shard_filtered)
+            continue
+        passed, shard_stats = result
+        filter_handler.stats.merge(shard_stats)
+        if passed is None:
+            stop = True
+            continue
+        for position, limits in passed:
+            shard[position].limits.update(limits)
+            filtered.append(shard[position])
+    if stop:
+        return None
+    return filtered
@@ -0,0 +1,146 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostStates, used to evaluate filters and weighers on all the
+hosts at once instead of one host at a time.
+"""
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from nova.i18n import _LW
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+host_table_opts = [
+    cfg.BoolOpt('scheduler_use_vectorized_filters',
+                default=False,
+                help='Evaluate the filters and weighers which support it '
+                     '(RamFilter, CoreFilter, DiskFilter, IoOpsFilter, '
+                     'NumInstancesFilter, RAMWeigher and IoOpsWeigher) on '
+                     'arrays of host values instead of host by host. '
+                     'Requires the numpy module to be installed.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(host_table_opts)
+
+LOG = logging.getLogger(__name__)
+
+_numpy_warned = False
+
+
+def is_enabled():
+    """Return True if the filters and weighers should be vectorized."""
+    global _numpy_warned
+    if not CONF.scheduler_use_vectorized_filters:
+        return False
+    if numpy is None:
+        if not _numpy_warned:
+            LOG.warning(_LW("scheduler_use_vectorized_filters is set but the "
+                            "numpy module could not be loaded. Falling back "
+                            "to filtering hosts one by one."))
+            _numpy_warned = True
+        return False
+    return True
+
+
+class HostStateTable(object):
+    """A list of HostStates with their numeric fields as arrays.
+
+    The arrays are lazily built the first time a field is accessed, so that
+    only the fields used by the filters or weighers are ever read. A None
+    value is stored as NaN, which makes every comparison against it False.
+
+    The tables of a subset of the hosts, returned by take() and view(),
+    slice the arrays of the table of all the hosts, so that the fields of
+    each host are only read once per request.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        self._columns = {}
+        # Table of all the hosts and positions of these hosts in it
+        self._parent = None
+        self._indices = None
+        self._positions = None
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def __iter__(self):
+        return iter(self.host_states)
+
+    def __getitem__(self, field):
+        column = self._columns.get(field)
+        if column is None:
+            if self._parent is not None:
+                column = self._parent[field][self._indices]
+            else:
+                column = numpy.array([getattr(host_state, field)
+                                      for host_state in self.host_states],
+                                     dtype=float)
+            self._columns[field] = column
+        return column
+
+    def _subtable(self, indices):
+        table = HostStateTable(self.host_states[i] for i in indices)
+        if self._parent is None:
+            table._parent = self
+            table._indices = indices
+        else:
+            table._parent = self._parent
+            table._indices = self._indices[indices]
+        return table
+
+    def take(self, mask):
+        """Return the table of the hosts for which the mask is True."""
+        return self._subtable(numpy.flatnonzero(mask))
+
+    def view(self, host_states):
+        """Return the table of some of the hosts of this table."""
+        if self._positions is None:
+            self._positions = {id(host_state): i for i, host_state
+                               in enumerate(self.host_states)}
+        return self._subtable(numpy.array(
+            [self._positions[id(host_state)] for host_state in host_states],
+            dtype=int))
+
+    def all_pass(self):
+        """Return a mask letting all the hosts pass."""
+        return numpy.ones(len(self.host_states), dtype=bool)
+
+    def is_unset(self, field):
+        """Return a mask of the hosts for which a field is zero or None."""
+        column = self[field]
+        return (column == 0) | numpy.isnan(column)
+
+    def select(self, mask):
+        """Return the HostStates for which the mask is True."""
+        return [self.host_states[i] for i in numpy.flatnonzero(mask)]
+
+    def select_with_values(self, mask, values):
+        """Yield (HostState, value) pairs for which the mask is True.
+
+        :param values: array of the same size as the table, whose elements
+                       are returned as Python numbers
+        """
+        indices = numpy.flatnonzero(mask)
+        for i, value in zip(indices, values[indices].tolist()):
+            yield self.host_states[i], value
@@ -119,3 +119,7 @@ class IronicHostManager(host_manager.HostManager):
     def _add_instance_info(self, context, compute, host_state):
         """Ironic hosts should not pass instance info."""
         host_state.instances = {}
+
+    def _get_stale_instance_info(self, context, host_names):
+        """Ironic hosts should not pass instance info."""
+        return {}
@@ -27,8 +27,11 @@ from oslo_service import periodic_task
 from oslo_utils import importutils
 
 from nova import exception
+from nova.i18n import _LI
 from nova import manager
 from nova import quota
+from nova.scheduler import host_shards
+from nova.scheduler import profiler
 
 
 LOG = logging.getLogger(__name__)
@@ -44,6 +47,13 @@ scheduler_driver_opts = [
                     'Please note this is likely to interact with the value '
                     'of service_down_time, but exactly how they interact '
                     'will depend on your choice of scheduler driver.'),
+    cfg.IntOpt('scheduler_plugin_stats_interval',
+               default=-1,
+               help='Interval in seconds to log how much time was spent in '
+                    'each filter and weigher, and how many hosts they '
+                    'were given and returned, since the scheduler started. '
+                    'Set to -1 to disable. '
+                    'Setting this to 0 will run at the default rate.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(scheduler_driver_opts)
@@ -63,6 +73,11 @@ class SchedulerManager(manager.Manager):
         super(SchedulerManager, self).__init__(service_name='scheduler',
                                                *args, **kwargs)
 
+    def cleanup_host(self):
+        # The processes filtering the hosts are forked by the nova-scheduler
+        # command before the service starts
+        host_shards.stop_workers()
+
     @periodic_task.periodic_task
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
@@ -72,6 +87,13 @@ class SchedulerManager(manager.Manager):
     def _run_periodic_tasks(self, context):
         self.driver.run_periodic_tasks(context)
 
+    @periodic_task.periodic_task(
+        spacing=CONF.scheduler_plugin_stats_interval)
+    def _log_plugin_stats(self, context):
+        lines = profiler.format_host_manager_stats(self.driver.host_manager)
+        LOG.info(_LI("Time spent in the scheduler filters and weighers:\n"
+                     "%s"), '\n'.join(lines))
+
     @messaging.expected_exceptions(exception.NoValidHost)
     def select_destinations(self, context, request_spec, filter_properties):
         """Returns destinations(s) best suited for this request_spec and
@@ -23,6 +23,8 @@ import nova.scheduler.filters.num_instances_filter
 import nova.scheduler.filters.ram_filter
 import nova.scheduler.filters.trusted_filter
 import nova.scheduler.host_manager
+import nova.scheduler.host_shards
+import nova.scheduler.host_table
 import nova.scheduler.ironic_host_manager
 import nova.scheduler.manager
 import nova.scheduler.rpcapi
@@ -48,6 +50,8 @@ def list_opts():
              nova.scheduler.filters.aggregate_image_properties_isolation.opts,
              nova.scheduler.filters.isolated_hosts_filter.isolated_opts,
              nova.scheduler.host_manager.host_manager_opts,
+             nova.scheduler.host_shards.host_shards_opts,
+             nova.scheduler.host_table.host_table_opts,
              nova.scheduler.ironic_host_manager.host_manager_opts,
              nova.scheduler.manager.scheduler_driver_opts,
              nova.scheduler.rpcapi.rpcapi_opts,
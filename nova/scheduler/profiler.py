@@ -0,0 +1,344 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Profiling of the scheduler filters and weighers.
+
+The hosts known to the scheduler can be saved into a snapshot file, against
+which requests can then be scheduled offline to see where the time is spent,
+or to benchmark several scheduler configurations.
+"""
+
+import copy
+import math
+import os
+import resource
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova import exception
+from nova.i18n import _, _LE
+from nova import objects
+from nova.objects import base as obj_base
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+from nova.scheduler import scheduler_options
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+_STATS_HEADER = '%-40s %8s %12s %12s %12s %10s %10s'
+_STATS_LINE = '%-40s %8d %12.3f %12.3f %12.3f %10d %10d'
+
+
+def format_stats(stats):
+    """Return the lines of a table of LoadableStats, slowest first."""
+    lines = [_STATS_HEADER % ('Name', 'Calls', 'Total (ms)', 'Avg (ms)',
+                              'Max (ms)', 'In', 'Out')]
+    for name, stat in sorted(stats.items(), key=lambda item: item[1]['time'],
+                             reverse=True):
+        lines.append(_STATS_LINE % (name, stat['calls'],
+                                    stat['time'] * 1000,
+                                    stat['time'] * 1000 / stat['calls'],
+                                    stat['max_time'] * 1000,
+                                    stat['count_in'], stat['count_out']))
+    return lines
+
+
+def format_host_manager_stats(manager):
+    """Return the lines of the tables of the filters and weighers stats."""
+    return (['Filters:'] +
+            format_stats(manager.filter_handler.stats.get()) +
+            ['', 'Weighers:'] +
+            format_stats(manager.weight_handler.stats.get()))
+
+
+def take_snapshot(context):
+    """Return what the scheduler needs to know about the hosts.
+
+    The compute nodes, compute services, aggregates and instances are
+    returned as object primitives, so that the result can be saved as JSON.
+    """
+    services = objects.ServiceList.get_by_binary(context, 'nova-compute')
+    compute_nodes = objects.ComputeNodeList.get_all(context)
+    aggregates = objects.AggregateList.get_all(context)
+    instances = objects.InstanceList.get_by_filters(context,
+                                                    {'deleted': False})
+    return {'version': SNAPSHOT_VERSION,
+            'services': [service.obj_to_primitive() for service in services],
+            'compute_nodes': [compute.obj_to_primitive()
+                              for compute in compute_nodes],
+            'aggregates': [aggregate.obj_to_primitive()
+                           for aggregate in aggregates],
+            'instances': [instance.obj_to_primitive()
+                          for instance in instances if instance.host]}
+
+
+def save_snapshot(snapshot, path):
+    with open(path, 'w') as f:
+        jsonutils.dump(snapshot, f)
+
+
+def load_snapshot(path):
+    """Load a snapshot file and return the objects it contains."""
+    with open(path) as f:
+        snapshot = jsonutils.load(f)
+    return {key: [obj_base.NovaObject.obj_from_primitive(primitive)
+                  for primitive in snapshot[key]]
+            for key in ('services', 'compute_nodes', 'aggregates',
+                        'instances')}
+
+
+class SnapshotHostManager(host_manager.HostManager):
+    """HostManager knowing about the hosts of a snapshot.
+
+    The database is never accessed, and the hosts are reset to their state
+    in the snapshot each time they are requested.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        super(SnapshotHostManager, self).__init__()
+        self.optimistic_claims = False
+        self.snapshot_instances = {}
+        for instance in snapshot['instances']:
+            self.snapshot_instances.setdefault(
+                instance.host, {})[instance.uuid] = instance
+
+    def _init_aggregates(self):
+        self.update_aggregates(self.snapshot['aggregates'])
+
+    def _init_instance_info(self):
+        pass
+
+    def _get_compute_services(self, context):
+        return {service.host: service
+                for service in self.snapshot['services']}
+
+    def _get_changed_compute_nodes(self, context):
+        # Forget about the resources consumed by the previous requests
+        for host_state in self.host_state_map.values():
+            host_state.updated = None
+        return self.snapshot['compute_nodes'], True
+
+    def _add_instance_info(self, context, compute, host_state):
+        host_state.instances = dict(
+            self.snapshot_instances.get(compute.host, {}))
+
+    def _get_stale_instance_info(self, context, host_names):
+        return {}
+
+
+class _NullNotifier(object):
+    """Notifier dropping the notifications of the replayed requests."""
+
+    def info(self, context, event_type, payload):
+        pass
+
+
+class SnapshotFilterScheduler(filter_scheduler.FilterScheduler):
+    """FilterScheduler scheduling requests against a snapshot."""
+
+    def __init__(self, snapshot):
+        # NOTE: the parent constructors are not called, as they would load
+        # a HostManager from the database and set up an RPC notifier.
+        self.host_manager = SnapshotHostManager(snapshot)
+        self.options = scheduler_options.SchedulerOptions()
+        self.notifier = _NullNotifier()
+
+    def schedule(self, context, request_spec, filter_properties=None):
+        """Return the hosts selected for a legacy request_spec dict."""
+        spec_obj = objects.RequestSpec.from_primitives(
+            context, request_spec, filter_properties or {})
+        return self._schedule(context, spec_obj)
+
+
+def load_requests(context, path):
+    """Load the requests to schedule from a JSON file.
+
+    The file contains one request, or a list of requests, each of them being
+    a dict with a 'request_spec' key, as found in the payload of the
+    scheduler.select_destinations.start notifications, and an optional
+    'filter_properties' key.
+    """
+    with open(path) as f:
+        requests = jsonutils.load(f)
+    if isinstance(requests, dict):
+        requests = [requests]
+    serializer = obj_base.NovaObjectSerializer()
+    return [(serializer.deserialize_entity(context, request['request_spec']),
+             serializer.deserialize_entity(
+                 context, request.get('filter_properties') or {}))
+            for request in requests]
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(index, 0)]
+
+
+def _start_memory_tracing():
+    """Start tracing the memory allocations, forgetting the previous ones."""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    tracemalloc.start()
+
+
+def _stop_memory_tracing():
+    """Stop tracing the memory allocations.
+
+    :returns: the peak memory allocated since the tracing started in KiB
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak // 1024
+
+
+def _get_max_rss():
+    """Return the maximum resident set size of the process in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _benchmark_in_child(context, snapshot, requests):
+    """Run the benchmark in a child process.
+
+    Without tracemalloc, i.e. on Python 2, the allocations can't be traced,
+    so the peak memory is how much the maximum resident set size of a child
+    process grows while it runs the benchmark: it starts from the size of
+    the pages its parent has resident when it forks, not from the peak of
+    the parent, so the previous benchmarks are not accounted for.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            start_rss = _get_max_rss()
+            result = _benchmark(context, snapshot, requests)
+            result['peak_memory'] = _get_max_rss() - start_rss
+            with os.fdopen(write_fd, 'w') as f:
+                jsonutils.dump(result, f)
+            status = 0
+        except Exception:
+            LOG.exception(_LE('The benchmark failed'))
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    status = os.waitpid(pid, 0)[1]
+    if status:
+        raise exception.NovaException(
+            _('The benchmark process failed with status %d') % status)
+    return jsonutils.loads(output)
+
+
+def _benchmark(context, snapshot, requests):
+    scheduler = SnapshotFilterScheduler(snapshot)
+    latencies = []
+    failures = 0
+    with timeutils.StopWatch() as total_timer:
+        for request_spec, filter_properties in requests:
+            # select_destinations() can update the filter_properties
+            filter_properties = copy.deepcopy(filter_properties)
+            with timeutils.StopWatch() as timer:
+                try:
+                    scheduler.select_destinations(context, request_spec,
+                                                  filter_properties)
+                except exception.NoValidHost:
+                    failures += 1
+            latencies.append(timer.elapsed())
+    elapsed = total_timer.elapsed()
+    return {'requests': len(latencies),
+            'failures': failures,
+            'requests_per_second': len(latencies) / elapsed if elapsed else 0,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99)}
+
+
+def benchmark(context, snapshot, requests):
+    """Schedule requests against a snapshot and measure the performance.
+
+    Each request goes through select_destinations(), as it would when
+    received by the scheduler service, against the hosts as they were in the
+    snapshot, so the requests don't depend on each other.
+
+    :returns: a dict with the number of requests, the number of them which
+              could not be fulfilled, the requests per second, the 50th and
+              99th percentile latencies in seconds and the peak memory used
+              by the benchmark in KiB
+    """
+    if tracemalloc is None:
+        return _benchmark_in_child(context, snapshot, requests)
+    # The peak memory of the process would include the one of the previous
+    # benchmarks, so only the allocations of this one are traced
+    _start_memory_tracing()
+    result = _benchmark(context, snapshot, requests)
+    result['peak_memory'] = _stop_memory_tracing()
+    return result
+
+
+def benchmark_configurations(context, snapshot, requests, configurations):
+    """Run the benchmark for several scheduler configurations.
+
+    :param configurations: list of dicts with a 'name' key and an 'options'
+                           key, which is a dict of the configuration options
+                           to override, e.g. scheduler_default_filters
+    :returns: a list of (name, benchmark result) tuples
+    """
+    results = []
+    for configuration in configurations:
+        options = configuration.get('options', {})
+        try:
+            for name, value in options.items():
+                CONF.set_override(name, value)
+            results.append((configuration['name'],
+                            benchmark(context, snapshot, requests)))
+        finally:
+            for name in options:
+                CONF.clear_override(name)
+    return results
+
+
+_BENCHMARK_HEADER = '%-30s %10s %10s %10s %10s %10s %14s'
+_BENCHMARK_LINE = '%-30s %10d %10d %10.1f %10.3f %10.3f %14d'
+
+
+def format_benchmark_results(results):
+    """Return the lines of a table of benchmark results."""
+    lines = [_BENCHMARK_HEADER % ('Configuration', 'Requests', 'Failures',
+                                  'Req/s', 'p50 (ms)', 'p99 (ms)',
+                                  'Peak mem (KiB)')]
+    for name, result in results:
+        lines.append(_BENCHMARK_LINE % (
+            name, result['requests'], result['failures'],
+            result['requests_per_second'], result['p50'] * 1000,
+            result['p99'] * 1000, result['peak_memory']))
+    return lines
@@ -17,6 +17,7 @@
 Scheduler host weights
 """
 
+from nova.scheduler import host_table
 from nova import weights
 
 
@@ -33,7 +34,47 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        """Weigh multiple hosts.
+
+        If vectorized weighing is enabled and the weigher supports it, all
+        the hosts are weighed at once by _weigh_table(). Otherwise,
+        _weigh_object() is called for each host.
+        """
+        table = getattr(weighed_obj_list, 'host_table', None)
+        if table is None and host_table.is_enabled():
+            table = host_table.HostStateTable(
+                weighed_obj.obj for weighed_obj in weighed_obj_list)
+        if table is not None:
+            weights = self._weigh_table(table, weight_properties)
+            if weights is not None:
+                if len(weights):
+                    minval, maxval = weights.min(), weights.max()
+                    if self.minval is None or minval < self.minval:
+                        self.minval = minval
+                    if self.maxval is None or maxval > self.maxval:
+                        self.maxval = maxval
+                return weights.tolist()
+        return super(BaseHostWeigher, self).weigh_objects(weighed_obj_list,
+                                                          weight_properties)
+
+    def _weigh_table(self, table, weight_properties):
+        """Return an array with the weights of all the hosts of a table.
+
+        Override this in a subclass which can weigh all the hosts of a
+        HostStateTable at once. Returning None means that the weigher can't,
+        and that _weigh_object() has to be called for each host instead.
+        """
+        return None
+
+
+class _WeighedHostList(list):
+    """WeighedHosts sharing the HostStateTable of their hosts."""
+
+    def __init__(self, weighed_hosts, table):
+        super(_WeighedHostList, self).__init__(weighed_hosts)
+        self.host_table = table
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -42,6 +83,16 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def _make_weighed_objects(self, obj_list):
+        weighed_objs = super(HostWeightHandler, self)._make_weighed_objects(
+            obj_list)
+        if not host_table.is_enabled():
+            return weighed_objs
+        # NOTE: A single HostStateTable is built per request and shared by
+        # all the weighers.
+        return _WeighedHostList(weighed_objs, host_table.HostStateTable(
+            weighed_obj.obj for weighed_obj in weighed_objs))
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
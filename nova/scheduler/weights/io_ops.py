@@ -49,3 +49,6 @@ class IoOpsWeigher(weights.BaseHostWeigher):
         to be the default.
         """
         return host_state.num_io_ops
+
+    def _weigh_table(self, table, weight_properties):
+        return table['num_io_ops']
@@ -614,6 +614,23 @@ class ServersControllerTest(ControllerTest):
                            'marker': [fakes.get_fake_uuid(2)]}
         self.assertThat(params, matchers.DictMatches(expected_params))
 
+    def test_get_servers_with_limit_keyset_pagination(self):
+        self.flags(osapi_keyset_pagination=True)
+        req = self.req('/fake/servers?limit=3')
+        res_dict = self.controller.index(req)
+
+        href_parts = urlparse.urlparse(res_dict['servers_links'][0]['href'])
+        marker = urlparse.parse_qs(href_parts.query)['marker'][0]
+        self.assertEqual({'id': 3, 'created_at': '2010-10-10T12:00:00'},
+                         common.get_keyset_marker_values(marker))
+
+        with mock.patch.object(compute_api.API, 'get_all') as mock_get_all:
+            mock_get_all.return_value = objects.InstanceList(objects=[])
+            self.controller.index(
+                self.req('/fake/servers?limit=3&marker=%s' % marker))
+        self.assertEqual({'id': 3, 'created_at': '2010-10-10T12:00:00'},
+                         mock_get_all.call_args[1]['marker'])
+
     def test_get_servers_with_limit_bad_value(self):
         req = self.req('/fake/servers?limit=aaa')
         self.assertRaises(webob.exc.HTTPBadRequest,
@@ -17,7 +17,11 @@
 Test suites for 'common' code used throughout the OpenStack HTTP API.
 """
 
+import base64
+import datetime
+
 import mock
+from oslo_serialization import jsonutils
 import six
 from testtools import matchers
 import webob
@@ -283,6 +287,43 @@ class PaginationParamsTest(test.NoDBTestCase):
         self.assertEqual(common.get_pagination_params(req),
                          {'page_size': 5, 'limit': 20})
 
+    def test_keyset_marker(self):
+        item = {'uuid': '263abb28-1de6-412f-b00b-f0ee0c4333c2', 'id': 3,
+                'created_at': datetime.datetime(2016, 1, 1, 12, 0, 0),
+                'display_name': None}
+
+        marker = common.get_keyset_marker(item, ['uuid'])
+        req = webob.Request.blank('/?marker=%s' % marker)
+        self.assertEqual(marker, common.get_pagination_params(req)['marker'])
+        self.assertEqual({'uuid': item['uuid'], 'id': 3,
+                          'created_at': '2016-01-01T12:00:00'},
+                         common.get_keyset_marker_values(marker))
+
+        # the sort keys not supported fall back to the uuid markers
+        self.assertIsNone(common.get_keyset_marker(item, ['display_name']))
+        self.assertIsNone(common.get_keyset_marker_values(item['uuid']))
+        self.assertIsNone(common.get_keyset_marker_values(None))
+
+    def test_invalid_keyset_marker(self):
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          common.get_keyset_marker_values, 'ks.foo')
+
+        valid = {'uuid': '263abb28-1de6-412f-b00b-f0ee0c4333c2', 'id': 3,
+                 'created_at': '2016-01-01T12:00:00'}
+        for values in (dict(valid, display_name='foo'),
+                       dict(valid, id='3'),
+                       dict(valid, id=True),
+                       dict(valid, uuid=3),
+                       dict(valid, created_at='yesterday'),
+                       dict(valid, created_at=None),
+                       {'uuid': valid['uuid']},
+                       [valid]):
+            data = base64.urlsafe_b64encode(
+                jsonutils.dumps(values).encode('utf-8'))
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              common.get_keyset_marker_values,
+                              'ks.' + data.decode('ascii'))
+
 
 class MiscFunctionsTest(test.TestCase):
 
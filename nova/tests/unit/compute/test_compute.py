@@ -6395,6 +6395,62 @@ class ComputeTestCase(BaseTestCase):
     def test_heal_instance_info_cache_with_info_cache_exception(self):
         self._heal_instance_info_cache(_get_instance_nw_info_raise_cache=True)
 
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    @mock.patch('nova.objects.InstanceList.get_by_host')
+    def test_heal_instance_info_cache_batch(self, get_by_host, get_by_filters):
+        self.flags(heal_instance_info_cache_batch_size=2)
+        now = timeutils.utcnow()
+
+        def fake_instance(uuid, updated_at, **kwargs):
+            info_cache = objects.InstanceInfoCache(
+                created_at=now - datetime.timedelta(days=1),
+                updated_at=updated_at)
+            return objects.Instance(uuid=uuid, host=self.compute.host,
+                                    vm_state=vm_states.ACTIVE,
+                                    task_state=None, info_cache=info_cache,
+                                    **kwargs)
+
+        recent = fake_instance('recent', now)
+        oldest = fake_instance('oldest', None)
+        old = fake_instance('old', now - datetime.timedelta(hours=1))
+        building = fake_instance('building', None,
+                                 vm_state=vm_states.BUILDING)
+        get_by_host.return_value = [recent, oldest, old, building]
+        get_by_filters.side_effect = [[oldest, old], [recent]]
+        ctxt = context.get_admin_context()
+
+        with test.nested(
+            mock.patch.object(self.compute.network_api,
+                              'get_instances_nw_info'),
+            mock.patch.object(self.compute._instance_cache, 'invalidate')
+        ) as (get_nw_infos, invalidate):
+            get_nw_infos.return_value = {
+                'oldest': exception.InstanceNotFound(instance_id='oldest'),
+                'old': mock.sentinel.nw_info}
+            self.compute._heal_instance_info_cache(ctxt)
+            get_nw_infos.assert_called_once_with(ctxt, [oldest, old])
+
+            get_nw_infos.reset_mock()
+            get_nw_infos.return_value = {'recent': mock.sentinel.nw_info}
+            self.compute._heal_instance_info_cache(ctxt)
+            get_nw_infos.assert_called_once_with(ctxt, [recent])
+
+        # the healed instances are reloaded by the instance cache
+        self.assertEqual([mock.call('oldest'), mock.call('old'),
+                          mock.call('recent')], invalidate.call_args_list)
+
+        get_by_host.assert_called_once_with(ctxt, self.compute.host,
+                                            expected_attrs=['info_cache'],
+                                            use_slave=True)
+        get_by_filters.assert_has_calls([
+            mock.call(ctxt, {'uuid': ['oldest', 'old'], 'deleted': False},
+                      expected_attrs=['system_metadata', 'info_cache'],
+                      use_slave=True),
+            mock.call(ctxt, {'uuid': ['recent'], 'deleted': False},
+                      expected_attrs=['system_metadata', 'info_cache'],
+                      use_slave=True)])
+        self.assertEqual([], self.compute._instance_uuids_to_heal)
+
     @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.compute.api.API.unrescue')
     def test_poll_rescued_instances(self, unrescue, get):
@@ -10135,6 +10191,25 @@ class ComputeAPIIpFilterTestCase(test.NoDBTestCase):
             kwargs = m_get.call_args[1]
             self.assertIsNone(kwargs['limit'])
 
+    @mock.patch('nova.db.instance_search_index_complete', return_value=True)
+    @mock.patch.object(compute_api.API, '_ip_filter')
+    def test_ip_filtering_search_index(self, mock_ip_filter, mock_complete):
+        self.flags(instance_search_index=True)
+        c = context.get_admin_context()
+        # The search index of the DB looks up the IP addresses
+        with mock.patch('nova.objects.InstanceList.get_by_filters') as m_get:
+            self.compute_api.get_all(
+                c, search_opts={'fixed_ip': '10.0.0.1', 'deleted': False},
+                limit=1)
+            self.assertEqual(1, m_get.call_args[1]['limit'])
+            self.assertFalse(mock_ip_filter.called)
+
+            # but not the ones of the deleted instances
+            self.compute_api.get_all(
+                c, search_opts={'fixed_ip': '10.0.0.1'}, limit=1)
+            self.assertIsNone(m_get.call_args[1]['limit'])
+            self.assertTrue(mock_ip_filter.called)
+
     def test_ip_filtering_pass_limit_to_db(self):
         c = context.get_admin_context()
         # No IP filter, verify that the limit is passed
@@ -159,15 +159,18 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
 
         def _make_compute_node(hyp_hostname):
             cn = mock.Mock(spec_set=['hypervisor_hostname', 'id',
+                                     'generation', 'obj_attr_is_set',
                                      'destroy'])
+            cn.obj_attr_is_set.return_value = True
             cn.id = info['cn_id']
+            cn.generation = info['cn_id'] * 10
             info['cn_id'] += 1
             cn.hypervisor_hostname = hyp_hostname
             return cn
 
         def _make_rt(node):
             n = mock.Mock(spec_set=['update_available_resource',
-                                    'nodename'])
+                                    '_stop_audit', 'nodename'])
             n.nodename = node
             return n
 
@@ -199,8 +202,13 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         get_db_nodes.assert_called_once_with(ctxt, use_slave=True)
         self.assertEqual([mock.call(node) for node in avail_nodes],
                          get_rt.call_args_list)
+        generations = {'node2': 20, 'node3': 30, 'node4': 40}
         for rt in rts:
-            rt.update_available_resource.assert_called_once_with(ctxt)
+            rt.update_available_resource.assert_called_once_with(
+                ctxt, generation=generations.get(rt.nodename))
+        # the failed audits no longer record the claims
+        self.assertEqual([False, True, True, False],
+                         [rt._stop_audit.called for rt in rts])
         self.assertEqual(expected_rt_dict,
                          self.compute._resource_tracker_dict)
         # First node in set should have been removed from DB
@@ -210,6 +218,105 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             else:
                 self.assertFalse(db_node.destroy.called)
 
+    @mock.patch.object(manager.ComputeManager, '_get_resource_audit_data')
+    @mock.patch.object(manager.ComputeManager, '_get_resource_tracker')
+    @mock.patch.object(fake_driver.FakeDriver, 'get_available_nodes')
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db')
+    def test_update_available_resource_bulk(self, get_db_nodes,
+                                            get_avail_nodes, get_rt,
+                                            get_audit_data):
+        self.flags(bulk_resource_audit=True)
+        ctxt = mock.Mock()
+        get_db_nodes.return_value = []
+        get_avail_nodes.return_value = ['node1', 'node2']
+        rts = {'node1': mock.Mock(), 'node2': mock.Mock()}
+        rts['node2'].update_available_resource.side_effect = (
+            exception.ComputeHostNotFound(host='fake'))
+        get_rt.side_effect = lambda nodename: rts[nodename]
+        audit_data = {nodename: {'resources': mock.sentinel.resources,
+                                 'instances': mock.sentinel.instances,
+                                 'migrations': mock.sentinel.migrations}
+                      for nodename in rts}
+        get_audit_data.return_value = audit_data
+
+        self.compute.update_available_resource(ctxt)
+
+        get_audit_data.assert_called_once_with(ctxt, set(['node1', 'node2']))
+        for rt in rts.values():
+            rt.start_audit.assert_called_once_with()
+            rt.update_available_resource.assert_called_once_with(
+                ctxt, resources=mock.sentinel.resources,
+                instances=mock.sentinel.instances,
+                migrations=mock.sentinel.migrations, generation=None)
+        self.assertEqual({'node1': rts['node1']},
+                         self.compute._resource_tracker_dict)
+
+    @mock.patch.object(manager.ComputeManager, '_get_resource_audit_data')
+    @mock.patch.object(manager.ComputeManager, '_get_resource_tracker')
+    @mock.patch.object(fake_driver.FakeDriver, 'get_available_nodes')
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db')
+    def test_update_available_resource_bulk_failed(self, get_db_nodes,
+                                                   get_avail_nodes, get_rt,
+                                                   get_audit_data):
+        self.flags(bulk_resource_audit=True)
+        ctxt = mock.Mock()
+        orphan = mock.Mock(hypervisor_hostname='orphan')
+        get_db_nodes.return_value = [orphan]
+        get_avail_nodes.return_value = ['node1', 'node2']
+        rts = {'node1': mock.Mock(), 'node2': mock.Mock()}
+        get_rt.side_effect = lambda nodename: rts[nodename]
+        get_audit_data.side_effect = test.TestingException()
+
+        self.compute.update_available_resource(ctxt)
+
+        # the nodes are audited one by one instead
+        for rt in rts.values():
+            rt.start_audit.assert_called_once_with()
+            rt._stop_audit.assert_called_once_with()
+            rt.update_available_resource.assert_called_once_with(
+                ctxt, generation=None)
+        self.assertEqual(rts, self.compute._resource_tracker_dict)
+        orphan.destroy.assert_called_once_with()
+
+    @mock.patch.object(objects.MigrationList, 'get_in_progress_by_host')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    @mock.patch.object(fake_driver.FakeDriver, 'get_available_resources')
+    def test_get_resource_audit_data(self, get_resources, get_instances,
+                                     get_migrations):
+        get_resources.return_value = {'node1': mock.sentinel.node1,
+                                      'node2': mock.sentinel.node2}
+        inst1 = objects.Instance(uuid='uuid1', node='node1')
+        inst2 = objects.Instance(uuid='uuid2', node='node2')
+        inst3 = objects.Instance(uuid='uuid3', node='gone')
+        get_instances.return_value = objects.InstanceList(
+            objects=[inst1, inst2, inst3])
+        mig1 = objects.Migration(source_compute=self.compute.host,
+                                 source_node='node1',
+                                 dest_compute=self.compute.host,
+                                 dest_node='node2')
+        mig2 = objects.Migration(source_compute='other',
+                                 source_node='node1',
+                                 dest_compute=self.compute.host,
+                                 dest_node='node2')
+        get_migrations.return_value = objects.MigrationList(
+            objects=[mig1, mig2])
+
+        audit_data = self.compute._get_resource_audit_data(
+            self.context, set(['node1', 'node2']))
+
+        get_instances.assert_called_once_with(
+            self.context, self.compute.host,
+            expected_attrs=['system_metadata', 'numa_topology'])
+        get_migrations.assert_called_once_with(self.context,
+                                               self.compute.host)
+        self.assertEqual(mock.sentinel.node1,
+                         audit_data['node1']['resources'])
+        self.assertEqual([inst1], audit_data['node1']['instances'].objects)
+        self.assertEqual([inst2], audit_data['node2']['instances'].objects)
+        self.assertEqual([mig1], audit_data['node1']['migrations'].objects)
+        self.assertEqual([mig1, mig2],
+                         audit_data['node2']['migrations'].objects)
+
     def test_delete_instance_without_info_cache(self):
         instance = fake_instance.fake_instance_obj(
                 self.context,
@@ -1335,6 +1442,25 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertEqual([x['uuid'] for x in driver_instances],
                          [x['uuid'] for x in result])
 
+    @mock.patch.object(objects.InstanceList, 'iter_by_filters')
+    @mock.patch.object(fake_driver.FakeDriver, 'list_instances')
+    @mock.patch.object(fake_driver.FakeDriver, 'list_instance_uuids',
+                       side_effect=NotImplementedError)
+    def test_get_instances_on_driver_fallback_batches(self, mock_uuids,
+                                                      mock_list, mock_iter):
+        self.flags(instance_list_batch_size=2)
+        self.flags(instance_name_template='inst-%i')
+        instances = [objects.Instance(id=x) for x in range(3)]
+        mock_iter.return_value = iter(instances)
+        mock_list.return_value = ['inst-2', 'inst-0']
+
+        result = self.compute._get_instances_on_driver(self.context,
+                                                       {'host': 'host'})
+
+        self.assertEqual([instances[2], instances[0]], result)
+        mock_iter.assert_called_once_with(self.context, {'host': 'host'},
+                                          batch_size=2, use_slave=True)
+
     def test_instance_usage_audit(self):
         instances = [objects.Instance(uuid='foo')]
 
@@ -1359,6 +1485,79 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
+    @mock.patch.object(compute_utils, 'notify_usage_exists')
+    @mock.patch.object(objects.BandwidthUsageList, 'get_by_uuids')
+    @mock.patch.object(objects.TaskLog, 'end_task')
+    @mock.patch.object(objects.TaskLog, 'begin_task')
+    @mock.patch.object(objects.InstanceList, 'get_active_by_window_joined')
+    @mock.patch.object(objects.TaskLog, 'get', return_value=None)
+    def test_instance_usage_audit_batch(self, mock_task_log, mock_get,
+                                        mock_begin, mock_end,
+                                        mock_get_bw_usages, mock_notify):
+        self.flags(instance_usage_audit=True, usage_audit_batch_size=2)
+        instances = [objects.Instance(uuid=uuid)
+                     for uuid in ('foo', 'bar', 'baz')]
+        mock_get.return_value = instances
+        bw_usage = objects.BandwidthUsage(instance_uuid='bar')
+        mock_get_bw_usages.side_effect = [[bw_usage], []]
+
+        self.compute._instance_usage_audit(self.context)
+
+        self.assertEqual(2, mock_get_bw_usages.call_count)
+        self.assertEqual(['foo', 'bar'],
+                         mock_get_bw_usages.call_args_list[0][0][1])
+        mock_notify.assert_has_calls([
+            mock.call(self.compute.notifier, self.context, instances[0],
+                      ignore_missing_network_data=False, bw_usages=[]),
+            mock.call(self.compute.notifier, self.context, instances[1],
+                      ignore_missing_network_data=False,
+                      bw_usages=[bw_usage]),
+            mock.call(self.compute.notifier, self.context, instances[2],
+                      ignore_missing_network_data=False, bw_usages=[])])
+
+    @mock.patch.object(compute_utils, 'notify_usage_exists')
+    @mock.patch.object(objects.BandwidthUsageList, 'get_by_uuids')
+    @mock.patch.object(objects.TaskLog, 'end_task')
+    @mock.patch.object(objects.TaskLog, 'begin_task')
+    @mock.patch.object(objects.InstanceList, 'get_active_by_window_joined')
+    @mock.patch.object(objects.TaskLog, 'get', return_value=None)
+    def test_instance_usage_audit_batch_failed(self, mock_task_log, mock_get,
+                                               mock_begin, mock_end,
+                                               mock_get_bw_usages,
+                                               mock_notify):
+        self.flags(instance_usage_audit=True, usage_audit_batch_size=2)
+        instances = [objects.Instance(uuid=uuid)
+                     for uuid in ('foo', 'bar', 'baz')]
+        mock_get.return_value = instances
+        mock_get_bw_usages.side_effect = [test.TestingException(), []]
+
+        self.compute._instance_usage_audit(self.context)
+
+        # the usages of the first batch are loaded for each instance
+        mock_notify.assert_has_calls([
+            mock.call(self.compute.notifier, self.context, instances[0],
+                      ignore_missing_network_data=False),
+            mock.call(self.compute.notifier, self.context, instances[1],
+                      ignore_missing_network_data=False),
+            mock.call(self.compute.notifier, self.context, instances[2],
+                      ignore_missing_network_data=False, bw_usages=[])])
+        self.assertTrue(mock_end.called)
+
+    def test_defer_periodic_task(self):
+        self.assertIsNone(self.compute._defer_periodic_task(
+            'update_available_resource'))
+
+        self.flags(periodic_task_busy_builds=2,
+                   periodic_task_defer_interval=20)
+        self.compute._builds_in_progress = 1
+        self.assertIsNone(self.compute._defer_periodic_task(
+            'update_available_resource'))
+        self.compute._builds_in_progress = 2
+        self.assertEqual(20, self.compute._defer_periodic_task(
+            'update_available_resource'))
+        self.assertIsNone(self.compute._defer_periodic_task(
+            '_sync_power_states'))
+
     @mock.patch.object(objects.InstanceList, 'get_by_host')
     def test_sync_power_states(self, mock_get):
         instance = mock.Mock()
@@ -1371,6 +1570,100 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                         use_slave=True)
             mock_spawn.assert_called_once_with(mock.ANY, instance)
 
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_columns_only(self, mock_get):
+        self.flags(sync_power_state_columns_only=True)
+        mock_get.return_value = []
+        self.compute._sync_power_states(mock.sentinel.context)
+        mock_get.assert_called_once_with(
+            mock.sentinel.context, self.compute.host, expected_attrs=[],
+            use_slave=True, columns=manager._SYNC_POWER_STATE_COLUMNS)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_instance_cache(self, mock_get):
+        self.flags(compute_instance_cache=True)
+        instance = fake_instance.fake_instance_obj(self.context,
+                                                   host=self.compute.host)
+        mock_get.return_value = [instance]
+        with mock.patch.object(self.compute._sync_power_pool,
+                               'spawn_n') as mock_spawn:
+            self.compute._sync_power_states(self.context)
+            mock_spawn.assert_called_once_with(mock.ANY, mock.ANY)
+            self.assertEqual(instance.uuid, mock_spawn.call_args[0][1].uuid)
+        mock_get.assert_called_once_with(self.context, self.compute.host,
+                                         expected_attrs=[], use_slave=True)
+
+        # the next runs only load the instances updated since then
+        with test.nested(
+            mock.patch.object(objects.InstanceList, 'get_by_filters',
+                              return_value=[]),
+            mock.patch.object(self.compute._sync_power_pool, 'spawn_n')
+        ) as (mock_get_by_filters, mock_spawn):
+            self.compute._sync_power_states(self.context)
+            self.assertEqual(1, mock_get_by_filters.call_count)
+            self.assertEqual(1, mock_spawn.call_count)
+        self.assertEqual(1, mock_get.call_count)
+
+    @mock.patch.object(fake_driver.FakeDriver, 'get_num_instances')
+    @mock.patch.object(fake_driver.FakeDriver, 'get_instances_power_states')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk(self, mock_get, mock_power_states,
+                                    mock_num):
+        self.flags(sync_power_state_bulk=True)
+        self.compute._last_full_power_sync = time.time()
+        running = objects.Instance(uuid='uuid1',
+                                   power_state=power_state.RUNNING)
+        stopped = objects.Instance(uuid='uuid2',
+                                   power_state=power_state.RUNNING)
+        gone = objects.Instance(uuid='uuid3',
+                                power_state=power_state.RUNNING)
+        mock_get.return_value = [running, stopped, gone]
+        mock_power_states.return_value = {'uuid1': power_state.RUNNING,
+                                          'uuid2': power_state.SHUTDOWN}
+        with mock.patch.object(self.compute._sync_power_pool,
+                               'spawn_n') as mock_spawn:
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertEqual([mock.call(mock.ANY, stopped),
+                              mock.call(mock.ANY, gone)],
+                             mock_spawn.call_args_list)
+        self.assertFalse(mock_num.called)
+
+    @mock.patch.object(fake_driver.FakeDriver, 'get_instances_power_states')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk_full_scan(self, mock_get,
+                                              mock_power_states):
+        self.flags(sync_power_state_bulk=True)
+        instance = objects.Instance(uuid='uuid1',
+                                    power_state=power_state.RUNNING)
+        mock_get.return_value = [instance]
+        mock_power_states.return_value = {'uuid1': power_state.RUNNING}
+        with mock.patch.object(self.compute._sync_power_pool,
+                               'spawn_n') as mock_spawn:
+            # The first sync checks all the instances
+            self.compute._sync_power_states(mock.sentinel.context)
+            mock_spawn.assert_called_once_with(mock.ANY, instance)
+            self.assertFalse(mock_power_states.called)
+
+            mock_spawn.reset_mock()
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertFalse(mock_spawn.called)
+            mock_power_states.assert_called_once_with()
+
+    @mock.patch.object(fake_driver.FakeDriver, 'get_instances_power_states',
+                       side_effect=NotImplementedError)
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk_not_implemented(self, mock_get,
+                                                    mock_power_states):
+        self.flags(sync_power_state_bulk=True,
+                   sync_power_state_full_interval=0)
+        instance = objects.Instance(uuid='uuid1',
+                                    power_state=power_state.RUNNING)
+        mock_get.return_value = [instance]
+        with mock.patch.object(self.compute._sync_power_pool,
+                               'spawn_n') as mock_spawn:
+            self.compute._sync_power_states(mock.sentinel.context)
+            mock_spawn.assert_called_once_with(mock.ANY, instance)
+
     def _get_sync_instance(self, power_state, vm_state, task_state=None,
                            shutdown_terminate=False):
         instance = objects.Instance()
@@ -2739,6 +3032,50 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                     last_refreshed=mock.ANY,
                     update_cells=False)
 
+    @mock.patch.object(utils, 'last_completed_audit_period',
+            return_value=(0, 1))
+    @mock.patch.object(time, 'time', side_effect=[10, 20, 21])
+    @mock.patch.object(objects.InstanceList, 'get_by_host', return_value=[])
+    @mock.patch.object(objects.BandwidthUsageList, 'get_by_uuids')
+    @mock.patch.object(objects.BandwidthUsageList, 'create_many')
+    def test_poll_bandwidth_usage_batch(self, create_many, get_by_uuids,
+            get_by_host, time, last_completed_audit):
+        self.flags(bandwidth_poll_interval=1, usage_audit_batch_size=2)
+        bw_counters = [{'uuid': 'uuid%d' % i, 'mac_address': 'mac%d' % i,
+                        'bw_in': 10, 'bw_out': 20} for i in range(3)]
+        usage = objects.BandwidthUsage(instance_uuid='uuid0', mac='mac0',
+                                       bw_in=3, bw_out=4, last_ctr_in=5,
+                                       last_ctr_out=30)
+        prev_usage = objects.BandwidthUsage(instance_uuid='uuid1',
+                                            mac='mac1', bw_in=100,
+                                            bw_out=100, last_ctr_in=8,
+                                            last_ctr_out=18)
+        # current then previous audit period of each batch
+        get_by_uuids.side_effect = [[usage], [prev_usage], [], []]
+        with mock.patch.object(self.compute.driver,
+                'get_all_bw_counters', return_value=bw_counters):
+            self.compute._poll_bandwidth_usage(self.context)
+
+        self.assertEqual(4, get_by_uuids.call_count)
+        get_by_uuids.assert_any_call(self.context, mock.ANY,
+                                     start_period=0, use_slave=True)
+        create_many.assert_has_calls([
+            mock.call(self.context,
+                      [{'uuid': 'uuid0', 'mac': 'mac0', 'bw_in': 8,
+                        'bw_out': 24, 'last_ctr_in': 10,
+                        'last_ctr_out': 20},
+                       {'uuid': 'uuid1', 'mac': 'mac1', 'bw_in': 2,
+                        'bw_out': 2, 'last_ctr_in': 10,
+                        'last_ctr_out': 20}],
+                      start_period=1, last_refreshed=mock.ANY,
+                      update_cells=False),
+            mock.call(self.context,
+                      [{'uuid': 'uuid2', 'mac': 'mac2', 'bw_in': 0,
+                        'bw_out': 0, 'last_ctr_in': 10,
+                        'last_ctr_out': 20}],
+                      start_period=1, last_refreshed=mock.ANY,
+                      update_cells=False)])
+
     def test_reverts_task_state_instance_not_found(self):
         # Tests that the reverts_task_state decorator in the compute manager
         # will not trace when an InstanceNotFound is raised.
@@ -2867,6 +3204,28 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             mock_save.assert_called_once_with()
             mock_rt.assert_called_once_with(self.context, instance)
 
+    @mock.patch.object(manager.LOG, 'info')
+    def test_report_build_stage_stats(self, mock_log):
+        self.compute.build_stage_stats.add('spawn', 2.0)
+        with mock.patch.object(self.compute.notifier, 'info') as mock_notify:
+            self.compute._report_build_stage_stats(self.context)
+
+        self.assertEqual(1, mock_log.call_count)
+        self.assertIn('spawn', mock_log.call_args[0][1])
+        mock_notify.assert_called_once_with(
+            self.context, 'compute.build_stage_stats',
+            {'host': self.compute.host,
+             'buckets': list(compute_utils.BuildStageStats.BUCKETS),
+             'stages': self.compute.build_stage_stats.get()})
+
+    @mock.patch.object(manager.LOG, 'info')
+    def test_report_build_stage_stats_no_builds(self, mock_log):
+        with mock.patch.object(self.compute.notifier, 'info') as mock_notify:
+            self.compute._report_build_stage_stats(self.context)
+
+        self.assertFalse(mock_log.called)
+        self.assertFalse(mock_notify.called)
+
 
 class ComputeManagerBuildInstanceTestCase(test.NoDBTestCase):
     def setUp(self):
@@ -3623,6 +3982,79 @@ class ComputeManagerBuildInstanceTestCase(test.NoDBTestCase):
         except Exception as e:
             self.assertIsInstance(e, exception.BuildAbortException)
 
+    def test_build_resources_image_prefetch(self):
+        self.flags(build_image_prefetch=True)
+        with test.nested(
+            mock.patch.object(self.compute, '_build_networks_for_instance',
+                              return_value=self.network_info),
+            mock.patch.object(self.compute, '_prep_block_device',
+                              return_value=mock.sentinel.block_device_info),
+            mock.patch.object(self.instance, 'save'),
+            mock.patch.object(self.compute.compute_api,
+                              'is_volume_backed_instance',
+                              return_value=False),
+            mock.patch.object(self.compute.driver, 'prefetch_image'),
+        ) as (mock_networks, mock_prep, mock_save, mock_volume_backed,
+              mock_prefetch):
+            with self.compute._build_resources(self.context, self.instance,
+                    self.requested_networks, self.security_groups,
+                    self.image, self.block_device_mapping) as resources:
+                self.assertEqual(mock.sentinel.block_device_info,
+                                 resources['block_device_info'])
+                mock_prefetch.assert_called_once_with(
+                    self.context, self.instance, self.image)
+
+        stats = self.compute.build_stage_stats.get()
+        self.assertEqual(1, stats['image']['runs'])
+        self.assertEqual(1, stats['block_device']['runs'])
+
+    def test_build_resources_image_prefetch_failure(self):
+        self.flags(build_image_prefetch=True)
+        with test.nested(
+            mock.patch.object(self.compute, '_build_networks_for_instance',
+                              return_value=self.network_info),
+            mock.patch.object(self.compute, '_prep_block_device'),
+            mock.patch.object(self.instance, 'save'),
+            mock.patch.object(self.compute.compute_api,
+                              'is_volume_backed_instance',
+                              return_value=False),
+            mock.patch.object(self.compute.driver, 'prefetch_image',
+                              side_effect=test.TestingException()),
+        ) as (mock_networks, mock_prep, mock_save, mock_volume_backed,
+              mock_prefetch):
+            # The image is then fetched when spawning the instance
+            with self.compute._build_resources(self.context, self.instance,
+                    self.requested_networks, self.security_groups,
+                    self.image, self.block_device_mapping):
+                pass
+            self.assertTrue(mock_prefetch.called)
+
+    def test_build_resources_image_prefetch_killed(self):
+        self.flags(build_image_prefetch=True)
+        with test.nested(
+            mock.patch.object(self.compute, '_build_networks_for_instance',
+                              return_value=self.network_info),
+            mock.patch.object(self.compute, '_prep_block_device',
+                              side_effect=test.TestingException()),
+            mock.patch.object(self.instance, 'save'),
+            mock.patch.object(self.compute.compute_api,
+                              'is_volume_backed_instance',
+                              return_value=False),
+            mock.patch.object(utils, 'spawn'),
+        ) as (mock_networks, mock_prep, mock_save, mock_volume_backed,
+              mock_spawn):
+            def _build_resources():
+                with self.compute._build_resources(self.context,
+                        self.instance, self.requested_networks,
+                        self.security_groups, self.image,
+                        self.block_device_mapping):
+                    pass
+
+            self.assertRaises(exception.BuildAbortException,
+                              _build_resources)
+            mock_spawn.return_value.kill.assert_called_once_with()
+            self.assertFalse(mock_spawn.return_value.wait.called)
+
     def test_failed_bdm_prep_from_delete_raises_unexpected(self):
         with test.nested(
                 mock.patch.object(self.compute,
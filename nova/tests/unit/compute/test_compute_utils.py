@@ -814,3 +814,52 @@ class ComputeUtilsMigrationTestCase(test.TestCase):
         result = compute_utils.get_inst_attrs_from_migration(migration,
                                                              instance)
         self.assertEqual(expected_result, result)
+
+
+class BuildStageStatsTestCase(test.NoDBTestCase):
+
+    def test_add(self):
+        stats = compute_utils.BuildStageStats()
+        stats.add('image', 0.5)
+        stats.add('image', 45.0, waited=2.0)
+        stats.add('image', 1000.0)
+
+        image_stats = stats.get()['image']
+        self.assertEqual(3, image_stats['runs'])
+        self.assertEqual(1045.5, image_stats['time'])
+        self.assertEqual(1000.0, image_stats['max_time'])
+        self.assertEqual(2.0, image_stats['wait_time'])
+        self.assertEqual([1, 0, 0, 0, 1, 0, 0, 0, 1],
+                         image_stats['histogram'])
+
+    def test_measure(self):
+        stats = compute_utils.BuildStageStats()
+        semaphore = mock.MagicMock()
+
+        self.assertRaises(test.TestingException,
+                          self._measure_failure, stats, semaphore)
+
+        self.assertTrue(semaphore.__enter__.called)
+        self.assertTrue(semaphore.__exit__.called)
+        self.assertEqual(1, stats.get()['network']['runs'])
+
+    def test_format(self):
+        stats = compute_utils.BuildStageStats()
+        stats.add('spawn', 2.0, waited=1.0)
+        stats.add('spawn', 40.0)
+
+        lines = stats.format()
+
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['Stage', 'Runs', 'Avg', '(s)', 'Max', '(s)', 'Wait',
+                          '(s)', '<=1s', '<=5s', '<=10s', '<=30s', '<=60s',
+                          '<=120s', '<=300s', '<=600s', '>600s'],
+                         lines[0].split())
+        self.assertEqual(['spawn', '2', '21.00', '40.00', '0.50', '0', '1',
+                          '0', '0', '1', '0', '0', '0', '0'],
+                         lines[1].split())
+
+    @staticmethod
+    def _measure_failure(stats, semaphore):
+        with stats.measure('network', semaphore):
+            raise test.TestingException()
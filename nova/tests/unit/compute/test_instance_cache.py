@@ -0,0 +1,134 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For the compute host instance cache.
+"""
+
+import mock
+from oslo_utils import timeutils
+
+from nova.compute import instance_cache
+from nova.compute import task_states
+from nova.compute import vm_states
+from nova import context
+from nova import objects
+from nova import test
+from nova.tests.unit import fake_instance
+
+
+class HostInstanceCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostInstanceCacheTestCase, self).setUp()
+        self.useFixture(test.TimeOverride())
+        self.ctxt = context.get_admin_context()
+        self.cache = instance_cache.HostInstanceCache('host1')
+        self.inst1 = self._instance('inst1')
+        self.inst2 = self._instance('inst2', vm_state=vm_states.RESCUED)
+
+    def _instance(self, uuid, **updates):
+        updates.setdefault('host', 'host1')
+        return fake_instance.fake_instance_obj(self.ctxt, uuid=uuid,
+                                               **updates)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_get_by_host_full_refresh(self, mock_get_by_host,
+                                      mock_get_by_filters):
+        mock_get_by_host.return_value = [self.inst1, self.inst2]
+
+        instances = self.cache.get_by_host(self.ctxt, expected_attrs=[])
+
+        self.assertEqual(set(['inst1', 'inst2']),
+                         set(inst.uuid for inst in instances))
+        # copies of the cached instances are returned
+        self.assertNotIn(self.inst1, instances)
+        mock_get_by_host.assert_called_once_with(
+            self.ctxt, 'host1', expected_attrs=[], use_slave=True)
+        self.assertFalse(mock_get_by_filters.called)
+
+        # new attributes need a full refresh
+        self.cache.get_by_host(self.ctxt, expected_attrs=['info_cache'])
+        self.assertEqual(2, mock_get_by_host.call_count)
+        # and so does an expired cache
+        timeutils.advance_time_seconds(601)
+        self.cache.get_by_host(self.ctxt, expected_attrs=[])
+        self.assertEqual(3, mock_get_by_host.call_count)
+        mock_get_by_host.assert_called_with(
+            self.ctxt, 'host1', expected_attrs=['info_cache'], use_slave=True)
+        self.assertFalse(mock_get_by_filters.called)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_get_by_host_incremental_refresh(self, mock_get_by_host,
+                                             mock_get_by_filters):
+        mock_get_by_host.return_value = [self.inst1, self.inst2]
+        self.cache.get_by_host(self.ctxt)
+        last_refresh = timeutils.utcnow()
+        timeutils.advance_time_seconds(60)
+
+        deleted = self._instance('inst1')
+        deleted.deleted = True
+        inst3 = self._instance('inst3')
+        mock_get_by_filters.return_value = [deleted, inst3]
+        instances = self.cache.get_by_host(self.ctxt)
+
+        self.assertEqual(set(['inst2', 'inst3']),
+                         set(inst.uuid for inst in instances))
+        mock_get_by_host.assert_called_once_with(
+            self.ctxt, 'host1', expected_attrs=[], use_slave=True)
+        mock_get_by_filters.assert_called_once_with(
+            mock.ANY, {'host': 'host1',
+                       'changes-since': last_refresh -
+                       instance_cache._REFRESH_OVERLAP},
+            expected_attrs=[])
+        self.assertEqual('yes',
+                         mock_get_by_filters.call_args[0][0].read_deleted)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_get_by_host_stale_instances(self, mock_get_by_host,
+                                         mock_get_by_filters):
+        self.inst2.task_state = task_states.MIGRATING
+        mock_get_by_host.return_value = [self.inst1, self.inst2]
+        self.cache.get_by_host(self.ctxt)
+
+        migrated = self._instance('inst2', host='host2')
+        mock_get_by_filters.side_effect = [[], [migrated]]
+        self.cache.invalidate('inst3')
+        instances = self.cache.get_by_host(self.ctxt)
+
+        self.assertEqual(['inst1'], [inst.uuid for inst in instances])
+        uuid_filters = mock_get_by_filters.call_args_list[1][0][1]
+        self.assertEqual(set(['inst2', 'inst3']),
+                         set(uuid_filters['uuid']))
+        # the invalidated instances are only reloaded once
+        mock_get_by_filters.reset_mock()
+        mock_get_by_filters.side_effect = None
+        mock_get_by_filters.return_value = []
+        self.cache.get_by_host(self.ctxt)
+        self.assertEqual(1, mock_get_by_filters.call_count)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_get_by_host_filters(self, mock_get_by_host):
+        self.inst1.task_state = task_states.REBOOTING
+        mock_get_by_host.return_value = [self.inst1, self.inst2]
+
+        instances = self.cache.get_by_host(
+            self.ctxt, filters={'vm_state': vm_states.RESCUED})
+        self.assertEqual(['inst2'], [inst.uuid for inst in instances])
+
+        instances = self.cache.get_by_host(
+            self.ctxt, filters={'task_state': [task_states.REBOOTING,
+                                               task_states.REBOOT_PENDING]})
+        self.assertEqual(['inst1'], [inst.uuid for inst in instances])
@@ -1241,10 +1241,31 @@ class TrackerPeriodicTestCase(BaseTrackerTestCase):
             resources = {'there is someone in my head': 'but it\'s not me'}
             mock_driver.get_available_resource.return_value = resources
             self.tracker.update_available_resource(self.context)
-            mock_uar.assert_called_once_with(self.context, resources)
+            mock_uar.assert_called_once_with(self.context, resources,
+                                             instances=None,
+                                             migrations=None,
+                                             generation=None)
 
         _test()
 
+    @mock.patch.object(objects.MigrationList,
+                       'get_in_progress_by_host_and_node')
+    @mock.patch.object(objects.InstanceList, 'get_by_host_and_node')
+    def test_update_available_resource_preloaded(self, mock_get_instances,
+                                                 mock_get_migrations):
+        resources = self.tracker.driver.get_available_resource(
+            self.tracker.nodename)
+        with mock.patch.object(self.tracker.driver,
+                               'get_available_resource') as mock_get_res:
+            self.tracker.update_available_resource(
+                self.context, resources=resources,
+                instances=objects.InstanceList(objects=[]),
+                migrations=objects.MigrationList(objects=[]))
+
+        self.assertFalse(mock_get_res.called)
+        self.assertFalse(mock_get_instances.called)
+        self.assertFalse(mock_get_migrations.called)
+
 
 class StatsDictTestCase(BaseTrackerTestCase):
     """Test stats handling for a virt driver that provides
@@ -421,6 +421,13 @@ class BaseTestCase(test.NoDBTestCase):
 
 class TestUpdateAvailableResources(BaseTestCase):
 
+    @mock.patch('nova.utils.synchronized')
+    def test_lock_per_node(self, sync_mock):
+        sync_mock.return_value = lambda f: f
+        self._setup_rt()
+        self.rt.update_usage(mock.sentinel.ctx, mock.sentinel.instance)
+        sync_mock.assert_called_once_with('compute_resources-fake-node')
+
     def _update_available_resources(self):
         # We test RT._update separately, since the complexity
         # of the update_available_resource() function is high enough as
@@ -587,6 +594,77 @@ class TestUpdateAvailableResources(BaseTestCase):
         self.assertTrue(obj_base.obj_equal_prims(expected_resources,
                                                  self.rt.compute_node))
 
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_prefetch_accounts_for_concurrent_claims(self, get_mock,
+                                                     migr_mock, get_cn_mock):
+        self.flags(reserved_host_disk_mb=0,
+                   reserved_host_memory_mb=0,
+                   resource_audit_prefetch=True)
+        self._setup_rt()
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+
+        def fake_get_instances(*args, **kwargs):
+            # The instance is claimed while the instances are loaded, after
+            # the query saw the instances of the node
+            self.rt._record_audit_claim(instance=instance)
+            return []
+
+        get_mock.side_effect = fake_get_instances
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0]
+
+        self._update_available_resources()
+
+        self.assertEqual([instance.uuid], list(self.rt.tracked_instances))
+        self.assertEqual(instance.memory_mb,
+                         self.rt.compute_node.memory_mb_used)
+        self.assertEqual(1, self.rt.compute_node.running_vms)
+        # The claims made after the audit are not recorded anymore
+        self.assertIsNone(self.rt.audit_claimed_instances)
+        self.assertIsNone(self.rt.audit_claimed_migrations)
+
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
+    def test_audit_checksum(self, get_mock, migr_mock, get_cn_mock):
+        self.flags(reserved_host_disk_mb=0,
+                   reserved_host_memory_mb=0,
+                   resource_audit_checksum=True)
+        self._setup_rt()
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+        get_mock.return_value = [instance]
+        migr_mock.return_value = []
+        get_cn_mock.return_value = _COMPUTE_NODE_FIXTURES[0]
+
+        with mock.patch.object(
+                self.rt, '_update_usage_from_instances',
+                wraps=self.rt._update_usage_from_instances) as mock_usage:
+            self._update_available_resources()
+            self._update_available_resources()
+
+            # Nothing changed since the first audit
+            self.assertEqual(1, mock_usage.call_count)
+            self.assertEqual([instance.uuid],
+                             list(self.rt.tracked_instances))
+            self.assertEqual(instance.memory_mb,
+                             self.rt.compute_node.memory_mb_used)
+            self.assertEqual(1, self.rt.compute_node.running_vms)
+            self.assertEqual(1, self.rt.stats.num_instances)
+
+            # A drift of the usage maintained by the claims is corrected
+            self.rt.compute_node.memory_mb_used += 1
+            self._update_available_resources()
+            self.assertEqual(2, mock_usage.call_count)
+            self.assertEqual(instance.memory_mb,
+                             self.rt.compute_node.memory_mb_used)
+
+            # and the usage is computed again when an instance changes
+            instance.task_state = task_states.REBOOTING
+            self._update_available_resources()
+            self.assertEqual(3, mock_usage.call_count)
+
     @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
     @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
     @mock.patch('nova.objects.InstanceList.get_by_host_and_node')
@@ -1119,6 +1197,80 @@ class TestUpdateComputeNode(BaseTestCase):
         urs_mock = self.sched_client_mock.update_resource_stats
         urs_mock.assert_called_once_with(self.rt.compute_node)
 
+    @mock.patch('nova.objects.Service.get_by_compute_host')
+    def test_existing_compute_node_updated_changed_fields(self,
+                                                         service_mock):
+        self._setup_rt()
+
+        compute = copy.deepcopy(_COMPUTE_NODE_FIXTURES[0])
+        self.rt.compute_node = compute
+        self.rt._update(mock.sentinel.ctx)
+        urs_mock = self.sched_client_mock.update_resource_stats
+        self.assertEqual(1, urs_mock.call_count)
+
+        # Setting a field to the value it already has must not be reported
+        changed_fields = []
+        urs_mock.side_effect = lambda compute_node: changed_fields.extend(
+            compute_node.obj_what_changed())
+        compute.memory_mb = compute.memory_mb
+        compute.free_disk_gb = compute.free_disk_gb
+        self.rt._update(mock.sentinel.ctx)
+        self.assertEqual(1, urs_mock.call_count)
+
+        compute.memory_mb_used += 512
+        compute.free_disk_gb = compute.free_disk_gb
+        self.rt._update(mock.sentinel.ctx)
+        self.assertEqual(2, urs_mock.call_count)
+        self.assertEqual(['memory_mb_used'], changed_fields)
+
+    def test_update_rewrites_claimed_fields(self):
+        self._setup_rt()
+        compute = copy.deepcopy(_COMPUTE_NODE_FIXTURES[0])
+        compute.generation = 4
+        self.rt.compute_node = compute
+        self.rt._update(mock.sentinel.ctx)
+        self.assertEqual(4, self.rt.saved_generation)
+
+        written = []
+
+        def fake_save(compute_node):
+            written.append(compute_node.obj_what_changed())
+            compute_node.obj_reset_changes()
+            if len(written) == 1:
+                # A scheduler claimed resources before this update, which
+                # loads them back in the fields which were not written
+                compute_node.generation += 2
+                compute_node.free_ram_mb -= 512
+            else:
+                compute_node.generation += 1
+
+        urs_mock = self.sched_client_mock.update_resource_stats
+        urs_mock.side_effect = fake_save
+        free_ram_mb = compute.free_ram_mb
+        compute.memory_mb_used += 512
+        self.rt._update(mock.sentinel.ctx)
+
+        self.assertEqual(2, len(written))
+        self.assertEqual(set(['memory_mb_used']), written[0])
+        self.assertEqual(set(resource_tracker._CLAIMED_FIELDS), written[1])
+        self.assertEqual(free_ram_mb, compute.free_ram_mb)
+        self.assertEqual(7, self.rt.saved_generation)
+
+    def test_reconcile_claims(self):
+        self._setup_rt()
+        self.rt.compute_node = copy.deepcopy(_COMPUTE_NODE_FIXTURES[0])
+        self.rt.old_resources = {'memory_mb_used': 512}
+        self.rt.saved_generation = 3
+
+        # An older generation was loaded before our last update
+        for generation in (None, 2, 3):
+            self.rt._reconcile_claims(generation)
+            self.assertEqual({'memory_mb_used': 512}, self.rt.old_resources)
+
+        # A scheduler claim bumped the generation
+        self.rt._reconcile_claims(4)
+        self.assertEqual({}, self.rt.old_resources)
+
 
 class TestInstanceClaim(BaseTestCase):
 
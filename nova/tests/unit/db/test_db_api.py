@@ -58,6 +58,7 @@ from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy import types as col_types
 from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
+from nova.network import model as network_model
 from nova import objects
 from nova.objects import fields
 from nova import quota
@@ -402,6 +403,43 @@ class UnsupportedDbRegexpTestCase(DbTestCase):
                     marker = insts[-1]['uuid']
                     self.assertEqual(correct[-1]['uuid'], marker)
 
+    def test_instance_get_all_by_filters_keyset_paginate(self,
+            mock_get_regexp):
+        '''Verifies sort order with pagination from keyset markers.'''
+        created_at = [datetime.datetime(2016, 1, 1, 0, 0, 1),
+                      datetime.datetime(2016, 1, 1, 0, 0, 2)]
+        insts = [self.create_instance_with_args(created_at=created_at[i % 2])
+                 for i in range(5)]
+
+        def _get_marker(inst, keys):
+            return {key: (inst[key].isoformat()
+                          if isinstance(inst[key], datetime.datetime)
+                          else inst[key])
+                    for key in keys}
+
+        # Default sorting, 'created_at' then 'id' in desc order, and by
+        # 'uuid' in asc order
+        for sort_keys, sort_dirs, correct_order in [
+                (None, None, sorted(insts, reverse=True,
+                    key=lambda inst: (inst['created_at'], inst['id']))),
+                (['uuid'], ['asc'], sorted(
+                    insts, key=lambda inst: inst['uuid']))]:
+            for limit in range(1, 4):
+                marker = None
+                for i in range(0, 6, limit):
+                    correct = correct_order[i:i + limit]
+                    result = self._assert_equals_inst_order(
+                        correct, {}, sort_keys=sort_keys,
+                        sort_dirs=sort_dirs, limit=limit, marker=marker)
+                    if result:
+                        marker = _get_marker(
+                            result[-1],
+                            (sort_keys or []) + ['created_at', 'id'])
+
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters_sort,
+                          self.context, {}, marker={'id': 1})
+
     def test_instance_get_deleted_by_filters_sort_keys_paginate(self,
             mock_get_regexp):
         '''Verifies sort order with pagination for deleted instances.'''
@@ -1305,6 +1343,18 @@ class MigrationTestCase(test.TestCase):
         self.assertEqual(3, len(migrations))
         self._assert_in_progress(migrations)
 
+    def test_in_progress_host1(self):
+        migrations = db.migration_get_in_progress_by_host(self.ctxt, 'host1')
+        # 2 as source + 1 as dest
+        self.assertEqual(3, len(migrations))
+        self._assert_in_progress(migrations)
+
+    def test_in_progress_host2(self):
+        migrations = db.migration_get_in_progress_by_host(self.ctxt, 'host2')
+        # 2 as dest, 2 as source
+        self.assertEqual(4, len(migrations))
+        self._assert_in_progress(migrations)
+
     def test_instance_join(self):
         migrations = db.migration_get_in_progress_by_host_and_node(self.ctxt,
                 'host2', 'b')
@@ -2103,6 +2153,26 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def test_instance_get_all_by_filters_columns(self):
+        instance = self.create_instance_with_args(vm_state='active')
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                columns=['vm_state'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(instance['uuid'], result[0]['uuid'])
+        self.assertEqual(instance['id'], result[0]['id'])
+        self.assertEqual('active', result[0]['vm_state'])
+        self.assertNotIn('hostname', result[0])
+        self.assertEqual([], result[0]['system_metadata'])
+
+    def test_instance_get_all_by_host_columns(self):
+        instance = self.create_instance_with_args(host='h1')
+        self.create_instance_with_args(host='h2')
+        result = db.instance_get_all_by_host(self.ctxt, 'h1',
+                                             columns=['power_state'])
+        self.assertEqual([instance['uuid']], [inst['uuid'] for inst in result])
+        self.assertIn('power_state', result[0])
+        self.assertNotIn('host', result[0])
+
     def test_instance_get_all_by_filters_zero_limit(self):
         self.create_instance_with_args()
         instances = db.instance_get_all_by_filters(self.ctxt, {}, limit=0)
@@ -2199,6 +2269,97 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                                 {'display_name': u'test♥'})
         self._assertEqualListsOfInstances(result, [i1, i3])
 
+    def test_instance_get_all_by_filters_search_index(self):
+        self.flags(instance_search_index=True)
+        # the index is complete once rebuilt
+        self.assertIsNone(db.instance_search_index_rebuild(self.ctxt, None,
+                                                           10))
+        self.assertTrue(db.instance_search_index_complete(self.ctxt))
+        i1 = self.create_instance_with_args(display_name='web-server1')
+        i2 = self.create_instance_with_args(display_name='db-server2')
+        i3 = self.create_instance_with_args(display_name='web3')
+
+        def _get_all(**filters):
+            filters['deleted'] = False
+            return db.instance_get_all_by_filters(self.ctxt, filters)
+
+        self._assertEqualListsOfInstances(
+            [i1, i2], _get_all(display_name='server'))
+        self._assertEqualListsOfInstances(
+            [i1, i3], _get_all(display_name='^web'))
+        self._assertEqualListsOfInstances(
+            [i1], _get_all(display_name='^web-server1$'))
+        # the regular expressions are still matched
+        self._assertEqualListsOfInstances(
+            [i3], _get_all(display_name='web[0-9]'))
+
+        i3 = db.instance_update(self.ctxt, i3['uuid'],
+                                {'display_name': 'server3'})
+        self._assertEqualListsOfInstances(
+            [i1, i2, i3], _get_all(display_name='server'))
+        self._assertEqualListsOfInstances(
+            [i1], _get_all(display_name='^web'))
+
+        nw_info = network_model.NetworkInfo([network_model.VIF(
+            network=network_model.Network(subnets=[network_model.Subnet(
+                cidr='10.0.0.0/24',
+                ips=[network_model.FixedIP(address='10.0.0.12')])]))])
+        db.instance_info_cache_update(self.ctxt, i2['uuid'],
+                                      {'network_info': nw_info.json()})
+        self._assertEqualListsOfInstances(
+            [i2], _get_all(ip='^10\\.0\\.0\\.1'))
+        self._assertEqualListsOfInstances(
+            [], _get_all(ip='^10\\.0\\.0\\.1$'))
+        self._assertEqualListsOfInstances(
+            [], _get_all(ip6='^10\\.0\\.0\\.1'))
+
+        db.instance_destroy(self.ctxt, i2['uuid'])
+        session = sqlalchemy_api.get_session()
+        for model in (models.InstanceSearchPrefix,
+                      models.InstanceSearchTrigram,
+                      models.InstanceSearchFixedIP):
+            self.assertEqual(0, session.query(model).filter_by(
+                instance_uuid=i2['uuid']).count())
+
+    def test_instance_search_index_rebuild(self):
+        i1 = self.create_instance_with_args(display_name='server1')
+        i2 = self.create_instance_with_args(display_name='server2')
+        self.flags(instance_search_index=True)
+        filters = {'display_name': 'server', 'deleted': False}
+
+        self.assertEqual(i1['id'],
+                         db.instance_search_index_rebuild(self.ctxt, None, 1))
+        self.assertEqual(i2['id'],
+                         db.instance_search_index_rebuild(self.ctxt,
+                                                          i1['id'], 1))
+        # the index is not used until the rebuild completes
+        self.assertFalse(db.instance_search_index_complete(self.ctxt))
+        with mock.patch.object(sqlalchemy_api,
+                               '_search_index_instance_filter') as mock_index:
+            result = db.instance_get_all_by_filters(self.ctxt, filters)
+            self.assertFalse(mock_index.called)
+        self._assertEqualListsOfInstances([i1, i2], result)
+
+        self.assertIsNone(db.instance_search_index_rebuild(self.ctxt,
+                                                           i2['id'], 1))
+        self.assertTrue(db.instance_search_index_complete(self.ctxt))
+        result = db.instance_get_all_by_filters(self.ctxt, filters)
+        self._assertEqualListsOfInstances([i1, i2], result)
+
+    def test_instance_search_index_complete_cached(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        sqlalchemy_api._instance_search_index_set_complete(
+            self.ctxt, sqlalchemy_api.get_session(), True)
+        session = sqlalchemy_api.get_session()
+        session.query(models.InstanceSearchIndexState).update(
+            {'complete': False})
+        # the state is only read again after _SEARCH_INDEX_STATE_TTL
+        self.assertTrue(db.instance_search_index_complete(self.ctxt))
+        timeutils.advance_time_seconds(
+            sqlalchemy_api._SEARCH_INDEX_STATE_TTL + 1)
+        self.assertFalse(db.instance_search_index_complete(self.ctxt))
+
     def test_instance_get_all_by_filters_tags(self):
         instance = self.create_instance_with_args(
             metadata={'foo': 'bar'})
@@ -6772,6 +6933,43 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
                          self.ctxt, 'p1', 'u1'))
 
+    def test_quota_usage_count(self):
+        for user_id, vcpus in (('u1', 1), ('u1', 2), ('u2', 4)):
+            db.instance_create(self.ctxt, {'project_id': 'p1',
+                                           'user_id': user_id,
+                                           'vcpus': vcpus, 'memory_mb': 64})
+        db.security_group_create(self.ctxt, {'project_id': 'p1',
+                                             'user_id': 'u2'})
+        syncs = ['_sync_instances', '_sync_security_groups']
+        self.assertEqual({'instances': 3, 'cores': 7, 'ram': 192,
+                          'security_groups': 1},
+                         db.quota_usage_count(self.ctxt, 'p1', syncs))
+        self.assertEqual({'instances': 2, 'cores': 3, 'ram': 128,
+                          'security_groups': 0},
+                         db.quota_usage_count(self.ctxt, 'p1', syncs,
+                                              user_id='u1'))
+
+    def test_quota_usage_count_resizing(self):
+        flavor = db.flavor_create(self.ctxt, {
+            'name': 'big', 'flavorid': 'big', 'memory_mb': 256, 'vcpus': 4,
+            'root_gb': 1, 'ephemeral_gb': 0, 'swap': 0})
+        for status, user_id in (('pre-migrating', 'u1'),
+                                ('post-migrating', 'u2'),
+                                ('finished', 'u1'), ('error', 'u1')):
+            instance = db.instance_create(self.ctxt, {
+                'project_id': 'p1', 'user_id': user_id, 'vcpus': 1,
+                'memory_mb': 64})
+            db.migration_create(self.ctxt, {
+                'instance_uuid': instance['uuid'], 'status': status,
+                'new_instance_type_id': flavor['id']})
+        syncs = ['_sync_instances']
+        # only the in progress upsizes are counted with their new flavor
+        self.assertEqual({'instances': 4, 'cores': 10, 'ram': 640},
+                         db.quota_usage_count(self.ctxt, 'p1', syncs))
+        self.assertEqual({'instances': 3, 'cores': 6, 'ram': 384},
+                         db.quota_usage_count(self.ctxt, 'p1', syncs,
+                                              user_id='u1'))
+
     def test_get_project_user_quota_usages_in_order(self):
         _quota_reserve(self.ctxt, 'p1', 'u1')
         with mock.patch.object(query.Query, 'order_by') as order_mock:
@@ -7026,7 +7224,8 @@ class S3ImageTestCase(test.TestCase):
 
 class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
-    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at']
+    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at',
+                     'generation']
 
     def setUp(self):
         super(ComputeNodeTestCase, self).setUp()
@@ -7077,6 +7276,23 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = jsonutils.loads(node['stats'])
         self.assertEqual(self.stats, new_stats)
 
+    def test_compute_node_get_all_changed_since(self):
+        since = timeutils.utcnow() - datetime.timedelta(minutes=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual([self.item['id']], [node['id'] for node in nodes])
+
+        since = timeutils.utcnow() + datetime.timedelta(minutes=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual([], nodes)
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        since = timeutils.utcnow() - datetime.timedelta(minutes=1)
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(self.item['id'], nodes[0]['id'])
+        self.assertTrue(nodes[0]['deleted'])
+
     def test_compute_node_get_all_deleted_compute_node(self):
         # Create a service and compute node and ensure we can find its stats;
         # delete the service and compute node when done and loop again
@@ -7246,6 +7462,32 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = jsonutils.loads(item_updated['stats'])
         self.assertEqual(stats, new_stats)
 
+    def test_compute_node_update_bumps_generation(self):
+        item_updated = db.compute_node_update(self.ctxt, self.item['id'], {})
+        self.assertEqual(self.item['generation'] + 1,
+                         item_updated['generation'])
+
+    def test_compute_node_claim(self):
+        item_claimed = db.compute_node_claim(self.ctxt, self.item['id'],
+                                             self.item['generation'],
+                                             512, 10, 1)
+        self.assertEqual(self.item['generation'] + 1,
+                         item_claimed['generation'])
+        self.assertEqual(1024 - 512, item_claimed['free_ram_mb'])
+        self.assertEqual(512, item_claimed['memory_mb_used'])
+        self.assertEqual(2048 - 10, item_claimed['free_disk_gb'])
+        self.assertEqual(10, item_claimed['local_gb_used'])
+        self.assertEqual(1, item_claimed['vcpus_used'])
+        self.assertEqual(1, item_claimed['running_vms'])
+
+    def test_compute_node_claim_generation_conflict(self):
+        db.compute_node_update(self.ctxt, self.item['id'], {})
+        self.assertRaises(exception.ComputeNodeGenerationConflict,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          self.item['generation'], 512, 10, 1)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1024, node['free_ram_mb'])
+
     def test_compute_node_delete(self):
         compute_node_id = self.item['id']
         db.compute_node_delete(self.ctxt, compute_node_id)
@@ -7928,6 +8170,35 @@ class BwUsageTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
         self._test_bw_usage_update(**expected_bw_usage)
 
+    def test_bw_usage_update_many(self):
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        db.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+
+        bw_usages = [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                      'bw_in': 300, 'bw_out': 400,
+                      'last_ctr_in': 23456, 'last_ctr_out': 78901},
+                     {'uuid': 'fake_uuid1', 'mac': 'fake_mac2',
+                      'bw_in': 1, 'bw_out': 2,
+                      'last_ctr_in': 3, 'last_ctr_out': 4},
+                     {'uuid': 'fake_uuid2', 'mac': 'fake_mac3',
+                      'bw_in': 5, 'bw_out': 6,
+                      'last_ctr_in': 7, 'last_ctr_out': 8}]
+        result = db.bw_usage_update_many(self.ctxt, start_period, bw_usages,
+                                         update_cells=False)
+        self.assertEqual(3, len(result))
+
+        for usage in bw_usages:
+            expected_bw_usage = dict(usage, start_period=start_period,
+                                     last_refreshed=now)
+            bw_usage = db.bw_usage_get(self.ctxt, usage['uuid'],
+                                       start_period, usage['mac'])
+            self._assertEqualObjects(expected_bw_usage, bw_usage,
+                                     ignored_keys=self._ignored_keys)
+        self.assertEqual([], db.bw_usage_update_many(self.ctxt, start_period,
+                                                     []))
+
 
 class Ec2TestCase(test.TestCase):
 
@@ -8078,6 +8349,12 @@ class ArchiveTestCase(test.TestCase):
             if table_name == 'tags':
                 continue
 
+            # NOTE: migrations 315 and 316 introduced the search index of the
+            #       instances, which is rebuilt rather than archived, so its
+            #       tables have no shadow tables
+            if table_name.startswith('instance_search_'):
+                continue
+
             if table_name.startswith("shadow_"):
                 self.assertIn(table_name[7:], metadata.tables)
                 continue
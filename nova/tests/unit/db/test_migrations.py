@@ -805,6 +805,38 @@ class NovaMigrationsCheckers(test_migrations.ModelsMigrationsSync,
         self.assertIndexMembers(engine, 'instance_system_metadata',
                                 'instance_uuid', ['instance_uuid'])
 
+    def _check_313(self, engine, data):
+        self.assertColumnExists(engine, 'compute_nodes', 'generation')
+        self.assertColumnExists(engine, 'shadow_compute_nodes', 'generation')
+
+    def _check_314(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_deleted_created_at_id_idx',
+                                ['deleted', 'created_at', 'id'])
+        self.assertIndexMembers(
+            engine, 'instances',
+            'instances_project_id_deleted_created_at_id_idx',
+            ['project_id', 'deleted', 'created_at', 'id'])
+
+    def _check_315(self, engine, data):
+        self.assertColumnExists(engine, 'instance_search_prefixes', 'value')
+        self.assertIndexMembers(engine, 'instance_search_prefixes',
+                                'instance_search_prefixes_field_value_idx',
+                                ['field', 'value'])
+        self.assertColumnExists(engine, 'instance_search_trigrams', 'trigram')
+        self.assertIndexMembers(engine, 'instance_search_trigrams',
+                                'instance_search_trigrams_field_trigram_idx',
+                                ['field', 'trigram', 'instance_uuid'])
+        self.assertColumnExists(engine, 'instance_search_fixed_ips',
+                                'address')
+        self.assertIndexMembers(engine, 'instance_search_fixed_ips',
+                                'instance_search_fixed_ips_address_idx',
+                                ['address'])
+
+    def _check_316(self, engine, data):
+        self.assertColumnExists(engine, 'instance_search_index_state',
+                                'complete')
+
 
 class TestNovaMigrationsSQLite(NovaMigrationsCheckers,
                                test_base.DbTestCase,
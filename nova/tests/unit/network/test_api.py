@@ -548,6 +548,19 @@ class ApiTestCase(test.TestCase):
                                             update_cells=False)
         self.assertEqual(fake_result, result)
 
+    @mock.patch.object(api.API, 'get_instance_nw_info')
+    def test_get_instances_nw_info(self, mock_get):
+        error = exception.InstanceNotFound(instance_id='uuid2')
+        mock_get.side_effect = [mock.sentinel.nw_info, error]
+        instances = [objects.Instance(uuid='uuid1'),
+                     objects.Instance(uuid='uuid2')]
+        result = self.network_api.get_instances_nw_info(self.context,
+                                                        instances)
+        self.assertEqual({'uuid1': mock.sentinel.nw_info, 'uuid2': error},
+                         result)
+        mock_get.assert_has_calls([mock.call(self.context, instances[0]),
+                                   mock.call(self.context, instances[1])])
+
 
 @mock.patch('nova.network.api.API')
 @mock.patch('nova.db.instance_info_cache_update', return_value=fake_info_cache)
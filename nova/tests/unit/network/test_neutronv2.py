@@ -2373,7 +2373,7 @@ class TestNeutronv2(TestNeutronv2Base):
         fake_ips = [model.IP(x['ip_address']) for x in fake_port['fixed_ips']]
         api = neutronapi.API()
         self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_port).AndReturn(
+        api._get_subnets_from_port(self.context, fake_port, None).AndReturn(
             [fake_subnet])
         self.mox.ReplayAll()
         neutronapi.get_client('fake')
@@ -2593,7 +2593,7 @@ class TestNeutronv2(TestNeutronv2Base):
                 self.moxed_client, '1.1.1.1', requested_port['id']).AndReturn(
                     [{'floating_ip_address': '10.0.0.1'}])
         for requested_port in requested_ports:
-            api._get_subnets_from_port(self.context, requested_port
+            api._get_subnets_from_port(self.context, requested_port, None
                 ).AndReturn(fake_subnets)
 
         self.mox.StubOutWithMock(api, '_get_preexisting_port_ids')
@@ -2847,6 +2847,138 @@ class TestNeutronv2WithMock(test.TestCase):
                           api.get_instance_nw_info, 'context', instance)
         mock_lock.assert_called_once_with('refresh_cache-%s' % instance.uuid)
 
+    @mock.patch.object(neutronapi, 'get_client', return_value=mock.Mock())
+    def test_get_instances_nw_info_kwargs(self, mock_get_client):
+        mock_client = mock_get_client()
+        instances = [objects.Instance(uuid='uuid1', project_id='project1'),
+                     objects.Instance(uuid='uuid2', project_id='project2')]
+        instances[0].info_cache = objects.InstanceInfoCache(
+            network_info=model.NetworkInfo.hydrate(
+                [{'id': 'port1', 'network': {'id': 'net1'}}]))
+        instances[1].info_cache = objects.InstanceInfoCache(
+            network_info=model.NetworkInfo())
+        port1 = {'id': 'port1', 'device_id': 'uuid1',
+                 'tenant_id': 'project1', 'network_id': 'net1',
+                 'fixed_ips': [{'subnet_id': 'subnet1',
+                                'ip_address': '10.0.0.2'}]}
+        port2 = {'id': 'port2', 'device_id': 'uuid1',
+                 'tenant_id': 'other-project'}
+        dhcp_port = {'id': 'dhcp1', 'network_id': 'net1'}
+        net1 = {'id': 'net1'}
+        subnet1 = {'id': 'subnet1', 'network_id': 'net1'}
+        fip1 = {'id': 'fip1', 'port_id': 'port1'}
+        mock_client.list_ports.side_effect = [{'ports': [port1, port2]},
+                                              {'ports': [dhcp_port]}]
+        mock_client.list_networks.return_value = {'networks': [net1]}
+        mock_client.list_subnets.return_value = {'subnets': [subnet1]}
+        mock_client.list_floatingips.return_value = {'floatingips': [fip1]}
+
+        with mock.patch.object(self.api, '_get_available_networks',
+                               return_value=[net1]) as mock_available:
+            result = self.api._get_instances_nw_info_kwargs(self.context,
+                                                            instances)
+
+        self.assertEqual([mock.call(device_id=['uuid1', 'uuid2']),
+                          mock.call(network_id=['net1'],
+                                    device_owner='network:dhcp')],
+                         mock_client.list_ports.call_args_list)
+        mock_client.list_networks.assert_called_once_with(id=['net1'])
+        mock_client.list_subnets.assert_called_once_with(id=['subnet1'])
+        mock_client.list_floatingips.assert_called_once_with(
+            port_id=['port1'])
+        mock_available.assert_called_once_with(self.context, 'project2',
+                                               neutron=mock_client)
+        resources = {'network_ids': set(['net1']),
+                     'networks': {'net1': net1},
+                     'project_networks': {'project2': [net1]},
+                     'subnets': {'subnet1': subnet1},
+                     'dhcp_ports': {'net1': [dhcp_port]},
+                     'floating_ips': {'port1': [fip1]}}
+        self.assertEqual({'uuid1': {'neutron_ports': [port1],
+                                    'admin_client': mock_client,
+                                    'neutron_resources': resources},
+                          'uuid2': {'neutron_ports': [],
+                                    'admin_client': mock_client,
+                                    'neutron_resources': resources}},
+                         result)
+
+    @mock.patch.object(neutronapi, 'MAX_SEARCH_IDS', 2)
+    @mock.patch.object(neutronapi, 'get_client', return_value=mock.Mock())
+    def test_get_instances_nw_info_kwargs_chunks(self, mock_get_client):
+        mock_client = mock_get_client()
+        instances = [objects.Instance(uuid='uuid%d' % i, project_id='project',
+                                      info_cache=None)
+                     for i in range(5)]
+        mock_client.list_ports.return_value = {'ports': []}
+
+        with mock.patch.object(self.api, '_get_available_networks',
+                               return_value=[]):
+            self.api._get_instances_nw_info_kwargs(self.context, instances)
+
+        self.assertEqual([mock.call(device_id=['uuid0', 'uuid1']),
+                          mock.call(device_id=['uuid2', 'uuid3']),
+                          mock.call(device_id=['uuid4'])],
+                         mock_client.list_ports.call_args_list)
+        # Nothing is searched by an empty list of IDs
+        self.assertFalse(mock_client.list_networks.called)
+        self.assertFalse(mock_client.list_subnets.called)
+        self.assertFalse(mock_client.list_floatingips.called)
+
+    @mock.patch.object(neutronapi, 'get_client', return_value=mock.Mock())
+    def test_build_network_info_model_prefetched(self, mock_get_client):
+        instance = objects.Instance(uuid='uuid1', project_id='project1')
+        instance.info_cache = objects.InstanceInfoCache(
+            network_info=model.NetworkInfo.hydrate(
+                [{'id': 'port1', 'network': {'id': 'net1'}}]))
+        port1 = {'id': 'port1', 'device_id': 'uuid1',
+                 'tenant_id': 'project1', 'network_id': 'net1',
+                 'admin_state_up': True, 'status': 'ACTIVE',
+                 'mac_address': 'de:ad:be:ef:00:01',
+                 'fixed_ips': [{'subnet_id': 'subnet1',
+                                'ip_address': '10.0.0.2'}]}
+        resources = {
+            'network_ids': set(['net1']),
+            'networks': {'net1': {'id': 'net1', 'name': 'net1',
+                                  'tenant_id': 'project1'}},
+            'project_networks': {},
+            'subnets': {'subnet1': {'id': 'subnet1', 'network_id': 'net1',
+                                    'cidr': '10.0.0.0/24',
+                                    'gateway_ip': '10.0.0.1',
+                                    'dns_nameservers': [],
+                                    'host_routes': []}},
+            'dhcp_ports': {'net1': [{'fixed_ips': [
+                {'subnet_id': 'subnet1', 'ip_address': '10.0.0.3'}]}]},
+            'floating_ips': {'port1': [{'fixed_ip_address': '10.0.0.2',
+                                        'floating_ip_address': '172.24.4.3'},
+                                       {'fixed_ip_address': '10.0.0.9',
+                                        'floating_ip_address': '172.24.4.4'}]}}
+
+        nw_info = self.api._build_network_info_model(
+            self.context, instance, neutron_ports=[port1],
+            neutron_resources=resources)
+
+        self.assertEqual(1, len(nw_info))
+        self.assertEqual(['172.24.4.3'], nw_info[0].floating_ips())
+        subnet = nw_info[0]['network']['subnets'][0]
+        self.assertEqual('10.0.0.0/24', subnet['cidr'])
+        self.assertEqual('10.0.0.3', subnet.get_meta('dhcp_server'))
+        self.assertFalse(mock_get_client().list_networks.called)
+        self.assertFalse(mock_get_client().list_subnets.called)
+        self.assertFalse(mock_get_client().list_ports.called)
+        self.assertFalse(mock_get_client().list_floatingips.called)
+
+    @mock.patch.object(neutronapi, 'get_client', return_value=mock.Mock())
+    def test_build_network_info_model_with_ports(self, mock_get_client):
+        instance = objects.Instance(uuid='uuid1', project_id='project1')
+        instance.info_cache = objects.InstanceInfoCache(
+            network_info=model.NetworkInfo())
+        with mock.patch.object(self.api, '_get_available_networks',
+                               return_value=[]):
+            nw_info = self.api._build_network_info_model(
+                self.context, instance, neutron_ports=[])
+        self.assertEqual(0, len(nw_info))
+        self.assertFalse(mock_get_client().list_ports.called)
+
     @mock.patch('oslo_concurrency.lockutils.lock')
     @mock.patch.object(neutronapi.API, '_get_instance_nw_info')
     @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
@@ -102,6 +102,23 @@ class _TestBandwidthUsage(test.TestCase):
 
         self._compare(self, self.expected_bw_usage, bw_usage)
 
+    @mock.patch.object(db, 'bw_usage_update_many')
+    def test_create_many(self, mock_update_many):
+        mock_update_many.return_value = [self.expected_bw_usage]
+        start_period = self.expected_bw_usage['start_period']
+        bw_usages = [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                      'bw_in': 100, 'bw_out': 200,
+                      'last_ctr_in': 12345, 'last_ctr_out': 67890}]
+
+        result = bandwidth_usage.BandwidthUsageList.create_many(
+            self.context, bw_usages, start_period=start_period)
+
+        self.assertEqual(1, len(result))
+        self._compare(self, self.expected_bw_usage, result[0])
+        mock_update_many.assert_called_once_with(
+            mock.ANY, mock.ANY, bw_usages, last_refreshed=None,
+            update_cells=True)
+
     def test_update_with_db(self):
         expected_bw_usage1 = self._fake_bw_usage(
             time=self.expected_bw_usage['last_refreshed'],
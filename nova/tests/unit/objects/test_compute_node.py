@@ -86,6 +86,7 @@ fake_compute_node = {
     'pci_stats': fake_pci,
     'cpu_allocation_ratio': 16.0,
     'ram_allocation_ratio': 1.5,
+    'generation': 5,
     }
 # FIXME(sbauza) : For compatibility checking, to be removed once we are sure
 # that all computes are running latest DB version with host field in it.
@@ -354,6 +355,27 @@ class _TestComputeNodeObject(object):
         self.assertRaises(ovo_exc.ReadOnlyFieldError, setattr,
                           compute, 'id', 124)
 
+    @mock.patch('nova.db.compute_node_claim')
+    def test_claim(self, mock_claim):
+        mock_claim.return_value = dict(fake_compute_node, generation=6)
+        compute = compute_node.ComputeNode(context=self.context)
+        compute.id = 123
+        compute.generation = 5
+        compute.claim(512, 10, 2)
+        mock_claim.assert_called_once_with(mock.ANY, 123, 5, 512, 10, 2)
+        self.assertEqual(6, compute.generation)
+        self.assertEqual(set(), compute.obj_what_changed())
+
+    @mock.patch('nova.db.compute_node_claim')
+    def test_claim_conflict(self, mock_claim):
+        mock_claim.side_effect = exception.ComputeNodeGenerationConflict(
+            compute_id=123, generation=5)
+        compute = compute_node.ComputeNode(context=self.context)
+        compute.id = 123
+        compute.generation = 5
+        self.assertRaises(exception.ComputeNodeGenerationConflict,
+                          compute.claim, 512, 10, 2)
+
     def test_destroy(self):
         self.mox.StubOutWithMock(db, 'compute_node_delete')
         db.compute_node_delete(self.context, 123)
@@ -372,6 +394,20 @@ class _TestComputeNodeObject(object):
                          subs=self.subs(),
                          comparators=self.comparators())
 
+    @mock.patch('nova.db.compute_node_get_all_changed_since')
+    def test_get_all_changed_since(self, cn_get_all_changed_since):
+        cn_get_all_changed_since.return_value = [fake_compute_node]
+        since = timeutils.utcnow().replace(microsecond=0)
+        computes = compute_node.ComputeNodeList.get_all_changed_since(
+            self.context, since)
+        self.assertEqual(1, len(computes))
+        self.compare_obj(computes[0], fake_compute_node,
+                         subs=self.subs(),
+                         comparators=self.comparators())
+        self.assertEqual(1, cn_get_all_changed_since.call_count)
+        called_since = cn_get_all_changed_since.call_args[0][1]
+        self.assertEqual(since, timeutils.normalize_time(called_since))
+
     def test_get_by_hypervisor(self):
         self.mox.StubOutWithMock(db, 'compute_node_search_by_hypervisor')
         db.compute_node_search_by_hypervisor(self.context, 'hyper').AndReturn(
@@ -513,6 +549,18 @@ class _TestComputeNodeObject(object):
         self.assertNotIn('cpu_allocation_ratio', primitive)
         self.assertNotIn('ram_allocation_ratio', primitive)
 
+    def test_compat_generation(self):
+        compute = compute_node.ComputeNode(generation=1)
+        primitive = compute.obj_to_primitive(target_version='1.14')
+        self.assertNotIn('generation', primitive['nova_object.data'])
+
+    def test_from_db_object_no_generation(self):
+        compute_dict = fake_compute_node.copy()
+        del compute_dict['generation']
+        cls = objects.ComputeNode
+        compute = cls._from_db_object(self.context, cls(), compute_dict)
+        self.assertEqual(0, compute.generation)
+
     def test_compat_allocation_ratios_old_compute(self):
         self.flags(cpu_allocation_ratio=2.0, ram_allocation_ratio=3.0)
         compute_dict = fake_compute_node.copy()
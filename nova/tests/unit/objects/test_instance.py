@@ -214,6 +214,34 @@ class _TestInstanceObject(object):
         self.assertRaises(exception.ObjectActionError,
                           inst.obj_load_attr, 'foo')
 
+    @mock.patch.object(objects.Instance, 'get_by_uuid')
+    def test_load_columns(self, mock_get):
+        # an instance loaded without the columns is not lazy-loaded
+        inst = objects.Instance(context=self.context, id=1, uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'host')
+        self.assertFalse(mock_get.called)
+
+        inst = objects.Instance._from_db_object(
+            self.context, objects.Instance(),
+            {'id': 1, 'uuid': 'fake-uuid', 'vm_state': 'active'},
+            columns=['vm_state'])
+        mock_get.return_value = fake_instance.fake_instance_obj(
+            self.context, id=1, uuid='fake-uuid', host=None,
+            vm_state='stopped')
+
+        self.assertIsNone(inst.host)
+
+        mock_get.assert_called_once_with(self.context, uuid='fake-uuid',
+                                         expected_attrs=[])
+        # only the fields which were not loaded are set
+        self.assertEqual('active', inst.vm_state)
+        self.assertEqual(set(), inst.obj_what_changed())
+        self.assertFalse(inst._projected)
+        # the fields which are not columns are still lazy-loaded one by one
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'foo')
+
     def test_get_remote(self):
         # isotime doesn't have microseconds and is always UTC
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
@@ -1434,6 +1462,65 @@ class _TestInstanceListObject(object):
             self.assertEqual(self.context, inst_list.objects[i]._context)
         self.assertEqual(set(), inst_list.obj_what_changed())
 
+    def test_get_by_host_columns(self):
+        fakes = [dict((key, value) for key, value
+                      in self.fake_instance(1).items()
+                      if key in ('id', 'uuid', 'power_state'))]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=None,
+                                    use_slave=False,
+                                    columns=['power_state']
+                                    ).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = objects.InstanceList.get_by_host(
+            self.context, 'foo', columns=['power_state'])
+        self.assertEqual(fakes[0]['power_state'],
+                         inst_list.objects[0].power_state)
+        self.assertTrue(inst_list.objects[0].obj_attr_is_set('uuid'))
+        self.assertFalse(inst_list.objects[0].obj_attr_is_set('host'))
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_iter_by_filters(self, mock_get):
+        created_at = datetime.datetime(2016, 1, 1)
+        batches = [[objects.Instance(id=1, created_at=created_at),
+                    objects.Instance(id=2, created_at=created_at)],
+                   [objects.Instance(id=3, created_at=created_at)]]
+        mock_get.side_effect = batches
+
+        instances = objects.InstanceList.iter_by_filters(
+            self.context, {'host': 'foo'}, batch_size=2,
+            expected_attrs=['fault'])
+
+        self.assertEqual([1, 2, 3], [inst.id for inst in instances])
+        self.assertEqual(
+            [mock.call(self.context, {'host': 'foo'}, limit=2, marker=marker,
+                       expected_attrs=['fault'], use_slave=False,
+                       sort_keys=['id', 'created_at'],
+                       sort_dirs=['asc', 'asc'], columns=None)
+             for marker in (None, {'id': 2,
+                                   'created_at': '2016-01-01T00:00:00'})],
+            mock_get.call_args_list)
+
+    def test_iter_by_filters_db(self):
+        values = {'user_id': self.context.user_id,
+                  'project_id': self.context.project_id,
+                  'host': 'foo'}
+        ids = [db.instance_create(self.context, values)['id']
+               for i in range(5)]
+
+        for sort_dir, columns in (('asc', None), ('desc', ['host'])):
+            instances = list(objects.InstanceList.iter_by_filters(
+                self.context, {'host': 'foo'}, batch_size=2,
+                sort_dir=sort_dir, columns=columns))
+            self.assertEqual(sorted(ids, reverse=sort_dir == 'desc'),
+                             [inst.id for inst in instances])
+
+    def test_get_by_filters_bad_columns(self):
+        self.assertRaises(exception.ObjectActionError,
+                          objects.InstanceList.get_by_filters,
+                          self.context, {}, columns=['flavor'])
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
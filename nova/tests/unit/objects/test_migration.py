@@ -176,6 +176,20 @@ class _TestMigrationObject(object):
         for index, db_migration in enumerate(db_migrations):
             self.compare_obj(migrations[index], db_migration)
 
+    def test_get_in_progress_by_host(self):
+        ctxt = context.get_admin_context()
+        fake_migration = fake_db_migration()
+        db_migrations = [fake_migration, dict(fake_migration, id=456)]
+        self.mox.StubOutWithMock(db, 'migration_get_in_progress_by_host')
+        db.migration_get_in_progress_by_host(
+            ctxt, 'host').AndReturn(db_migrations)
+        self.mox.ReplayAll()
+        migrations = migration.MigrationList.get_in_progress_by_host(
+            ctxt, 'host')
+        self.assertEqual(2, len(migrations))
+        for index, db_migration in enumerate(db_migrations):
+            self.compare_obj(migrations[index], db_migration)
+
     def test_get_by_filters(self):
         ctxt = context.get_admin_context()
         fake_migration = fake_db_migration()
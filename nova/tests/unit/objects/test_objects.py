@@ -1166,12 +1166,12 @@ object_data = {
     'Aggregate': '1.1-1ab35c4516f71de0bef7087026ab10d1',
     'AggregateList': '1.2-fb6e19f3c3a3186b04eceb98b5dadbfa',
     'BandwidthUsage': '1.2-c6e4c779c7f40f2407e3d70022e3cd1c',
-    'BandwidthUsageList': '1.2-5fe7475ada6fe62413cbfcc06ec70746',
+    'BandwidthUsageList': '1.3-372d851f2983eb662f4a9ffe3ad7397e',
     'BlockDeviceMapping': '1.15-d44d8d694619e79c172a99b3c1d6261d',
     'BlockDeviceMappingList': '1.16-6fa262c059dad1d519b9fe05b9e4f404',
     'CellMapping': '1.0-7f1a7e85a22bbb7559fc730ab658b9bd',
-    'ComputeNode': '1.14-a396975707b66281c5f404a68fccd395',
-    'ComputeNodeList': '1.14-3b6f4f5ade621c40e70cb116db237844',
+    'ComputeNode': '1.15-1419a42468d4943558a1f69a51e9a2ff',
+    'ComputeNodeList': '1.16-870c17c7d279641337a8cf65431af517',
     'DNSDomain': '1.0-7b0b2dab778454b6a7b6c66afe163a1a',
     'DNSDomainList': '1.0-4ee0d9efdfd681fed822da88376e04d2',
     'EC2Ids': '1.0-474ee1094c7ec16f8ce657595d8c49d9',
@@ -1199,7 +1199,7 @@ object_data = {
     'InstanceGroup': '1.10-1a0c8c7447dc7ecb9da53849430c4a5f',
     'InstanceGroupList': '1.7-be18078220513316abd0ae1b2d916873',
     'InstanceInfoCache': '1.5-cd8b96fefe0fc8d4d337243ba0bf0e1e',
-    'InstanceList': '2.0-6c8ba6147cca3082b1e4643f795068bf',
+    'InstanceList': '2.1-2568e1f68267b413617249b5ed17a3d6',
     'InstanceMapping': '1.0-47ef26034dfcbea78427565d9177fe50',
     'InstanceMappingList': '1.0-9e982e3de1613b9ada85e35f69b23d47',
     'InstanceNUMACell': '1.2-535ef30e0de2d6a0d26a71bd58ecafc4',
@@ -1210,7 +1210,7 @@ object_data = {
     'KeyPairList': '1.2-58b94f96e776bedaf1e192ddb2a24c4e',
     'Migration': '1.2-8784125bedcea0a9227318511904e853',
     'MigrationContext': '1.0-d8c2f10069e410f639c49082b5932c92',
-    'MigrationList': '1.2-02c0ec0c50b75ca86a2a74c5e8c911cc',
+    'MigrationList': '1.3-43b3d0a3b852a04b17b921770daf44f4',
     'MonitorMetric': '1.1-53b1db7c4ae2c531db79761e7acc52ba',
     'MonitorMetricList': '1.1-15ecf022a68ddbb8c2a6739cfc9f8f5e',
     'NUMACell': '1.2-74fc993ac5c83005e76e34e8487f1c05',
@@ -12,7 +12,9 @@
 
 import mock
 
+from nova import objects
 from nova.scheduler.filters import aggregate_multitenancy_isolation as ami
+from nova.scheduler import host_manager
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -72,3 +74,20 @@ class TestAggregateMultitenancyIsolationFilter(test.NoDBTestCase):
                                      'project_id': 'my_tenantid'}}}
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
+
+    def test_aggregate_multi_tenancy_isolation_excluded_hosts(self,
+            agg_mock):
+        aggregate_index = host_manager.AggregateIndex([
+            objects.Aggregate(hosts=['host1', 'host2'],
+                              metadata={'filter_tenant_id': 'my_tenantid, '
+                                                            'other_tenantid'}),
+            objects.Aggregate(hosts=['host2', 'host3'],
+                              metadata={'filter_tenant_id': 'other_tenantid'}),
+            objects.Aggregate(hosts=['host4'], metadata={'foo': 'bar'})])
+        filter_properties = {'context': mock.sentinel.ctx,
+                             'request_spec': {
+                                 'instance_properties': {
+                                     'project_id': 'my_tenantid'}}}
+        self.assertEqual(set(['host3']), self.filt_cls.excluded_hosts(
+            aggregate_index, filter_properties))
+        self.assertFalse(agg_mock.called)
@@ -19,6 +19,7 @@ from nova.scheduler.filters import numa_topology_filter
 from nova import test
 from nova.tests.unit import fake_instance
 from nova.tests.unit.scheduler import fakes
+from nova.virt import hardware
 
 
 class TestNUMATopologyFilter(test.NoDBTestCase):
@@ -147,3 +148,35 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         limits = host.limits['numa_topology']
         self.assertEqual(limits.cpu_allocation_ratio, 21)
         self.assertEqual(limits.ram_allocation_ratio, 1.3)
+
+    @mock.patch.object(hardware, 'numa_fit_instance_to_host',
+                       wraps=hardware.numa_fit_instance_to_host)
+    def test_numa_topology_filter_all_fits_identical_hosts_once(self,
+                                                                mock_fit):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([3]), memory=512)
+               ])
+        instance = fake_instance.fake_instance_obj(mock.sentinel.ctx)
+        instance.numa_topology = instance_topology
+        filter_properties = {
+            'request_spec': {
+                'instance_properties': jsonutils.to_primitive(
+                    obj_base.obj_to_primitive(instance))}}
+        used_topology = fakes.NUMA_TOPOLOGY.obj_clone()
+        used_topology.cells[0].memory_usage = 128
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'numa_topology': topology,
+                                      'pci_stats': None,
+                                      'cpu_allocation_ratio': 16.0,
+                                      'ram_allocation_ratio': 1.5})
+                 for i, topology in enumerate([fakes.NUMA_TOPOLOGY,
+                                               fakes.NUMA_TOPOLOGY,
+                                               used_topology])]
+
+        result = list(self.filt_cls.filter_all(hosts, filter_properties))
+
+        self.assertEqual(hosts, result)
+        self.assertEqual(2, mock_fit.call_count)
+        for host in hosts:
+            self.assertIn('numa_topology', host.limits)
@@ -235,6 +235,194 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEqual(50, hosts[0].weight)
 
+    @mock.patch('nova.scheduler.host_manager.HostManager._add_instance_info')
+    @mock.patch('nova.objects.ServiceList.get_by_binary',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_chooses_again_after_lost_claim(self, mock_get_extra,
+                                                     mock_cn_get_all,
+                                                     mock_get_by_binary,
+                                                     mock_add_inst_info):
+        self.flags(scheduler_claim_attempts=3)
+        spec_obj = objects.RequestSpec(
+            num_instances=1,
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            flavor=objects.Flavor(root_gb=512,
+                                  memory_mb=512,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            pci_requests=None,
+            numa_topology=None)
+
+        with test.nested(
+            mock.patch.object(self.driver.host_manager, 'get_filtered_hosts',
+                              side_effect=fake_get_filtered_hosts),
+            mock.patch.object(self.driver.host_manager, 'claim_host',
+                              side_effect=[False, True])
+        ) as (mock_filtered, mock_claim):
+            hosts = self.driver._schedule(self.context, spec_obj)
+
+        self.assertEqual(1, len(hosts))
+        self.assertEqual(2, mock_filtered.call_count)
+        self.assertEqual(2, mock_claim.call_count)
+
+    @mock.patch('nova.scheduler.host_manager.HostManager._add_instance_info')
+    @mock.patch('nova.objects.ServiceList.get_by_binary',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_prunes_hosts(self, mock_get_extra, mock_cn_get_all,
+                                   mock_get_by_binary, mock_add_inst_info):
+        self.driver.host_manager.prune_hosts = True
+        spec_obj = objects.RequestSpec(
+            num_instances=1,
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            flavor=objects.Flavor(root_gb=512,
+                                  memory_mb=512,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            pci_requests=None,
+            numa_topology=None,
+            ignore_hosts=['host1', 'host3'])
+
+        with mock.patch.object(self.driver.host_manager,
+                               'get_filtered_hosts',
+                               side_effect=fake_get_filtered_hosts
+                               ) as mock_filtered:
+            hosts = self.driver._schedule(self.context, spec_obj)
+
+        self.assertEqual(1, len(hosts))
+        self.assertEqual(['host2', 'host4'],
+                         sorted(host.host for host in
+                                mock_filtered.call_args[0][0]))
+
+    @mock.patch('nova.scheduler.host_manager.HostManager._add_instance_info')
+    @mock.patch('nova.objects.ServiceList.get_by_binary',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_batch(self, mock_get_extra, mock_cn_get_all,
+                            mock_get_by_binary, mock_add_inst_info):
+        self.flags(scheduler_batch_placement=True)
+        manager = self.driver.host_manager
+        spec_obj = objects.RequestSpec(
+            num_instances=3,
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            flavor=objects.Flavor(root_gb=512,
+                                  memory_mb=512,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            pci_requests=None,
+            numa_topology=None,
+            instance_group=None)
+
+        with test.nested(
+            mock.patch.object(manager, 'get_filtered_hosts',
+                              side_effect=fake_get_filtered_hosts),
+            mock.patch.object(manager, 'get_weighed_hosts',
+                              wraps=manager.get_weighed_hosts),
+            mock.patch.object(manager, 'reweigh_host',
+                              wraps=manager.reweigh_host)
+        ) as (mock_filtered, mock_weighed, mock_reweigh):
+            hosts = self.driver._schedule(self.context, spec_obj)
+
+        self.assertEqual(3, len(hosts))
+        # all the hosts are filtered once, then each chosen host again
+        self.assertEqual(4, mock_filtered.call_count)
+        for i, call in enumerate(mock_filtered.call_args_list[1:]):
+            self.assertEqual([hosts[i].obj], call[0][0])
+            self.assertEqual(i + 1, call[1]['index'])
+        self.assertEqual(1, mock_weighed.call_count)
+        self.assertEqual([mock.call(host, mock.ANY) for host in hosts],
+                         mock_reweigh.call_args_list)
+
+    @mock.patch.object(filter_scheduler.FilterScheduler, '_schedule_batch')
+    @mock.patch('nova.scheduler.host_manager.HostManager._add_instance_info')
+    @mock.patch('nova.objects.ServiceList.get_by_binary',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_batch_not_for_groups(self, mock_get_extra,
+                                           mock_cn_get_all,
+                                           mock_get_by_binary,
+                                           mock_add_inst_info,
+                                           mock_schedule_batch):
+        self.flags(scheduler_batch_placement=True)
+        self.stubs.Set(self.driver.host_manager, 'get_filtered_hosts',
+                fake_get_filtered_hosts)
+        spec_obj = objects.RequestSpec(
+            num_instances=2,
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            flavor=objects.Flavor(root_gb=512,
+                                  memory_mb=512,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            pci_requests=None,
+            numa_topology=None,
+            instance_group=objects.InstanceGroup(hosts=[],
+                                                 policies=['affinity']))
+
+        hosts = self.driver._schedule(self.context, spec_obj)
+
+        self.assertEqual(2, len(hosts))
+        self.assertFalse(mock_schedule_batch.called)
+
+    @mock.patch('nova.scheduler.host_manager.HostManager._add_instance_info')
+    @mock.patch('nova.objects.ServiceList.get_by_binary',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_claim_attempts_exhausted(self, mock_get_extra,
+                                               mock_cn_get_all,
+                                               mock_get_by_binary,
+                                               mock_add_inst_info):
+        self.flags(scheduler_claim_attempts=2)
+        self.stubs.Set(self.driver.host_manager, 'get_filtered_hosts',
+                fake_get_filtered_hosts)
+        spec_obj = objects.RequestSpec(
+            num_instances=1,
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            flavor=objects.Flavor(root_gb=512,
+                                  memory_mb=512,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            pci_requests=None,
+            numa_topology=None)
+
+        with mock.patch.object(self.driver.host_manager, 'claim_host',
+                               return_value=False) as mock_claim:
+            hosts = self.driver._schedule(self.context, spec_obj)
+
+        # the host claimed by another scheduler is not returned
+        self.assertEqual([], hosts)
+        self.assertEqual(2, mock_claim.call_count)
+
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
     @mock.patch('nova.objects.InstanceList.get_by_host')
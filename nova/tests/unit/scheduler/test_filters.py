@@ -271,3 +271,32 @@ class FiltersTestCase(test.NoDBTestCase):
             cargs = mock_log.call_args[0][0]
             self.assertIn("with instance ID '%s'" % fake_uuid, cargs)
             self.assertIn(exp_output, cargs)
+
+    def test_get_filtered_objects_stats(self):
+        class FilterA(filters.BaseFilter):
+            def filter_all(self, list_objs, filter_properties):
+                # return all but the first object
+                return list_objs[1:]
+
+        class FilterB(filters.BaseFilter):
+            def filter_all(self, list_objs, filter_properties):
+                # return an empty list
+                return []
+
+        all_filters = [FilterA(), FilterB()]
+        hosts = ["Host0", "Host1", "Host2"]
+        self.filter_handler.get_filtered_objects(all_filters, hosts, {})
+        self.filter_handler.get_filtered_objects(all_filters, hosts[:2], {})
+
+        stats = self.filter_handler.stats.get()
+        self.assertEqual(['FilterA', 'FilterB'], sorted(stats))
+        self.assertEqual(2, stats['FilterA']['calls'])
+        self.assertEqual(5, stats['FilterA']['count_in'])
+        self.assertEqual(3, stats['FilterA']['count_out'])
+        self.assertEqual(3, stats['FilterB']['count_in'])
+        self.assertEqual(0, stats['FilterB']['count_out'])
+        self.assertGreaterEqual(stats['FilterA']['time'],
+                                stats['FilterA']['max_time'])
+
+        self.filter_handler.stats.reset()
+        self.assertEqual({}, self.filter_handler.stats.get())
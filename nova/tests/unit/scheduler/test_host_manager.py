@@ -22,6 +22,7 @@ import datetime
 import mock
 from oslo_config import cfg
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 
 import nova
@@ -176,6 +177,60 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual({'fake-host': set([])},
                          self.host_manager.host_aggregates_map)
 
+    def test_aggregate_index(self):
+        agg1 = objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                                 metadata={'filter_tenant_id': 't1,t2'})
+        agg2 = objects.Aggregate(id=2, hosts=['host3'],
+                                 metadata={'filter_tenant_id': 't2'})
+        self.host_manager.update_aggregates([agg1, agg2])
+
+        index = self.host_manager.aggregate_index
+        self.assertIs(index, self.host_manager.aggregate_index)
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         index.hosts_with_key('filter_tenant_id'))
+        self.assertEqual(set(['host1', 'host2']),
+                         index.hosts_with_value('filter_tenant_id', 't1'))
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         index.hosts_with_value('filter_tenant_id', 't2'))
+        self.assertEqual(set(), index.hosts_with_value('filter_tenant_id',
+                                                       't3'))
+        self.assertEqual(set(), index.hosts_with_key('foo'))
+        self.assertEqual(set(), index.hosts_with_value('foo', 'bar'))
+
+        self.host_manager.delete_aggregate(agg2)
+        index = self.host_manager.aggregate_index
+        self.assertEqual(set(['host1', 'host2']),
+                         index.hosts_with_key('filter_tenant_id'))
+
+    def test_exclude_hosts_by_aggregates(self):
+        fake_filter1 = FakeFilterClass1()
+        fake_filter2 = FakeFilterClass2()
+        filter_properties = {'fake_prop': 'fake_val'}
+
+        with mock.patch.object(fake_filter1, 'excluded_hosts',
+                               return_value=set(['fake_host1',
+                                                 'fake_multihost'])):
+            filters, hosts = self.host_manager._exclude_hosts_by_aggregates(
+                [fake_filter1, fake_filter2], self.fake_hosts,
+                filter_properties, 0)
+            fake_filter1.excluded_hosts.assert_called_once_with(
+                self.host_manager.aggregate_index, filter_properties)
+
+        self.assertEqual([fake_filter2], filters)
+        self.assertEqual(self.fake_hosts[1:4], hosts)
+
+    def test_exclude_hosts_by_aggregates_not_for_index(self):
+        fake_filter = FakeFilterClass1()
+        fake_filter.run_filter_once_per_request = True
+
+        with mock.patch.object(fake_filter, 'excluded_hosts') as mock_excl:
+            filters, hosts = self.host_manager._exclude_hosts_by_aggregates(
+                [fake_filter], self.fake_hosts, {}, 1)
+
+        self.assertFalse(mock_excl.called)
+        self.assertEqual([fake_filter], filters)
+        self.assertEqual(self.fake_hosts, hosts)
+
     def test_choose_host_filters_not_found(self):
         self.assertRaises(exception.SchedulerHostFilterNotFound,
                           self.host_manager._choose_host_filters,
@@ -483,6 +538,172 @@ class HostManagerTestCase(test.NoDBTestCase):
         host_state = self.host_manager.host_state_map[('fake', 'fake')]
         self.assertEqual([], host_state.aggregates)
 
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_aggs_refreshed_on_change(self,
+                                                          svc_get_by_binary,
+                                                          cn_get_all,
+                                                          update_from_cn,
+                                                          mock_get_by_host):
+        svc_get_by_binary.return_value = [objects.Service(host='fake')]
+        cn_get_all.return_value = [
+            objects.ComputeNode(host='fake', hypervisor_hostname='fake')]
+        mock_get_by_host.return_value = objects.InstanceList()
+        fake_agg = objects.Aggregate(id=1, hosts=['fake'])
+        self.host_manager.get_all_host_states('fake-context')
+        host_state = self.host_manager.host_state_map[('fake', 'fake')]
+        self.assertEqual([], host_state.aggregates)
+
+        self.host_manager.aggs_by_id = {1: fake_agg}
+        self.host_manager.host_aggregates_map['fake'].add(1)
+        # the aggregates are not rebuilt until an aggregate changes
+        self.host_manager.get_all_host_states('fake-context')
+        self.assertEqual([], host_state.aggregates)
+
+        self.host_manager.update_aggregates([fake_agg])
+        self.host_manager.get_all_host_states('fake-context')
+        self.assertEqual([fake_agg], host_state.aggregates)
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_bulk_load_instance_info(self,
+                                                         svc_get_by_binary,
+                                                         cn_get_all,
+                                                         update_from_cn,
+                                                         mock_get_by_filters,
+                                                         mock_get_by_host):
+        self.host_manager.bulk_load_instance_info = True
+        svc_get_by_binary.return_value = [objects.Service(host='host1'),
+                                          objects.Service(host='host2'),
+                                          objects.Service(host='host3')]
+        cn_get_all.return_value = [
+            objects.ComputeNode(host='host1', hypervisor_hostname='node1'),
+            objects.ComputeNode(host='host2', hypervisor_hostname='node2'),
+            objects.ComputeNode(host='host3', hypervisor_hostname='node3')]
+        inst1 = objects.Instance(host='host1', uuid='uuid1')
+        inst2 = objects.Instance(host='host2', uuid='uuid2')
+        inst3 = objects.Instance(host='host3', uuid='uuid3')
+        self.host_manager._instance_info = {
+            'host2': {'instances': {'uuid2': inst2}, 'updated': False},
+            'host3': {'instances': {'uuid3': inst3}, 'updated': True}}
+        mock_get_by_filters.return_value = objects.InstanceList(
+            objects=[inst1, inst2])
+
+        self.host_manager.get_all_host_states('fake-context')
+
+        self.assertFalse(mock_get_by_host.called)
+        mock_get_by_filters.assert_called_once_with(
+            'fake-context', {'host': mock.ANY, 'deleted': False,
+                             'soft_deleted': True})
+        self.assertEqual(['host1', 'host2'],
+                         sorted(mock_get_by_filters.call_args[0][1]['host']))
+        host_state_map = self.host_manager.host_state_map
+        self.assertEqual({'uuid1': inst1},
+                         host_state_map[('host1', 'node1')].instances)
+        self.assertEqual({'uuid2': inst2},
+                         host_state_map[('host2', 'node2')].instances)
+        self.assertEqual({'uuid3': inst3},
+                         host_state_map[('host3', 'node3')].instances)
+
+    def _mock_pruning_hosts(self, svc_get_by_binary, cn_get_all,
+                            mock_get_by_host):
+        self.host_manager.prune_hosts = True
+        self.host_manager.filters_availability_zones = True
+        svc_get_by_binary.return_value = [
+            objects.Service(host='host%d' % i) for i in range(1, 5)]
+        cn_get_all.return_value = [
+            objects.ComputeNode(host='host%d' % i,
+                                hypervisor_hostname='node%d' % i)
+            for i in range(1, 5)]
+        mock_get_by_host.return_value = objects.InstanceList()
+        self.host_manager.update_aggregates([
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'availability_zone': 'az1'}),
+            objects.Aggregate(id=2, hosts=['host3'],
+                              metadata={'availability_zone': 'az2'})])
+
+    def _get_pruned_nodes(self, **spec_fields):
+        spec_obj = objects.RequestSpec(**spec_fields)
+        return sorted(host_state.nodename for host_state in
+                      self.host_manager.get_all_host_states('fake-context',
+                                                            spec_obj))
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_pruned(self, svc_get_by_binary, cn_get_all,
+                                        update_from_cn, mock_get_by_host):
+        self._mock_pruning_hosts(svc_get_by_binary, cn_get_all,
+                                 mock_get_by_host)
+
+        self.assertEqual(['node1', 'node2'],
+                         self._get_pruned_nodes(availability_zone='az1'))
+        self.assertEqual(['node2'],
+                         self._get_pruned_nodes(availability_zone='az1',
+                                                ignore_hosts=['host1']))
+        self.assertEqual(['node4'],
+                         self._get_pruned_nodes(availability_zone='nova'))
+        # forcing a host skips the filters, hence the availability zone
+        self.assertEqual(['node3'],
+                         self._get_pruned_nodes(availability_zone='az1',
+                                                force_hosts=['host3']))
+        self.assertEqual(['node2', 'node4'],
+                         self._get_pruned_nodes(force_nodes=['node2',
+                                                             'node4']))
+        self.assertEqual(['node1', 'node2', 'node3', 'node4'],
+                         self._get_pruned_nodes())
+
+        self.host_manager.filters_availability_zones = False
+        self.assertEqual(['node1', 'node2', 'node3', 'node4'],
+                         self._get_pruned_nodes(availability_zone='az1'))
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_pruned_keeps_host_states(self,
+                                                          svc_get_by_binary,
+                                                          cn_get_all,
+                                                          update_from_cn,
+                                                          mock_get_by_host):
+        self._mock_pruning_hosts(svc_get_by_binary, cn_get_all,
+                                 mock_get_by_host)
+        self.host_manager.get_all_host_states('fake-context')
+        host_state = self.host_manager.host_state_map[('host3', 'node3')]
+        host_state.updated = 'fake-updated'
+        mock_get_by_host.reset_mock()
+
+        self.assertEqual(['node1', 'node2'],
+                         self._get_pruned_nodes(availability_zone='az1'))
+        # the pruned HostState is kept and refreshed once it is a candidate
+        self.assertIs(host_state,
+                      self.host_manager.host_state_map[('host3', 'node3')])
+        self.assertIsNone(host_state.updated)
+        self.assertEqual(4, len(self.host_manager.host_state_map))
+        self.assertEqual(2, mock_get_by_host.call_count)
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_not_pruned_by_default(self,
+                                                       svc_get_by_binary,
+                                                       cn_get_all,
+                                                       update_from_cn,
+                                                       mock_get_by_host):
+        self._mock_pruning_hosts(svc_get_by_binary, cn_get_all,
+                                 mock_get_by_host)
+        self.host_manager.prune_hosts = False
+
+        self.assertEqual(['node1', 'node2', 'node3', 'node4'],
+                         self._get_pruned_nodes(availability_zone='az1'))
+
     @mock.patch('nova.objects.ServiceList.get_by_binary')
     @mock.patch('nova.objects.ComputeNodeList.get_all')
     @mock.patch('nova.objects.InstanceList.get_by_host')
@@ -752,6 +973,194 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalTestCase(test.NoDBTestCase):
+    """Test case for HostManager with incremental host states."""
+
+    @mock.patch.object(host_manager.HostManager, '_init_instance_info')
+    @mock.patch.object(host_manager.HostManager, '_init_aggregates')
+    def setUp(self, mock_init_agg, mock_init_inst):
+        super(HostManagerIncrementalTestCase, self).setUp()
+        self.flags(scheduler_incremental_host_state=True,
+                   scheduler_host_state_full_sync_interval=600)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake-context'
+        self.t0 = datetime.datetime(2015, 11, 1, 12, 0, 0)
+        self.t1 = datetime.datetime(2015, 11, 1, 12, 0, 30)
+
+        patcher = mock.patch.object(objects.ServiceList, 'get_by_binary',
+            return_value=[objects.Service(host='host1'),
+                          objects.Service(host='host2')])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(objects.InstanceList, 'get_by_host',
+                                    return_value=objects.InstanceList())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _make_compute(host, timestamp, deleted=False):
+        return objects.ComputeNode(host=host, hypervisor_hostname=host,
+                                   created_at=timestamp, updated_at=timestamp,
+                                   deleted_at=timestamp if deleted else None,
+                                   deleted=deleted)
+
+    def _load_initial_host_states(self, cn_get_all):
+        cn_get_all.return_value = [self._make_compute('host1', self.t0),
+                                   self._make_compute('host2', self.t0)]
+        self.host_manager.get_all_host_states(self.context)
+        for host_state in self.host_manager.host_state_map.values():
+            host_state.updated = cn_get_all.return_value[0].updated_at
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all_changed_since')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def test_get_all_host_states_only_updates_changed(self, cn_get_all,
+                                                      cn_get_changed,
+                                                      update_from_cn):
+        self._load_initial_host_states(cn_get_all)
+        high_water_mark = self.host_manager._compute_nodes_high_water_mark
+        self.assertEqual(cn_get_all.return_value[0].updated_at,
+                         high_water_mark)
+        update_from_cn.reset_mock()
+
+        cn1 = self._make_compute('host1', self.t1)
+        cn_get_changed.return_value = [cn1]
+        self.host_manager.get_all_host_states(self.context)
+
+        cn_get_all.assert_called_once_with(self.context)
+        cn_get_changed.assert_called_once_with(
+            self.context, high_water_mark - datetime.timedelta(seconds=2))
+        update_from_cn.assert_called_once_with(cn1)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+        self.assertEqual(cn1.updated_at,
+                         self.host_manager._compute_nodes_high_water_mark)
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def test_get_all_host_states_high_water_mark_capped(self, cn_get_all,
+                                                        update_from_cn):
+        # The clock of host2 is ahead of the one of the scheduler
+        now = timeutils.utcnow()
+        cn_get_all.return_value = [
+            self._make_compute('host1', self.t0),
+            self._make_compute('host2', now + datetime.timedelta(hours=1))]
+
+        with mock.patch.object(timeutils, 'utcnow', return_value=now):
+            self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(now, timeutils.normalize_time(
+            self.host_manager._compute_nodes_high_water_mark))
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all_changed_since')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def test_get_all_host_states_refreshes_reset_host_state(self, cn_get_all,
+                                                            cn_get_changed,
+                                                            update_from_cn):
+        self._load_initial_host_states(cn_get_all)
+        update_from_cn.reset_mock()
+        self.host_manager.host_state_map[('host2', 'host2')].updated = None
+
+        cn_get_changed.return_value = []
+        self.host_manager.get_all_host_states(self.context)
+
+        update_from_cn.assert_called_once_with(
+            self.host_manager._compute_nodes[('host2', 'host2')])
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all_changed_since')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def test_get_all_host_states_removes_deleted(self, cn_get_all,
+                                                 cn_get_changed,
+                                                 update_from_cn):
+        self._load_initial_host_states(cn_get_all)
+
+        cn_get_changed.return_value = [
+            self._make_compute('host2', self.t1, deleted=True)]
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual([('host1', 'host1')],
+                         list(self.host_manager.host_state_map.keys()))
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all_changed_since')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def test_get_all_host_states_full_sync(self, cn_get_all, cn_get_changed,
+                                           update_from_cn):
+        self._load_initial_host_states(cn_get_all)
+        self.host_manager._last_full_sync -= datetime.timedelta(seconds=601)
+
+        cn_get_all.return_value = [self._make_compute('host1', self.t1)]
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, cn_get_all.call_count)
+        self.assertFalse(cn_get_changed.called)
+        self.assertEqual([('host1', 'host1')],
+                         list(self.host_manager.host_state_map.keys()))
+
+
+class HostManagerOptimisticClaimsTestCase(test.NoDBTestCase):
+    """Test case for HostManager.claim_host."""
+
+    @mock.patch.object(host_manager.HostManager, '_init_instance_info')
+    @mock.patch.object(host_manager.HostManager, '_init_aggregates')
+    def setUp(self, mock_init_agg, mock_init_inst):
+        super(HostManagerOptimisticClaimsTestCase, self).setUp()
+        self.flags(scheduler_optimistic_claims=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake-context'
+        self.compute = objects.ComputeNode(id=1, host='host1',
+                                           hypervisor_hostname='node1',
+                                           generation=3)
+        self.host_manager._compute_nodes[('host1', 'node1')] = self.compute
+        self.host_state = host_manager.HostState('host1', 'node1')
+        self.spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=512, root_gb=10, ephemeral_gb=5,
+                                  vcpus=2))
+
+    @mock.patch.object(objects.ComputeNode, 'claim')
+    def test_claim_host_disabled(self, mock_claim):
+        self.host_manager.optimistic_claims = False
+        self.assertTrue(self.host_manager.claim_host(
+            self.context, self.host_state, self.spec_obj))
+        self.assertFalse(mock_claim.called)
+
+    @mock.patch.object(objects.ComputeNode, 'claim')
+    def test_claim_host_unknown_compute(self, mock_claim):
+        host_state = host_manager.HostState('host2', 'node2')
+        self.assertTrue(self.host_manager.claim_host(
+            self.context, host_state, self.spec_obj))
+        self.assertFalse(mock_claim.called)
+
+    @mock.patch.object(objects.ComputeNode, 'claim')
+    def test_claim_host(self, mock_claim):
+        self.assertTrue(self.host_manager.claim_host(
+            self.context, self.host_state, self.spec_obj))
+        mock_claim.assert_called_once_with(512, 15, 2)
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNode, 'get_by_id')
+    @mock.patch.object(objects.ComputeNode, 'claim')
+    def test_claim_host_conflict(self, mock_claim, mock_get_by_id,
+                                 mock_update):
+        mock_claim.side_effect = exception.ComputeNodeGenerationConflict(
+            compute_id=1, generation=3)
+        refreshed = objects.ComputeNode(id=1, host='host1',
+                                        hypervisor_hostname='node1',
+                                        generation=4)
+        mock_get_by_id.return_value = refreshed
+        self.host_state.updated = datetime.datetime(2015, 11, 1, 12, 0, 0)
+
+        self.assertFalse(self.host_manager.claim_host(
+            self.context, self.host_state, self.spec_obj))
+
+        mock_get_by_id.assert_called_once_with(self.context, 1)
+        mock_update.assert_called_once_with(refreshed)
+        self.assertIsNone(self.host_state.updated)
+        self.assertIs(refreshed,
+                      self.host_manager._compute_nodes[('host1', 'node1')])
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
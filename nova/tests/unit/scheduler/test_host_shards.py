@@ -0,0 +1,212 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the parallel filtering of host shards.
+"""
+
+import os
+import signal
+
+import mock
+from six.moves import cPickle as pickle
+
+from nova.scheduler import filters
+from nova.scheduler import host_shards
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class EvenHostFilter(filters.BaseHostFilter):
+    """Lets the hosts with an even number pass and sets their limits."""
+
+    def host_passes(self, host_state, filter_properties):
+        number = int(host_state.host[len('host'):])
+        if number % 2:
+            return False
+        host_state.limits['number'] = number
+        return True
+
+
+class StopFilter(filters.BaseHostFilter):
+    def filter_all(self, filter_obj_list, filter_properties):
+        return None
+
+
+class HostShardsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostShardsTestCase, self).setUp()
+        self.flags(scheduler_filter_processes=2,
+                   scheduler_filter_shard_min_hosts=2)
+        self.filter_handler = filters.HostFilterHandler()
+        self.hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                      for i in range(6)]
+        patcher = mock.patch.object(host_shards, '_pickling_errors', set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fake_workers(self, results):
+        workers = []
+        for result in results:
+            worker = mock.Mock(spec=host_shards._Worker, alive=True)
+            worker.get_result.return_value = result
+            workers.append(worker)
+        patcher = mock.patch.object(host_shards, '_idle_workers',
+                                    list(workers))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return workers
+
+    def test_get_num_shards(self):
+        self._fake_workers([None, None])
+        self.assertEqual(1, host_shards.get_num_shards(3))
+        self.assertEqual(2, host_shards.get_num_shards(4))
+        self.assertEqual(2, host_shards.get_num_shards(100))
+        self._fake_workers([])
+        self.assertEqual(1, host_shards.get_num_shards(100))
+
+    def test_not_enough_hosts(self):
+        workers = self._fake_workers([None, None])
+        result = host_shards.get_filtered_objects(
+            self.filter_handler, [EvenHostFilter()], self.hosts[:3], {})
+
+        self.assertEqual([self.hosts[0], self.hosts[2]], result)
+        self.assertFalse(workers[0].submit.called)
+        self.assertFalse(workers[1].submit.called)
+
+    def test_host_table(self):
+        table = host_shards._HostTable()
+
+        def _make_request(hosts):
+            return pickle.loads(table.make_request(b'request', hosts))
+
+        request, keys, updates, evicted = _make_request(self.hosts[:2])
+        self.assertEqual(b'request', request)
+        self.assertEqual([('host0', 'node0'), ('host1', 'node1')], keys)
+        self.assertEqual(set(keys), set(updates))
+        self.assertEqual('host0',
+                         pickle.loads(updates[('host0', 'node0')]).host)
+        self.assertEqual([], evicted)
+
+        # only the HostStates which changed are sent again
+        self.assertEqual({}, _make_request(self.hosts[:2])[2])
+        self.hosts[0].updated = 'changed'
+        self.hosts[1].instances['uuid'] = 'instance'
+        self.assertEqual(set(keys), set(_make_request(self.hosts[:2])[2]))
+
+        with mock.patch.object(host_shards, '_EVICTION_REQUESTS', 3):
+            for i in range(3):
+                request, keys, updates, evicted = _make_request(
+                    self.hosts[1:3])
+        self.assertEqual([('host0', 'node0')], evicted)
+        self.assertEqual({}, updates)
+        self.assertNotIn(('host0', 'node0'), table.versions)
+
+    @mock.patch.object(host_shards.LOG, 'warning')
+    def test_host_table_unpicklable_host(self, mock_warning):
+        table = host_shards._HostTable()
+        self.hosts[1].unpicklable = lambda: None
+
+        for i in range(2):
+            self.assertIsNone(table.make_request(b'request', self.hosts))
+        self.assertEqual({}, table.versions)
+        self.assertEqual(1, mock_warning.call_count)
+
+    def test_get_filtered_objects(self):
+        host_shards.start_workers()
+        self.addCleanup(host_shards.stop_workers)
+        self.assertEqual(2, len(host_shards._idle_workers))
+
+        for i in range(2):
+            # the same processes filter the hosts of each request
+            self.filter_handler.stats.reset()
+            for host in self.hosts:
+                host.limits = {}
+            result = host_shards.get_filtered_objects(
+                self.filter_handler, [EvenHostFilter()], self.hosts, {})
+
+            self.assertEqual([self.hosts[0], self.hosts[2], self.hosts[4]],
+                             result)
+            # the limits set by the processes are copied back
+            self.assertEqual([{'number': 0}, {'number': 2}, {'number': 4}],
+                             [host.limits for host in result])
+            stats = self.filter_handler.stats.get()['EvenHostFilter']
+            self.assertEqual(2, stats['calls'])
+            self.assertEqual(6, stats['count_in'])
+            self.assertEqual(3, stats['count_out'])
+            self.assertEqual(2, len(host_shards._idle_workers))
+
+    def test_get_filtered_objects_worker_died(self):
+        host_shards.start_workers()
+        self.addCleanup(host_shards.stop_workers)
+        dead = host_shards._idle_workers[0]
+        os.kill(dead.pid, signal.SIGKILL)
+
+        for i in range(2):
+            result = host_shards.get_filtered_objects(
+                self.filter_handler, [EvenHostFilter()], self.hosts, {})
+            self.assertEqual([self.hosts[0], self.hosts[2], self.hosts[4]],
+                             result)
+        # the process which died was replaced
+        self.assertEqual(2, len(host_shards._idle_workers))
+        self.assertNotIn(dead, host_shards._workers)
+        self.assertTrue(all(worker.alive
+                            for worker in host_shards._workers))
+
+    def test_get_filtered_objects_failed_shard(self):
+        workers = self._fake_workers([([(0, {'number': 0})], {}), None])
+        workers[1].alive = False
+
+        result = host_shards.get_filtered_objects(
+            self.filter_handler, [EvenHostFilter()], self.hosts, {})
+
+        self.assertEqual([self.hosts[0], self.hosts[4]], result)
+        self.assertEqual({'number': 0}, self.hosts[0].limits)
+        for worker in workers:
+            self.assertEqual(1, worker.submit.call_count)
+        # the process which stopped is not used anymore
+        self.assertEqual([workers[0]], host_shards._idle_workers)
+
+    @mock.patch.object(host_shards, '_spawner')
+    def test_get_filtered_objects_replace_worker(self, mock_spawner):
+        workers = self._fake_workers([([(0, {})], {}), None])
+        workers[1].alive = False
+        patcher = mock.patch.object(host_shards, '_workers', list(workers))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        new_worker = mock_spawner.spawn.return_value
+
+        host_shards.get_filtered_objects(
+            self.filter_handler, [EvenHostFilter()], self.hosts, {})
+
+        self.assertEqual([workers[0], new_worker], host_shards._workers)
+        self.assertEqual([workers[0], new_worker], host_shards._idle_workers)
+
+    @mock.patch.object(host_shards.LOG, 'warning')
+    def test_get_filtered_objects_unpicklable_filter(self, mock_warning):
+        workers = self._fake_workers([None, None])
+        unpicklable = EvenHostFilter()
+        unpicklable.unpicklable = lambda: None
+
+        for i in range(2):
+            result = host_shards.get_filtered_objects(
+                self.filter_handler, [unpicklable], self.hosts, {})
+            self.assertEqual([self.hosts[0], self.hosts[2], self.hosts[4]],
+                             result)
+        self.assertFalse(workers[0].submit.called)
+        self.assertEqual(1, mock_warning.call_count)
+
+    def test_get_filtered_objects_stop(self):
+        self._fake_workers([([(0, {})], {}), (None, {})])
+
+        self.assertIsNone(host_shards.get_filtered_objects(
+            self.filter_handler, [StopFilter()], self.hosts, {}))
@@ -0,0 +1,178 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the vectorized filters and weighers.
+"""
+
+import mock
+import testtools
+
+from nova.scheduler import filters
+from nova.scheduler.filters import core_filter
+from nova.scheduler.filters import disk_filter
+from nova.scheduler.filters import io_ops_filter
+from nova.scheduler.filters import num_instances_filter
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_table
+from nova.scheduler import weights
+from nova.scheduler.weights import io_ops
+from nova.scheduler.weights import ram
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class _Host2Filter(filters.BaseHostFilter):
+
+    def host_passes(self, host_state, filter_properties):
+        return host_state.host != 'host2'
+
+
+class HostTableEnabledTestCase(test.NoDBTestCase):
+
+    def test_disabled_by_default(self):
+        self.assertFalse(host_table.is_enabled())
+
+    @mock.patch.object(host_table, 'numpy', None)
+    @mock.patch.object(host_table.LOG, 'warning')
+    def test_enabled_without_numpy(self, mock_warning):
+        self.flags(scheduler_use_vectorized_filters=True)
+        self.assertFalse(host_table.is_enabled())
+
+
+@testtools.skipIf(host_table.numpy is None, 'numpy is not installed')
+class HostStateTableTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostStateTableTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_filters=True)
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1024, 'total_usable_ram_mb': 2048,
+                 'ram_allocation_ratio': 1.0, 'vcpus_total': 4,
+                 'vcpus_used': 4, 'cpu_allocation_ratio': 2.0,
+                 'free_disk_mb': 10 * 1024, 'total_usable_disk_gb': 20,
+                 'num_io_ops': 8, 'num_instances': 3}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': 256, 'total_usable_ram_mb': 2048,
+                 'ram_allocation_ratio': 1.5, 'vcpus_total': 0,
+                 'vcpus_used': 0, 'cpu_allocation_ratio': 16.0,
+                 'free_disk_mb': 512, 'total_usable_disk_gb': 20,
+                 'num_io_ops': 0, 'num_instances': 50}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': 512, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0, 'vcpus_total': 2,
+                 'vcpus_used': 1, 'cpu_allocation_ratio': 1.0,
+                 'free_disk_mb': 2048, 'total_usable_disk_gb': 2,
+                 'num_io_ops': 2, 'num_instances': 10}),
+        ]
+        self.filter_properties = {'instance_type': {
+            'memory_mb': 768, 'vcpus': 2, 'root_gb': 1, 'ephemeral_gb': 0,
+            'swap': 0}}
+
+    def test_column(self):
+        table = host_table.HostStateTable(self.hosts)
+        self.assertEqual([1024, 256, 512], table['free_ram_mb'].tolist())
+        self.assertIs(table['free_ram_mb'], table['free_ram_mb'])
+
+    def test_column_none_value(self):
+        self.hosts[0].ram_allocation_ratio = None
+        table = host_table.HostStateTable(self.hosts)
+        self.assertEqual([True, False, False],
+                         table.is_unset('ram_allocation_ratio').tolist())
+
+    def _assert_same_as_host_passes(self, filt_cls):
+        expected = [host for host in self.hosts
+                    if filt_cls.host_passes(host, self.filter_properties)]
+        expected_limits = [dict(host.limits) for host in expected]
+        for host in self.hosts:
+            host.limits = {}
+        result = filt_cls.filter_all(self.hosts, self.filter_properties)
+        self.assertEqual(expected, result)
+        self.assertEqual(expected_limits, [host.limits for host in result])
+        return result
+
+    def test_ram_filter(self):
+        result = self._assert_same_as_host_passes(ram_filter.RamFilter())
+        self.assertEqual([self.hosts[0], self.hosts[1]], result)
+        self.assertIsInstance(self.hosts[1].limits['memory_mb'], float)
+
+    def test_core_filter(self):
+        result = self._assert_same_as_host_passes(core_filter.CoreFilter())
+        self.assertEqual([self.hosts[0], self.hosts[1]], result)
+
+    def test_disk_filter(self):
+        result = self._assert_same_as_host_passes(disk_filter.DiskFilter())
+        self.assertEqual([self.hosts[0], self.hosts[2]], result)
+
+    def test_io_ops_filter(self):
+        result = self._assert_same_as_host_passes(
+            io_ops_filter.IoOpsFilter())
+        self.assertEqual([self.hosts[1], self.hosts[2]], result)
+
+    def test_num_instances_filter(self):
+        result = self._assert_same_as_host_passes(
+            num_instances_filter.NumInstancesFilter())
+        self.assertEqual([self.hosts[0], self.hosts[2]], result)
+
+    def test_aggregate_filters_not_vectorized(self):
+        table = host_table.HostStateTable(self.hosts)
+        for filt_cls in (ram_filter.AggregateRamFilter(),
+                         core_filter.AggregateCoreFilter(),
+                         disk_filter.AggregateDiskFilter(),
+                         io_ops_filter.AggregateIoOpsFilter(),
+                         num_instances_filter.AggregateNumInstancesFilter()):
+            self.assertIsNone(filt_cls.hosts_pass(table,
+                                                  self.filter_properties))
+
+    def _count_reads(self, func, *args):
+        with mock.patch.object(host_table, 'getattr', create=True,
+                               side_effect=getattr) as mock_getattr:
+            result = func(*args)
+        return result, mock_getattr.call_count
+
+    def test_filter_handler_shares_table(self):
+        handler = filters.HostFilterHandler()
+        ram_filters = [ram_filter.RamFilter()]
+        result, reads = self._count_reads(
+            handler.get_filtered_objects, ram_filters, self.hosts,
+            self.filter_properties)
+
+        # the fields are read once, even when a filter is not vectorized
+        mixed_filters = [ram_filter.RamFilter(), _Host2Filter(),
+                         ram_filter.RamFilter()]
+        mixed_result, mixed_reads = self._count_reads(
+            handler.get_filtered_objects, mixed_filters, self.hosts,
+            self.filter_properties)
+
+        self.assertEqual([self.hosts[0], self.hosts[1]], result)
+        self.assertEqual([self.hosts[0]], mixed_result)
+        self.assertIsInstance(mixed_result, list)
+        self.assertEqual(reads, mixed_reads)
+
+    def test_weight_handler_shares_table(self):
+        weight_handler = weights.HostWeightHandler()
+        _result, reads = self._count_reads(
+            weight_handler.get_weighed_objects,
+            [ram.RAMWeigher(), ram.RAMWeigher()], self.hosts, {})
+        self.assertEqual(len(self.hosts), reads)
+
+    def test_weighers(self):
+        weight_handler = weights.HostWeightHandler()
+        weighed = weight_handler.get_weighed_objects(
+            [ram.RAMWeigher(), io_ops.IoOpsWeigher()], self.hosts, {})
+
+        self.flags(scheduler_use_vectorized_filters=False)
+        expected = weight_handler.get_weighed_objects(
+            [ram.RAMWeigher(), io_ops.IoOpsWeigher()], self.hosts, {})
+
+        self.assertEqual([(w.obj, w.weight) for w in expected],
+                         [(w.obj, w.weight) for w in weighed])
@@ -0,0 +1,225 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler profiler.
+"""
+
+import os
+
+import mock
+from oslo_serialization import jsonutils
+
+from nova import context
+from nova import exception
+from nova import objects
+from nova.scheduler import profiler
+from nova import test
+from nova.tests.unit.scheduler import fakes
+from nova import utils
+
+
+class ProfilerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ProfilerTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(scheduler_default_filters=['RamFilter'])
+        self.snapshot = {
+            'services': fakes.SERVICES,
+            'compute_nodes': fakes.COMPUTE_NODES[:4],
+            'aggregates': [objects.Aggregate(id=1, name='agg1',
+                                             hosts=['host1'],
+                                             metadata={'foo': 'bar'})],
+            'instances': [objects.Instance(uuid='fake-uuid', host='host1')],
+        }
+        self.request_spec = {
+            'num_instances': 1,
+            'image': {},
+            'instance_properties': {'uuid': 'fake-uuid',
+                                    'project_id': 'fake',
+                                    'availability_zone': None,
+                                    'numa_topology': None,
+                                    'pci_requests': None},
+            'instance_type': {'memory_mb': 1024, 'root_gb': 1,
+                              'ephemeral_gb': 0, 'vcpus': 1},
+        }
+
+    def test_format_stats(self):
+        stats = {'FastFilter': {'calls': 2, 'time': 0.001, 'max_time': 0.001,
+                                'count_in': 10, 'count_out': 8},
+                 'SlowFilter': {'calls': 4, 'time': 0.01, 'max_time': 0.005,
+                                'count_in': 20, 'count_out': 4}}
+        lines = profiler.format_stats(stats)
+        self.assertEqual(3, len(lines))
+        self.assertEqual(['Name', 'Calls', 'Total', '(ms)', 'Avg', '(ms)',
+                          'Max', '(ms)', 'In', 'Out'], lines[0].split())
+        self.assertEqual(['SlowFilter', '4', '10.000', '2.500', '5.000',
+                          '20', '4'], lines[1].split())
+        self.assertEqual('FastFilter', lines[2].split()[0])
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.AggregateList, 'get_all')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_save_and_load_snapshot(self, mock_services, mock_nodes,
+                                    mock_aggs, mock_instances):
+        mock_services.return_value = self.snapshot['services']
+        mock_nodes.return_value = self.snapshot['compute_nodes']
+        mock_aggs.return_value = self.snapshot['aggregates']
+        mock_instances.return_value = self.snapshot['instances'] + [
+            objects.Instance(uuid='fake-uuid2', host=None)]
+
+        snapshot = profiler.take_snapshot(self.context)
+        mock_services.assert_called_once_with(self.context, 'nova-compute')
+        mock_instances.assert_called_once_with(self.context,
+                                               {'deleted': False})
+        self.assertEqual(1, len(snapshot['instances']))
+
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'snapshot.json')
+            profiler.save_snapshot(snapshot, path)
+            loaded = profiler.load_snapshot(path)
+
+        self.assertEqual(['host1', 'host2', 'host3', 'host4'],
+                         [compute.host for compute in
+                          loaded['compute_nodes']])
+        self.assertIsInstance(loaded['services'][0], objects.Service)
+        self.assertEqual({'foo': 'bar'}, loaded['aggregates'][0].metadata)
+        self.assertEqual('fake-uuid', loaded['instances'][0].uuid)
+
+    def test_snapshot_host_manager(self):
+        manager = profiler.SnapshotHostManager(self.snapshot)
+        host_states = {host_state.host: host_state for host_state in
+                       manager.get_all_host_states(self.context)}
+
+        self.assertEqual(['host1', 'host2', 'host3', 'host4'],
+                         sorted(host_states))
+        self.assertEqual(['agg1'], [agg.name for agg in
+                                    host_states['host1'].aggregates])
+        self.assertEqual(['fake-uuid'], list(host_states['host1'].instances))
+        self.assertEqual({}, host_states['host2'].instances)
+
+    def test_snapshot_host_manager_forgets_consumed_resources(self):
+        manager = profiler.SnapshotHostManager(self.snapshot)
+        spec_obj = objects.RequestSpec.from_primitives(
+            self.context, self.request_spec, {})
+        host_state = list(manager.get_all_host_states(self.context))[0]
+        free_ram_mb = host_state.free_ram_mb
+        host_state.consume_from_request(spec_obj)
+        self.assertNotEqual(free_ram_mb, host_state.free_ram_mb)
+
+        manager.get_all_host_states(self.context)
+        self.assertEqual(free_ram_mb, host_state.free_ram_mb)
+
+    def test_snapshot_filter_scheduler(self):
+        scheduler = profiler.SnapshotFilterScheduler(self.snapshot)
+        hosts = scheduler.schedule(self.context, self.request_spec)
+
+        self.assertEqual(1, len(hosts))
+        stats = scheduler.host_manager.filter_handler.stats.get()
+        self.assertEqual(1, stats['RamFilter']['calls'])
+        self.assertEqual(4, stats['RamFilter']['count_in'])
+
+    def test_load_requests(self):
+        flavor = objects.Flavor(memory_mb=1024, root_gb=1, ephemeral_gb=0,
+                                vcpus=1)
+        request = {'request_spec': dict(
+            self.request_spec, instance_type=flavor.obj_to_primitive())}
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'requests.json')
+            with open(path, 'w') as f:
+                f.write(jsonutils.dumps(request))
+            requests = profiler.load_requests(self.context, path)
+
+        self.assertEqual(1, len(requests))
+        request_spec, filter_properties = requests[0]
+        self.assertIsInstance(request_spec['instance_type'], objects.Flavor)
+        self.assertEqual(1024, request_spec['instance_type'].memory_mb)
+        self.assertEqual(self.request_spec['instance_properties'],
+                         request_spec['instance_properties'])
+        self.assertEqual({}, filter_properties)
+
+    def test_percentile(self):
+        values = [float(i) for i in range(100, 0, -1)]
+        self.assertEqual(50.0, profiler.percentile(values, 50))
+        self.assertEqual(99.0, profiler.percentile(values, 99))
+        self.assertEqual(100.0, profiler.percentile(values, 100))
+        self.assertEqual(3.0, profiler.percentile([3.0], 99))
+        self.assertEqual(0.0, profiler.percentile([], 50))
+
+    def test_benchmark(self):
+        too_big = dict(self.request_spec,
+                       instance_type=dict(self.request_spec['instance_type'],
+                                          memory_mb=1024 * 1024))
+        requests = [(self.request_spec, {}), (too_big, {}),
+                    (self.request_spec, {})]
+        result = profiler.benchmark(self.context, self.snapshot, requests)
+
+        self.assertEqual(3, result['requests'])
+        self.assertEqual(1, result['failures'])
+        self.assertGreater(result['requests_per_second'], 0)
+        self.assertGreaterEqual(result['p99'], result['p50'])
+        if profiler.tracemalloc is not None:
+            self.assertGreater(result['peak_memory'], 0)
+            self.assertFalse(profiler.tracemalloc.is_tracing())
+        else:
+            self.assertGreaterEqual(result['peak_memory'], 0)
+
+    @mock.patch.object(profiler, '_get_max_rss', side_effect=[1000, 1500])
+    def test_benchmark_in_child(self, mock_get_max_rss):
+        result = profiler._benchmark_in_child(
+            self.context, self.snapshot, [(self.request_spec, {})])
+
+        self.assertEqual(1, result['requests'])
+        self.assertEqual(0, result['failures'])
+        self.assertEqual(500, result['peak_memory'])
+
+    @mock.patch.object(profiler, '_benchmark',
+                       side_effect=test.TestingException)
+    def test_benchmark_in_child_failed(self, mock_benchmark):
+        self.assertRaises(exception.NovaException,
+                          profiler._benchmark_in_child,
+                          self.context, self.snapshot, [])
+
+    @mock.patch.object(profiler, 'benchmark')
+    def test_benchmark_configurations(self, mock_benchmark):
+        weighers = []
+
+        def fake_benchmark(context, snapshot, requests):
+            weighers.append(profiler.CONF.scheduler_weight_classes)
+            return {'requests': len(requests)}
+
+        mock_benchmark.side_effect = fake_benchmark
+        configurations = [
+            {'name': 'default'},
+            {'name': 'ram', 'options': {
+                'scheduler_weight_classes': [
+                    'nova.scheduler.weights.ram.RAMWeigher']}}]
+        results = profiler.benchmark_configurations(
+            self.context, self.snapshot, ['request'], configurations)
+
+        self.assertEqual([('default', {'requests': 1}),
+                          ('ram', {'requests': 1})], results)
+        self.assertEqual(['nova.scheduler.weights.ram.RAMWeigher'],
+                         weighers[1])
+        self.assertNotEqual(weighers[0], weighers[1])
+        self.assertEqual(weighers[0],
+                         profiler.CONF.scheduler_weight_classes)
+
+    def test_format_benchmark_results(self):
+        lines = profiler.format_benchmark_results(
+            [('default', {'requests': 10, 'failures': 1,
+                          'requests_per_second': 123.45, 'p50': 0.002,
+                          'p99': 0.0105, 'peak_memory': 2048})])
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['default', '10', '1', '123.5', '2.000', '10.500',
+                          '2048'], lines[1].split())
@@ -54,12 +54,25 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
         manager = self.manager
         self.assertIsInstance(manager.driver, self.driver_cls)
 
+    @mock.patch('nova.scheduler.host_shards.stop_workers')
+    def test_cleanup_host(self, mock_stop_workers):
+        self.manager.cleanup_host()
+        mock_stop_workers.assert_called_once_with()
+
     def test_select_destination(self):
         with mock.patch.object(self.manager.driver, 'select_destinations'
                 ) as select_destinations:
             self.manager.select_destinations(None, None, {})
             select_destinations.assert_called_once_with(None, None, {})
 
+    @mock.patch('nova.scheduler.profiler.format_host_manager_stats',
+                return_value=['line1', 'line2'])
+    @mock.patch('nova.scheduler.manager.LOG.info')
+    def test_log_plugin_stats(self, mock_log, mock_format):
+        self.manager._log_plugin_stats(self.context)
+        mock_format.assert_called_once_with(self.manager.driver.host_manager)
+        self.assertEqual('line1\nline2', mock_log.call_args[0][1])
+
     def test_update_aggregates(self):
         with mock.patch.object(self.manager.driver.host_manager,
                                'update_aggregates'
@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For the periodic tasks of the base Manager.
+"""
+
+import fixtures
+import mock
+from oslo_service import periodic_task
+from oslo_utils import timeutils
+
+from nova import manager
+from nova import test
+
+
+class FakeManager(manager.Manager):
+
+    def __init__(self, *args, **kwargs):
+        self.runs = []
+        self.defer_for = None
+        super(FakeManager, self).__init__(*args, **kwargs)
+
+    def _defer_periodic_task(self, task_name):
+        return self.defer_for
+
+    @periodic_task.periodic_task(spacing=100)
+    def _delayed_task(self, context):
+        self.runs.append('_delayed_task')
+
+    @periodic_task.periodic_task(spacing=100, run_immediately=True)
+    def _immediate_task(self, context):
+        self.runs.append('_immediate_task')
+
+
+class ManagerPeriodicTasksTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ManagerPeriodicTasksTestCase, self).setUp()
+        # The delayed task is not due until its spacing has elapsed
+        self.now = FakeManager._delayed_task._periodic_last_run
+        self.useFixture(fixtures.MonkeyPatch(
+            'oslo_service.periodic_task.now', lambda: self.now))
+
+    def test_no_jitter(self):
+        mgr = FakeManager(host='host1')
+        self.assertIsNone(mgr._periodic_last_run['_immediate_task'])
+
+        mgr.periodic_tasks('context')
+
+        self.assertEqual(['_immediate_task'], mgr.runs)
+        stats = mgr.periodic_task_stats['_immediate_task']
+        self.assertEqual(1, stats['runs'])
+        self.assertEqual(0, stats['overruns'])
+        self.assertEqual(0, mgr.periodic_task_stats['_delayed_task']['runs'])
+
+    def test_jitter(self):
+        self.flags(periodic_task_jitter=0.5)
+        mgr1 = FakeManager(host='host1')
+        mgr2 = FakeManager(host='host1')
+        mgr3 = FakeManager(host='host2')
+
+        offset = mgr1._get_periodic_task_offset(
+            '_delayed_task', FakeManager._delayed_task)
+        self.assertTrue(0 <= offset <= 50)
+        self.assertNotEqual(offset, mgr3._get_periodic_task_offset(
+            '_delayed_task', FakeManager._delayed_task))
+        last_run = mgr1._periodic_last_run['_delayed_task']
+        self.assertEqual(last_run, mgr2._periodic_last_run['_delayed_task'])
+
+        # The tasks run immediately are only shifted after their first run
+        self.assertIsNone(mgr1._periodic_last_run['_immediate_task'])
+        mgr1.periodic_tasks('context')
+        self.assertEqual(['_immediate_task'], mgr1.runs)
+        self.assertEqual(
+            self.now + mgr1._get_periodic_task_offset(
+                '_immediate_task', FakeManager._immediate_task),
+            mgr1._periodic_last_run['_immediate_task'])
+
+    @mock.patch.object(manager.LOG, 'warning')
+    @mock.patch.object(timeutils.StopWatch, 'elapsed', return_value=150.0)
+    def test_overrun(self, mock_elapsed, mock_warning):
+        self.flags(periodic_task_notifications=True)
+        mgr = FakeManager(host='host1')
+        with mock.patch.object(mgr, 'notifier') as mock_notifier:
+            mgr.periodic_tasks('context')
+
+        stats = mgr.periodic_task_stats['_immediate_task']
+        self.assertEqual(1, stats['overruns'])
+        self.assertEqual(150.0, stats['max_time'])
+        self.assertTrue(mock_warning.called)
+        mock_notifier.info.assert_called_once_with(
+            'context', 'periodic_task.end', mock.ANY)
+        payload = mock_notifier.info.call_args[0][2]
+        self.assertEqual('_immediate_task', payload['task'])
+        self.assertEqual(150.0, payload['last_time'])
+
+    def test_deferred(self):
+        mgr = FakeManager(host='host1')
+        mgr.defer_for = 10
+
+        mgr.periodic_tasks('context')
+
+        self.assertEqual([], mgr.runs)
+        # The task is due again in 10 seconds
+        self.assertEqual(self.now - 90,
+                         mgr._periodic_last_run['_immediate_task'])
+        stats = mgr.periodic_task_stats['_immediate_task']
+        self.assertEqual(1, stats['deferrals'])
+        self.assertEqual(0, stats['runs'])
+
+    def test_deferred_for_up_to_spacing(self):
+        mgr = FakeManager(host='host1')
+        mgr.defer_for = 10
+        self.useFixture(test.TimeOverride())
+
+        mgr.periodic_tasks('context')
+        self.assertEqual([], mgr.runs)
+
+        timeutils.advance_time_seconds(101)
+        mgr._periodic_last_run['_immediate_task'] = None
+        mgr.periodic_tasks('context')
+        self.assertEqual(['_immediate_task'], mgr.runs)
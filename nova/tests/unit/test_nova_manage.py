@@ -383,6 +383,21 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    @mock.patch.object(db, 'instance_search_index_rebuild',
+                       side_effect=[5, 8, None])
+    def test_rebuild_instance_search_index(self, mock_rebuild):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO()))
+        self.commands.rebuild_instance_search_index(max_rows='5')
+        self.assertEqual([mock.call(mock.ANY, None, 5),
+                          mock.call(mock.ANY, 5, 5),
+                          mock.call(mock.ANY, 8, 5)],
+                         mock_rebuild.call_args_list)
+        self.assertIn("in 2 transaction(s)", sys.stdout.getvalue())
+
+    def test_rebuild_instance_search_index_negative(self):
+        self.assertEqual(1, self.commands.rebuild_instance_search_index(0))
+
     @mock.patch.object(migration, 'db_null_instance_uuid_scan',
                        return_value={'foo': 0})
     def test_null_instance_uuid_scan_no_records_found(self, mock_scan):
@@ -452,6 +467,66 @@ class ServiceCommandsTestCase(test.TestCase):
         self.assertEqual(2, self.commands.disable('nohost', 'noservice'))
 
 
+class SchedulerCommandsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerCommandsTestCase, self).setUp()
+        self.commands = manage.SchedulerCommands()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+
+    @mock.patch('nova.scheduler.profiler.save_snapshot')
+    @mock.patch('nova.scheduler.profiler.take_snapshot',
+                return_value={'compute_nodes': ['node1', 'node2']})
+    def test_snapshot(self, mock_take, mock_save):
+        self.commands.snapshot('/fake/path')
+        mock_save.assert_called_once_with(mock_take.return_value,
+                                          '/fake/path')
+        self.assertIn('Saved 2 compute nodes to /fake/path',
+                      sys.stdout.getvalue())
+
+    @mock.patch('nova.scheduler.profiler.format_host_manager_stats',
+                return_value=['Filters:', 'RamFilter'])
+    @mock.patch('nova.scheduler.profiler.load_requests',
+                return_value=[('spec1', 'props1'), ('spec2', {})])
+    @mock.patch('nova.scheduler.profiler.load_snapshot')
+    @mock.patch('nova.scheduler.profiler.SnapshotFilterScheduler')
+    def test_profile(self, mock_scheduler, mock_load_snapshot,
+                     mock_load_requests, mock_format):
+        schedule = mock_scheduler.return_value.schedule
+        schedule.return_value = ['host1']
+
+        self.commands.profile('/fake/snapshot', '/fake/requests', repeat='2')
+
+        mock_load_snapshot.assert_called_once_with('/fake/snapshot')
+        mock_scheduler.assert_called_once_with(
+            mock_load_snapshot.return_value)
+        self.assertEqual(4, schedule.call_count)
+        self.assertEqual('spec2', schedule.call_args[0][1])
+        output = sys.stdout.getvalue()
+        self.assertIn('Request 1: 1 host(s) selected in', output)
+        self.assertIn('RamFilter', output)
+
+    def test_profile_invalid_repeat(self):
+        self.assertEqual(1, self.commands.profile('/fake/snapshot',
+                                                  '/fake/requests',
+                                                  repeat='0'))
+
+    @mock.patch('nova.scheduler.profiler.format_benchmark_results',
+                return_value=['Configuration', 'current'])
+    @mock.patch('nova.scheduler.profiler.benchmark_configurations')
+    @mock.patch('nova.scheduler.profiler.load_requests')
+    @mock.patch('nova.scheduler.profiler.load_snapshot')
+    def test_benchmark(self, mock_load_snapshot, mock_load_requests,
+                       mock_benchmark, mock_format):
+        self.commands.benchmark('/fake/snapshot', '/fake/requests')
+
+        mock_benchmark.assert_called_once_with(
+            mock.ANY, mock_load_snapshot.return_value,
+            mock_load_requests.return_value,
+            [{'name': 'current', 'options': {}}])
+        mock_format.assert_called_once_with(mock_benchmark.return_value)
+        self.assertIn('current', sys.stdout.getvalue())
+
+
 class CellCommandsTestCase(test.TestCase):
     def setUp(self):
         super(CellCommandsTestCase, self).setUp()
@@ -16,6 +16,7 @@
 
 import datetime
 
+import mock
 from oslo_config import cfg
 from oslo_utils import timeutils
 from six.moves import range
@@ -2788,6 +2789,139 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.compare_reservation(result, reservations_list)
 
 
+class CountingQuotaDriverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CountingQuotaDriverTestCase, self).setUp()
+        self.flags(quota_instances=10, quota_cores=20)
+        self.useFixture(test.TimeOverride())
+        self.context = FakeContext('test_project', None)
+        self.driver = quota.CountingQuotaDriver()
+        self.counts = {None: {'instances': 9, 'cores': 9, 'ram': 512},
+                       'fake_user': {'instances': 5, 'cores': 5,
+                                     'ram': 512}}
+        for name, value in (('quota_get_all_by_project', {}),
+                            ('quota_get_all_by_project_and_user', {}),
+                            ('quota_class_get_default', {}),
+                            ('quota_get_all', [])):
+            patcher = mock.patch.object(db, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            db, 'quota_usage_count',
+            side_effect=lambda context, project_id, syncs, user_id=None:
+            dict(self.counts[user_id]))
+        self.mock_count = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reserve(self):
+        reservations = self.driver.reserve(self.context,
+                                           quota.QUOTAS._resources,
+                                           dict(instances=1, cores=1))
+        self.assertEqual(1, len(reservations))
+        # all the reservable resources are counted at once
+        syncs = set(resource.sync
+                    for resource in quota.QUOTAS._resources.values()
+                    if hasattr(resource, 'sync'))
+        self.mock_count.assert_has_calls([
+            mock.call(self.context, 'test_project', syncs, user_id=None),
+            mock.call(self.context, 'test_project', syncs,
+                      user_id='fake_user')], any_order=True)
+
+        # the first reservation is added to the counts
+        exc = self.assertRaises(exception.OverQuota, self.driver.reserve,
+                                self.context, quota.QUOTAS._resources,
+                                dict(instances=1))
+        self.assertEqual(['instances'], exc.kwargs['overs'])
+        self.assertEqual({'in_use': 5, 'reserved': 1},
+                         exc.kwargs['usages']['instances'])
+        self.assertEqual(2, self.mock_count.call_count)
+
+        # until it is rolled back
+        self.driver.rollback(self.context, reservations)
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+        self.assertEqual(2, self.mock_count.call_count)
+
+    def test_reserve_counts_expire(self):
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=-1))
+        self.assertEqual(2, self.mock_count.call_count)
+
+        timeutils.advance_time_seconds(3)
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+        self.assertEqual(4, self.mock_count.call_count)
+
+    def test_reserve_held_until_expired(self):
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+
+        # the reservation outlives the counts
+        timeutils.advance_time_seconds(3)
+        self.assertRaises(exception.OverQuota, self.driver.reserve,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=1))
+        self.assertEqual(4, self.mock_count.call_count)
+
+        timeutils.advance_time_seconds(60)
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+
+    def test_reserve_negative_delta_not_held(self):
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=-1))
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+        self.assertRaises(exception.OverQuota, self.driver.reserve,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=1))
+
+    def test_commit(self):
+        reservations = self.driver.reserve(self.context,
+                                           quota.QUOTAS._resources,
+                                           dict(instances=1))
+        self.driver.commit(self.context, reservations)
+        # the resources are counted again, once, with the committed ones
+        self.counts[None]['instances'] = 10
+        self.assertRaises(exception.OverQuota, self.driver.reserve,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=1))
+        self.assertEqual(4, self.mock_count.call_count)
+
+    def test_commit_rollback_unknown(self):
+        self.driver.commit(self.context, ['fake-reservation'])
+        self.driver.rollback(self.context, ['fake-reservation'])
+        self.assertFalse(self.mock_count.called)
+
+    def test_reserve_negative_delta_over_quota(self):
+        self.counts[None]['instances'] = 12
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=-1))
+
+    def test_get_project_quotas(self):
+        result = self.driver.get_project_quotas(
+            self.context, quota.QUOTAS._resources, 'test_project')
+        self.assertEqual(dict(limit=10, in_use=9, reserved=0),
+                         result['instances'])
+        self.driver.reserve(self.context, quota.QUOTAS._resources,
+                            dict(instances=1))
+        result = self.driver.get_project_quotas(
+            self.context, quota.QUOTAS._resources, 'test_project')
+        self.assertEqual(dict(limit=10, in_use=9, reserved=1),
+                         result['instances'])
+        self.assertEqual(dict(limit=128, in_use=0, reserved=0),
+                         result['metadata_items'])
+
+    def test_get_user_quotas(self):
+        result = self.driver.get_user_quotas(
+            self.context, quota.QUOTAS._resources, 'test_project',
+            'fake_user', usages=False)
+        self.assertEqual(dict(limit=10), result['instances'])
+        self.assertFalse(self.mock_count.called)
+
+
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
         super(NoopQuotaDriverTestCase, self).setUp()
@@ -1327,6 +1327,19 @@ class SafeTruncateTestCase(test.NoDBTestCase):
         self.assertEqual(254, len(byte_message))
 
 
+class GetAddressLikePatternTestCase(test.NoDBTestCase):
+    def test_get_address_like_pattern(self):
+        for regex, pattern in (('^10\\.0\\.0\\.1$', '10.0.0.1'),
+                               ('10.0', '10_0%'),
+                               ('fe80::', 'fe80::%'),
+                               ('', '%')):
+            self.assertEqual(pattern, utils.get_address_like_pattern(regex))
+
+    def test_get_address_like_pattern_not_supported(self):
+        for regex in ('10.*', '^.*12.*34.*', 'FE80::', '1\\$'):
+            self.assertIsNone(utils.get_address_like_pattern(regex))
+
+
 class SpawnNTestCase(test.NoDBTestCase):
     def setUp(self):
         super(SpawnNTestCase, self).setUp()
@@ -72,3 +72,43 @@ class TestWeigher(test.NoDBTestCase):
         self.assertEqual(1, len(weighed_host))
         self.assertEqual('host1', weighed_host[0].obj.host)
         self.assertFalse(mock_weigh.called)
+
+    def test_reweigh_object(self):
+        host_values = [
+            ('host1', 'node1', {'free_ram_mb': 512}),
+            ('host2', 'node2', {'free_ram_mb': 1024}),
+        ]
+        hostinfo = [fakes.FakeHostState(host, node, values)
+                    for host, node, values in host_values]
+
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighers = [ram.RAMWeigher()]
+        weighed_hosts = weight_handler.get_weighed_objects(weighers,
+                                                           hostinfo, {})
+        self.assertEqual(['host2', 'host1'],
+                         [w.obj.host for w in weighed_hosts])
+        self.assertEqual([1.0, 0.5], [w.weight for w in weighed_hosts])
+
+        # the normalization range of the first weighing is kept
+        hostinfo[1].free_ram_mb = 256
+        weighed_host = weight_handler.reweigh_object(weighers,
+                                                     weighed_hosts[0], {})
+        self.assertIs(weighed_hosts[0], weighed_host)
+        self.assertEqual(0.25, weighed_host.weight)
+
+    def test_get_weighed_objects_stats(self):
+        host_values = [
+            ('host1', 'node1', {'free_ram_mb': 512}),
+            ('host2', 'node2', {'free_ram_mb': 1024}),
+        ]
+        hostinfo = [fakes.FakeHostState(host, node, values)
+                    for host, node, values in host_values]
+
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weight_handler.get_weighed_objects([ram.RAMWeigher()], hostinfo, {})
+
+        stats = weight_handler.stats.get()
+        self.assertEqual(['RAMWeigher'], list(stats))
+        self.assertEqual(1, stats['RAMWeigher']['calls'])
+        self.assertEqual(2, stats['RAMWeigher']['count_in'])
+        self.assertEqual(2, stats['RAMWeigher']['count_out'])
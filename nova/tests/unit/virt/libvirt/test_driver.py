@@ -92,6 +92,7 @@ from nova.virt.libvirt import firewall
 from nova.virt.libvirt import guest as libvirt_guest
 from nova.virt.libvirt import host
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt.storage import dmcrypt
 from nova.virt.libvirt.storage import lvm
 from nova.virt.libvirt.storage import rbd_utils
@@ -4790,6 +4791,45 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         self.assertEqual(uuids[3], vm4.UUIDString())
         mock_list.assert_called_with(only_running=False)
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    def test_get_instances_power_states(self, mock_list):
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(name="instance00000002")
+        vm2._info[0] = power_state.SHUTDOWN
+
+        mock_list.return_value = [vm1, vm2]
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        power_states = drvr.get_instances_power_states()
+        self.assertEqual({vm1.UUIDString(): power_state.RUNNING,
+                          vm2.UUIDString(): power_state.SHUTDOWN},
+                         power_states)
+        mock_list.assert_called_with(only_running=False)
+
+    def test_prefetch_image(self):
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instance = objects.Instance(image_ref='fake-image', root_gb=1,
+                                    user_id='fake-user',
+                                    project_id='fake-project')
+        backend = mock.Mock(SUPPORTS_CLONE=False)
+        with mock.patch.object(drvr.image_backend, 'image',
+                               return_value=backend) as mock_image:
+            drvr.prefetch_image(self.context, instance, {})
+
+            mock_image.assert_called_once_with(instance, 'disk')
+            backend.cache_template.assert_called_once_with(
+                fetch_func=libvirt_driver.libvirt_utils.fetch_image,
+                filename=imagecache.get_cache_fname(
+                    {'image_id': 'fake-image'}, 'image_id'),
+                max_size=units.Gi, context=self.context,
+                image_id='fake-image', user_id='fake-user',
+                project_id='fake-project')
+
+            # The backends cloning the image do not need it cached
+            backend.reset_mock()
+            backend.SUPPORTS_CLONE = True
+            drvr.prefetch_image(self.context, instance, {})
+            self.assertFalse(backend.cache_template.called)
+
     @mock.patch.object(host.Host, "list_instance_domains")
     def test_get_all_block_devices(self, mock_list):
         xml = [
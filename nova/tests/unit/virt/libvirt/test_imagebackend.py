@@ -277,6 +277,30 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
 
         self.mox.VerifyAll()
 
+    @mock.patch.object(imagebackend.utils, 'synchronized',
+                       return_value=lambda f: f)
+    @mock.patch.object(imagebackend.fileutils, 'ensure_tree')
+    @mock.patch.object(os.path, 'exists')
+    def test_cache_template(self, mock_exists, mock_ensure_tree,
+                            mock_synchronized):
+        mock_exists.side_effect = lambda path: path == self.TEMPLATE_DIR
+        fn = mock.Mock()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        image.create_image = mock.Mock()
+        image.cache_template(fn, self.TEMPLATE, max_size=10)
+
+        fn.assert_called_once_with(target=self.TEMPLATE_PATH, max_size=10)
+        # The image itself is not created
+        self.assertFalse(image.create_image.called)
+        self.assertFalse(mock_ensure_tree.called)
+
+        fn.reset_mock()
+        mock_exists.side_effect = None
+        mock_exists.return_value = True
+        image.cache_template(fn, self.TEMPLATE, max_size=10)
+        self.assertFalse(fn.called)
+
     def test_create_image(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, max_size=None, image_id=None)
@@ -1508,6 +1508,38 @@ class VirtNUMAHostTopologyTestCase(test.NoDBTestCase):
                                                         pci_stats=pci_stats)
             self.assertIsNone(fitted_instance1)
 
+    def test_get_fitting_many_host_cells(self):
+        host = objects.NUMATopology(
+            cells=[objects.NUMACell(id=i, cpuset=set([2 * i, 2 * i + 1]),
+                                    memory=2048, cpu_usage=0,
+                                    memory_usage=0 if i >= 6 else 2048,
+                                    mempages=[], siblings=[],
+                                    pinned_cpus=set([]))
+                   for i in range(8)])
+        instance = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=i, cpuset=set([i]),
+                                            memory=1024)
+                   for i in range(2)])
+        limits = objects.NUMATopologyLimits(
+            cpu_allocation_ratio=1, ram_allocation_ratio=1)
+
+        with mock.patch.object(hw, '_numa_fit_instance_cell',
+                               wraps=hw._numa_fit_instance_cell) as mock_fit:
+            fitted_instance = hw.numa_fit_instance_to_host(host, instance,
+                                                           limits)
+
+        self.assertEqual([6, 7], [cell.id for cell in fitted_instance.cells])
+        # each pair of cells is checked once, then the fitting ones again
+        self.assertEqual(8 * 2 + 2, mock_fit.call_count)
+
+    def test_numa_topology_fingerprint(self):
+        fingerprint = hw.numa_topology_fingerprint(self.host)
+        self.assertEqual(fingerprint,
+                         hw.numa_topology_fingerprint(self.host.obj_clone()))
+        self.host.cells[1].memory_usage = 1024
+        self.assertNotEqual(fingerprint,
+                            hw.numa_topology_fingerprint(self.host))
+
 
 class NumberOfSerialPortsTest(test.NoDBTestCase):
     def test_flavor(self):
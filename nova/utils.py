@@ -1505,6 +1505,43 @@ def safe_truncate(value, length):
     return u_value
 
 
+def get_address_like_pattern(regex):
+    """Return the SQL LIKE pattern matching the same IP addresses as a
+    regular expression matched at their start, as the ip and ip6 filters
+    of the lists of instances are.
+
+    Only the regular expressions made of lowercase hexadecimal digits,
+    colons and dots, escaped or not, and anchored or not, are supported,
+    e.g. the '^10\\.0\\.0\\.1$' of the fixed_ip filter.
+
+    :returns: the LIKE pattern, or None if the regular expression is not
+              supported
+    """
+    regex = six.text_type(regex)
+    if regex.startswith('^'):
+        regex = regex[1:]
+    suffix = '%'
+    if regex.endswith('$') and not regex.endswith('\\$'):
+        regex = regex[:-1]
+        suffix = ''
+    pattern = []
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if regex[i:i + 2] == '\\.':
+            pattern.append('.')
+            i += 1
+        elif char == '.':
+            # Matches any character
+            pattern.append('_')
+        elif char in '0123456789abcdef:':
+            pattern.append(char)
+        else:
+            return None
+        i += 1
+    return ''.join(pattern) + suffix
+
+
 def read_cached_file(filename, force_reload=False):
     """Read from a file if it has been modified.
 
@@ -256,6 +256,17 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def get_instances_power_states(self):
+        """Return the power states of all the instances known to the
+        virtualization layer, as a dict of power_state keyed by instance
+        UUID.
+
+        This is used to synchronize the power states of the instances of
+        the host with a single call, instead of calling get_info() for each
+        of them.
+        """
+        raise NotImplementedError()
+
     def rebuild(self, context, instance, image_meta, injected_files,
                 admin_password, bdms, detach_block_devices,
                 attach_block_devices, network_info=None,
@@ -324,6 +335,22 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetch the image of an instance about to be spawned into the
+        image cache of the host.
+
+        This is called while the networks and the block devices of the
+        instance are prepared, so that spawn() does not have to wait for
+        the image to be downloaded. The default implementation does
+        nothing, the image being fetched by spawn().
+
+        :param context: security context
+        :param instance: nova.objects.instance.Instance
+        :param image_meta: image object returned by nova.image.glance that
+                           defines the image from which to boot this instance
+        """
+        pass
+
     def destroy(self, context, instance, network_info, block_device_info=None,
                 destroy_disks=True, migrate_data=None):
         """Destroy the specified instance from the Hypervisor.
@@ -818,6 +845,19 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def get_available_resources(self, nodenames):
+        """Retrieve the resource information of several nodes.
+
+        A driver managing many nodes can override this to retrieve them
+        with a few batched calls.
+
+        :param nodenames: the nodes to get the resources of
+        :returns: dictionary of the get_available_resource() results, keyed
+                  by nodename
+        """
+        return {nodename: self.get_available_resource(nodename)
+                for nodename in nodenames}
+
     def pre_live_migration(self, context, instance, block_device_info,
                            network_info, disk_info, migrate_data=None):
         """Prepare an instance for live migration
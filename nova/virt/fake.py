@@ -168,6 +168,10 @@ class FakeDriver(driver.ComputeDriver):
     def list_instance_uuids(self):
         return self.instances.keys()
 
+    def get_instances_power_states(self):
+        return {uuid: instance.state
+                for uuid, instance in self.instances.items()}
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         pass
@@ -1066,6 +1066,59 @@ def numa_get_constraints(flavor, image_meta):
     return _add_cpu_pinning_constraint(flavor, image_meta, numa_topology)
 
 
+def _fitting_host_cell_permutations(host_cells, instance_cells,
+                                    limit_cell=None):
+    """Yield the permutations of host cells the instance cells fit onto
+
+    :param host_cells: list of objects.NUMACell of the host
+    :param instance_cells: list of objects.InstanceNUMACell to be fitted
+    :param limit_cell: an objects.NUMATopologyLimit or None
+
+    Whether an instance cell fits onto a host cell doesn't depend on the
+    other cells, so each pair is only checked once, against a copy of the
+    instance cell, and the permutations are built by a depth-first search
+    skipping the pairs which don't fit. They are yielded in the same order
+    as by itertools.permutations, without going through all of them on a
+    host with many cells.
+    """
+    fits = [[_numa_fit_instance_cell(host_cell, instance_cell.obj_clone(),
+                                     limit_cell) is not None
+             for host_cell in host_cells]
+            for instance_cell in instance_cells]
+
+    def _permutations(index, used):
+        if index == len(instance_cells):
+            yield ()
+            return
+        for host_index, host_cell in enumerate(host_cells):
+            if host_index in used or not fits[index][host_index]:
+                continue
+            used.add(host_index)
+            for host_cell_perm in _permutations(index + 1, used):
+                yield (host_cell,) + host_cell_perm
+            used.remove(host_index)
+
+    return _permutations(0, set())
+
+
+def numa_topology_fingerprint(host_topology):
+    """Return a hashable summary of a host NUMA topology and its usage
+
+    :param host_topology: objects.NUMATopology
+
+    Two topologies with the same fingerprint have the same cells, with the
+    same usage, so an instance topology fits onto both of them the same way.
+    """
+    return tuple((cell.id, tuple(sorted(cell.cpuset)), cell.memory,
+                  cell.cpu_usage, cell.memory_usage,
+                  tuple(sorted(cell.pinned_cpus)),
+                  tuple(tuple(sorted(siblings))
+                        for siblings in cell.siblings),
+                  tuple((pages.size_kb, pages.total, pages.used)
+                        for pages in cell.mempages))
+                 for cell in host_topology.cells)
+
+
 def numa_fit_instance_to_host(
         host_topology, instance_topology, limits=None,
         pci_requests=None, pci_stats=None):
@@ -1078,7 +1131,7 @@ def numa_fit_instance_to_host(
     :param pci_stats: pci_stats for the host
 
     Given a host and instance topology and optionally limits - this method
-    will attempt to fit instance cells onto all permutations of host cells
+    will attempt to fit instance cells onto the permutations of host cells
     by calling the _numa_fit_instance_cell method, and return a new
     InstanceNUMATopology with it's cell ids set to host cell id's of
     the first successful permutation, or None.
@@ -1089,8 +1142,8 @@ def numa_fit_instance_to_host(
     else:
         # TODO(ndipanov): We may want to sort permutations differently
         # depending on whether we want packing/spreading over NUMA nodes
-        for host_cell_perm in itertools.permutations(
-                host_topology.cells, len(instance_topology)):
+        for host_cell_perm in _fitting_host_cell_permutations(
+                host_topology.cells, instance_topology.cells, limits):
             cells = []
             for host_cell, instance_cell in zip(
                     host_cell_perm, instance_topology.cells):
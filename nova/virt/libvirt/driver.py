@@ -660,6 +660,18 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return uuids
 
+    def get_instances_power_states(self):
+        power_states = {}
+        for dom in self._host.list_instance_domains(only_running=False):
+            guest = libvirt_guest.Guest(dom)
+            try:
+                power_states[guest.uuid] = guest.get_power_state(self._host)
+            except exception.InstanceNotFound:
+                # The domain was undefined after being listed
+                continue
+
+        return power_states
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -2478,6 +2490,21 @@ class LibvirtDriver(driver.ComputeDriver):
     def poll_rebooting_instances(self, timeout, instances):
         pass
 
+    def prefetch_image(self, context, instance, image_meta):
+        backend = self.image_backend.image(instance, 'disk')
+        # NOTE: The backends able to clone the image do not need it cached
+        if backend.SUPPORTS_CLONE or not instance.image_ref:
+            return
+        disk_images = {'image_id': instance.image_ref}
+        root_fname = imagecache.get_cache_fname(disk_images, 'image_id')
+        backend.cache_template(fetch_func=libvirt_utils.fetch_image,
+                               filename=root_fname,
+                               max_size=instance.root_gb * units.Gi,
+                               context=context,
+                               image_id=instance.image_ref,
+                               user_id=instance.user_id,
+                               project_id=instance.project_id)
+
     # NOTE(ilyaalekseyev): Implementation like in multinics
     # for xenapi(tr3buchet)
     def spawn(self, context, instance, image_meta, injected_files,
@@ -219,17 +219,9 @@ class Image(object):
     def check_image_exists(self):
         return os.path.exists(self.path)
 
-    def cache(self, fetch_func, filename, size=None, *args, **kwargs):
-        """Creates image from template.
-
-        Ensures that template and image not already exists.
-        Ensures that base directory exists.
-        Synchronizes on template fetching.
-
-        :fetch_func: Function that creates the base image
-                     Should accept `target` argument.
-        :filename: Name of the file in the image directory
-        :size: Size of created image in bytes (optional)
+    def _get_template(self, fetch_func, filename):
+        """Return a function synchronizing fetch_func on the template and
+        the path of the template in the image cache.
         """
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
         def fetch_func_sync(target, *args, **kwargs):
@@ -243,6 +235,33 @@ class Image(object):
         if not os.path.exists(base_dir):
             fileutils.ensure_tree(base_dir)
         base = os.path.join(base_dir, filename)
+        return fetch_func_sync, base
+
+    def cache_template(self, fetch_func, filename, *args, **kwargs):
+        """Fetches the template into the image cache without creating the
+        image, e.g. before the image is created.
+
+        :fetch_func: Function that creates the base image
+                     Should accept `target` argument.
+        :filename: Name of the file in the image directory
+        """
+        fetch_func_sync, base = self._get_template(fetch_func, filename)
+        if not os.path.exists(base):
+            fetch_func_sync(base, *args, **kwargs)
+
+    def cache(self, fetch_func, filename, size=None, *args, **kwargs):
+        """Creates image from template.
+
+        Ensures that template and image not already exists.
+        Ensures that base directory exists.
+        Synchronizes on template fetching.
+
+        :fetch_func: Function that creates the base image
+                     Should accept `target` argument.
+        :filename: Name of the file in the image directory
+        :size: Size of created image in bytes (optional)
+        """
+        fetch_func_sync, base = self._get_template(fetch_func, filename)
 
         if not self.check_image_exists() or not os.path.exists(base):
             self.create_image(fetch_func_sync, base, size,
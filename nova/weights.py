@@ -19,6 +19,7 @@ Pluggable Weighing support
 
 import abc
 
+from oslo_utils import timeutils
 import six
 
 from nova import loadables
@@ -121,23 +122,53 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def __init__(self, *args, **kwargs):
+        super(BaseWeightHandler, self).__init__(*args, **kwargs)
+        # Time spent in each weigher and number of objects they weighed
+        self.stats = loadables.LoadableStats()
+
+    def _make_weighed_objects(self, obj_list):
+        """Return the list of the WeighedObjects passed to the weighers."""
+        return [self.object_class(obj, 0.0) for obj in obj_list]
+
     def get_weighed_objects(self, weighers, obj_list, weighing_properties):
         """Return a sorted (descending), normalized list of WeighedObjects."""
-        weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
+        weighed_objs = self._make_weighed_objects(obj_list)
 
         if len(weighed_objs) <= 1:
             return weighed_objs
 
         for weigher in weighers:
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
+            with timeutils.StopWatch() as timer:
+                weights = weigher.weigh_objects(weighed_objs,
+                                                weighing_properties)
 
-            # Normalize the weights
-            weights = normalize(weights,
-                                minval=weigher.minval,
-                                maxval=weigher.maxval)
+                # Normalize the weights
+                weights = normalize(weights,
+                                    minval=weigher.minval,
+                                    maxval=weigher.maxval)
 
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
+                for i, weight in enumerate(weights):
+                    obj = weighed_objs[i]
+                    obj.weight += weigher.weight_multiplier() * weight
+            self.stats.add(weigher.__class__.__name__, timer.elapsed(),
+                           len(weighed_objs), len(weighed_objs))
 
         return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+
+    def reweigh_object(self, weighers, weighed_obj, weighing_properties):
+        """Recompute the weight of a single, already weighed, object.
+
+        The weights are normalized with the minimum and maximum values
+        recorded by the weighers when all the objects were weighed, so that
+        the new weight can still be compared to the weights of the other
+        objects without weighing them again.
+        """
+        weighed_obj.weight = 0.0
+        for weigher in weighers:
+            weights = weigher.weigh_objects([weighed_obj], weighing_properties)
+            weight = list(normalize(weights,
+                                    minval=weigher.minval,
+                                    maxval=weigher.maxval))[0]
+            weighed_obj.weight += weigher.weight_multiplier() * weight
+        return weighed_obj